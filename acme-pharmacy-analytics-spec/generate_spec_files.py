@@ -3,19 +3,109 @@
 ACME Pharmacy Analytics Spec Kit Generator
 Generates all remaining specification files for the demo project.
 
+Builds are incremental: a manifest (.spec_manifest.json) records the SHA-256
+of every generated file, so unchanged files are never rewritten and keep
+their mtimes. Changed files are written atomically (temp file + rename).
+Files in the manifest that are no longer generated are reported as stale.
+
 Usage:
-    python generate_spec_files.py
+    python generate_spec_files.py                # incremental build
+    python generate_spec_files.py --force        # rewrite every file
+    python generate_spec_files.py --prune        # also delete stale files
+    python generate_spec_files.py --jobs 8       # render/write concurrently
 """
 
+import argparse
+import hashlib
+import json
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def write_file(filepath, content):
-    """Write content to file, creating directories as needed."""
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(content.strip() + '\n')
-    print(f"✓ Created: {filepath}")
+MANIFEST_NAME = ".spec_manifest.json"
+
+# mkstemp creates files 0600; generated files are readable by everyone
+FILE_MODE = 0o644
+
+
+def render(content):
+    """Final file bytes for a spec entry."""
+    return (content.strip() + '\n').encode('utf-8')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_file(filepath, data):
+    """Atomically write bytes to file, creating directories as needed."""
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, FILE_MODE)
+        os.replace(tmp, filepath)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_manifest(path):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def build_one(base_dir, filepath, content, recorded, force):
+    """Render one entry and write it if needed; return (status, filepath, hash).
+
+    status is "added" (file did not exist), "changed" (written over a
+    different file) or "unchanged" (skipped). A file whose hash matches the
+    manifest is skipped without reading it; a file missing from the manifest
+    is hashed on disk, so the first incremental run does not touch files that
+    are already current.
+    """
+    data = render(content)
+    digest = content_hash(data)
+    full_path = Path(base_dir) / filepath
+    exists = full_path.exists()
+    if not force and exists:
+        current = recorded if recorded is not None else content_hash(full_path.read_bytes())
+        if current == digest:
+            return "unchanged", filepath, digest
+    write_file(full_path, data)
+    return ("changed" if exists else "added"), filepath, digest
+
+
+def build(base_dir, files, force=False, prune=False, jobs=None):
+    """Incrementally build files into base_dir; return {status: [filepath]}."""
+    manifest_path = Path(base_dir) / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+            lambda item: build_one(base_dir, item[0], item[1], manifest.get(item[0]), force),
+            files.items(),
+        ))
+
+    report = {"added": [], "changed": [], "unchanged": [], "stale": []}
+    new_manifest = {}
+    for status, filepath, digest in results:
+        report[status].append(filepath)
+        new_manifest[filepath] = digest
+    for filepath in sorted(set(manifest) - set(files)):
+        report["stale"].append(filepath)
+        if prune:
+            (Path(base_dir) / filepath).unlink(missing_ok=True)
+        else:
+            new_manifest[filepath] = manifest[filepath]
+
+    if new_manifest != manifest:
+        write_file(manifest_path, (json.dumps(new_manifest, indent=2, sort_keys=True) + '\n').encode('utf-8'))
+    return report
 
 # Define all file contents
 spec_files = {
@@ -788,18 +878,32 @@ spec_files = {
 """,
 }
 
-# Generate all files
-base_dir = os.path.dirname(os.path.abspath(__file__))
-for filepath, content in spec_files.items():
-    full_path = os.path.join(base_dir, filepath)
-    write_file(full_path, content)
-
-print("\n" + "="*60)
-print("✓ Spec Kit Generation Complete!")
-print("="*60)
-print(f"\nTotal files created: {len(spec_files)}")
-print("\nNext steps:")
-print("1. Review all generated files for completeness")
-print("2. Run: ls -R acme-pharmacy-analytics-spec/ to see full structure")
-print("3. Customize content as needed for your specific demo")
-print("="*60)
+def main():
+    parser = argparse.ArgumentParser(description="Generate the spec kit files")
+    parser.add_argument("--force", action="store_true", help="Rewrite every file, ignoring the manifest")
+    parser.add_argument("--prune", action="store_true", help="Delete stale files no longer generated")
+    parser.add_argument("--jobs", type=int, default=None, help="Concurrent render/write workers")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    report = build(base_dir, spec_files, force=args.force, prune=args.prune, jobs=args.jobs)
+
+    for status, marker in (("added", "+"), ("changed", "~"), ("stale", "-")):
+        for filepath in report[status]:
+            print(f"{marker} {status.capitalize()}: {filepath}")
+
+    print("\n" + "="*60)
+    print("✓ Spec Kit Generation Complete!")
+    print("="*60)
+    print(f"\nAdded: {len(report['added'])}  Changed: {len(report['changed'])}  "
+          f"Unchanged: {len(report['unchanged'])}  Stale: {len(report['stale'])}"
+          + (" (pruned)" if args.prune and report['stale'] else ""))
+    print("\nNext steps:")
+    print("1. Review all generated files for completeness")
+    print("2. Run: ls -R acme-pharmacy-analytics-spec/ to see full structure")
+    print("3. Customize content as needed for your specific demo")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+ACME Pharmacy Analytics data pipeline.
+
+Python batch jobs that turn the data contracts in
+acme-pharmacy-analytics-spec/data_contracts/ into tables the web app can read.
+
+Modules:
+    tables        CSV readers/writers for the contract tables
+    adherence     PDC_90 / PDC_180 / MPR_90 computation over fact_claims
+    generate      Seeded, multi-process synthetic data generator
+    incremental   Nightly delta refresh of fact_adherence from persisted coverage state
+    load          Bulk loader into the web app's Prisma SQLite database
+    rules         Nightly notification rule engine with 48h deduplication
+    rollup        Weekly KPI rollup cube for dashboard tiles and trends
+    columnar      Memory-mapped columnar store for fact_adherence segments
+    rls           Row-level security scopes from requirements/rbac.md
+    cache         RLS-scoped query result cache with generation invalidation
+    search        BM25 search and link graph over the metrics catalog and spec kit
+    gaps          Gap Closure Cycle Time from mergeable t-digest sketches
+    stars         Rolling 12-week Star Ratings proxy with O(1) weekly updates
+    movers        Weekly top-K "what changed" digest across the cohort lattice
+    cohorts       Bitmap-indexed cohort builder with saved cohort definitions
+    export        Streaming masked member-list export (CSV or gzip)
+    bench         Scale-tiered benchmarks checked against the NFR targets
+    metrics       Latency histograms and stage timers with Prometheus text export
+    audit         Append-only audit log with group fsync and indexed segments
+    feeds         Feed latency heatmap and row-count anomaly detection
+    contracts     Data-contract validator generated from schemas.md, with drift detection
+    runner        Parallel, cached DAG runner for the nightly batch with critical-path reports
+    service       Asyncio KPI query service with request coalescing and pooled connections
+    partitions    Hive-style client/month partitioned claims and adherence with manifest pruning
+    shards        Sharded multi-process adherence with shared-memory results and deterministic merge
+    approx        Approximate KPI previews from HyperLogLog sketches and stratified samples
+
+Run modules from the acme-pharmacy-analytics/ directory, e.g.:
+    python -m pipeline.adherence --claims data/fact_claims --drugs data/dim_drug.csv
+"""
@@ -0,0 +1,458 @@
+"""
+Approximate KPI queries: HyperLogLog distinct counts and stratified samples.
+
+The exec persona (personas/client_exec.md) wants "5 numbers" instantly, and
+exploratory drill-downs do not need exact answers over 100M claims. This
+module answers them from two small structures. The cost of a query depends on
+the number of partitions and strata it touches, not on the number of rows.
+
+    sketches  one HyperLogLog of member_id per day for every part file of
+              the partitioned store (pipeline.partitions), under
+              _sketches/. Part files are immutable, so `sketch` builds only
+              the parts written since its last run. A distinct count is the
+              register-wise max over the part files the planner keeps
+              (pruned by RLS scope and date) and the days in range.
+    samples   a stratified sample of the fact_adherence snapshot. Strata are
+              client x drug class x plan, and each stratum keeps its
+              population count and up to --per-stratum rows: the members
+              with the smallest member_id hashes, a uniform sample that
+              stays stable from one night to the next. The nightly runner
+              rebuilds it after the adherence stage.
+
+Every estimate carries a 95% bound. For HLL it is 1.96 x 1.04 / sqrt(m) of
+the estimate. For the stratified estimators it comes from the usual variance,
+with the finite population correction. A stratum kept whole contributes no
+error. --exact reruns the same numbers against the full data, reports the
+actual error next to each bound, and takes seconds instead of milliseconds.
+
+Usage:
+    python -m pipeline.approx sketch --store data/lake
+    python -m pipeline.approx sample --snapshot data/fact_adherence.csv --members data/dim_member \\
+        --out data/adherence_samples.npz
+    python -m pipeline.approx preview --samples data/adherence_samples.npz --store data/lake \\
+        --role CLIENT_VIEWER --client ACME [--drug-class Diabetes] [--plan plan-1] [--exact]
+"""
+
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import ADHERENT_PDC
+from pipeline.contracts import file_chunks, key_hashes
+from pipeline.partitions import latest_day, load_manifest, plan
+from pipeline.rls import scope_for, scoped_filters
+from pipeline.shards import bytes_matrix
+from pipeline.tables import day_string, load_members, table_files
+
+HLL_PRECISION = 12  # 4096 registers, 1.6% relative standard error
+SAMPLE_PER_STRATUM = 512
+ACTIVE_DAYS = 90
+
+# Two-sided 95% normal quantile for the error bounds
+Z_95 = 1.96
+
+SKETCH_INDEX = "_sketches.json"
+SKETCH_DIR = "_sketches"
+SKETCH_VERSION = 1
+
+STRATA = ("client_id", "drug_class", "plan_id")
+
+
+@dataclass
+class Estimate:
+    name: str
+    value: float
+    bound: float  # half-width of the 95% interval; 0 when the value is exact
+    method: str
+    exact: float = None
+
+    @property
+    def error(self):
+        return None if self.exact is None or self.value is None else abs(self.value - self.exact)
+
+    @property
+    def within_bound(self):
+        return None if self.error is None else bool(self.error <= self.bound + 1e-9)
+
+
+# HyperLogLog
+
+def hll_update(registers, rows, hashes, precision=HLL_PRECISION):
+    """Fold 64-bit hashes into registers[rows]: the top bits pick a register,
+    the rank is 1 + the leading zeros of the rest."""
+    bits = 64 - precision
+    index = (hashes >> np.uint64(bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << bits) - 1)
+    # rest < 2**52 is exact as a float64; frexp's exponent is its bit length (0 for 0)
+    rank = bits + 1 - np.frexp(rest.astype(np.float64))[1]
+    np.maximum.at(registers, (rows, index), rank.astype(np.uint8))
+
+
+def hll_estimate(registers):
+    """Cardinality estimate from one register array, with the small-range correction."""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return float(estimate)
+
+
+def hll_bound(estimate, precision):
+    return float(Z_95 * 1.04 / np.sqrt(1 << precision) * estimate)
+
+
+def sketch_part(path, date_column, precision=HLL_PRECISION):
+    """(days, registers) for one part file: a member_id HLL per distinct date."""
+    days, hashes = [], []
+    for chunk in file_chunks(path):
+        if not len(chunk):
+            continue
+        valid, day = chunk.parsed(date_column, "DATE")
+        days.append(day[valid])
+        hashes.append(key_hashes(*chunk.matrix("member_id"))[valid])
+    day = np.concatenate(days) if days else np.empty(0, dtype=np.int64)
+    unique, rows = np.unique(day, return_inverse=True)
+    registers = np.zeros((len(unique), 1 << precision), dtype=np.uint8)
+    if len(day):
+        hll_update(registers, rows, np.concatenate(hashes), precision)
+    return unique, registers
+
+
+def load_index(store):
+    path = Path(store) / SKETCH_INDEX
+    if not path.exists():
+        return {"version": SKETCH_VERSION, "precision": HLL_PRECISION, "parts": {}}
+    index = json.loads(path.read_text())
+    if index.get("version") != SKETCH_VERSION:
+        raise ValueError(f"{path}: sketch index version {index.get('version')}, expected {SKETCH_VERSION}")
+    return index
+
+
+def build_sketches(store, precision=HLL_PRECISION):
+    """Sketch every part file in the store's manifest that has no sketch yet; return how many."""
+    store = Path(store)
+    index = load_index(store)
+    if index["parts"] and index["precision"] != precision:
+        raise ValueError(f"{store} sketches use precision {index['precision']}; rebuild to change it")
+    index["precision"] = precision
+    built = 0
+    for table, entry in sorted(load_manifest(store)["tables"].items()):
+        for partition in entry["partitions"].values():
+            for part in partition["files"]:
+                if part["path"] in index["parts"]:
+                    continue
+                days, registers = sketch_part(store / part["path"], entry["date_column"], precision)
+                sketch = (Path(SKETCH_DIR) / part["path"]).with_suffix(".npz")
+                target = store / sketch
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_name(f".{target.name}.tmp")
+                with open(tmp, "wb") as f:
+                    np.savez_compressed(f, day=days, registers=registers, union=registers.max(axis=0, initial=0))
+                os.replace(tmp, target)
+                index["parts"][part["path"]] = sketch.as_posix()
+                built += 1
+    path = store / SKETCH_INDEX
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(index, indent=1, sort_keys=True) + "\n")
+    os.replace(tmp, path)
+    return built
+
+
+def distinct_members(store, table, scope, start=None, end=None, client_id=None, exact=False):
+    """Distinct member_ids of a partitioned table over a scoped date range, as an Estimate.
+
+    The union reads only the sketches of the part files the planner keeps.
+    With exact, those part files are scanned too, and the exact count is
+    attached.
+    """
+    store = Path(store)
+    scan_plan = plan(store, table, scope, start, end, client_id)
+    index = load_index(store)
+    precision = index["precision"]
+    low = scan_plan.start_day if scan_plan.start_day is not None else np.iinfo(np.int64).min
+    high = scan_plan.end_day if scan_plan.end_day is not None else np.iinfo(np.int64).max
+    union = np.zeros(1 << precision, dtype=np.uint8)
+    for file in scan_plan.files:
+        sketch = index["parts"].get(file.relative_to(store).as_posix())
+        if sketch is None:
+            raise ValueError(f"{file} has no sketch; run `python -m pipeline.approx sketch --store {store}`")
+        with np.load(store / sketch) as data:
+            days = data["day"]
+            keep = (days >= low) & (days <= high)
+            if keep.all():
+                # Only boundary parts need their per-day registers
+                np.maximum(union, data["union"], out=union)
+            elif keep.any():
+                np.maximum(union, data["registers"][keep].max(axis=0), out=union)
+    estimate = hll_estimate(union)
+    result = Estimate("", estimate, hll_bound(estimate, precision), f"HLL over {len(scan_plan.files)} part files")
+    if exact:
+        hashes = []
+        for file in scan_plan.files:
+            for chunk in file_chunks(file):
+                if not len(chunk):
+                    continue
+                valid, day = chunk.parsed(scan_plan.date_column, "DATE")
+                keep = valid & (day >= low) & (day <= high)
+                hashes.append(np.unique(key_hashes(*chunk.matrix("member_id"))[keep]))
+        result.exact = float(len(np.unique(np.concatenate(hashes)))) if hashes else 0.0
+    return result
+
+
+# Stratified samples
+
+def _codes(chunk, name, codes, values):
+    """Integer codes of a low-cardinality column, extending codes/values with new strings."""
+    hashes = key_hashes(*chunk.matrix(name))
+    unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    lookup = np.empty(len(unique), dtype=np.int64)
+    for i, (h, row) in enumerate(zip(unique.tolist(), first.tolist())):
+        if h not in codes:
+            codes[h] = len(values)
+            values.append(chunk.values(name, [row])[0])
+        lookup[i] = codes[h]
+    return lookup[inverse]
+
+
+def read_strata(snapshot, members_path):
+    """The snapshot's rows with their strata, read vectorized.
+
+    Returns (keys, stratum, member hash, {pdc_90, pdc_180, mpr_90}, as_of_day),
+    where keys[s] is the (client_id, drug_class, plan_id) of stratum s. Rows
+    of members missing from dim_member are skipped, as in load_adherence.
+    """
+    members = load_members(members_path)
+    member_hashes = key_hashes(*bytes_matrix([m.encode("utf-8") for m in members.member_ids]))
+    by_hash = np.argsort(member_hashes)
+    sorted_hashes = member_hashes[by_hash]
+    class_codes, classes = {}, []
+    parts = {"member": [], "hash": [], "drug_class": [], "pdc_90": [], "pdc_180": [], "mpr_90": []}
+    as_of_day = None
+    for file in table_files(snapshot):
+        for chunk in file_chunks(file):
+            if not len(chunk):
+                continue
+            hashes = key_hashes(*chunk.matrix("member_id"))
+            at = np.minimum(np.searchsorted(sorted_hashes, hashes), max(len(sorted_hashes) - 1, 0))
+            known = sorted_hashes[at] == hashes if len(sorted_hashes) else np.zeros(len(chunk), dtype=bool)
+            parts["member"].append(by_hash[at][known])
+            parts["hash"].append(hashes[known])
+            parts["drug_class"].append(_codes(chunk, "drug_class", class_codes, classes)[known])
+            for name in ("pdc_90", "pdc_180", "mpr_90"):
+                valid, value = chunk.parsed(name, "DECIMAL", 2)[:2]
+                if not valid[known].all():
+                    raise ValueError(f"{file}: unparseable {name}")
+                parts[name].append(value[known] / 100.0)
+            valid, day = chunk.parsed("as_of_date", "DATE")
+            if valid.any():
+                as_of_day = max(as_of_day or 0, int(day[valid].max()))
+    columns = {name: np.concatenate(values) if values else np.empty(0) for name, values in parts.items()}
+    member = columns["member"].astype(np.int64)
+    n_classes, n_plans = max(len(classes), 1), max(len(members.plans), 1)
+    cell = (members.client[member].astype(np.int64) * n_classes + columns["drug_class"].astype(np.int64)) \
+        * n_plans + members.plan[member]
+    cells, stratum = np.unique(cell, return_inverse=True)
+    keys = [(members.clients[c // (n_classes * n_plans)], classes[c // n_plans % n_classes],
+             members.plans[c % n_plans]) for c in cells.tolist()]
+    metrics = {name: columns[name] for name in ("pdc_90", "pdc_180", "mpr_90")}
+    return keys, stratum, columns["hash"].astype(np.uint64), metrics, as_of_day
+
+
+def build_samples(snapshot, members_path, out, per_stratum=SAMPLE_PER_STRATUM):
+    """Write the stratified sample of a snapshot; return (rows, strata, sampled rows)."""
+    keys, stratum, hashes, metrics, as_of_day = read_strata(snapshot, members_path)
+    population = np.bincount(stratum, minlength=len(keys))
+    # Bottom-k by member hash within each stratum
+    order = np.lexsort((hashes, stratum))
+    first = np.concatenate([[0], np.cumsum(population)[:-1]]).astype(np.int64)
+    rank = np.arange(len(order)) - first[stratum[order]]
+    chosen = order[rank < per_stratum]
+    chosen.sort()
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f".{out.name}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f, population=population, stratum=stratum[chosen].astype(np.int32),
+            **{f"key_{dim}": np.array([key[i] for key in keys]) for i, dim in enumerate(STRATA)},
+            **{name: values[chosen].astype(np.float32) for name, values in metrics.items()},
+            as_of_date=day_string(as_of_day or 0), per_stratum=per_stratum,
+            snapshot=str(Path(snapshot).resolve()), members=str(Path(members_path).resolve()),
+        )
+    os.replace(tmp, out)
+    return len(stratum), len(keys), len(chosen)
+
+
+@dataclass
+class Samples:
+    keys: list
+    population: np.ndarray
+    stratum: np.ndarray
+    metrics: dict
+    as_of_date: str
+    snapshot: str
+    members: str
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            keys = list(zip(*[data[f"key_{dim}"].tolist() for dim in STRATA]))
+            return cls(keys, data["population"], data["stratum"],
+                       {name: data[name].astype(np.float64) for name in ("pdc_90", "pdc_180", "mpr_90")},
+                       str(data["as_of_date"]), str(data["snapshot"]), str(data["members"]))
+
+    def select(self, filters):
+        """Mask of strata matching client_id / drug_class / plan_id filters."""
+        return np.array([all(filters.get(dim) in (None, key[i]) for i, dim in enumerate(STRATA))
+                         for key in self.keys], dtype=bool)
+
+
+def stratified_mean(values, stratum, population, selected):
+    """Stratified estimate of the mean of values over the selected strata, and its 95% bound."""
+    strata = len(population)
+    n = np.bincount(stratum, minlength=strata).astype(np.float64)
+    sums = np.bincount(stratum, values, minlength=strata)
+    squares = np.bincount(stratum, values * values, minlength=strata)
+    use = selected & (n > 0)
+    if not use.any():
+        return None, 0.0
+    n, big_n = n[use], population[use].astype(np.float64)
+    means = sums[use] / n
+    variances = np.where(n > 1, np.maximum(squares[use] - n * means * means, 0) / np.maximum(n - 1, 1), 0.0)
+    weights = big_n / big_n.sum()
+    variance = (weights * weights * (1 - n / big_n) * variances / n).sum()
+    return float((weights * means).sum()), float(Z_95 * np.sqrt(variance))
+
+
+SAMPLE_NUMBERS = (
+    ("% adherent (PDC_90 ≥ 80%)", lambda m: (m["pdc_90"] >= ADHERENT_PDC) * 100.0),
+    ("Mean PDC_90", lambda m: m["pdc_90"]),
+    ("Mean PDC_180", lambda m: m["pdc_180"]),
+)
+
+
+def preview(samples, scope, store=None, client_id=None, drug_class=None, plan_id=None,
+            days=ACTIVE_DAYS, exact=False, snapshot=None, members=None):
+    """The exec "5 numbers" for a scope and optional cohort filters, as Estimates.
+
+    Distinct counts need store (a partitioned store with sketches); they cover
+    every drug class and plan, since claims carry neither. With exact, each
+    number is recomputed from the full data and attached.
+    """
+    filters = scoped_filters(scope, {"client_id": client_id} if client_id else {}, client_key="client_id")
+    client = filters.get("client_id")
+    estimates = []
+    if store is not None:
+        end_day = latest_day(store, "fact_claims")
+        if end_day is not None:
+            active = distinct_members(store, "fact_claims", scope, day_string(end_day - days + 1),
+                                      day_string(end_day), client, exact)
+            active.name = f"Active members (claim in last {days} days)"
+            estimates.append(active)
+
+    selected = samples.select({"client_id": client, "drug_class": drug_class, "plan_id": plan_id})
+    population = int(samples.population[selected].sum())
+    sampled = int(np.isin(samples.stratum, np.flatnonzero(selected)).sum())
+    if drug_class:
+        # One row per member in a drug class, so the strata sizes are the count
+        estimates.append(Estimate("Members measured", float(population), 0.0, "stratum sizes (exact)",
+                                  float(population) if exact else None))
+    elif store is not None and plan_id is None and "fact_adherence" in load_manifest(store)["tables"]:
+        measured = distinct_members(store, "fact_adherence", scope, samples.as_of_date, samples.as_of_date,
+                                    client, exact)
+        measured.name = "Members measured"
+        estimates.append(measured)
+
+    exact_rows = None
+    if exact:
+        keys, stratum, _, metrics, _ = read_strata(snapshot or samples.snapshot, members or samples.members)
+        wanted = set(k for k, s in zip(samples.keys, selected) if s)
+        rows = np.isin(stratum, [i for i, key in enumerate(keys) if key in wanted])
+        exact_rows = {name: values[rows] for name, values in metrics.items()}
+    for name, measure in SAMPLE_NUMBERS:
+        value, bound = stratified_mean(measure(samples.metrics), samples.stratum, samples.population, selected)
+        estimate = Estimate(name, value, bound, f"stratified sample, {sampled:,} of {population:,} rows")
+        if exact_rows is not None:
+            values = measure(exact_rows)
+            estimate.exact = float(values.mean()) if len(values) else None
+        estimates.append(estimate)
+    return estimates
+
+
+def print_estimates(estimates, elapsed_ms, exact):
+    print(f"{'':<44}{'estimate':>14}{'± 95%':>10}" + (f"{'exact':>14}{'error':>10}" if exact else ""))
+    for e in estimates:
+        count = e.name.startswith(("Active", "Members"))
+        fmt = (lambda v: f"{v:,.0f}") if count else (lambda v: f"{v:.2f}")
+        line = f"{e.name:<44}{fmt(e.value) if e.value is not None else '-':>14}{fmt(e.bound):>10}"
+        if exact:
+            line += f"{fmt(e.exact) if e.exact is not None else '-':>14}"
+            line += f"{fmt(e.error) if e.error is not None else '-':>10}"
+            line += "  ✓" if e.within_bound else "  ⚠ outside bound" if e.within_bound is False else ""
+        print(line + f"   · {e.method}")
+    print(f"({elapsed_ms:.1f} ms{', exact rerun' if exact else ''})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Approximate KPI queries from HLL sketches and samples")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sketch_parser = sub.add_parser("sketch", help="Build HLL sketches for new part files of a partitioned store")
+    sketch_parser.add_argument("--store", required=True, help="Partitioned store (pipeline.partitions)")
+    sketch_parser.add_argument("--precision", type=int, default=HLL_PRECISION, help="log2 of HLL registers (4-16)")
+
+    sample_parser = sub.add_parser("sample", help="Stratified sample of a fact_adherence snapshot")
+    sample_parser.add_argument("--snapshot", required=True, help="fact_adherence CSV file or part directory")
+    sample_parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+    sample_parser.add_argument("--out", required=True, help="Sample file (.npz)")
+    sample_parser.add_argument("--per-stratum", type=int, default=SAMPLE_PER_STRATUM,
+                               help="Rows kept per client x drug class x plan stratum")
+
+    preview_parser = sub.add_parser("preview", help="The exec 5 numbers, with error bounds")
+    preview_parser.add_argument("--samples", required=True, help="Sample file from `sample`")
+    preview_parser.add_argument("--store", help="Partitioned store with sketches (for distinct counts)")
+    preview_parser.add_argument("--role", required=True, help="Requesting role, e.g. CLIENT_VIEWER")
+    preview_parser.add_argument("--client", help="Client id (required for client roles; a filter otherwise)")
+    preview_parser.add_argument("--org", help="Org id for org-scoped roles")
+    preview_parser.add_argument("--drug-class", help="drug_class filter")
+    preview_parser.add_argument("--plan", help="plan_id filter")
+    preview_parser.add_argument("--days", type=int, default=ACTIVE_DAYS, help="Active-member window in days")
+    preview_parser.add_argument("--exact", action="store_true", help="Rerun exactly and show the actual error")
+    preview_parser.add_argument("--snapshot", help="Snapshot for --exact (default: the one sampled)")
+    preview_parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "sketch":
+        if not 4 <= args.precision <= 16:
+            parser.error("--precision must be between 4 and 16")
+        built = build_sketches(args.store, args.precision)
+        print(f"✓ Sketched {built:,} new part files in {time.perf_counter() - started:.1f}s")
+    elif args.command == "sample":
+        if args.per_stratum < 2:
+            parser.error("--per-stratum must be at least 2")
+        rows, strata, sampled = build_samples(args.snapshot, args.members, args.out, args.per_stratum)
+        print(f"✓ Sampled {sampled:,} of {rows:,} rows in {strata:,} strata "
+              f"in {time.perf_counter() - started:.1f}s → {args.out}")
+    else:
+        scope = scope_for(args.role, client_id=args.client, org_id=args.org)
+        client = args.client if scope.kind != "client" else None
+        estimates = preview(Samples.load(args.samples), scope, args.store, client, args.drug_class, args.plan,
+                            args.days, args.exact, args.snapshot)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if args.json:
+            print(json.dumps({"estimates": [asdict(e) | {"error": e.error} for e in estimates],
+                              "exact": args.exact, "elapsed_ms": round(elapsed_ms, 1)}, indent=2))
+        else:
+            print_estimates(estimates, elapsed_ms, args.exact)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""
+Append-only audit log (requirements/auditability.md).
+
+Every BI query, AI chat exchange, alert triage, login/logout, RLS policy
+change and metric definition change is an event. AuditLog.log() only queues
+the event, so the request path never waits on disk. A writer thread takes
+everything queued, up to BATCH_EVENTS events, writes it with one write()
+and makes it durable with one fsync (group commit). Callers that must know
+the event is on disk pass wait=True.
+
+Events are JSON lines in segment files that rotate by size and at each UTC
+day boundary:
+
+    audit/seg-20251018-000001.log        events, never modified once written
+    audit/seg-20251018-000001.log.idx    sparse index, written when sealed
+
+The index has the segment's time range, plus the blocks (every BLOCK_EVENTS
+events: byte offset and min/max time) in which each user, role and event
+type appears. A query skips segments whose time range, users or roles do not
+match, and within a segment it reads only the matching blocks. Sealed
+segments are made read-only. Retention drops whole segments once their last
+event is older than the retention window (90 days demo, 365 production).
+That is the only way events are ever removed.
+
+Reading is restricted to the COMPLIANCE role.
+
+Usage:
+    python -m pipeline.audit query --log data/audit --as-role COMPLIANCE --user u-123 --since 2025-09-01
+    python -m pipeline.audit report --log data/audit --as-role COMPLIANCE --month 2025-09
+    python -m pipeline.audit retention --log data/audit --days 90
+    python -m pipeline.audit append --log data/audit < events.jsonl
+    python -m pipeline.audit bench --log /tmp/audit_bench --events 200000 --threads 8
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+from pipeline.metrics import Histogram
+from pipeline.rls import AccessDenied
+from pipeline.tables import day_number, day_string
+
+EVENT_TYPES = ("bi_query", "ai_chat", "alert_triage", "login", "logout", "rls_change", "metric_change")
+
+READER_ROLE = "COMPLIANCE"
+
+DEMO_RETENTION_DAYS = 90
+PRODUCTION_RETENTION_DAYS = 365
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+BATCH_EVENTS = 4096
+FLUSH_INTERVAL = 0.01
+BLOCK_EVENTS = 1024
+
+MS_PER_DAY = 86_400_000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def ms_string(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def segment_day(path):
+    """UTC day (YYYYMMDD) a segment belongs to, from its name."""
+    return Path(path).name.split("-")[1]
+
+
+class SegmentIndex:
+    """Sparse index of one segment, built while it is written."""
+
+    def __init__(self):
+        self.count = 0
+        self.first_ms = None
+        self.last_ms = None
+        self.blocks = []             # [offset, min_ms, max_ms]
+        self.keys = {"user": {}, "role": {}, "type": {}}
+        self.bytes = 0               # end of the last indexed event
+
+    def add(self, event, offset, size):
+        block = self.count // BLOCK_EVENTS
+        ts = event["ts"]
+        if block == len(self.blocks):
+            self.blocks.append([offset, ts, ts])
+        else:
+            entry = self.blocks[block]
+            entry[1], entry[2] = min(entry[1], ts), max(entry[2], ts)
+        for field, positions in self.keys.items():
+            blocks = positions.setdefault(event.get(field), [])
+            if not blocks or blocks[-1] != block:
+                blocks.append(block)
+        self.first_ms = ts if self.first_ms is None else min(self.first_ms, ts)
+        self.last_ms = ts if self.last_ms is None else max(self.last_ms, ts)
+        self.count += 1
+        self.bytes = offset + size
+
+    def to_json(self):
+        return {
+            "count": self.count, "bytes": self.bytes, "first_ms": self.first_ms, "last_ms": self.last_ms,
+            "block_events": BLOCK_EVENTS, "blocks": self.blocks,
+            "keys": {field: {str(k): v for k, v in positions.items()} for field, positions in self.keys.items()},
+        }
+
+
+def encode(event):
+    return (json.dumps(event, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def scan_segment(path):
+    """Yield (offset, size, event) for every complete event line in a segment.
+
+    A torn final line (crash mid-write) is skipped.
+    """
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                try:
+                    yield offset, len(line), json.loads(line)
+                except json.JSONDecodeError:
+                    pass
+            offset += len(line)
+
+
+def seal(path, index=None):
+    """Write a segment's index (scanning it if needed) and make it read-only."""
+    path = Path(path)
+    if index is None:
+        index = SegmentIndex()
+        for offset, size, event in scan_segment(path):
+            index.add(event, offset, size)
+    tmp = path.with_name(f".{path.name}.idx.tmp")
+    tmp.write_text(json.dumps(index.to_json(), separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, f"{path}.idx")
+    path.chmod(0o444)
+
+
+def segments(log_dir):
+    return sorted(Path(log_dir).glob("seg-*.log"))
+
+
+class AuditLog:
+    """Batched, group-fsynced writer of audit events.
+
+    log() is safe to call from any thread and does not block on I/O. Close
+    the log (or use it as a context manager) to flush and seal the active
+    segment.
+    """
+
+    def __init__(self, log_dir, segment_bytes=SEGMENT_BYTES, batch_events=BATCH_EVENTS,
+                 flush_interval=FLUSH_INTERVAL, fsync=True):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.batch_events = batch_events
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        # A segment left unsealed by a crash is sealed as-is; writing
+        # always starts a fresh segment
+        for path in segments(self.log_dir):
+            if not Path(f"{path}.idx").exists():
+                seal(path)
+        self._sequence = max((int(p.stem.split("-")[2]) for p in segments(self.log_dir)), default=0)
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._queued = 0          # events ever queued
+        self._durable = 0         # events ever written and fsynced
+        self._closing = False
+        self._error = None
+        self._file = None
+        self._path = None
+        self._index = None
+        self._day = None
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, type, user, role, scope=None, client_id=None, ts=None, wait=False, **detail):
+        """Queue an event; with wait, return only once it is on disk."""
+        if type not in EVENT_TYPES:
+            raise ValueError(f"unknown audit event type {type!r}; expected one of {EVENT_TYPES}")
+        event = {"ts": ts if ts is not None else now_ms(), "type": type, "user": user, "role": role}
+        if scope is not None:
+            event["scope"] = scope
+        if client_id is not None:
+            event["client_id"] = client_id
+        if detail:
+            event["detail"] = detail
+        with self._cond:
+            if self._error is not None:
+                # Never accept an event that can no longer reach the disk
+                raise RuntimeError("audit writer failed") from self._error
+            if self._closing:
+                raise RuntimeError("audit log is closed")
+            self._queue.append(event)
+            self._queued += 1
+            sequence = self._queued
+            self._cond.notify_all()
+            if wait:
+                self._wait_durable(sequence)
+        return sequence
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        with self._cond:
+            self._cond.notify_all()
+            self._wait_durable(self._queued)
+
+    def _wait_durable(self, sequence):
+        while self._durable < sequence and self._error is None:
+            self._cond.wait()
+        if self._error is not None:
+            raise RuntimeError("audit writer failed") from self._error
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("audit writer failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and not self._closing:
+                        self._cond.wait()
+                    if not self._queue and self._closing:
+                        break
+                # Let concurrent callers pile up briefly so one fsync covers them
+                if len(self._queue) < self.batch_events and not self._closing:
+                    time.sleep(self.flush_interval)
+                batch = []
+                while self._queue and len(batch) < self.batch_events:
+                    batch.append(self._queue.popleft())
+                self._write(batch)
+                with self._cond:
+                    self._durable += len(batch)
+                    self._cond.notify_all()
+            self._seal_active()
+        except BaseException as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def _write(self, batch):
+        chunks = []
+        offset = self._file.tell() if self._file is not None else 0
+        for event in batch:
+            day = day_string(event["ts"] // MS_PER_DAY).replace("-", "")
+            if self._file is None or day != self._day or offset >= self.segment_bytes:
+                self._commit(chunks)
+                chunks = []
+                self._rotate(day)
+                offset = 0
+            data = encode(event)
+            self._index.add(event, offset, len(data))
+            chunks.append(data)
+            offset += len(data)
+        self._commit(chunks)
+        self.batches += 1
+
+    def _commit(self, chunks):
+        if not chunks or self._file is None:
+            return
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _rotate(self, day):
+        self._seal_active()
+        self._sequence += 1
+        self._day = day
+        self._path = self.log_dir / f"seg-{day}-{self._sequence:06d}.log"
+        self._file = open(self._path, "ab")
+        self._index = SegmentIndex()
+
+    def _seal_active(self):
+        if self._file is None:
+            return
+        self._file.close()
+        seal(self._path, self._index)
+        self._file = None
+
+
+def check_reader(role):
+    if role != READER_ROLE:
+        raise AccessDenied(f"Access Denied: only {READER_ROLE} may read the audit log (got {role})")
+
+
+def load_index(path):
+    index_path = Path(f"{path}.idx")
+    if not index_path.exists():
+        return None
+    return json.loads(index_path.read_text(encoding="utf-8"))
+
+
+def query(log_dir, reader_role, user=None, role=None, type=None, since_ms=None, until_ms=None, stats=None):
+    """Yield matching events in segment order; stats counts segments/blocks/bytes read.
+
+    Segments and blocks that cannot match (by time range, user, role or
+    type in their index) are never read. The active segment of a running
+    writer has no index yet and is scanned whole.
+    """
+    check_reader(reader_role)
+    stats = stats if stats is not None else {}
+    stats.update(segments=0, segments_read=0, blocks_read=0, bytes_read=0)
+    wanted = {"user": user, "role": role, "type": type}
+
+    def matches(event):
+        return (
+            all(value is None or event.get(field) == value for field, value in wanted.items())
+            and (since_ms is None or event["ts"] >= since_ms)
+            and (until_ms is None or event["ts"] < until_ms)
+        )
+
+    for path in segments(log_dir):
+        stats["segments"] += 1
+        index = load_index(path)
+        if index is None:
+            stats["segments_read"] += 1
+            stats["bytes_read"] += path.stat().st_size
+            yield from (event for _, _, event in scan_segment(path) if matches(event))
+            continue
+        if not index["count"]:
+            continue
+        if (since_ms is not None and index["last_ms"] < since_ms) or (until_ms is not None and index["first_ms"] >= until_ms):
+            continue
+        candidates = set(range(len(index["blocks"])))
+        for field, value in wanted.items():
+            if value is not None:
+                candidates &= set(index["keys"][field].get(str(value), []))
+        candidates = [
+            b for b in sorted(candidates)
+            if (since_ms is None or index["blocks"][b][2] >= since_ms)
+            and (until_ms is None or index["blocks"][b][1] < until_ms)
+        ]
+        if not candidates:
+            continue
+        stats["segments_read"] += 1
+        with open(path, "rb") as f:
+            for b in candidates:
+                start = index["blocks"][b][0]
+                end = index["blocks"][b + 1][0] if b + 1 < len(index["blocks"]) else index["bytes"]
+                f.seek(start)
+                data = f.read(end - start)
+                stats["blocks_read"] += 1
+                stats["bytes_read"] += len(data)
+                for line in data.splitlines():
+                    event = json.loads(line)
+                    if matches(event):
+                        yield event
+
+
+def access_report(log_dir, reader_role, since_ms, until_ms):
+    """Monthly access pattern rows: events by user, role and type."""
+    counts = collections.Counter()
+    for event in query(log_dir, reader_role, since_ms=since_ms, until_ms=until_ms):
+        counts[(event["user"], event["role"], event["type"])] += 1
+    return [
+        {"user": user, "role": role, "type": type, "events": n}
+        for (user, role, type), n in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
+
+def drop_expired(log_dir, retention_days, now=None):
+    """Delete whole sealed segments older than the retention window; return their paths."""
+    cutoff = (now if now is not None else now_ms()) - retention_days * MS_PER_DAY
+    dropped = []
+    for path in segments(log_dir):
+        index = load_index(path)
+        if index is None:
+            continue
+        last_ms = index["last_ms"]
+        if last_ms is None:
+            # Empty segment (crash before its first write): its day is all we know
+            day = segment_day(path)
+            last_ms = date_ms(f"{day[:4]}-{day[4:6]}-{day[6:]}") + MS_PER_DAY - 1
+        if last_ms < cutoff:
+            Path(f"{path}.idx").unlink()
+            path.unlink()
+            dropped.append(path)
+    return dropped
+
+
+def date_ms(value):
+    return day_number(value) * MS_PER_DAY
+
+
+def bench(log_dir, events, threads, sync):
+    """log() latency and throughput with group commit (or one fsync per event)."""
+    latency = Histogram()
+    per_thread = events // threads
+    options = {"batch_events": 1, "flush_interval": 0} if sync else {}
+    started = time.perf_counter()
+    with AuditLog(log_dir, **options) as log:
+        def worker(t):
+            clock = time.perf_counter_ns
+            for i in range(per_thread):
+                before = clock()
+                log.log("bi_query", f"u-{(t * 7919 + i) % 500:03d}", "CLIENT_VIEWER", scope="client:ACME",
+                        client_id="ACME", wait=sync, sql="SELECT ... FROM AggAdherenceWeekly", filters={"drugClass": "Diabetes"})
+                latency.record(clock() - before)
+
+        pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        log.flush()
+        batches = log.batches
+    elapsed = time.perf_counter() - started
+    p50, p99 = latency.quantiles([0.5, 0.99])
+    total = per_thread * threads
+    print(f"✓ {total:,} events from {threads} threads in {elapsed:.2f}s: {total / elapsed:,.0f} events/s, "
+          f"{batches:,} fsyncs, log() p50 {p50 / 1000:.1f} µs / p99 {p99 / 1000:.1f} µs"
+          + (" (fsync per event)" if sync else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append-only audit log")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = sub.add_parser("query", help="Events matching user/role/type/time")
+    report_parser = sub.add_parser("report", help="Monthly access patterns by user and role")
+    for p in (query_parser, report_parser):
+        p.add_argument("--log", required=True, help="Audit log directory")
+        p.add_argument("--as-role", required=True, help=f"Requesting role (must be {READER_ROLE})")
+    query_parser.add_argument("--user", help="User id")
+    query_parser.add_argument("--role", help="Role of the acting user")
+    query_parser.add_argument("--type", choices=EVENT_TYPES, help="Event type")
+    query_parser.add_argument("--since", help="From date (YYYY-MM-DD, inclusive)")
+    query_parser.add_argument("--until", help="To date (YYYY-MM-DD, exclusive)")
+    query_parser.add_argument("--limit", type=int, default=100, help="Events to print")
+    report_parser.add_argument("--month", required=True, help="Month (YYYY-MM)")
+
+    retention_parser = sub.add_parser("retention", help="Drop segments past the retention window")
+    retention_parser.add_argument("--log", required=True, help="Audit log directory")
+    retention_parser.add_argument("--days", type=int, default=DEMO_RETENTION_DAYS,
+                                  help=f"Retention in days ({DEMO_RETENTION_DAYS} demo, {PRODUCTION_RETENTION_DAYS} production)")
+
+    append_parser = sub.add_parser("append", help="Append JSON-lines events from stdin")
+    append_parser.add_argument("--log", required=True, help="Audit log directory")
+
+    bench_parser = sub.add_parser("bench", help="Measure log() latency and throughput")
+    bench_parser.add_argument("--log", required=True, help="Scratch audit log directory")
+    bench_parser.add_argument("--events", type=int, default=200_000, help="Events to log")
+    bench_parser.add_argument("--threads", type=int, default=8, help="Logging threads")
+    bench_parser.add_argument("--sync", action="store_true", help="Baseline: wait for an fsync per event")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "query":
+        stats = {}
+        events = query(args.log, args.as_role, args.user, args.role, args.type,
+                       date_ms(args.since) if args.since else None, date_ms(args.until) if args.until else None, stats)
+        shown = 0
+        for shown, event in enumerate(events, start=1):
+            if shown <= args.limit:
+                print(json.dumps({**event, "ts": ms_string(event["ts"])}))
+        print(f"✓ {shown:,} events; read {stats['segments_read']}/{stats['segments']} segments, "
+              f"{stats['blocks_read']} blocks, {stats['bytes_read'] / 1e6:.1f} MB "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    elif args.command == "report":
+        first = date_ms(f"{args.month}-01")
+        year, month = map(int, args.month.split("-"))
+        last = date_ms(f"{year + month // 12:04d}-{month % 12 + 1:02d}-01")
+        for row in access_report(args.log, args.as_role, first, last):
+            print(f"  {row['user']:<24} {row['role']:<14} {row['type']:<14} {row['events']:>8,}")
+    elif args.command == "retention":
+        dropped = drop_expired(args.log, args.days)
+        print(f"✓ Dropped {len(dropped)} segments older than {args.days} days")
+    elif args.command == "append":
+        count = 0
+        with AuditLog(args.log) as log:
+            for line in sys.stdin:
+                if line.strip():
+                    event = json.loads(line)
+                    log.log(**event)
+                    count += 1
+        print(f"✓ Appended {count:,} events")
+    elif args.command == "bench":
+        bench(args.log, args.events, args.threads, args.sync)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Scale-tiered benchmark suite against the NFR targets.
+
+requirements/non_functional.md sets the numbers: dashboard p95 <3 s with
+≥50 concurrent users (NFR-1), a nightly refresh inside the 24 h SLA, and
+5M+ members / 100M+ claims (NFR-4). For each tier (1K, 100K, 1M, 5M members)
+this generates a seeded dataset, times every pipeline stage on it:
+
+    adherence   load fact_claims, compute PDC/MPR, write the snapshot
+    rules       notification rules over the current vs prior snapshot
+    rollup      refresh two weeks of AggAdherenceWeekly
+    load        bulk load DimClient, DimMember, FactAdherence, FactNotification
+    export      columnar segment append + full masked member-list export
+
+and then runs the KPI queries the dashboard issues (tiles, drug class
+breakdown, 12-week trend, worst-member drill-down) from N concurrent users,
+each on its own SQLite connection, recording p50/p95/p99 latency.
+
+Results are one JSON document per run. Checks compare them with the NFR
+targets and, given --baseline (an earlier results file), with the previous
+run: a stage or query p95 more than TOLERANCE slower than its baseline (and
+by more than NOISE_FLOOR_S) is a regression. Any failed check exits 1, so
+the suite can gate a release.
+
+Datasets are cached under --work per tier and seed; the bulk load target is
+a copy of --db-template, an empty database created by `npm run db:push`.
+
+Usage:
+    python -m pipeline.bench run --tiers 1k,100k --db-template apps/web/prisma/dev.db \\
+        --work data/bench --out data/bench/results.json [--baseline data/bench/baseline.json]
+    python -m pipeline.bench compare data/bench/results.json data/bench/baseline.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import adherence_rows as snapshot_rows
+from pipeline.adherence import compute_adherence, load_adherence
+from pipeline.columnar import ColumnStore, encode_snapshot
+from pipeline.export import export_chunks, peak_rss_mb
+from pipeline.generate import generate
+from pipeline.load import adherence_rows, bulk_load, client_rows, member_rows, notification_rows
+from pipeline.rls import scope_for
+from pipeline.rollup import member_rows as worst_members
+from pipeline.rollup import query, refresh
+from pipeline.rules import evaluate
+from pipeline.tables import COLUMNS, day_string, load_claims, load_members, write_rows
+
+RESULTS_VERSION = 1
+
+TIERS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "5m": 5_000_000}
+
+# requirements/non_functional.md
+NFR_DASHBOARD_P95_S = 3.0
+NFR_CONCURRENT_USERS = 50
+NFR_REFRESH_SLA_S = 24 * 3600
+NFR_MEMBERS = 5_000_000
+NFR_CLAIMS = 100_000_000
+
+# Regression vs baseline: relative slowdown allowed, and an absolute floor
+# below which timing noise on small tiers is ignored
+TOLERANCE = 0.25
+NOISE_FLOOR_S = 0.1
+
+QUERIES_PER_USER = 20
+
+BENCH_MASK_KEY = b"bench-only-mask-key"
+
+
+def dataset(work, tier, seed):
+    """Generate the tier's dataset under work unless a matching one is cached.
+
+    Returns (data_dir, generate seconds or None if cached).
+    """
+    data_dir = Path(work) / tier / "data"
+    marker = data_dir / "bench_dataset.json"
+    wanted = {"members": TIERS[tier], "seed": seed}
+    if marker.exists() and json.loads(marker.read_text()) == wanted:
+        return data_dir, None
+    started = time.perf_counter()
+    generate(data_dir, TIERS[tier], seed=seed)
+    marker.write_text(json.dumps(wanted))
+    return data_dir, time.perf_counter() - started
+
+
+class StageTimer:
+    """Collects {stage: {seconds, rows, rows_per_s, peak_rss_mb}}."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name, fn, *args):
+        started = time.perf_counter()
+        result, rows = fn(*args)
+        seconds = time.perf_counter() - started
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "rows_per_s": round(rows / seconds) if seconds else None,
+            "peak_rss_mb": round(peak_rss_mb()),
+        }
+        print(f"  {name}: {rows:,} rows in {seconds:.2f}s")
+        return result
+
+
+def run_adherence(data_dir, out_dir):
+    """Current snapshot (timed) plus the prior week's for rules and trends."""
+    claims = load_claims(data_dir / "fact_claims", data_dir / "dim_drug.csv")
+    as_of_day = int(claims.claim_day.max())
+    current = compute_adherence(claims, as_of_day)
+    path = out_dir / "fact_adherence.csv"
+    rows = write_rows(path, COLUMNS["fact_adherence"], snapshot_rows(current, claims.member_ids, claims.drug_classes))
+    prior = compute_adherence(claims, as_of_day - 7)
+    write_rows(out_dir / "fact_adherence_prior.csv", COLUMNS["fact_adherence"],
+               snapshot_rows(prior, claims.member_ids, claims.drug_classes))
+    return (len(claims), path), rows
+
+
+def run_rules(members, current, prior, drug_classes, out_dir):
+    run_at = datetime.datetime.combine(
+        datetime.date.fromisoformat(day_string(current.as_of_day)), datetime.time(6),
+        tzinfo=datetime.timezone.utc,
+    )
+    rows, _ = evaluate(current, prior, members, drug_classes, run_at, set())
+    path = out_dir / "fact_notification.csv"
+    write_rows(path, COLUMNS["fact_notification"], rows)
+    return path, len(current) + len(prior)
+
+
+def run_rollup(db_path, members, snapshots, drug_classes):
+    conn = sqlite3.connect(db_path)
+    try:
+        cells = sum(refresh(conn, snapshot, members, drug_classes) for snapshot in snapshots)
+    finally:
+        conn.close()
+    return cells, sum(len(snapshot) for snapshot in snapshots)
+
+
+def run_load(db_path, data_dir, adherence_path, notification_path):
+    created_ms = int(time.time() * 1000)
+    inserted = bulk_load(db_path, {
+        "DimClient": client_rows(data_dir / "dim_client.csv", created_ms),
+        "DimMember": member_rows(data_dir / "dim_member", created_ms, datetime.date.today()),
+        "FactAdherence": adherence_rows(adherence_path, created_ms),
+        "FactNotification": notification_rows(notification_path),
+    }, replace=True)
+    return inserted, sum(inserted.values())
+
+
+def run_export(store_dir, members, current, drug_classes):
+    shutil.rmtree(store_dir, ignore_errors=True)
+    store = ColumnStore(store_dir)
+    store.append(encode_snapshot(store, current, members, drug_classes), day_string(current.as_of_day))
+    stats = {}
+    for _ in export_chunks(store, scope_for("INTERNAL_OPS"), key=BENCH_MASK_KEY, gzip_output=True, stats=stats):
+        pass
+    return stats, stats["rows"]
+
+
+def dashboard_queries(conn, clients, i):
+    """The i-th query of a user session, cycling through the dashboard mix."""
+    client = clients[i % len(clients)]
+    kind = i % 4
+    if kind == 0:
+        return "tiles", lambda: query(conn, (), {"clientId": client})
+    if kind == 1:
+        return "by_drug_class", lambda: query(conn, ("drugClass",), {"clientId": client})
+    if kind == 2:
+        return "trend_12w", lambda: query(conn, ("weekStart",), {"clientId": client}, weeks=12)
+    return "worst_members", lambda: worst_members(conn, client, limit=100)
+
+
+def percentiles(latencies):
+    values = np.array(latencies)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0, 0, 0)
+    return {"count": len(values), "p50_s": round(float(p50), 4), "p95_s": round(float(p95), 4),
+            "p99_s": round(float(p99), 4), "max_s": round(float(values.max()) if len(values) else 0, 4)}
+
+
+def run_queries(db_path, users, per_user):
+    """Run the query mix from concurrent users; return latency percentiles."""
+    conn = sqlite3.connect(db_path)
+    clients = [client_id for (client_id,) in conn.execute('SELECT id FROM "DimClient" ORDER BY id')]
+    conn.close()
+    start = threading.Barrier(users)
+    latencies = {}
+    lock = threading.Lock()
+
+    def session(user):
+        local = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        timings = []
+        start.wait()
+        for i in range(per_user):
+            kind, run = dashboard_queries(local, clients, user + i)
+            started = time.perf_counter()
+            run()
+            timings.append((kind, time.perf_counter() - started))
+        local.close()
+        with lock:
+            for kind, seconds in timings:
+                latencies.setdefault(kind, []).append(seconds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(session, range(users)))
+    elapsed = time.perf_counter() - started
+    everything = [s for values in latencies.values() for s in values]
+    result = {
+        "users": users,
+        "queries_per_s": round(len(everything) / elapsed, 1) if elapsed else None,
+        "all": percentiles(everything),
+        "by_query": {kind: percentiles(values) for kind, values in sorted(latencies.items())},
+    }
+    print(f"  queries: {len(everything):,} from {users} users, p95 {result['all']['p95_s'] * 1000:.1f} ms")
+    return result
+
+
+def run_tier(tier, work, db_template, seed, users, per_user):
+    print(f"Tier {tier} ({TIERS[tier]:,} members)")
+    data_dir, generate_s = dataset(work, tier, seed)
+    out_dir = Path(work) / tier / "out"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    db_path = out_dir / "bench.db"
+    shutil.copyfile(db_template, db_path)
+
+    timer = StageTimer()
+    n_claims, adherence_path = timer("adherence", run_adherence, data_dir, out_dir)
+    # Snapshot parsing is shared input to the later stages, not part of them
+    members = load_members(data_dir / "dim_member")
+    drug_classes = []
+    current = load_adherence(adherence_path, members.index, drug_classes)
+    prior = load_adherence(out_dir / "fact_adherence_prior.csv", members.index, drug_classes)
+
+    notification_path = timer("rules", run_rules, members, current, prior, drug_classes, out_dir)
+    timer("rollup", run_rollup, db_path, members, [prior, current], drug_classes)
+    timer("load", run_load, db_path, data_dir, adherence_path, notification_path)
+    timer("export", run_export, out_dir / "store", members, current, drug_classes)
+    queries = run_queries(db_path, users, per_user)
+    return {
+        "members": len(members),
+        "claims": n_claims,
+        "adherence_rows": len(current),
+        "generate_s": round(generate_s, 2) if generate_s is not None else None,
+        "stages": timer.stages,
+        "pipeline_s": round(sum(stage["seconds"] for stage in timer.stages.values()), 3),
+        "queries": queries,
+    }
+
+
+def check(checks, name, tier, value, limit, source):
+    passed = value is None or value <= limit
+    checks.append({"check": name, "tier": tier, "value": value, "limit": limit,
+                   "source": source, "status": "pass" if passed else "fail"})
+
+
+def evaluate_checks(results, baseline=None, tolerance=TOLERANCE):
+    """NFR and baseline checks for a results document; returns the check list."""
+    checks = []
+    for tier, run in results["tiers"].items():
+        check(checks, "dashboard_p95_s", tier, run["queries"]["all"]["p95_s"], NFR_DASHBOARD_P95_S, "NFR-1")
+        check(checks, "refresh_s", tier, run["pipeline_s"], NFR_REFRESH_SLA_S, "NFR-1")
+        users = run["queries"]["users"]
+        checks.append({"check": "concurrent_users", "tier": tier, "value": users, "limit": NFR_CONCURRENT_USERS,
+                       "source": "NFR-1", "status": "pass" if users >= NFR_CONCURRENT_USERS else "fail"})
+
+        prior = (baseline or {}).get("tiers", {}).get(tier)
+        if not prior:
+            continue
+        timings = {f"stage.{name}": stage["seconds"] for name, stage in run["stages"].items()}
+        timings["query.p95"] = run["queries"]["all"]["p95_s"]
+        before = {f"stage.{name}": stage["seconds"] for name, stage in prior["stages"].items()}
+        before["query.p95"] = prior["queries"]["all"]["p95_s"]
+        for name, seconds in timings.items():
+            if name in before:
+                limit = max(before[name] * (1 + tolerance), before[name] + NOISE_FLOOR_S)
+                check(checks, name, tier, seconds, round(limit, 4), "baseline")
+
+    # NFR-4 scale is met only once the largest tier has actually been run
+    largest = max(results["tiers"].values(), key=lambda run: run["members"], default=None)
+    for name, key, target in (("scale_members", "members", NFR_MEMBERS), ("scale_claims", "claims", NFR_CLAIMS)):
+        value = largest[key] if largest else 0
+        checks.append({"check": name, "tier": None, "value": value, "limit": target, "source": "NFR-4",
+                       "status": "pass" if value >= target else "not_reached"})
+    return checks
+
+
+def print_checks(checks):
+    failed = [c for c in checks if c["status"] == "fail"]
+    for c in checks:
+        if c["status"] != "pass":
+            mark = "✗" if c["status"] == "fail" else "·"
+            print(f"  {mark} {c['check']} [{c['tier'] or 'all'}]: {c['value']} vs {c['limit']} ({c['source']}, {c['status']})")
+    print(f"{'✗' if failed else '✓'} {len(checks) - len(failed)}/{len(checks)} checks passed")
+    return not failed
+
+
+def write_json(path, document):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scale-tiered pipeline and query benchmarks vs the NFR targets")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run the benchmark tiers and write results JSON")
+    run_parser.add_argument("--tiers", default="1k,100k", help=f"Comma-separated tiers from {list(TIERS)}")
+    run_parser.add_argument("--db-template", required=True, help="Empty web app database (`npm run db:push`)")
+    run_parser.add_argument("--work", default="data/bench", help="Dataset cache and scratch directory")
+    run_parser.add_argument("--seed", type=int, default=42, help="Generator seed")
+    run_parser.add_argument("--users", type=int, default=NFR_CONCURRENT_USERS, help="Concurrent query users")
+    run_parser.add_argument("--queries-per-user", type=int, default=QUERIES_PER_USER, help="Queries per user")
+    run_parser.add_argument("--baseline", help="Previous results JSON to check for regressions")
+    run_parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown vs baseline")
+    run_parser.add_argument("--out", default="data/bench/results.json", help="Results JSON path")
+
+    compare_parser = sub.add_parser("compare", help="Re-check a results file against the NFRs and a baseline")
+    compare_parser.add_argument("results", help="Results JSON")
+    compare_parser.add_argument("baseline", nargs="?", help="Baseline results JSON")
+    compare_parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown vs baseline")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    if args.command == "compare":
+        results = json.loads(Path(args.results).read_text())
+        ok = print_checks(evaluate_checks(results, baseline, args.tolerance))
+        sys.exit(0 if ok else 1)
+
+    tiers = [tier for tier in args.tiers.split(",") if tier]
+    unknown = [tier for tier in tiers if tier not in TIERS]
+    if unknown:
+        parser.error(f"unknown tier(s) {', '.join(unknown)}; expected {list(TIERS)}")
+    if not Path(args.db_template).exists():
+        parser.error(f"{args.db_template} not found; run `npm run db:push` first")
+
+    results = {
+        "version": RESULTS_VERSION,
+        "started_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "seed": args.seed,
+        "host": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                 "cpus": os.cpu_count()},
+        "tiers": {},
+    }
+    for tier in tiers:
+        results["tiers"][tier] = run_tier(tier, args.work, args.db_template, args.seed,
+                                          args.users, args.queries_per_user)
+    results["checks"] = evaluate_checks(results, baseline, args.tolerance)
+    ok = print_checks(results["checks"])
+    results["passed"] = ok
+    write_json(args.out, results)
+    print(f"✓ Wrote {args.out}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
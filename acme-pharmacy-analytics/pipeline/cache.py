@@ -0,0 +1,218 @@
+"""
+RLS-scoped query result cache.
+
+Many users at the same client issue identical KPI queries. Results are cached
+under (normalized query, parameters, effective RLS scope) — never the user —
+so users sharing a scope share entries and no entry can be served across
+clients.
+
+Entries are bounded by count and approximate bytes with LRU eviction, expire
+after a TTL, and are invalidated wholesale when the nightly refresh publishes
+a new generation number: an entry stamped with an older generation is a
+miss. Counters track hits, misses, evictions, expirations and invalidations.
+
+Usage:
+    # At the end of the nightly refresh
+    python -m pipeline.cache publish --generation-file data/cache_generation
+"""
+
+import argparse
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pipeline import rollup
+from pipeline.rls import scoped_filters
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 15 * 60
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Canonical form of a SQL string: collapsed whitespace, lowercase
+    outside string literals, no trailing semicolon."""
+    parts = _STRING_LITERAL.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else _WHITESPACE.sub(" ", part).lower()
+        for i, part in enumerate(parts)
+    )
+
+
+class GenerationFile:
+    """Generation number stored in a small file; publish() bumps it.
+
+    Readers re-read the file only when its mtime changes.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mtime = None
+        self._value = 0
+
+    def __call__(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        if mtime != self._mtime:
+            self._value = int(self.path.read_text().strip() or 0)
+            self._mtime = mtime
+        return self._value
+
+    def publish(self):
+        """Atomically increment the generation; return the new value."""
+        value = self() + 1
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(f"{value}\n")
+        os.replace(tmp, self.path)
+        return value
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class _Entry:
+    value: object
+    size: int
+    expires_at: float
+    generation: int
+
+
+@dataclass
+class QueryCache:
+    max_entries: int = DEFAULT_MAX_ENTRIES
+    max_bytes: int = DEFAULT_MAX_BYTES
+    ttl_seconds: float = DEFAULT_TTL_SECONDS
+    generation: object = lambda: 0  # callable returning the published generation
+    stats: CacheStats = field(default_factory=CacheStats)
+
+    def __post_init__(self):
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(sql, params, scope):
+        """Cache key: normalized query, parameters and RLS scope."""
+        return normalize_sql(sql), tuple(params or ()), scope.key
+
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) on a miss."""
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return False, None
+            if entry.generation != generation:
+                self._drop(key)
+                self.stats.invalidations += 1
+                self.stats.misses += 1
+                return False, None
+            if entry.expires_at <= time.monotonic():
+                self._drop(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return True, entry.value
+
+    def put(self, key, value, size=None, generation=None):
+        """Store a result. Pass the generation read before computing it: a
+        result computed across a publish is dropped instead of being stamped
+        with the new generation."""
+        current = self.generation()
+        if generation is None:
+            generation = current
+        elif generation != current:
+            return
+        size = size if size is not None else len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        entry = _Entry(value, size, time.monotonic() + self.ttl_seconds, generation)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.stats.evictions += 1
+
+    def get_or_compute(self, sql, params, scope, compute):
+        """Return the cached result for the query in scope, computing it on a miss."""
+        key = self.key(sql, params, scope)
+        generation = self.generation()
+        hit, value = self.get(key)
+        if hit:
+            return value
+        value = compute()
+        self.put(key, value, generation=generation)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def cached_cube_query(cache, conn, scope, group_by=(), filters=None, weeks=1):
+    """rollup.query under an RLS scope, served from the cache when possible.
+
+    The scope is applied to the filters first (raising AccessDenied for
+    out-of-scope requests), and the key is the canonical cube query plus scope.
+    """
+    filters = scoped_filters(scope, filters)
+    sql = f"cube group_by={','.join(group_by)} weeks={weeks}"
+    params = tuple(sorted(filters.items()))
+    return cache.get_or_compute(sql, params, scope, lambda: rollup.query(conn, group_by, filters, weeks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query result cache maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    publish_parser = sub.add_parser("publish", help="Bump the generation, invalidating all cached results")
+    publish_parser.add_argument("--generation-file", required=True, help="Generation file shared with readers")
+    args = parser.parse_args()
+
+    generation = GenerationFile(args.generation_file).publish()
+    print(f"✓ Published cache generation {generation}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Bitmap-indexed cohort builder for outreach segmentation.
+
+Every member attribute value and every bucket of a derived measure has a
+bitmap over member positions (one bit per member, 64 members per word):
+
+    client=ACME  plan=plan-3  risk_band=High  gender=F  age=65-74
+    days_since_fill=31-60                      from fact_claims
+    pdc_90=60-70           any drug class in the band (fact_adherence)
+    pdc_90.Diabetes=60-70  that drug class in the band
+
+A cohort is an AND / OR / NOT expression over these terms, with bucket
+ranges on band boundaries as shorthand:
+
+    risk_band=High AND pdc_90.Diabetes<80 AND NOT plan=plan-3
+    (days_since_fill>=61 OR pdc_90<60) AND client=ACME
+
+so resolving a cohort is a handful of word-wise bitwise ops and a popcount
+over 5M / 64 words - well under a millisecond per operator. Bitmaps are
+stored compressed (npz) and loaded lazily per term.
+
+Member positions come from an append-only member id dictionary, so they
+never move. The nightly refresh only rebuilds bitmap families whose source
+changed (dim_member, the adherence snapshot, claims), folds only claims
+newer than the last refresh into each member's last fill day, and
+recomputes the date-relative families (age, days_since_fill) for the new
+as-of date. Saved cohorts are stored as expressions and re-evaluated
+against the current bitmaps.
+
+Usage:
+    python -m pipeline.cohorts refresh --store data/cohort_index --members data/dim_member \\
+        --snapshot data/fact_adherence.csv --claims data/fact_claims
+    python -m pipeline.cohorts query --store data/cohort_index "risk_band=High AND pdc_90<80" --by client
+    python -m pipeline.cohorts save --store data/cohort_index --name high_risk_lapsed "risk_band=High AND days_since_fill>=61"
+    python -m pipeline.cohorts run --store data/cohort_index --name high_risk_lapsed --out data/high_risk_lapsed.csv
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import load_adherence
+from pipeline.columnar import PDC_BANDS, Dictionary
+from pipeline.tables import day_number, day_string, load_claims, read_columns, table_files, write_rows
+
+MEMBER_ATTRIBUTES = {"client": "client_id", "plan": "plan_id", "risk_band": "risk_band", "gender": "gender"}
+
+# Lower bounds of each bucketed measure's bands; the last band is open-ended
+BUCKETS = {
+    "pdc_90": PDC_BANDS,
+    "days_since_fill": [0, 31, 61, 91],
+    "age": [0, 18, 45, 65, 75],
+}
+
+# Whole-number measures get inclusive labels (31-60); PDC bands are [lo, hi)
+WHOLE_NUMBER_BUCKETS = {"days_since_fill", "age"}
+
+_TOKEN = re.compile(r"\s*(\(|\)|[A-Za-z_][\w.]*(?:>=|<|=)[^\s()]+|\S+)")
+_TERM = re.compile(r"([A-Za-z_][\w.]*)(>=|<|=)(.+)")
+
+
+def bucket_labels(measure):
+    bounds = BUCKETS[measure]
+    top = 1 if measure in WHOLE_NUMBER_BUCKETS else 0
+    return [f"{lo}-{hi - top}" for lo, hi in zip(bounds, bounds[1:])] + [f"{bounds[-1]}+"]
+
+
+def to_bitmap(mask):
+    """Boolean member mask -> uint64 words (bit i of the bitmap = member i)."""
+    packed = np.packbits(mask, bitorder="little")
+    padded = np.zeros(-(-len(packed) // 8) * 8, dtype=np.uint8)
+    padded[:len(packed)] = packed
+    return padded.view(np.uint64)
+
+
+def popcount(words):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def positions(words, n):
+    """Member positions set in a bitmap."""
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), count=n, bitorder="little"))
+
+
+def fingerprint(path):
+    """Cheap change detector for a table path: (name, size, mtime) per file."""
+    if not path:
+        return None
+    return [[f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in table_files(path)]
+
+
+def parse(expression):
+    """Parse a cohort expression into nested ("and" | "or" | "not" | "term", ...) tuples."""
+    tokens = [t for t in _TOKEN.findall(expression) if t]
+    pos = 0
+
+    def peek():
+        return tokens[pos].upper() if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def either():
+        node = both()
+        while peek() == "OR":
+            take()
+            node = ("or", node, both())
+        return node
+
+    def both():
+        node = negated()
+        while peek() == "AND":
+            take()
+            node = ("and", node, negated())
+        return node
+
+    def negated():
+        if peek() == "NOT":
+            take()
+            return ("not", negated())
+        if peek() == "(":
+            take()
+            node = either()
+            if peek() != ")":
+                raise ValueError(f"expected ')' in cohort expression {expression!r}")
+            take()
+            return node
+        if peek() is None:
+            raise ValueError(f"unexpected end of cohort expression {expression!r}")
+        token = take()
+        match = _TERM.fullmatch(token)
+        if not match:
+            raise ValueError(f"bad term {token!r} in cohort expression; expected name=value, name<x or name>=x")
+        return ("term", *match.groups())
+
+    node = either()
+    if pos != len(tokens):
+        raise ValueError(f"unexpected {tokens[pos]!r} in cohort expression {expression!r}")
+    return node
+
+
+class CohortIndex:
+    """Bitmap index over member positions, persisted in a store directory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.members = Dictionary(self.path / "members.txt")
+        self.values = {name: Dictionary(self.path / "values" / f"{name}.txt") for name in MEMBER_ATTRIBUTES}
+        meta_path = self.path / "meta.json"
+        self.meta = json.loads(meta_path.read_text()) if meta_path.exists() else {"families": {}, "sources": {}}
+        self.arrays = {}
+        if (self.path / "attributes.npz").exists():
+            with np.load(self.path / "attributes.npz") as data:
+                self.arrays = {name: data[name] for name in data.files}
+        self._stored = np.load(self.path / "bitmaps.npz") if (self.path / "bitmaps.npz").exists() else None
+        self._bitmaps = {}
+
+    def __len__(self):
+        return len(self.members.values)
+
+    @property
+    def words(self):
+        return -(-len(self) // 64)
+
+    @property
+    def as_of_day(self):
+        return self.meta.get("as_of_day")
+
+    def bitmap(self, name):
+        """Words of one bitmap (all zeros for a value no member has)."""
+        if name not in self._bitmaps:
+            words = np.zeros(self.words, dtype=np.uint64)
+            if self._stored is not None and name in self._stored.files:
+                stored = self._stored[name]
+                words[:len(stored)] = stored
+            self._bitmaps[name] = words
+        return self._bitmaps[name]
+
+    def universe(self):
+        return to_bitmap(np.ones(len(self), dtype=bool))
+
+    def _array(self, name, fill):
+        """Per-member array, padded with fill for members added since it was built."""
+        array = self.arrays.get(name, np.empty(0, dtype=np.int32))
+        if len(array) < len(self):
+            array = np.concatenate([array, np.full(len(self) - len(array), fill, dtype=np.int32)])
+        self.arrays[name] = array
+        return array
+
+    def _set_family(self, family, labels, masks):
+        """Replace every bitmap of a family."""
+        for label in self.meta["families"].get(family, []):
+            self._bitmaps.pop(f"{family}={label}", None)
+        for label, mask in zip(labels, masks):
+            self._bitmaps[f"{family}={label}"] = to_bitmap(mask)
+        self.meta["families"][family] = list(labels)
+
+    def _code_family(self, family, codes, labels):
+        self._set_family(family, labels, [codes == k for k in range(len(labels))])
+
+    def _bucket_family(self, family, values, valid):
+        measure = family.split(".")[0]
+        band = np.searchsorted(np.asarray(BUCKETS[measure]), values, side="right") - 1
+        band = np.where(valid & (band >= 0), band, -1)
+        self._code_family(family, band, bucket_labels(measure))
+
+    def refresh(self, members_path=None, snapshot_path=None, claims_path=None, drugs_path=None, as_of_day=None):
+        """Rebuild what changed since the last refresh; return rebuilt family names."""
+        sources = self.meta["sources"]
+        rebuilt = []
+
+        if members_path and fingerprint(members_path) != sources.get("members"):
+            columns = ["member_id", *MEMBER_ATTRIBUTES.values(), "dob"]
+            rows = {name: [] for name in columns}
+            for row in read_columns(members_path, columns):
+                for name, value in zip(columns, row):
+                    rows[name].append(value)
+            code = np.array([self.members.encode(m) for m in rows["member_id"]], dtype=np.int64)
+            for name, column in MEMBER_ATTRIBUTES.items():
+                array = self._array(name, -1)
+                array[code] = [self.values[name].encode(v) for v in rows[column]]
+                self._code_family(name, array, self.values[name].values)
+                rebuilt.append(name)
+            self._array("dob", -1)[code] = [day_number(d) for d in rows["dob"]]
+            sources["members"] = fingerprint(members_path)
+
+        if snapshot_path and fingerprint(snapshot_path) != sources.get("snapshot"):
+            drug_classes = []
+            snapshot = load_adherence(snapshot_path, self.members.codes, drug_classes)
+            masks = {}
+            for c, drug_class in enumerate(drug_classes):
+                rows = snapshot.drug_class == c
+                values = np.full(len(self), np.nan)
+                values[snapshot.member[rows]] = snapshot.pdc_90[rows]
+                masks[drug_class] = values
+            # Member is in an "any class" band if any of their classes is
+            labels = bucket_labels("pdc_90")
+            band = np.searchsorted(np.asarray(BUCKETS["pdc_90"]), snapshot.pdc_90, side="right") - 1
+            any_masks = []
+            for b in range(len(labels)):
+                mask = np.zeros(len(self), dtype=bool)
+                mask[snapshot.member[band == b]] = True
+                any_masks.append(mask)
+            for family in [f for f in self.meta["families"] if f.startswith("pdc_90.")]:
+                self._set_family(family, [], [])
+                del self.meta["families"][family]
+            self._set_family("pdc_90", labels, any_masks)
+            for drug_class, values in masks.items():
+                self._bucket_family(f"pdc_90.{drug_class}", values, ~np.isnan(values))
+            rebuilt.extend(["pdc_90", *(f"pdc_90.{c}" for c in masks)])
+            sources["snapshot"] = fingerprint(snapshot_path)
+            as_of_day = as_of_day or snapshot.as_of_day
+
+        if claims_path and fingerprint(claims_path) != sources.get("claims"):
+            if not drugs_path:
+                raise ValueError("refreshing from claims needs the dim_drug path")
+            claims = load_claims(claims_path, drugs_path)
+            since = self.meta.get("claims_as_of", -1)
+            newer = claims.claim_day > since
+            to_code = np.array([self.members.codes.get(m, -1) for m in claims.member_ids], dtype=np.int64)
+            code = to_code[claims.member[newer]]
+            known = code >= 0
+            last_fill = self._array("last_fill", -1)
+            np.maximum.at(last_fill, code[known], claims.claim_day[newer][known].astype(np.int32))
+            if newer.any():
+                self.meta["claims_as_of"] = int(claims.claim_day.max())
+            sources["claims"] = fingerprint(claims_path)
+            as_of_day = as_of_day or self.meta.get("claims_as_of")
+            rebuilt.append("last_fill")
+
+        as_of_day = as_of_day or self.as_of_day
+        if as_of_day is not None and (rebuilt or as_of_day != self.as_of_day):
+            last_fill = self._array("last_fill", -1)
+            self._bucket_family("days_since_fill", as_of_day - last_fill, last_fill >= 0)
+            dob = self._array("dob", -1)
+            self._bucket_family("age", (as_of_day - dob) // 365.25, dob >= 0)
+            rebuilt.extend(["days_since_fill", "age"])
+            self.meta["as_of_day"] = int(as_of_day)
+        return rebuilt
+
+    def save(self):
+        """Persist dictionaries, arrays, bitmaps and meta (each via temp + rename)."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.members.flush()
+        for dictionary in self.values.values():
+            dictionary.flush()
+        names = [f"{family}={label}" for family, labels in self.meta["families"].items() for label in labels]
+        bitmaps = {name: self.bitmap(name) for name in names}
+        for target, arrays, saver in (
+            ("bitmaps.npz", bitmaps, np.savez_compressed),
+            ("attributes.npz", {n: self._array(n, -1) for n in self.arrays}, np.savez),
+        ):
+            tmp = self.path / f".{target}.tmp.npz"
+            saver(tmp, **arrays)
+            os.replace(tmp, self.path / target)
+        tmp = self.path / ".meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta, indent=2))
+        os.replace(tmp, self.path / "meta.json")
+
+    def evaluate(self, expression):
+        """Bitmap of the members matching a cohort expression."""
+        return self._evaluate(parse(expression) if isinstance(expression, str) else expression)
+
+    def _evaluate(self, node):
+        op = node[0]
+        if op == "and":
+            return self._evaluate(node[1]) & self._evaluate(node[2])
+        if op == "or":
+            return self._evaluate(node[1]) | self._evaluate(node[2])
+        if op == "not":
+            return self.universe() & ~self._evaluate(node[1])
+        _, family, comparison, value = node
+        labels = self.meta["families"].get(family)
+        if labels is None:
+            raise ValueError(f"unknown cohort attribute {family!r}; known: {sorted(self.meta['families'])}")
+        if comparison == "=":
+            return self.bitmap(f"{family}={value}").copy()
+
+        bounds = BUCKETS.get(family.split(".")[0])
+        if bounds is None:
+            raise ValueError(f"{family} is not a bucketed attribute; use {family}=value")
+        threshold = float(value)
+        if threshold not in bounds[1:]:
+            raise ValueError(f"{family}{comparison}{value}: threshold must be a band boundary {bounds[1:]}")
+        result = np.zeros(self.words, dtype=np.uint64)
+        for lo, label in zip(bounds, labels):
+            if (lo < threshold) == (comparison == "<"):
+                result |= self.bitmap(f"{family}={label}")
+        return result
+
+    def breakdown(self, words, family):
+        """{label: count} of a cohort by one attribute family."""
+        return {
+            label: popcount(words & self.bitmap(f"{family}={label}"))
+            for label in self.meta["families"].get(family, [])
+        }
+
+    def member_ids(self, words, limit=None):
+        found = positions(words, len(self))
+        if limit is not None:
+            found = found[:limit]
+        return [self.members.values[i] for i in found.tolist()]
+
+    def saved_cohorts(self):
+        path = self.path / "cohorts.json"
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def save_cohort(self, name, expression):
+        """Validate and store a cohort definition; return its current count."""
+        count = popcount(self.evaluate(expression))
+        cohorts = self.saved_cohorts()
+        cohorts[name] = {"expression": expression, "count": count, "as_of_date": day_string(self.as_of_day)}
+        tmp = self.path / ".cohorts.json.tmp"
+        tmp.write_text(json.dumps(cohorts, indent=2))
+        os.replace(tmp, self.path / "cohorts.json")
+        return count
+
+
+def print_cohort(index, words, by, limit, started):
+    count = popcount(words)
+    print(f"{count:,} members ({(time.perf_counter() - started) * 1000:.2f} ms, as of {day_string(index.as_of_day)})")
+    if by:
+        for label, n in index.breakdown(words, by).items():
+            if n:
+                print(f"  {by}={label}: {n:,}")
+    if limit:
+        print("  " + ", ".join(index.member_ids(words, limit)) + (" ..." if count > limit else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitmap-indexed cohort builder")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = sub.add_parser("refresh", help="Incrementally rebuild the bitmap index")
+    refresh_parser.add_argument("--members", help="dim_member CSV file or part directory")
+    refresh_parser.add_argument("--snapshot", help="fact_adherence snapshot")
+    refresh_parser.add_argument("--claims", help="fact_claims (only claims newer than the last refresh are used)")
+    refresh_parser.add_argument("--drugs", help="dim_drug CSV file (required with --claims)")
+    refresh_parser.add_argument("--as-of", help="As-of date (YYYY-MM-DD); default: snapshot or latest claim date")
+
+    query_parser = sub.add_parser("query", help="Evaluate a cohort expression")
+    query_parser.add_argument("expression", help='e.g. "risk_band=High AND pdc_90<80 AND NOT plan=plan-3"')
+
+    save_parser = sub.add_parser("save", help="Save a named cohort definition")
+    save_parser.add_argument("--name", required=True, help="Cohort name")
+    save_parser.add_argument("expression", help="Cohort expression")
+
+    run_parser = sub.add_parser("run", help="Re-evaluate saved cohorts (all, or --name)")
+    run_parser.add_argument("--name", help="Cohort name")
+    run_parser.add_argument("--out", help="Write the member ids to a CSV (with --name)")
+
+    for p in (refresh_parser, query_parser, save_parser, run_parser):
+        p.add_argument("--store", required=True, help="Index directory")
+    for p in (query_parser, run_parser):
+        p.add_argument("--by", help="Break counts down by an attribute, e.g. client or pdc_90")
+        p.add_argument("--limit", type=int, default=0, help="Show the first N member ids")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = CohortIndex(args.store)
+    if args.command == "refresh":
+        as_of_day = day_number(args.as_of) if args.as_of else None
+        rebuilt = index.refresh(args.members, args.snapshot, args.claims, args.drugs, as_of_day)
+        index.save()
+        print(f"✓ {len(index):,} members; rebuilt {', '.join(rebuilt) or 'nothing (no changes)'} "
+              f"in {time.perf_counter() - started:.1f}s")
+    elif args.command == "query":
+        print_cohort(index, index.evaluate(args.expression), args.by, args.limit, time.perf_counter())
+    elif args.command == "save":
+        count = index.save_cohort(args.name, args.expression)
+        print(f"✓ Saved cohort {args.name}: {count:,} members")
+    else:
+        cohorts = index.saved_cohorts()
+        names = [args.name] if args.name else sorted(cohorts)
+        for name in names:
+            if name not in cohorts:
+                raise SystemExit(f"No saved cohort {name!r}")
+            began = time.perf_counter()
+            words = index.evaluate(cohorts[name]["expression"])
+            print(f"{name}: {cohorts[name]['expression']}  (was {cohorts[name]['count']:,} "
+                  f"as of {cohorts[name]['as_of_date']})")
+            print_cohort(index, words, args.by, args.limit, began)
+            if args.out and args.name:
+                count = write_rows(args.out, ["member_id"], ({"member_id": m} for m in index.member_ids(words)))
+                print(f"✓ Wrote {count:,} member ids to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Memory-mapped columnar store for fact_adherence.
+
+Layout:
+
+    store/
+      dict/member_id.txt         one value per line; code = line number
+      dict/client_id.txt
+      dict/drug_class.txt
+      dict/plan_id.txt
+      segments/2025-10-19/       one immutable segment per as_of_date
+        member_id.npy            int32 dictionary codes
+        client_id.npy            uint16 dictionary codes
+        drug_class.npy           uint8 dictionary codes
+        plan_id.npy              uint16 dictionary codes
+        pdc_90.npy               float32
+        pdc_180.npy              float32
+        mpr_90.npy               float32
+
+Each column is a fixed-width .npy file opened with mmap_mode="r", so a reader
+gets zero-copy NumPy views and a scan touches only the columns it asks for:
+a PDC-band histogram over 15M rows reads pdc_90 and drug_class (75 MB), not
+the whole table. Dictionaries are append-only, so codes never change once
+written. The nightly job appends a new segment (written to a temp directory,
+then renamed) and never rewrites history.
+
+Usage:
+    python -m pipeline.columnar append --store data/adherence_store \\
+        --members data/dim_member --snapshot data/fact_adherence.csv
+    python -m pipeline.columnar info --store data/adherence_store
+    python -m pipeline.columnar histogram --store data/adherence_store
+"""
+
+import argparse
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import load_adherence
+from pipeline.tables import day_string, load_members
+
+DICTIONARY_COLUMNS = ["member_id", "client_id", "drug_class", "plan_id"]
+
+COLUMN_DTYPES = {
+    "member_id": np.int32,
+    "client_id": np.uint16,
+    "drug_class": np.uint8,
+    "plan_id": np.uint16,
+    "pdc_90": np.float32,
+    "pdc_180": np.float32,
+    "mpr_90": np.float32,
+}
+
+# Lower bounds of the PDC bands shown on the Adherence Deep Dive page
+PDC_BANDS = [0, 60, 70, 80, 90]
+
+
+class Dictionary:
+    """Append-only value <-> code mapping backed by a text file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.values = self.path.read_text(encoding="utf-8").splitlines() if self.path.exists() else []
+        self.codes = {value: i for i, value in enumerate(self.values)}
+        self.pending = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.pending.append(value)
+        return code
+
+    def flush(self):
+        if self.pending:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(value + "\n" for value in self.pending))
+            self.pending = []
+
+
+class Segment:
+    """One as_of_date of fact_adherence; columns are memory-mapped lazily."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.as_of_date = self.path.name
+        self._columns = {}
+
+    def column(self, name):
+        """Zero-copy read-only view of a column."""
+        if name not in self._columns:
+            self._columns[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def __len__(self):
+        return len(self.column("pdc_90"))
+
+
+class ColumnStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._dictionaries = {}
+
+    def dictionary(self, name):
+        """Values for a dictionary-encoded column, indexed by code."""
+        if name not in self._dictionaries:
+            self._dictionaries[name] = Dictionary(self.path / "dict" / f"{name}.txt")
+        return self._dictionaries[name]
+
+    def segment_dates(self):
+        segments = self.path / "segments"
+        if not segments.exists():
+            return []
+        return sorted(p.name for p in segments.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+    def segment(self, as_of_date=None):
+        """Open a segment by date (default: latest)."""
+        dates = self.segment_dates()
+        if not dates:
+            raise FileNotFoundError(f"no segments in {self.path}")
+        as_of_date = as_of_date or dates[-1]
+        if as_of_date not in dates:
+            raise FileNotFoundError(f"no segment for {as_of_date} in {self.path}")
+        return Segment(self.path / "segments" / as_of_date)
+
+    def append(self, columns, as_of_date):
+        """Write a new immutable segment from encoded column arrays.
+
+        Raises FileExistsError if the date already has a segment.
+        """
+        target = self.path / "segments" / as_of_date
+        if target.exists():
+            raise FileExistsError(f"segment {as_of_date} already exists in {self.path}")
+        for name in DICTIONARY_COLUMNS:
+            self.dictionary(name).flush()
+
+        staging = self.path / "segments" / f".{as_of_date}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for name, dtype in COLUMN_DTYPES.items():
+            np.save(staging / f"{name}.npy", np.ascontiguousarray(columns[name], dtype=dtype))
+        os.replace(staging, target)
+        return Segment(target)
+
+
+def encode_snapshot(store, snapshot, members, drug_classes):
+    """Translate a snapshot's codes into the store's dictionary codes."""
+    def recode(name, values):
+        dictionary = store.dictionary(name)
+        codes = np.array([dictionary.encode(v) for v in values], dtype=np.int64)
+        # Codes are stored narrow; one value too many would wrap onto code 0
+        limit = np.iinfo(COLUMN_DTYPES[name]).max
+        if len(dictionary.values) - 1 > limit:
+            raise ValueError(f"{name} has {len(dictionary.values):,} distinct values; "
+                             f"{np.dtype(COLUMN_DTYPES[name]).name} codes hold at most {limit + 1:,}")
+        return codes
+
+    # Map each distinct code once, then gather per row
+    member_codes = recode("member_id", members.member_ids)
+    client_codes = recode("client_id", members.clients)
+    plan_codes = recode("plan_id", members.plans)
+    class_codes = recode("drug_class", drug_classes)
+    m = snapshot.member
+    return {
+        "member_id": member_codes[m],
+        "client_id": client_codes[members.client[m]],
+        "drug_class": class_codes[snapshot.drug_class],
+        "plan_id": plan_codes[members.plan[m]],
+        "pdc_90": snapshot.pdc_90,
+        "pdc_180": snapshot.pdc_180,
+        "mpr_90": snapshot.mpr_90,
+    }
+
+
+def pdc_histogram(segment, bands=PDC_BANDS, column="pdc_90"):
+    """Row counts per PDC band per drug class code; reads two columns only."""
+    band = np.searchsorted(np.asarray(bands, dtype=np.float32), segment.column(column), side="right") - 1
+    drug_class = segment.column("drug_class").astype(np.int64)
+    n_classes = int(drug_class.max()) + 1 if len(drug_class) else 0
+    counts = np.bincount(drug_class * len(bands) + band, minlength=n_classes * len(bands))
+    return counts.reshape(n_classes, len(bands))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped columnar store for fact_adherence")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    append_parser = sub.add_parser("append", help="Append a fact_adherence snapshot as a new segment")
+    append_parser.add_argument("--store", required=True, help="Store directory")
+    append_parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+    append_parser.add_argument("--snapshot", required=True, help="fact_adherence snapshot (one as_of_date)")
+
+    info_parser = sub.add_parser("info", help="List segments")
+    info_parser.add_argument("--store", required=True, help="Store directory")
+
+    hist_parser = sub.add_parser("histogram", help="PDC band histogram by drug class")
+    hist_parser.add_argument("--store", required=True, help="Store directory")
+    hist_parser.add_argument("--as-of", help="Segment date (default: latest)")
+    args = parser.parse_args()
+
+    store = ColumnStore(args.store)
+    started = time.perf_counter()
+    if args.command == "append":
+        members = load_members(args.members)
+        drug_classes = []
+        snapshot = load_adherence(args.snapshot, members.index, drug_classes)
+        as_of_date = day_string(snapshot.as_of_day)
+        segment = store.append(encode_snapshot(store, snapshot, members, drug_classes), as_of_date)
+        print(f"✓ Appended segment {as_of_date}: {len(segment):,} rows in {time.perf_counter() - started:.1f}s")
+    elif args.command == "info":
+        for as_of_date in store.segment_dates():
+            segment = store.segment(as_of_date)
+            size = sum(f.stat().st_size for f in segment.path.iterdir())
+            print(f"{as_of_date}: {len(segment):,} rows, {size / 1e6:.1f} MB")
+    else:
+        segment = store.segment(args.as_of)
+        counts = pdc_histogram(segment)
+        classes = store.dictionary("drug_class").values
+        labels = [f"{lo}-{hi}%" for lo, hi in zip(PDC_BANDS, PDC_BANDS[1:] + [100])]
+        print(f"Segment {segment.as_of_date} ({len(segment):,} rows)")
+        print(f"{'drug_class':<14}" + "".join(f"{label:>10}" for label in labels))
+        for code, row in enumerate(counts):
+            print(f"{classes[code]:<14}" + "".join(f"{n:>10,}" for n in row))
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
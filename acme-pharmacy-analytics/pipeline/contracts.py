@@ -0,0 +1,846 @@
+"""
+Data-contract validator generated from data_contracts/schemas.md (FR-1.3).
+
+The contract tables in schemas.md are parsed into executable rules, one per
+column constraint:
+
+    not_null    NOT NULL, or PRIMARY KEY
+    type        INTEGER, DECIMAL(p,s) and DATE values parse (STRING always does)
+    range       "1-90", "≥0" style bounds on numeric columns
+    domain      value lists: "paid, denied, pending" in Constraints, or a
+                Description that is only a list ("M, F, Other", "Brand or Generic")
+    unique      PRIMARY KEY
+    fk          "FK to dim_x" in the Description, against dim_x's keys
+
+Incoming files are read in blocks of CHUNK_BYTES and split into fields with
+NumPy byte operations, never a Python object per field, so every rule runs
+vectorized over a whole block. Keys are reduced to 64-bit FNV-1a hashes: FK
+checks probe the sorted hash set of the dimension's keys (8 bytes per key
+rather than a set of strings), and uniqueness keeps (hash, row) pairs in
+memory up to memory_mb, then spills them to disk partitioned by hash prefix
+and checks one partition at a time. Two distinct 100M-key columns collide
+on a 64-bit hash with odds of about 1 in 3,700, and a reported duplicate
+names both lines, so it can be confirmed.
+
+Each table's contract is fingerprinted, and so is each file's observed
+schema (header plus the type its values parse as). The state file keeps the
+fingerprints of the last run, so a changed contract or file schema is
+reported as drift alongside missing columns, unexpected columns and type
+changes, and drift raises "Schema Drift" notifications for the ops
+dashboard's drift log.
+
+Usage:
+    python -m pipeline.contracts rules
+    python -m pipeline.contracts validate --data data --tables fact_claims dim_member \\
+        [--state data/contract_state.json] [--report data/contract_report.json] [--memory-mb 512] \\
+        [--out data/drift_notifications.csv] [--db apps/web/prisma/dev.db]
+"""
+
+import argparse
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.feeds import notification, parse_now
+from pipeline.load import bulk_load, notification_rows
+from pipeline.metrics import stage
+from pipeline.rules import recent_alerts
+from pipeline.tables import COLUMNS, table_files, write_rows
+
+DEFAULT_SCHEMAS = "../acme-pharmacy-analytics-spec/data_contracts/schemas.md"
+
+CHUNK_BYTES = 8 * 1024 * 1024
+MEMORY_MB = 512
+SAMPLES = 5
+# Rows of each file's first chunk used to infer its observed column types,
+# and the share of them a type must parse: a few bad values are rule
+# violations, a column that mostly no longer parses is drift
+INFER_ROWS = 10_000
+TYPE_SHARE = 0.95
+# Uniqueness spill partitions (top hash bits); 100M keys are ~25 MB each
+SPILL_BITS = 6
+
+DRIFT_RULE = {
+    "rule_key": "schema_drift",
+    "severity": "High",
+    "owner": "INTERNAL_OPS",
+    "sla_hours": 8,
+    "recommended_action": "Diff the file against data_contracts/schemas.md; hold the load and ask the source "
+                          "to re-send, or update the contract if the change is agreed (playbook: Schema Drift)",
+}
+
+# Drift that makes files unfit to load (exit 1); the rest alerts only
+BLOCKING_DRIFT = {"missing_columns", "type_change", "mixed_file_schemas"}
+
+_HEADING = re.compile(r"^#{2,}\s+(\w+)\s*$")
+_DECIMAL = re.compile(r"^DECIMAL\((\d+),\s*(\d+)\)$")
+_RANGE = re.compile(r"^(-?\d+(?:\.\d+)?)\s*-\s*(-?\d+(?:\.\d+)?)$")
+_BOUND = re.compile(r"^(≥|>=|≤|<=|>|<)\s*(-?\d+(?:\.\d+)?)$")
+_FK = re.compile(r"\bFK to (\w+)")
+_VALUE_LIST = re.compile(r"^[\w-]+(?:\s*,\s*[\w-]+)+$|^[\w-]+ or [\w-]+$")
+_KEYWORDS = re.compile(r"\b(PRIMARY KEY|NOT NULL|UNIQUE)\b")
+
+_COMPARE = {
+    "≥": np.greater_equal, ">=": np.greater_equal, ">": np.greater,
+    "≤": np.less_equal, "<=": np.less_equal, "<": np.less,
+}
+
+# Which observed value types each contract type accepts
+_ACCEPTS = {
+    "STRING": {"STRING", "INTEGER", "DECIMAL", "DATE", "EMPTY"},
+    "INTEGER": {"INTEGER", "EMPTY"},
+    "DECIMAL": {"INTEGER", "DECIMAL", "EMPTY"},
+    "DATE": {"DATE", "EMPTY"},
+}
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# A row reference packs (file index, line number) for samples and duplicates
+_LINE_BITS = 40
+_PAIR = np.dtype([("hash", "<u8"), ("ref", "<i8")])
+
+
+@dataclass
+class Rule:
+    """One executable check on one contract column."""
+
+    table: str
+    column: str
+    kind: str
+    detail: str = ""
+    arg: object = None
+
+    @property
+    def id(self):
+        return f"{self.table}.{self.column}.{self.kind}"
+
+
+@dataclass
+class Contract:
+    """A table's columns from schemas.md, their rules and fingerprint."""
+
+    table: str
+    columns: list
+    rules: list = field(default_factory=list)
+    unparsed: list = field(default_factory=list)
+
+    @property
+    def names(self):
+        return [column["column"] for column in self.columns]
+
+    def type_of(self, name):
+        return base_type(next(c["type"] for c in self.columns if c["column"] == name))
+
+    @property
+    def key(self):
+        """The PRIMARY KEY column, if any."""
+        return next((rule.column for rule in self.rules if rule.kind == "unique"), None)
+
+    @property
+    def fingerprint(self):
+        canonical = json.dumps([[c["column"], c["type"].upper(), c.get("constraints", "")] for c in self.columns])
+        return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def base_type(type_text):
+    """STRING, INTEGER, DECIMAL or DATE for a schemas.md type."""
+    return type_text.upper().split("(")[0].strip()
+
+
+def parse_schemas(text):
+    """{table: Contract} for every markdown table under a table heading."""
+    contracts = {}
+    table, labels = None, None
+    for line in text.splitlines():
+        heading = _HEADING.match(line)
+        if heading:
+            table, labels = heading.group(1), None
+            continue
+        if table is None or not line.startswith("|"):
+            continue
+        cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+        if labels is None:
+            labels = [cell.lower() for cell in cells]
+        elif not set(cells[0]) <= set("-: "):
+            contracts.setdefault(table, Contract(table, [])).columns.append(dict(zip(labels, cells)))
+    for contract in contracts.values():
+        contract.rules, contract.unparsed = contract_rules(contract.table, contract.columns)
+    return contracts
+
+
+def load_contracts(path=DEFAULT_SCHEMAS):
+    return parse_schemas(Path(path).read_text(encoding="utf-8"))
+
+
+def contract_rules(table, columns):
+    """Rules for one table's columns, plus constraint texts that were not understood."""
+    rules, unparsed = [], []
+    for column in columns:
+        name, type_text = column["column"], column["type"].upper()
+        description, constraints = column.get("description", ""), column.get("constraints", "")
+        keywords = set(_KEYWORDS.findall(f"{constraints} {description}".upper()))
+        rest = _KEYWORDS.sub("", constraints).strip(" ,")
+
+        if keywords & {"PRIMARY KEY", "NOT NULL"}:
+            rules.append(Rule(table, name, "not_null"))
+        kind, scale = base_type(type_text), 0
+        if kind == "DECIMAL":
+            match = _DECIMAL.match(type_text)
+            precision, scale = (int(match.group(1)), int(match.group(2))) if match else (18, 6)
+            rules.append(Rule(table, name, "type", type_text, (kind, precision, scale)))
+        elif kind in ("INTEGER", "DATE"):
+            rules.append(Rule(table, name, "type", type_text, (kind, 18, 0)))
+        elif kind != "STRING":
+            unparsed.append(f"{table}.{name}: type {type_text}")
+        # Bounds compare the value parsed as a number at the column's scale
+        number = ("INTEGER", 0) if kind == "INTEGER" else ("DECIMAL", scale if kind == "DECIMAL" else 6)
+        if keywords & {"PRIMARY KEY", "UNIQUE"}:
+            rules.append(Rule(table, name, "unique"))
+        fk = _FK.search(description) or _FK.search(constraints)
+        if fk:
+            rules.append(Rule(table, name, "fk", fk.group(1), fk.group(1)))
+
+        range_match, bound = _RANGE.match(rest), _BOUND.match(rest)
+        if range_match:
+            low, high = float(range_match.group(1)), float(range_match.group(2))
+            rules.append(Rule(table, name, "range", rest, ([(">=", low), ("<=", high)], *number)))
+        elif bound:
+            rules.append(Rule(table, name, "range", rest, ([(bound.group(1), float(bound.group(2)))], *number)))
+        elif rest and _VALUE_LIST.match(rest):
+            rules.append(domain_rule(table, name, rest))
+        elif rest:
+            unparsed.append(f"{table}.{name}: {rest}")
+        elif _VALUE_LIST.match(description):
+            rules.append(domain_rule(table, name, description))
+    return rules, unparsed
+
+
+def domain_rule(table, name, text):
+    values = [v.strip() for v in re.split(r",| or ", text) if v.strip()]
+    return Rule(table, name, "domain", ", ".join(values), np.array([v.encode() for v in values]))
+
+
+class Chunk:
+    """One block of a table file split into fields, as offsets into a byte buffer.
+
+    starts and ends are (rows, columns) offsets; lines holds each row's line
+    number in the file. Column matrices and parsed numbers are cached, since
+    several rules read the same column.
+    """
+
+    def __init__(self, header, buf, starts, ends, lines, bad_lines):
+        self.header = header
+        self.buf = buf
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+        self.bad_lines = bad_lines
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.lines)
+
+    def head(self, rows):
+        return Chunk(self.header, self.buf, self.starts[:rows], self.ends[:rows], self.lines[:rows], self.bad_lines)
+
+    def matrix(self, name):
+        """(rows, width) uint8 matrix of a column's bytes, zero padded, and the widths."""
+        if name not in self._cache:
+            j = self.header.index(name)
+            starts, widths = self.starts[:, j], self.ends[:, j] - self.starts[:, j]
+            width = max(int(widths.max(initial=0)), 1)
+            dtype = np.int32 if len(self.buf) < 2**31 - width else np.int64
+            offsets = np.arange(width, dtype=dtype)
+            index = starts.astype(dtype)[:, None] + offsets
+            np.minimum(index, max(len(self.buf) - 1, 0), out=index)
+            mat = self.buf[index] if len(self.buf) else np.zeros((len(self), width), dtype=np.uint8)
+            mat *= offsets < widths[:, None]
+            self._cache[name] = (mat, widths)
+        return self._cache[name]
+
+    def values(self, name, rows):
+        """Decoded values of a column at some row positions."""
+        j = self.header.index(name)
+        return [bytes(self.buf[self.starts[r, j]:self.ends[r, j]]).decode("utf-8", "replace") for r in rows]
+
+    def parsed(self, name, kind, scale=0):
+        """(valid, value) arrays for a column read as INTEGER, DECIMAL or DATE."""
+        key = (name, kind, scale)
+        if key not in self._cache:
+            mat, widths = self.matrix(name)
+            self._cache[key] = parse_dates(mat, widths) if kind == "DATE" else parse_numbers(mat, widths, kind, scale)
+        return self._cache[key]
+
+
+def split_block(block, ncols):
+    """Split a block of whole CSV lines into (buf, starts, ends, line offsets, bad line offsets).
+
+    Blocks without quotes are split with byte comparisons only. Quoted
+    fields go through the csv module and are re-packed into a buffer of
+    unquoted values; fields spanning lines are not supported.
+    """
+    if b'"' in block:
+        return split_quoted(block, ncols)
+    buf = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate([[0], newlines[:-1] + 1])
+    commas = np.flatnonzero(buf == 44)
+    if len(commas) == len(newlines) * (ncols - 1):
+        # The usual case: every line has ncols - 1 commas and none is blank
+        grid = commas.reshape(-1, ncols - 1)
+        if ncols == 1 or ((grid[:, 0] > line_starts).all() and (grid[:, -1] < newlines).all()):
+            return fields_of(buf, line_starts, grid, newlines, np.arange(len(newlines)), np.empty(0, dtype=np.int64))
+    comma_line = np.searchsorted(newlines, commas)
+    fields = np.bincount(comma_line, minlength=len(newlines)) + 1
+    blank = newlines - line_starts <= (buf[np.maximum(newlines - 1, 0)] == 13)
+    good = (fields == ncols) & ~blank
+    commas = commas[good[comma_line]].reshape(-1, ncols - 1)
+    return fields_of(buf, line_starts[good], commas, newlines[good], np.flatnonzero(good), np.flatnonzero(~good & ~blank))
+
+
+def fields_of(buf, line_starts, commas, newlines, lines, bad):
+    starts = np.column_stack([line_starts, commas + 1])
+    ends = np.column_stack([commas, newlines])
+    ends[:, -1] -= (buf[np.maximum(ends[:, -1] - 1, 0)] == 13) & (ends[:, -1] > starts[:, -1])
+    return buf, starts, ends, lines, bad
+
+
+def split_quoted(block, ncols):
+    values, lengths, good, bad = [], [], [], []
+    for i, row in enumerate(csv.reader(io.StringIO(block.decode("utf-8", "replace"), newline=""))):
+        if not row:
+            continue
+        if len(row) != ncols:
+            bad.append(i)
+            continue
+        encoded = [value.encode() for value in row]
+        values.extend(encoded)
+        lengths.extend(map(len, encoded))
+        good.append(i)
+    buf = np.frombuffer(b"".join(values), dtype=np.uint8)
+    ends = np.cumsum(np.array(lengths, dtype=np.int64)).reshape(-1, ncols)
+    starts = ends - np.array(lengths, dtype=np.int64).reshape(-1, ncols)
+    return buf, starts, ends, np.array(good, dtype=np.int64), np.array(bad, dtype=np.int64)
+
+
+def file_chunks(file, chunk_bytes=CHUNK_BYTES):
+    """Yield Chunks of whole lines from one CSV (or .csv.gz) file."""
+    opener = gzip.open if str(file).endswith(".gz") else open
+    with opener(file, "rb") as f:
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        first_line = 2
+        carry = b""
+        while True:
+            data = f.read(chunk_bytes)
+            block = carry + data
+            if not data:
+                if not block:
+                    break
+                block += b"\n"
+                carry = b""
+            else:
+                cut = block.rfind(b"\n") + 1
+                block, carry = block[:cut], block[cut:]
+                if not block:
+                    continue
+            buf, starts, ends, lines, bad = split_block(block, len(header))
+            yield Chunk(header, buf, starts, ends, lines + first_line, bad + first_line)
+            first_line += block.count(b"\n")
+            if not data:
+                break
+
+
+def key_hashes(mat, widths):
+    """64-bit FNV-1a hash of each row's bytes, with a murmur finalizer to mix the high bits."""
+    h = np.full(len(mat), _FNV_OFFSET, dtype=np.uint64)
+    for j in range(mat.shape[1]):
+        step = (h ^ mat[:, j]) * _FNV_PRIME
+        h = np.where(j < widths, step, h)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xC4CEB9FE1A85EC53)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def parse_numbers(mat, widths, kind="DECIMAL", scale=0):
+    """(valid, value, integer digits) for decimal text: -?digits(.digits)?, at most scale decimals.
+
+    Values are exact integers scaled by 10**scale, built digit by digit.
+    """
+    inside = np.arange(mat.shape[1]) < widths[:, None]
+    digit = (mat - np.uint8(48)) <= 9
+    dot = (mat == 46) & inside
+    sign = mat[:, 0] == 45
+    dots = dot.sum(axis=1)
+    dot_at = np.where(dots > 0, dot.argmax(axis=1), widths)
+    decimals = np.where(dots > 0, widths - dot_at - 1, 0)
+    int_digits = dot_at - sign
+    ok = digit | dot | ~inside
+    ok[:, 0] |= sign
+    valid = ok.all(axis=1) & (dots <= 1) & (int_digits + decimals > 0) & (decimals <= scale)
+    valid &= (int_digits + scale <= 18) & ((dots == 0) | (decimals > 0))
+    if kind == "INTEGER":
+        valid &= dots == 0
+    value = np.zeros(len(mat), dtype=np.int64)
+    for j in range(mat.shape[1]):
+        step = inside[:, j] & digit[:, j]
+        value = np.where(step, value * 10 + (mat[:, j] - np.uint8(48)), value)
+    value *= 10 ** np.clip(scale - decimals, 0, 18)
+    return valid, np.where(sign, -value, value), int_digits
+
+
+def parse_dates(mat, widths):
+    """(valid, days since 1970-01-01) for YYYY-MM-DD text."""
+    mat = mat[:, :10] if mat.shape[1] >= 10 else np.pad(mat, ((0, 0), (0, 10 - mat.shape[1])))
+    digits = (mat - np.uint8(48)).astype(np.int64)
+    positions = [0, 1, 2, 3, 5, 6, 8, 9]
+    valid = (widths == 10) & (mat[:, 4] == 45) & (mat[:, 7] == 45) & (digits[:, positions] <= 9).all(axis=1)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+    valid &= (month >= 1) & (month <= 12)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid &= (day >= 1) & (day <= _DAYS_IN_MONTH[np.where(valid, month, 0)] + (leap & (month == 2)))
+    text = np.where(valid[:, None], mat, np.frombuffer(b"1970-01-01", dtype=np.uint8))
+    days = np.ascontiguousarray(text).view("S10").ravel().astype("datetime64[D]").astype(np.int64)
+    return valid, days
+
+
+def observed_type(chunk, name):
+    """The narrowest type at least TYPE_SHARE of a column's non-empty values parse as."""
+    _, widths = chunk.matrix(name)
+    present = widths > 0
+    if not present.any():
+        return "EMPTY"
+    for kind, scale in (("INTEGER", 0), ("DECIMAL", 9), ("DATE", 0)):
+        if chunk.parsed(name, kind, scale)[0][present].mean() >= TYPE_SHARE:
+            return kind
+    return "STRING"
+
+
+class KeySet:
+    """Sorted, unique 64-bit hashes of a dimension's key column."""
+
+    def __init__(self, path, column, chunk_bytes=CHUNK_BYTES):
+        parts = []
+        for file in table_files(path):
+            for chunk in file_chunks(file, chunk_bytes):
+                if column not in chunk.header:
+                    raise ValueError(f"{file}: no {column} column")
+                parts.append(key_hashes(*chunk.matrix(column)))
+        hashes = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+        self.hashes = hashes[np.concatenate([[True], hashes[1:] != hashes[:-1]])] if len(hashes) else hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def missing(self, hashes):
+        """Mask of hashes not in the set."""
+        if not len(self.hashes):
+            return np.ones(len(hashes), dtype=bool)
+        at = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[at] != hashes
+
+
+class UniqueKeys:
+    """(hash, row ref) pairs of a key column, spilled to disk by hash prefix past a memory budget.
+
+    The budget covers the buffer and the sort that checks it, which needs
+    about twice the buffer again, so pairs are buffered up to a third of it.
+    """
+
+    def __init__(self, budget_bytes, spill_dir=None):
+        self.budget = budget_bytes // 3
+        self.spill_dir = spill_dir
+        self.parts = []
+        self.size = 0
+        self.directory = None
+        self.spilled = 0
+
+    def add(self, hashes, refs):
+        pairs = np.empty(len(hashes), dtype=_PAIR)
+        pairs["hash"], pairs["ref"] = hashes, refs
+        self.parts.append(pairs)
+        self.size += pairs.nbytes
+        if self.size > self.budget:
+            self._spill()
+
+    def _spill(self):
+        if self.directory is None:
+            self.directory = Path(tempfile.mkdtemp(prefix="unique-", dir=self.spill_dir))
+        files = [open(self.directory / f"part-{p:03d}.bin", "ab") for p in range(1 << SPILL_BITS)]
+        try:
+            # Part by part, so spilling needs no more than one chunk's pairs on top of the buffer
+            while self.parts:
+                pairs = self.parts.pop()
+                partition = (pairs["hash"] >> np.uint64(64 - SPILL_BITS)).astype(np.int64)
+                order = np.argsort(partition, kind="stable")
+                pairs, bounds = pairs[order], np.searchsorted(partition[order], np.arange((1 << SPILL_BITS) + 1))
+                for p, f in enumerate(files):
+                    pairs[bounds[p]:bounds[p + 1]].tofile(f)
+                self.spilled += len(pairs)
+        finally:
+            for f in files:
+                f.close()
+        self.size = 0
+
+    def duplicates(self):
+        """Yield (ref, first ref) for every repeated key, one partition at a time."""
+        if self.directory is None:
+            groups = [np.concatenate(self.parts)] if self.parts else []
+        else:
+            if self.parts:
+                self._spill()
+            groups = (np.fromfile(path, dtype=_PAIR) for path in sorted(self.directory.iterdir()))
+        try:
+            for pairs in groups:
+                pairs = pairs[np.lexsort((pairs["ref"], pairs["hash"]))]
+                repeat = np.concatenate([[False], pairs["hash"][1:] == pairs["hash"][:-1]])
+                if not repeat.any():
+                    continue
+                first = np.maximum.accumulate(np.where(repeat, 0, np.arange(len(pairs))))
+                yield from zip(pairs["ref"][repeat].tolist(), pairs["ref"][first[repeat]].tolist())
+        finally:
+            if self.directory is not None:
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def table_path(data_dir, table):
+    """A table's file or part directory under a data directory, or None."""
+    for candidate in (Path(data_dir) / table, Path(data_dir) / f"{table}.csv", Path(data_dir) / f"{table}.csv.gz"):
+        if candidate.exists():
+            return candidate
+    return None
+
+
+class Results:
+    """Per-rule violation counts and a few sample rows each."""
+
+    def __init__(self, files):
+        self.files = files
+        self.rules = {}
+
+    def add_rule(self, rule_id, kind, column, detail=""):
+        self.rules.setdefault(rule_id, {"rule": rule_id, "kind": kind, "column": column, "detail": detail,
+                                        "status": "pass", "violations": 0, "samples": []})
+
+    def skip(self, rule_id, reason):
+        self.rules[rule_id].update(status="skipped", reason=reason)
+
+    def missing_from(self, rule_id, file):
+        result = self.rules[rule_id]
+        result["missing_from"] = result.get("missing_from", []) + [file.name]
+        if len(result["missing_from"]) == len(self.files):
+            self.skip(rule_id, "column missing from every file")
+
+    def record(self, rule_id, file_index, chunk, mask, column=None, **extra):
+        count = int(np.count_nonzero(mask))
+        if not count:
+            return
+        result = self.rules[rule_id]
+        result["violations"] += count
+        result["status"] = "fail"
+        room = SAMPLES - len(result["samples"])
+        if room > 0:
+            rows = np.flatnonzero(mask)[:room]
+            values = chunk.values(column, rows) if column else [None] * len(rows)
+            for row, value in zip(rows.tolist(), values):
+                result["samples"].append({"file": self.files[file_index].name, "line": int(chunk.lines[row]),
+                                          "value": value, **extra})
+
+    def record_refs(self, rule_id, pairs, total):
+        result = self.rules[rule_id]
+        result["violations"] += total
+        if total:
+            result["status"] = "fail"
+        for ref, first in pairs[:SAMPLES - len(result["samples"])]:
+            result["samples"].append({"file": self.files[ref >> _LINE_BITS].name, "line": ref & ((1 << _LINE_BITS) - 1),
+                                      "duplicate_of": f"{self.files[first >> _LINE_BITS].name}:"
+                                                      f"{first & ((1 << _LINE_BITS) - 1)}"})
+
+
+def check_rule(rule, chunk):
+    """Violation mask of one rule over a chunk (unique and fk are handled by the caller)."""
+    mat, widths = chunk.matrix(rule.column)
+    present = widths > 0
+    if rule.kind == "not_null":
+        return ~present
+    if rule.kind == "type":
+        kind, precision, scale = rule.arg
+        if kind == "DATE":
+            valid = chunk.parsed(rule.column, kind)[0]
+        else:
+            valid, _, int_digits = chunk.parsed(rule.column, kind, scale)
+            valid = valid & (int_digits <= precision - scale)
+        return present & ~valid
+    if rule.kind == "range":
+        bounds, kind, scale = rule.arg
+        valid, value = chunk.parsed(rule.column, kind, scale)[:2]
+        value = value / 10 ** scale
+        ok = np.ones(len(chunk), dtype=bool)
+        for op, bound in bounds:
+            ok &= _COMPARE[op](value, bound)
+        return present & valid & ~ok
+    if rule.kind == "domain":
+        return present & ~np.isin(mat.view(f"S{mat.shape[1]}").ravel(), rule.arg)
+    raise ValueError(f"unknown rule kind {rule.kind}")
+
+
+def schema_drift(contract, header, observed):
+    """Drift findings for one file: missing/unexpected columns and type changes."""
+    drift = []
+    missing = [name for name in contract.names if name not in header]
+    unexpected = [name for name in header if name not in contract.names]
+    if missing:
+        drift.append({"kind": "missing_columns", "columns": missing})
+    if unexpected:
+        drift.append({"kind": "unexpected_columns", "columns": unexpected})
+    for name, kind in observed.items():
+        expected = contract.type_of(name) if name in contract.names else None
+        if expected in _ACCEPTS and kind not in _ACCEPTS[expected]:
+            drift.append({"kind": "type_change", "columns": [name], "expected": expected, "observed": kind})
+    return drift
+
+
+def file_fingerprint(header, observed):
+    return hashlib.sha256(json.dumps([[name, observed.get(name)] for name in header]).encode()).hexdigest()[:16]
+
+
+@stage("contracts")
+def validate(contract, path, data_dir, contracts, memory_mb=MEMORY_MB, chunk_bytes=CHUNK_BYTES, spill_dir=None):
+    """Validate one table's files against its contract; return the report dict."""
+    started = time.perf_counter()
+    files = table_files(path)
+    results = Results(files)
+    results.add_rule(f"{contract.table}.row.shape", "shape", None, f"{len(contract.names)} fields per row")
+    for rule in contract.rules:
+        results.add_rule(rule.id, rule.kind, rule.column, rule.detail)
+
+    key_sets = {}
+    for rule in contract.rules:
+        if rule.kind != "fk" or rule.arg in key_sets:
+            continue
+        dim_path = table_path(data_dir, rule.arg)
+        target = contracts.get(rule.arg)
+        dim_key = (target.key if target else None) or rule.column
+        key_sets[rule.arg] = KeySet(dim_path, dim_key, chunk_bytes) if dim_path else None
+    for rule in contract.rules:
+        if rule.kind == "fk" and key_sets[rule.arg] is None:
+            results.skip(rule.id, f"{rule.arg} not found under {data_dir}")
+
+    unique = {rule.id: UniqueKeys(memory_mb * 1024 * 1024 // max(1, sum(r.kind == "unique" for r in contract.rules)),
+                                  spill_dir)
+              for rule in contract.rules if rule.kind == "unique"}
+    drift, schemas, rows = [], {}, 0
+    for file_index, file in enumerate(files):
+        first = True
+        for chunk in file_chunks(file, chunk_bytes):
+            if first:
+                head = chunk.head(INFER_ROWS)
+                observed = {name: observed_type(head, name) for name in chunk.header}
+                schemas.setdefault(file_fingerprint(chunk.header, observed), []).append(file.name)
+                for finding in schema_drift(contract, chunk.header, observed):
+                    if finding not in drift:
+                        drift.append(finding)
+                active = [rule for rule in contract.rules if rule.column in chunk.header
+                          and results.rules[rule.id]["status"] != "skipped"]
+                for rule in contract.rules:
+                    if rule.column not in chunk.header:
+                        results.missing_from(rule.id, file)
+                first = False
+            rows += len(chunk)
+            if len(chunk.bad_lines):
+                shape = results.rules[f"{contract.table}.row.shape"]
+                shape["violations"] += len(chunk.bad_lines)
+                shape["status"] = "fail"
+                for line in chunk.bad_lines[:SAMPLES - len(shape["samples"])].tolist():
+                    shape["samples"].append({"file": file.name, "line": line})
+            for rule in active:
+                if rule.kind == "unique":
+                    mat, widths = chunk.matrix(rule.column)
+                    unique[rule.id].add(key_hashes(mat, widths)[widths > 0],
+                                        (file_index << _LINE_BITS) + chunk.lines[widths > 0])
+                elif rule.kind == "fk":
+                    mat, widths = chunk.matrix(rule.column)
+                    mask = (widths > 0) & key_sets[rule.arg].missing(key_hashes(mat, widths))
+                    results.record(rule.id, file_index, chunk, mask, rule.column)
+                else:
+                    results.record(rule.id, file_index, chunk, check_rule(rule, chunk), rule.column)
+
+    spilled = 0
+    for rule_id, keys in unique.items():
+        pairs, total = [], 0
+        for pair in keys.duplicates():
+            total += 1
+            if len(pairs) < SAMPLES:
+                pairs.append(pair)
+        results.record_refs(rule_id, pairs, total)
+        spilled += keys.spilled
+    if len(schemas) > 1:
+        drift.append({"kind": "mixed_file_schemas", "files": {fp: names[:SAMPLES] for fp, names in schemas.items()}})
+
+    return {
+        "table": contract.table,
+        "path": str(path),
+        "contract_fingerprint": contract.fingerprint,
+        "file_fingerprints": sorted(schemas),
+        "files": len(files),
+        "rows": rows,
+        "seconds": round(time.perf_counter() - started, 3),
+        "spilled_keys": spilled,
+        "rules": list(results.rules.values()),
+        "drift": drift,
+    }
+
+
+def state_drift(report, state):
+    """Drift since the last run: a changed contract or file schema; updates state in place."""
+    previous = state.get(report["table"])
+    current = {"contract": report["contract_fingerprint"], "files": report["file_fingerprints"]}
+    state[report["table"]] = current
+    drift = []
+    if previous and previous["contract"] != current["contract"]:
+        drift.append({"kind": "contract_changed", "previous": previous["contract"], "current": current["contract"]})
+    if previous and previous["files"] != current["files"]:
+        drift.append({"kind": "file_schema_changed", "previous": previous["files"], "current": current["files"]})
+    return drift
+
+
+def drift_alerts(reports, now, recent):
+    created_at = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    out = []
+    for report in reports:
+        for finding in report["drift"]:
+            entity_ref = f"{report['table']}:{finding['kind']}"
+            if (DRIFT_RULE["rule_key"], entity_ref) in recent:
+                continue
+            recent.add((DRIFT_RULE["rule_key"], entity_ref))
+            if "columns" in finding:
+                detail = ", ".join(finding["columns"])
+            elif "files" in finding:
+                detail = f"{len(finding['files'])} different headers/types across files"
+            else:
+                detail = f"{finding['previous']} → {finding['current']}"
+            message = f"Schema drift in {report['table']}: {finding['kind'].replace('_', ' ')} ({detail})"
+            out.append(notification(DRIFT_RULE, entity_ref, message, created_at))
+    return out
+
+
+def print_report(report):
+    failed = [r for r in report["rules"] if r["status"] == "fail"]
+    print(f"✓ {report['table']}: {report['rows']:,} rows in {report['files']} files, {len(report['rules'])} rules "
+          f"in {report['seconds']:.1f}s ({report['rows'] / max(report['seconds'], 1e-3):,.0f} rows/s), "
+          f"{len(failed)} failing")
+    for result in report["rules"]:
+        if result["status"] == "pass" and not result.get("missing_from"):
+            continue
+        note = result.get("reason") or f"{result['violations']:,} violations"
+        print(f"  {'⚠' if result['status'] == 'fail' else '·'} {result['rule']:<36} {note}")
+        if result.get("missing_from") and result["status"] != "skipped":
+            print(f"      column missing from {', '.join(result['missing_from'][:SAMPLES])}")
+        for sample in result["samples"][:3]:
+            where = f"{sample['file']}:{sample['line']}"
+            if "value" in sample:
+                print(f"      {where} {sample['value']!r}")
+            else:
+                print(f"      {where}" + (f" duplicate of {sample['duplicate_of']}" if "duplicate_of" in sample else ""))
+    for finding in report["drift"]:
+        print(f"  ⚠ drift: {finding['kind']} {json.dumps({k: v for k, v in finding.items() if k != 'kind'})}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Data-contract validator generated from schemas.md")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rules_parser = sub.add_parser("rules", help="Print the rules generated from schemas.md")
+    rules_parser.add_argument("--schemas", default=DEFAULT_SCHEMAS, help="data_contracts/schemas.md")
+
+    validate_parser = sub.add_parser("validate", help="Validate table files against the contract")
+    validate_parser.add_argument("--schemas", default=DEFAULT_SCHEMAS, help="data_contracts/schemas.md")
+    validate_parser.add_argument("--data", required=True, help="Data directory (tables as files or part directories)")
+    validate_parser.add_argument("--tables", nargs="+", help="Tables to validate (default: all found under --data)")
+    validate_parser.add_argument("--state", help="Fingerprint state JSON from the last run (drift detection)")
+    validate_parser.add_argument("--report", help="Write the full report as JSON")
+    validate_parser.add_argument("--memory-mb", type=int, default=MEMORY_MB, help="Uniqueness buffer before spilling")
+    validate_parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES >> 20, help="Bytes read per chunk")
+    validate_parser.add_argument("--spill-dir", help="Spill directory (default: system temp)")
+    validate_parser.add_argument("--now", help="Alert time (ISO datetime, default now UTC)")
+    validate_parser.add_argument("--out", help="Write drift notifications (fact_notification CSV)")
+    validate_parser.add_argument("--db", help="Web app SQLite database: dedup source and insert target")
+    validate_parser.add_argument("--recent", help="Recent fact_notification CSV to dedup against")
+    args = parser.parse_args()
+
+    contracts = load_contracts(args.schemas)
+    if args.command == "rules":
+        for contract in contracts.values():
+            print(f"{contract.table} (fingerprint {contract.fingerprint})")
+            for rule in contract.rules:
+                print(f"  {rule.id:<36} {rule.detail}")
+            for text in contract.unparsed:
+                print(f"  ⚠ not understood: {text}")
+        return
+
+    tables = args.tables or [table for table in contracts if table_path(args.data, table)]
+    unknown = [table for table in tables if table not in contracts]
+    if unknown:
+        known = ", ".join(contracts)
+        parser.error(f"no contract for {', '.join(unknown)} in {args.schemas} (known: {known}; "
+                     f"also in tables.COLUMNS: {', '.join(t for t in COLUMNS if t not in contracts)})")
+
+    state = json.loads(Path(args.state).read_text()) if args.state and Path(args.state).exists() else {}
+    reports = []
+    for table in tables:
+        path = table_path(args.data, table)
+        if path is None:
+            print(f"  · {table}: not found under {args.data}")
+            continue
+        report = validate(contracts[table], path, args.data, contracts, args.memory_mb, args.chunk_mb << 20,
+                          args.spill_dir)
+        report["drift"].extend(state_drift(report, state))
+        print_report(report)
+        reports.append(report)
+
+    if args.state:
+        Path(args.state).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{args.state}.tmp"
+        Path(tmp).write_text(json.dumps(state, indent=2))
+        os.replace(tmp, args.state)
+    if args.report:
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"validated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                       "tables": reports}, f, indent=2)
+    if args.db and not args.out:
+        parser.error("--db needs --out (notifications are loaded from the CSV)")
+    if args.out:
+        now = parse_now(args.now)
+        rows = drift_alerts(reports, now, recent_alerts(now, db_path=args.db, csv_path=args.recent))
+        write_rows(args.out, COLUMNS["fact_notification"], rows)
+        if args.db and rows:
+            bulk_load(args.db, {"FactNotification": notification_rows(args.out)})
+        print(f"✓ {len(rows)} drift notifications → {args.out}")
+
+    failed = any(r["status"] == "fail" for report in reports for r in report["rules"]) or any(
+        finding["kind"] in BLOCKING_DRIFT for report in reports for finding in report["drift"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
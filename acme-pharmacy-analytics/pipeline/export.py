@@ -0,0 +1,228 @@
+"""
+Streaming member-list export with masked IDs (Story 1.2, FR-1.1).
+
+Rows are pulled from a columnar store segment (pipeline.columnar) in chunks
+of chunk_rows, filtered, masked, formatted as CSV and optionally gzipped,
+and handed out one encoded chunk at a time by a generator. Nothing holds
+more than one chunk, so memory is bounded whatever the cohort size; and the
+generator only produces the next chunk when the consumer asks for it, so a
+slow client (an HTTP response body, a pipe) back-pressures the whole
+pipeline instead of buffering the file.
+
+Member IDs are masked deterministically with a keyed BLAKE2b hash: the same
+member always gets the same masked ID under the same key, so outreach teams
+can de-duplicate across exports, but IDs cannot be reversed or joined to
+other data without the key. The key comes from ACME_EXPORT_MASK_KEY or a key
+file and is never defaulted. Exports run under an RLS scope: client roles
+only ever export their own client, and aggregate-only roles (PRODUCT) cannot
+export member lists.
+
+Usage:
+    ACME_EXPORT_MASK_KEY=... python -m pipeline.export --store data/adherence_store \\
+        --role CLIENT_ADMIN --client ACME --drug-class Diabetes --below 80 --out data/acme_diabetes.csv.gz
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import mmap
+import os
+import resource
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.columnar import ColumnStore
+from pipeline.metrics import stage
+from pipeline.rls import AccessDenied, scope_for, scoped_filters
+
+CHUNK_ROWS = 100_000
+
+MASK_KEY_ENV = "ACME_EXPORT_MASK_KEY"
+MASK_PREFIX = "MBR-"
+
+EXPORT_COLUMNS = ["member_key", "client_id", "plan_id", "drug_class", "pdc_90", "pdc_180", "mpr_90", "as_of_date"]
+
+
+def load_mask_key(key_file=None):
+    """Masking key from a key file or ACME_EXPORT_MASK_KEY; raises if neither is set."""
+    key = Path(key_file).read_bytes().strip() if key_file else os.environ.get(MASK_KEY_ENV, "").encode()
+    if not key:
+        raise ValueError(f"no masking key: set {MASK_KEY_ENV} or pass a key file")
+    if len(key) > 64:
+        key = hashlib.sha256(key).digest()
+    return key
+
+
+class MemberIds:
+    """Random access to the store's member_id dictionary without loading it.
+
+    The dictionary file is memory-mapped and only an array of line offsets
+    is kept (4 bytes per member), instead of millions of Python strings.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        newlines = np.flatnonzero(np.frombuffer(self._map, dtype=np.uint8) == ord("\n"))
+        dtype = np.uint32 if len(self._map) < 2**32 else np.int64
+        # starts[i]..starts[i + 1] - 1 is line i (without its newline)
+        self.starts = np.concatenate([[0], newlines + 1]).astype(dtype)
+
+    def lookup(self, codes):
+        """Member ids for an array of codes."""
+        starts, ends = self.starts[codes].tolist(), (self.starts[codes + 1] - 1).tolist()
+        data = self._map
+        return [data[a:b].decode("utf-8") for a, b in zip(starts, ends)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def mask_ids(key, member_ids):
+    """Masked IDs for a chunk of member ids (keyed BLAKE2b, 64 bits)."""
+    blake2b = hashlib.blake2b
+    return [MASK_PREFIX + blake2b(m.encode(), key=key, digest_size=8).hexdigest() for m in member_ids]
+
+
+def csv_field(value):
+    """A value quoted for CSV only when it needs it."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow([value])
+    return buffer.getvalue()
+
+
+def selected_rows(segment, store, filters, below, start, end):
+    """Row positions in [start, end) that match the filters."""
+    keep = np.ones(end - start, dtype=bool)
+    for name, value in filters.items():
+        code = store.dictionary(name).codes.get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        keep &= segment.column(name)[start:end] == code
+    if below is not None:
+        keep &= segment.column("pdc_90")[start:end] < below
+    return np.flatnonzero(keep) + start
+
+
+def export_chunks(store, scope, filters=None, below=None, key=None, as_of_date=None,
+                  gzip_output=False, chunk_rows=CHUNK_ROWS, stats=None):
+    """Yield the export as encoded byte chunks (CSV, or gzip if gzip_output).
+
+    filters uses store column names (client_id, plan_id, drug_class) and is
+    narrowed to the scope first; raises AccessDenied for out-of-scope
+    requests or scopes without member-level access. stats, if given, is a
+    dict updated with rows and bytes as chunks are produced.
+    """
+    if not scope.member_level:
+        raise AccessDenied(f"Access Denied: scope {scope.key} cannot export member-level rows")
+    filters = scoped_filters(scope, filters, client_key="client_id")
+    segment = store.segment(as_of_date)
+    member_ids = MemberIds(store.path / "dict" / "member_id.txt")
+    try:
+        labels = {
+            name: [csv_field(value) for value in store.dictionary(name).values]
+            for name in ("client_id", "plan_id", "drug_class")
+        }
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None
+        stats = stats if stats is not None else {}
+        stats.update(rows=0, bytes=0)
+
+        def emit(text):
+            data = text.encode("utf-8")
+            if compressor is not None:
+                data = compressor.compress(data)
+            stats["bytes"] += len(data)
+            return data
+
+        header = emit(",".join(EXPORT_COLUMNS) + "\n")
+        if header:
+            yield header
+
+        # Labels are quoted once per dictionary value, masked IDs are hex, and
+        # measures are numbers, so rows are formatted without a csv.writer
+        for start in range(0, len(segment), chunk_rows):
+            rows = selected_rows(segment, store, filters, below, start, min(start + chunk_rows, len(segment)))
+            if not len(rows):
+                continue
+            member = mask_ids(key, member_ids.lookup(segment.column("member_id")[rows].astype(np.int64)))
+            client, plan, drug_class = (
+                [labels[name][c] for c in segment.column(name)[rows].tolist()] for name in labels
+            )
+            pdc_90, pdc_180, mpr_90 = (
+                segment.column(name)[rows].tolist() for name in ("pdc_90", "pdc_180", "mpr_90")
+            )
+            as_of = segment.as_of_date
+            text = "".join([
+                f"{m},{c},{p},{d},{a:.2f},{b:.2f},{r:.2f},{as_of}\n"
+                for m, c, p, d, a, b, r in zip(member, client, plan, drug_class, pdc_90, pdc_180, mpr_90)
+            ])
+            stats["rows"] += len(rows)
+            data = emit(text)
+            if data:
+                yield data
+
+        if compressor is not None:
+            tail = compressor.flush()
+            stats["bytes"] += len(tail)
+            yield tail
+    finally:
+        # Also runs when the consumer drops the generator (a client disconnect)
+        member_ids.close()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming masked member-list export")
+    parser.add_argument("--store", required=True, help="Columnar store directory (pipeline.columnar)")
+    parser.add_argument("--as-of", help="Segment date (default: latest)")
+    parser.add_argument("--role", required=True, help="Requesting role, e.g. CLIENT_ADMIN")
+    parser.add_argument("--client", help="Client id (required for client roles; a filter otherwise)")
+    parser.add_argument("--plan", help="plan_id filter")
+    parser.add_argument("--drug-class", help="drug_class filter")
+    parser.add_argument("--below", type=float, help="Only rows with PDC_90 below this value")
+    parser.add_argument("--mask-key-file", help=f"Masking key file (default: ${MASK_KEY_ENV})")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows per streamed chunk")
+    parser.add_argument("--out", required=True, help="Output path (.gz to compress), or - for stdout")
+    args = parser.parse_args()
+
+    scope = scope_for(args.role, client_id=args.client)
+    filters = {name: value for name, value in (
+        ("client_id", args.client), ("plan_id", args.plan), ("drug_class", args.drug_class)) if value}
+    gzip_output = args.out.endswith(".gz")
+    stats = {}
+    started = time.perf_counter()
+    chunks = export_chunks(ColumnStore(args.store), scope, filters, args.below, load_mask_key(args.mask_key_file),
+                           args.as_of, gzip_output, args.chunk_rows, stats)
+    with stage("export"):
+        if args.out == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+            tmp = f"{args.out}.tmp"
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, args.out)
+
+    elapsed = time.perf_counter() - started
+    print(f"✓ Exported {stats['rows']:,} rows ({stats['bytes'] / 1e6:.1f} MB) in {elapsed:.1f}s: "
+          f"{stats['rows'] / elapsed:,.0f} rows/s, {stats['bytes'] / 1e6 / elapsed:.1f} MB/s, "
+          f"peak RSS {peak_rss_mb():.0f} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+"""
+Feed monitoring: latency heatmap and row-count anomalies (FR-1.3, Story 3.1).
+
+Feed manifests record one delivery per line: feed, source (payer or
+upstream system), the business day it covers (data_date), when it arrived,
+and its row count. Manifest files land in a directory, and each run ingests
+only files it has not seen before. Their rows fold into a per-feed x per-day
+grid:
+
+    latency_hours   hours from the end of data_date to the last delivery for it
+    row_count       rows delivered for the day (all parts summed)
+    parts           number of deliveries for the day
+
+The grid is persisted in a small store, so a run costs only the new
+manifests plus array operations over the whole history:
+
+- Status per cell: green < 24 h, yellow 24-48 h, red > 48 h. A feed whose
+  next expected day (from its median cadence) has not arrived is an open
+  cell whose lateness keeps growing.
+- Row counts are scored against the feed's previous WINDOW deliveries with a
+  robust z-score, 0.6745 * (x - median) / MAD. Every feed and every point
+  in history is scored in one batch: deliveries are packed per feed,
+  windowed with sliding_window_view, and sorted along the window axis.
+- Each anomaly carries root-cause hints: a late or split delivery, and other
+  feeds from the same source (or the whole platform) failing the same day.
+
+Latency over 24 h raises "Feed Latency Breach" (Rule 2: Critical,
+INTERNAL_OPS, 4 h SLA), and new anomalies raise "Feed Row Count Anomaly".
+Both are written as fact_notification rows and deduplicated like the rule
+engine's.
+
+Usage:
+    python -m pipeline.feeds simulate --out data/feed_manifests --feeds 300 --days 1095
+    python -m pipeline.feeds run --store data/feed_monitor --manifests data/feed_manifests \\
+        [--db apps/web/prisma/dev.db] [--out data/feed_notifications.csv] [--heatmap-json data/feed_heatmap.json]
+    python -m pipeline.feeds heatmap --store data/feed_monitor --days 14
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from pipeline.columnar import Dictionary
+from pipeline.load import MS_PER_DAY, bulk_load, notification_rows, timestamp_ms
+from pipeline.metrics import stage
+from pipeline.rules import recent_alerts
+from pipeline.tables import COLUMNS, day_number, day_string, read_columns, table_files, write_rows
+
+# Heatmap bands (demo script: green < 24h, yellow 24-48h, red > 48h)
+GREEN_HOURS = 24
+RED_HOURS = 48
+ALERT_HOURS = 24
+STATUSES = ["green", "yellow", "red"]
+
+# Robust z-score over the feed's previous WINDOW deliveries on the same
+# weekday (daily feeds are much lighter at weekends; weekly feeds always
+# land on one weekday anyway)
+SEASON_DAYS = 7
+WINDOW = 12
+MIN_HISTORY = 6
+Z_THRESHOLD = 3.5
+# MAD floor as a fraction of the median. A dozen same-weekday points give a
+# noisy MAD, and steady feeds would turn a 1% wobble into a huge z; with the
+# floor a delivery must be at least ~10% off to reach Z_THRESHOLD
+MAD_FLOOR = 0.02
+# Share of a source's (or all) feeds anomalous on one day that reads as systemic
+SYSTEMIC_SHARE = 0.5
+# Only cells this recent alert; older ones (first ingest, late backfills) are history
+ALERT_LOOKBACK_DAYS = 7
+
+ANOMALY_COLUMNS = ["feed_id", "source", "data_date", "row_count", "expected_rows", "delta_pct", "z", "causes"]
+
+LATENCY_RULE = {
+    "rule_key": "feed_latency_breach",
+    "severity": "Critical",
+    "owner": "INTERNAL_OPS",
+    "sla_hours": 4,
+    "recommended_action": "Contact the feed owner, confirm the delivery ETA, and backfill once received (playbook: Feed Delay Response)",
+}
+ANOMALY_RULE = {
+    "rule_key": "feed_row_count_anomaly",
+    "severity": "High",
+    "owner": "INTERNAL_OPS",
+    "sla_hours": 8,
+    "recommended_action": "Compare against the source's control totals; request a re-send if the delivery is partial",
+}
+
+
+class FeedGrid:
+    """Per-feed x per-day delivery grid, persisted under a store directory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.feeds = Dictionary(self.path / "feeds.txt")
+        meta_path = self.path / "meta.json"
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        self.sources = meta.get("sources", {})
+        self.manifests = meta.get("manifests", {})
+        self.day0 = meta.get("day0")
+        grid_path = self.path / "grid.npz"
+        if grid_path.exists():
+            with np.load(grid_path) as data:
+                self.latency = data["latency"]
+                self.rows = data["rows"]
+                self.parts = data["parts"]
+        else:
+            self.latency = np.empty((0, 0), dtype=np.float32)
+            self.rows = np.empty((0, 0), dtype=np.float64)
+            self.parts = np.empty((0, 0), dtype=np.int16)
+
+    def _fit(self, n_feeds, first_day, last_day):
+        """Grow the arrays to cover n_feeds and [first_day, last_day]."""
+        if self.day0 is None:
+            self.day0 = first_day
+        left = max(self.day0 - first_day, 0)
+        right = max(last_day - (self.day0 + self.latency.shape[1] - 1), 0) if self.latency.shape[1] else last_day - first_day + 1
+        down = n_feeds - self.latency.shape[0]
+        if left or right or down:
+            pad = ((0, down), (left, right))
+            self.latency = np.pad(self.latency, pad, constant_values=np.nan)
+            self.rows = np.pad(self.rows, pad, constant_values=np.nan)
+            self.parts = np.pad(self.parts, pad)
+            self.day0 -= left
+
+    def ingest(self, manifest_dir):
+        """Fold manifest files not seen before into the grid; return (files, touched (feed, day) arrays).
+
+        Manifests are immutable once delivered: a seen file that has since
+        changed is reported and skipped, since re-reading it would count its
+        rows twice. Files are only hashed when their size or mtime moved, so
+        a re-copied but identical manifest is recognised without a re-read
+        of the whole directory every run.
+        """
+        new_files = []
+        for file in table_files(manifest_dir):
+            stat = file.stat()
+            seen = self.manifests.get(file.name)
+            if seen is not None and seen[:2] == [stat.st_size, stat.st_mtime_ns]:
+                continue
+            fingerprint = [stat.st_size, stat.st_mtime_ns, hashlib.sha256(file.read_bytes()).hexdigest()]
+            if seen is None:
+                new_files.append((file, fingerprint))
+            elif seen[2] == fingerprint[2]:
+                self.manifests[file.name] = fingerprint
+            else:
+                print(f"  ⚠ {file.name} changed after it was ingested; skipped")
+
+        feed, day, arrived, count = [], [], [], []
+        for file, _ in new_files:
+            for feed_id, source, data_date, arrived_at, row_count in read_columns(file, COLUMNS["feed_manifest"]):
+                feed.append(self.feeds.encode(feed_id))
+                self.sources.setdefault(feed_id, source)
+                day.append(day_number(data_date))
+                arrived.append(timestamp_ms(arrived_at))
+                count.append(float(row_count))
+        if not feed:
+            for file, fingerprint in new_files:
+                self.manifests[file.name] = fingerprint
+            return len(new_files), (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+        feed, day = np.array(feed, dtype=np.int64), np.array(day, dtype=np.int64)
+        arrived, count = np.array(arrived, dtype=np.int64), np.array(count)
+        self._fit(len(self.feeds.values), int(day.min()), int(day.max()))
+        col = day - self.day0
+        hours = ((arrived - (day + 1) * MS_PER_DAY) / 3_600_000).astype(np.float32)
+
+        # Latency is to the last delivery for the day; row counts add up
+        latency = np.nan_to_num(self.latency, nan=-np.inf)
+        np.maximum.at(latency, (feed, col), hours)
+        self.latency = np.where(np.isneginf(latency), np.nan, latency).astype(np.float32)
+        rows = np.nan_to_num(self.rows)
+        np.add.at(rows, (feed, col), count)
+        np.add.at(self.parts, (feed, col), 1)
+        self.rows = np.where(self.parts > 0, rows, np.nan)
+        for file, fingerprint in new_files:
+            self.manifests[file.name] = fingerprint
+        touched = np.unique(feed * self.latency.shape[1] + col)
+        return len(new_files), np.divmod(touched, self.latency.shape[1])
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.feeds.flush()
+        tmp = self.path / "grid.tmp.npz"
+        np.savez(tmp, latency=self.latency, rows=self.rows, parts=self.parts)
+        os.replace(tmp, self.path / "grid.npz")
+        meta = {"day0": self.day0, "sources": self.sources, "manifests": self.manifests}
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / "meta.json")
+
+
+def latency_status(hours):
+    """Status codes (0 green, 1 yellow, 2 red; -1 no delivery) for latency hours."""
+    status = np.digitize(hours, [GREEN_HOURS, RED_HOURS]).astype(np.int8)
+    return np.where(np.isnan(hours), -1, status)
+
+
+def pack(values):
+    """Pack each row's non-NaN values to the left; return (packed, positions).
+
+    positions[f, k] is the column of feed f's k-th delivery (-1 past the end).
+    """
+    observed = ~np.isnan(values)
+    rank = np.cumsum(observed, axis=1) - 1
+    width = int(observed.sum(axis=1).max()) if observed.size else 0
+    packed = np.full((values.shape[0], width), np.nan)
+    positions = np.full((values.shape[0], width), -1, dtype=np.int64)
+    f, d = np.nonzero(observed)
+    packed[f, rank[f, d]] = values[f, d]
+    positions[f, rank[f, d]] = d
+    return packed, positions
+
+
+def window_median(windows):
+    """Median over the last axis ignoring NaNs (sorted to the end); NaN if empty."""
+    ordered = np.sort(windows, axis=-1)
+    n = (~np.isnan(ordered)).sum(axis=-1)
+    lo = np.take_along_axis(ordered, np.maximum((n - 1) // 2, 0)[..., None], axis=-1)[..., 0]
+    hi = np.take_along_axis(ordered, np.maximum(n // 2, 0)[..., None], axis=-1)[..., 0]
+    return np.where(n > 0, (lo + hi) / 2, np.nan), n
+
+
+def robust_z(rows, window=WINDOW, min_history=MIN_HISTORY):
+    """Rolling robust z-score of every delivery against the feed's previous window deliveries.
+
+    Returns (z, expected) grids shaped like rows; NaN where there is no
+    delivery or fewer than min_history prior deliveries.
+    """
+    z = np.full(rows.shape, np.nan)
+    expected = np.full(rows.shape, np.nan)
+    packed, positions = pack(rows)
+    if not packed.size:
+        return z, expected
+    # Window k holds deliveries k - window .. k - 1 (the current one excluded)
+    padded = np.pad(packed, ((0, 0), (window, 0)), constant_values=np.nan).astype(np.float32)
+    windows = sliding_window_view(padded, window, axis=1)[:, :packed.shape[1]]
+    median, n = window_median(windows)
+    mad, _ = window_median(np.abs(windows - median[..., None]))
+    mad = np.maximum(mad, MAD_FLOOR * np.abs(median))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = 0.6745 * (packed - median) / mad
+    valid = (positions >= 0) & (n >= min_history)
+    f, k = np.nonzero(valid)
+    z[f, positions[f, k]] = scores[f, k]
+    expected[f, positions[f, k]] = median[f, k]
+    return z, expected
+
+
+def cadence_days(latency):
+    """Median days between deliveries per feed (1 if unknown)."""
+    _, positions = pack(np.where(np.isnan(latency), np.nan, 0.0))
+    gaps = np.diff(positions.astype(np.float64), axis=1)
+    gaps[positions[:, 1:] < 0] = np.nan
+    cadence, _ = window_median(gaps)
+    return np.where(np.isnan(cadence), 1, np.maximum(np.rint(cadence), 1)).astype(np.int64)
+
+
+def open_deliveries(grid, now_ms):
+    """Feeds whose next expected day is overdue: (feed codes, expected days, hours late)."""
+    if not grid.latency.size:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    delivered = ~np.isnan(grid.latency)
+    last = grid.latency.shape[1] - 1 - np.argmax(delivered[:, ::-1], axis=1)
+    expected_day = grid.day0 + last + cadence_days(grid.latency)
+    hours = (now_ms - (expected_day + 1) * MS_PER_DAY) / 3_600_000
+    late = delivered.any(axis=1) & (hours > 0)
+    feeds = np.flatnonzero(late)
+    return feeds, expected_day[feeds], hours[feeds]
+
+
+def seasonal_z(rows, day0, season=SEASON_DAYS):
+    """robust_z with each feed's history split by day of the season (weekday).
+
+    The (feeds, days) grid is reshaped to (feeds * season, weeks) so every
+    weekday of every feed is its own series, scored in the same batch.
+    """
+    feeds, days = rows.shape
+    left = day0 % season
+    weeks = -(-(left + days) // season)
+    padded = np.full((feeds, weeks * season), np.nan)
+    padded[:, left:left + days] = rows
+    phased = padded.reshape(feeds, weeks, season).transpose(0, 2, 1).reshape(feeds * season, weeks)
+
+    def unphase(grid):
+        return grid.reshape(feeds, season, weeks).transpose(0, 2, 1).reshape(feeds, weeks * season)[:, left:left + days]
+
+    z, expected = robust_z(phased)
+    return unphase(z), unphase(expected)
+
+
+@stage("feeds")
+def evaluate(grid):
+    """Scores over the full history: (z, expected, anomaly mask, status)."""
+    if not grid.rows.size:
+        empty = np.empty(grid.rows.shape)
+        return empty, empty, empty.astype(bool), latency_status(grid.latency)
+    z, expected = seasonal_z(grid.rows, grid.day0)
+    anomaly = np.abs(np.nan_to_num(z)) >= Z_THRESHOLD
+    return z, expected, anomaly, latency_status(grid.latency)
+
+
+def anomaly_rows(grid, z, expected, anomaly, cells=None):
+    """Anomaly records with root-cause hints, for the given (feed, col) cells or the whole grid.
+
+    Hints: a late or split delivery of the cell itself, and whether most of
+    the same source's feeds (or a large share of all feeds) were anomalous
+    that day, which points upstream rather than at the feed.
+    """
+    if cells is None:
+        feeds, cols = np.nonzero(anomaly)
+    else:
+        keep = anomaly[cells[0], cells[1]]
+        feeds, cols = cells[0][keep], cells[1][keep]
+    if not len(feeds):
+        return []
+
+    feed_ids = grid.feeds.values
+    source_names = sorted(set(grid.sources.get(f, "") for f in feed_ids))
+    source = np.array([source_names.index(grid.sources.get(f, "")) for f in feed_ids])
+    delivered = ~np.isnan(grid.rows)
+    days = grid.rows.shape[1]
+
+    def per_source(mask):
+        keys = (source[:, None] * days + np.arange(days)).ravel()
+        return np.bincount(keys, mask.ravel(), minlength=len(source_names) * days).reshape(-1, days)
+
+    source_delivered, source_anomalous = per_source(delivered), per_source(anomaly & delivered)
+    all_delivered, all_anomalous = delivered.sum(axis=0), (anomaly & delivered).sum(axis=0)
+
+    rows = []
+    for f, c in zip(feeds.tolist(), cols.tolist()):
+        causes = []
+        hours = grid.latency[f, c]
+        if hours > ALERT_HOURS:
+            causes.append(f"late delivery ({hours:.0f}h)")
+        if grid.parts[f, c] > 1:
+            causes.append(f"split delivery ({grid.parts[f, c]} manifests)")
+        s, peers, bad = source[f], source_delivered[source[f], c], source_anomalous[source[f], c]
+        if bad > 1 and bad / peers >= SYSTEMIC_SHARE:
+            causes.append(f"source-wide: {bad:.0f} of {peers:.0f} {source_names[s]} feeds anomalous")
+        if all_anomalous[c] > 1 and all_anomalous[c] / all_delivered[c] >= SYSTEMIC_SHARE / 2:
+            causes.append(f"platform-wide: {all_anomalous[c]} of {all_delivered[c]} feeds anomalous")
+        actual, median = grid.rows[f, c], expected[f, c]
+        rows.append({
+            "feed_id": feed_ids[f],
+            "source": grid.sources.get(feed_ids[f], ""),
+            "data_date": day_string(grid.day0 + c),
+            "row_count": int(actual),
+            "expected_rows": int(round(median)),
+            "delta_pct": f"{(actual - median) / median * 100:+.1f}" if median else "",
+            "z": f"{z[f, c]:.1f}",
+            "causes": "; ".join(causes),
+        })
+    return rows
+
+
+def notification(rule, entity_ref, message, created_at):
+    return {
+        "notification_id": hashlib.sha1(f"{rule['rule_key']}|{entity_ref}|{created_at}".encode()).hexdigest()[:24],
+        "client_id": "",
+        "entity_ref": entity_ref,
+        "message": message,
+        "status": "Active",
+        "created_at": created_at,
+        **rule,
+    }
+
+
+def alerts(grid, touched, anomalies, now, recent):
+    """Latency breaches in newly ingested cells and open deliveries, plus new anomalies.
+
+    Only data dates within ALERT_LOOKBACK_DAYS of now alert, so a first
+    ingest of years of manifests does not page anyone about history.
+    """
+    created_at = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    cutoff = int(now.timestamp() * 1000) // MS_PER_DAY - ALERT_LOOKBACK_DAYS
+    out = []
+
+    def add(rule, entity_ref, message):
+        if (rule["rule_key"], entity_ref) in recent:
+            return
+        recent.add((rule["rule_key"], entity_ref))
+        out.append(notification(rule, entity_ref, message, created_at))
+
+    feeds, cols = touched
+    recent_cells = grid.day0 + cols >= cutoff if len(cols) else np.empty(0, dtype=bool)
+    feeds, cols = feeds[recent_cells], cols[recent_cells]
+    hours = grid.latency[feeds, cols]
+    for f, c, h in zip(feeds.tolist(), cols.tolist(), hours.tolist()):
+        if h > ALERT_HOURS:
+            feed_id = grid.feeds.values[f]
+            add(LATENCY_RULE, f"{feed_id} - {day_string(grid.day0 + c)}",
+                f"{feed_id} for {day_string(grid.day0 + c)} arrived {h:.0f}h after the day closed (SLA 24h)")
+    open_feeds, expected_days, late_hours = open_deliveries(grid, int(now.timestamp() * 1000))
+    for f, d, h in zip(open_feeds.tolist(), expected_days.tolist(), late_hours.tolist()):
+        if h > ALERT_HOURS:
+            feed_id = grid.feeds.values[f]
+            add(LATENCY_RULE, f"{feed_id} - {day_string(d)}",
+                f"{feed_id} for {day_string(d)} has not arrived, {h:.0f}h after the day closed (SLA 24h)")
+    for row in anomalies:
+        if day_number(row["data_date"]) < cutoff:
+            continue
+        add(ANOMALY_RULE, f"{row['feed_id']} - {row['data_date']}",
+            f"{row['feed_id']} delivered {row['row_count']:,} rows for {row['data_date']}, "
+            f"expected ~{row['expected_rows']:,} ({row['delta_pct']}%, z={row['z']})"
+            + (f"; {row['causes']}" if row["causes"] else ""))
+    return out
+
+
+def heatmap(grid, status, anomaly, days, now_ms):
+    """Last `days` columns as a dashboard-ready dict (open deliveries included)."""
+    width = grid.latency.shape[1]
+    start = max(width - days, 0)
+    latency = grid.latency[:, start:].astype(np.float64)
+    cells = status[:, start:].copy()
+    open_feeds, expected_days, late_hours = open_deliveries(grid, now_ms)
+    pending = np.zeros(cells.shape, dtype=bool)
+    for f, d, h in zip(open_feeds.tolist(), expected_days.tolist(), late_hours.tolist()):
+        c = d - grid.day0 - start
+        if 0 <= c < cells.shape[1]:
+            latency[f, c] = h
+            cells[f, c] = latency_status(np.array([h]))[0]
+            pending[f, c] = True
+    return {
+        "dates": [day_string(grid.day0 + c) for c in range(start, width)],
+        "feeds": grid.feeds.values,
+        "sources": [grid.sources.get(f, "") for f in grid.feeds.values],
+        "latency_hours": np.round(latency, 1).tolist(),
+        "status": [[STATUSES[s] if s >= 0 else None for s in row] for row in cells.tolist()],
+        "pending": pending.tolist(),
+        "row_count_anomaly": anomaly[:, start:].tolist(),
+    }
+
+
+def simulate(out_dir, feeds, days, seed=42, end_date="2025-10-19"):
+    """Write seeded synthetic manifests, one file per arrival day; return rows written.
+
+    Feeds are claims (daily), gaps (daily) and member roster (weekly) per
+    source, with lognormal delivery lag, occasional late and short
+    deliveries, split deliveries, and source-wide outages.
+    """
+    rng = np.random.default_rng(seed)
+    n_sources = max(feeds // 3, 1)
+    kinds = [("claims_feed", 1, 50_000), ("gaps_feed", 1, 4_000), ("member_roster", 7, 200_000)]
+    end_day = day_number(end_date)
+    first_day = end_day - days + 1
+    by_arrival = {}
+    outages = rng.random((n_sources, days)) < 0.002
+    for i in range(feeds):
+        kind, cadence, base = kinds[i % 3]
+        source = f"payer-{i // 3 + 1:03d}" if i // 3 < n_sources else f"payer-{n_sources:03d}"
+        feed_id = f"{kind}.{source}"
+        scale = base * rng.uniform(0.5, 2.0)
+        for offset in range(0, days, cadence):
+            day = first_day + offset
+            # 1970-01-01 was a Thursday; daily feeds are lighter at weekends
+            weekday = 0.6 if (day + 3) % 7 >= 5 and cadence == 1 else 1.0
+            rows = scale * weekday * rng.normal(1.0, 0.03)
+            lag_hours = rng.lognormal(np.log(6), 0.5)
+            outage = outages[min(i // 3, n_sources - 1), offset]
+            if outage or rng.random() < 0.01:
+                lag_hours += rng.uniform(20, 60)
+            if outage or rng.random() < 0.004:
+                rows *= rng.uniform(0.2, 0.7)
+            parts = [(rows, lag_hours)]
+            if rng.random() < 0.01:
+                parts = [(rows * 0.6, lag_hours), (rows * 0.4, lag_hours + rng.uniform(2, 30))]
+            for part_rows, part_lag in parts:
+                arrived_ms = int((day + 1) * MS_PER_DAY + part_lag * 3_600_000)
+                arrival_day = arrived_ms // MS_PER_DAY
+                if arrival_day > end_day:
+                    continue
+                arrived_at = datetime.datetime.fromtimestamp(arrived_ms / 1000, datetime.timezone.utc)
+                by_arrival.setdefault(arrival_day, []).append({
+                    "feed_id": feed_id, "source": source, "data_date": day_string(day),
+                    "arrived_at": arrived_at.strftime("%Y-%m-%dT%H:%M:%SZ"), "row_count": max(int(part_rows), 0),
+                })
+    written = 0
+    for arrival_day, rows in sorted(by_arrival.items()):
+        written += write_rows(Path(out_dir) / f"manifest-{day_string(arrival_day)}.csv", COLUMNS["feed_manifest"], rows)
+    return written
+
+
+def parse_now(value):
+    now = (datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+           if value else datetime.datetime.now(datetime.timezone.utc))
+    return now if now.tzinfo else now.replace(tzinfo=datetime.timezone.utc)
+
+
+def print_heatmap(view):
+    symbols = {"green": "G", "yellow": "Y", "red": "R", None: "·"}
+    print(f"{'feed':<28} " + " ".join(d[8:] for d in view["dates"]))
+    for i, feed_id in enumerate(view["feeds"]):
+        cells = [
+            (symbols[s].lower() if view["pending"][i][c] else symbols[s]) + ("!" if view["row_count_anomaly"][i][c] else " ")
+            for c, s in enumerate(view["status"][i])
+        ]
+        print(f"{feed_id:<28} " + " ".join(cells))
+    print("G/Y/R delivered (<24h / 24-48h / >48h), lowercase = not yet arrived, ! = row count anomaly")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed latency heatmap and row-count anomaly detection")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Ingest new manifests, score the history, emit alerts")
+    run_parser.add_argument("--store", required=True, help="Feed monitor state directory")
+    run_parser.add_argument("--manifests", required=True, help="Directory of feed manifest CSVs")
+    run_parser.add_argument("--now", help="Evaluation time (ISO datetime, default now UTC)")
+    run_parser.add_argument("--db", help="Web app SQLite database: dedup source and insert target")
+    run_parser.add_argument("--recent", help="Recent fact_notification CSV to dedup against")
+    run_parser.add_argument("--out", default="data/feed_notifications.csv", help="Notifications CSV path")
+    run_parser.add_argument("--anomalies", default="data/feed_anomalies.csv", help="All anomalies in history (CSV)")
+    run_parser.add_argument("--heatmap-json", help="Write the heatmap grid for the ops dashboard")
+    run_parser.add_argument("--days", type=int, default=14, help="Heatmap days")
+
+    heatmap_parser = sub.add_parser("heatmap", help="Print the latency heatmap")
+    heatmap_parser.add_argument("--store", required=True, help="Feed monitor state directory")
+    heatmap_parser.add_argument("--days", type=int, default=14, help="Days to show")
+    heatmap_parser.add_argument("--now", help="Evaluation time (ISO datetime, default now UTC)")
+
+    simulate_parser = sub.add_parser("simulate", help="Write seeded synthetic manifests")
+    simulate_parser.add_argument("--out", required=True, help="Manifest directory")
+    simulate_parser.add_argument("--feeds", type=int, default=9, help="Number of feeds")
+    simulate_parser.add_argument("--days", type=int, default=365, help="Days of history")
+    simulate_parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    simulate_parser.add_argument("--end-date", default="2025-10-19", help="Last arrival date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "simulate":
+        rows = simulate(args.out, args.feeds, args.days, args.seed, args.end_date)
+        print(f"✓ Wrote {rows:,} manifest rows to {args.out} in {time.perf_counter() - started:.1f}s")
+        return
+
+    grid = FeedGrid(args.store)
+    now = parse_now(args.now)
+    if args.command == "heatmap":
+        _, _, anomaly, status = evaluate(grid)
+        print_heatmap(heatmap(grid, status, anomaly, args.days, int(now.timestamp() * 1000)))
+        return
+
+    files, touched = grid.ingest(args.manifests)
+    ingested = time.perf_counter()
+    z, expected, anomaly, status = evaluate(grid)
+    evaluated = time.perf_counter()
+    new_anomalies = anomaly_rows(grid, z, expected, anomaly, touched)
+    recent = recent_alerts(now, db_path=args.db, csv_path=args.recent)
+    rows = alerts(grid, touched, new_anomalies, now, recent)
+    write_rows(args.out, COLUMNS["fact_notification"], rows)
+    if args.db and rows:
+        bulk_load(args.db, {"FactNotification": notification_rows(args.out)})
+    history = write_rows(args.anomalies, ANOMALY_COLUMNS, anomaly_rows(grid, z, expected, anomaly))
+    if args.heatmap_json:
+        Path(args.heatmap_json).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.heatmap_json, "w", encoding="utf-8") as f:
+            json.dump(heatmap(grid, status, anomaly, args.days, int(now.timestamp() * 1000)), f)
+    grid.save()
+
+    feeds, days = grid.latency.shape
+    print(f"✓ Ingested {files} new manifest files ({len(touched[0]):,} feed-days) in {ingested - started:.2f}s")
+    print(f"✓ Scored {feeds} feeds x {days:,} days in {(evaluated - ingested) * 1000:.0f} ms: "
+          f"{int(anomaly.sum()):,} row-count anomalies in history, {len(new_anomalies)} new")
+    print(f"✓ {len(rows)} notifications → {args.out}; anomaly history ({history:,}) → {args.anomalies}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Gap Closure Cycle Time with mergeable quantile sketches.
+
+A therapy gap opens when a member runs out of a drug class for more than
+GAP_GRACE_DAYS (detected on the day the grace expires) and closes at the next
+fill. Cycle time is closed - detected days; the catalog metric is its median
+against a target of ≤14 days (data_contracts/metrics_catalog.md).
+
+Rather than keeping and sorting every gap event per slice, each
+client x plan x week-closed cell keeps a t-digest: a few dozen centroids
+(mean, weight) whose size bound is tight at the tails and loose in the
+middle. Digests merge by concatenating centroids and recompressing, so
+coarser rollups (client, client x week, all) and per-partition builds
+combine without rescanning raw events. Building and merging are vectorized
+over all cells at once.
+
+Usage:
+    python -m pipeline.gaps build --claims data/fact_claims --drugs data/dim_drug.csv \\
+        --members data/dim_member --out data/gap_sketches.npz --by client_id --exact
+    python -m pipeline.gaps report --sketches data/gap_sketches.npz --by client_id,week_start --weeks 4
+    python -m pipeline.gaps report --sketches part1.npz part2.npz --by plan_id
+"""
+
+import argparse
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import group_starts, shift_fills, sort_claims
+from pipeline.rollup import week_start
+from pipeline.search import parse_markdown
+from pipeline.tables import day_number, day_string, load_claims, load_members
+
+# Days out of medication before a late refill counts as a gap
+GAP_GRACE_DAYS = 7
+
+# Fallback when the metrics catalog is not available
+GAP_CLOSURE_TARGET_DAYS = 14.0
+
+DEFAULT_CATALOG = "../acme-pharmacy-analytics-spec/data_contracts/metrics_catalog.md"
+
+# Cell dimensions, in key order
+DIMENSIONS = ("client_id", "plan_id", "week_start")
+
+DEFAULT_COMPRESSION = 100
+QUANTILES = (0.5, 0.9)
+
+
+@dataclass
+class GapEvents:
+    member: np.ndarray  # claim-local member codes
+    drug_class: np.ndarray
+    detected_day: np.ndarray
+    closed_day: np.ndarray
+    open_gaps: int  # detected by as_of_day but not yet closed
+
+    @property
+    def cycle_days(self):
+        return self.closed_day - self.detected_day
+
+    def __len__(self):
+        return len(self.detected_day)
+
+
+def gap_events(claims, as_of_day, grace_days=GAP_GRACE_DAYS):
+    """Closed gaps between consecutive fills of each member/drug class."""
+    member, drug_class, day, supply = sort_claims(claims, as_of_day)
+    if len(day) == 0:
+        # No fills on or before as_of_day (empty input or an early --as-of)
+        return GapEvents(member, drug_class, day, day, 0)
+    group_start = group_starts(member, drug_class)
+    _, end = shift_fills(group_start, day, supply)
+
+    # Fill i is followed by fill i+1 of the same group; the supply from
+    # fills up to i (overlaps shifted forward) runs out at end[i].
+    same_group = ~group_start[1:]
+    detected = end[:-1] + grace_days
+    closed = day[1:]
+    gap = same_group & (closed > detected)
+
+    last = np.append(np.flatnonzero(group_start[1:]), len(day) - 1)
+    open_gaps = int(np.count_nonzero(end[last] + grace_days <= as_of_day))
+    return GapEvents(member[:-1][gap], drug_class[:-1][gap], detected[gap], closed[gap], open_gaps)
+
+
+def _k_scale(q, compression):
+    """t-digest k1 scale: centroids span at most one unit of k."""
+    return compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+
+
+def compress(cell, mean, weight, compression=DEFAULT_COMPRESSION):
+    """Compress weighted points of many cells into t-digest centroids at once.
+
+    Returns (cell, mean, weight) of the centroids sorted by cell then mean.
+    Raw values are points of weight 1; merging digests passes centroids.
+    """
+    order = np.lexsort((mean, cell))
+    cell, mean, weight = cell[order], mean[order], weight[order]
+    if len(cell) == 0:
+        return cell, mean, weight
+
+    cell_start = np.empty(len(cell), dtype=bool)
+    cell_start[0] = True
+    cell_start[1:] = cell[1:] != cell[:-1]
+    gid = np.cumsum(cell_start) - 1
+    cum = np.cumsum(weight)
+    before = (cum - weight)[cell_start]
+    total = np.add.reduceat(weight, np.flatnonzero(cell_start))
+    q_mid = (cum - before[gid] - weight / 2) / total[gid]
+    bucket = np.floor(_k_scale(q_mid, compression) + compression / 4).astype(np.int64)
+
+    centroid_start = cell_start.copy()
+    centroid_start[1:] |= bucket[1:] != bucket[:-1]
+    starts = np.flatnonzero(centroid_start)
+    w = np.add.reduceat(weight, starts)
+    m = np.add.reduceat(mean * weight, starts) / w
+    return cell[starts], m, w
+
+
+@dataclass
+class Sketches:
+    """One t-digest per cell; cells are keyed by tuples over dims."""
+
+    dims: tuple
+    keys: list
+    cell: np.ndarray  # centroid -> index into keys
+    mean: np.ndarray
+    weight: np.ndarray
+    low: np.ndarray  # per-cell min
+    high: np.ndarray  # per-cell max
+    compression: int = DEFAULT_COMPRESSION
+
+    @classmethod
+    def from_values(cls, dims, keys, cell, values, compression=DEFAULT_COMPRESSION):
+        """Build digests from raw values; cell indexes into keys."""
+        values = np.asarray(values, dtype=np.float64)
+        cell = np.asarray(cell, dtype=np.int64)
+        return cls._compressed(dims, keys, cell, values, np.ones(len(values)), values, values, cell, compression)
+
+    @classmethod
+    def _compressed(cls, dims, keys, cell, mean, weight, low, high, low_cell, compression):
+        lows = np.full(len(keys), np.inf)
+        highs = np.full(len(keys), -np.inf)
+        np.minimum.at(lows, low_cell, low)
+        np.maximum.at(highs, low_cell, high)
+        cell, mean, weight = compress(cell, mean, weight, compression)
+        return cls(tuple(dims), list(keys), cell, mean, weight, lows, highs, compression)
+
+    def regroup(self, dims, keep=None):
+        """Merge cells into coarser cells over a subset of dims.
+
+        keep optionally masks which current cells take part.
+        """
+        positions = [self.dims.index(d) for d in dims]
+        new_keys, codes = [], {}
+        remap = np.full(len(self.keys), -1, dtype=np.int64)
+        for i, key in enumerate(self.keys):
+            if keep is not None and not keep[i]:
+                continue
+            coarse = tuple(key[p] for p in positions)
+            if coarse not in codes:
+                codes[coarse] = len(new_keys)
+                new_keys.append(coarse)
+            remap[i] = codes[coarse]
+
+        used = remap[self.cell] >= 0
+        cells_used = remap >= 0
+        return Sketches._compressed(
+            dims, new_keys, remap[self.cell][used], self.mean[used], self.weight[used],
+            self.low[cells_used], self.high[cells_used], remap[cells_used], self.compression,
+        )
+
+    @classmethod
+    def merge(cls, parts):
+        """Merge sketches over the same dims (e.g. per-partition builds)."""
+        dims = parts[0].dims
+        keys, codes = [], {}
+        cells, lows, highs, low_cells = [], [], [], []
+        for part in parts:
+            if part.dims != dims:
+                raise ValueError(f"cannot merge sketches over {part.dims} into {dims}")
+            remap = np.empty(len(part.keys), dtype=np.int64)
+            for i, key in enumerate(part.keys):
+                if key not in codes:
+                    codes[key] = len(keys)
+                    keys.append(key)
+                remap[i] = codes[key]
+            cells.append(remap[part.cell])
+            lows.append(part.low)
+            highs.append(part.high)
+            low_cells.append(remap)
+        return cls._compressed(
+            dims, keys, np.concatenate(cells), np.concatenate([p.mean for p in parts]),
+            np.concatenate([p.weight for p in parts]), np.concatenate(lows), np.concatenate(highs),
+            np.concatenate(low_cells), max(p.compression for p in parts),
+        )
+
+    def counts(self):
+        return np.bincount(self.cell, self.weight, minlength=len(self.keys)).round().astype(np.int64)
+
+    def _curves(self):
+        """Per non-empty cell: (index, cumulative-rank points, value points, count).
+
+        Each centroid's mean sits at the midpoint of its rank range; the cell
+        min and max anchor ranks 0 and n.
+        """
+        bounds = np.searchsorted(self.cell, np.arange(len(self.keys) + 1))
+        for i in range(len(self.keys)):
+            mean = self.mean[bounds[i]:bounds[i + 1]]
+            weight = self.weight[bounds[i]:bounds[i + 1]]
+            if len(mean) == 0:
+                continue
+            n = weight.sum()
+            ranks = np.concatenate([[0.0], np.cumsum(weight) - weight / 2, [n]])
+            values = np.concatenate([[self.low[i]], mean, [self.high[i]]])
+            yield i, ranks, values, n
+
+    def quantiles(self, qs=QUANTILES):
+        """(cells x len(qs)) quantile estimates."""
+        qs = np.asarray(qs, dtype=np.float64)
+        result = np.full((len(self.keys), len(qs)), np.nan)
+        for i, ranks, values, n in self._curves():
+            # Rank of the q-quantile in [0, n], matching np.quantile's linear method
+            result[i] = np.interp(qs * (n - 1) + 0.5, ranks, values)
+        return result
+
+    def cdf(self, x):
+        """Per-cell estimated fraction of values <= x (NaN for empty cells)."""
+        result = np.full(len(self.keys), np.nan)
+        for i, ranks, values, n in self._curves():
+            result[i] = np.interp(x, values, ranks) / n
+        return result
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        columns = {f"key_{dim}": np.array([key[i] for key in self.keys]) for i, dim in enumerate(self.dims)}
+        np.savez_compressed(
+            path, dims=np.array(self.dims), cell=self.cell, mean=self.mean, weight=self.weight,
+            low=self.low, high=self.high, compression=self.compression, **columns,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dims = tuple(str(d) for d in data["dims"])
+            columns = [data[f"key_{dim}"].tolist() for dim in dims]
+            keys = list(zip(*columns)) if columns else []
+            return cls(dims, keys, data["cell"], data["mean"], data["weight"],
+                       data["low"], data["high"], int(data["compression"]))
+
+
+def event_cells(events, claims, members):
+    """Client x plan x week-closed cell of each gap event; return (keys, cell)."""
+    to_member = np.array([members.index[m] for m in claims.member_ids], dtype=np.int64)
+    m = to_member[events.member]
+    client = members.client[m].astype(np.int64)
+    plan = members.plan[m].astype(np.int64)
+    week = week_start(events.closed_day).astype(np.int64)
+    if len(week) == 0:
+        return [], np.zeros(0, dtype=np.int64)
+
+    # Dense cell id over the distinct combinations present (one packed key)
+    first_week = week.min()
+    n_weeks = int(week.max() - first_week) // 7 + 1
+    packed = (client * len(members.plans) + plan) * n_weeks + (week - first_week) // 7
+    combos, cell = np.unique(packed, return_inverse=True)
+    rest, week_index = np.divmod(combos, n_weeks)
+    client_code, plan_code = np.divmod(rest, len(members.plans))
+    keys = [
+        (members.clients[c], members.plans[p], day_string(int(first_week) + 7 * w))
+        for c, p, w in zip(client_code.tolist(), plan_code.tolist(), week_index.tolist())
+    ]
+    return keys, cell.ravel()
+
+
+def build_sketches(events, claims, members, compression=DEFAULT_COMPRESSION):
+    """Per client x plan x week-closed sketches of gap cycle days."""
+    keys, cell = event_cells(events, claims, members)
+    return Sketches.from_values(DIMENSIONS, keys, cell, events.cycle_days, compression)
+
+
+def catalog_target(path, metric="Gap Closure Cycle Time"):
+    """Target days for a metric from metrics_catalog.md (e.g. "≤14 days")."""
+    path = Path(path)
+    if not path.exists():
+        return GAP_CLOSURE_TARGET_DAYS
+    sections, _ = parse_markdown(path.name, path.read_text(encoding="utf-8"))
+    for section in sections:
+        if section["title"].startswith(metric):
+            match = re.search(r"\d+(?:\.\d+)?", section["fields"].get("target", ""))
+            if match:
+                return float(match.group())
+    return GAP_CLOSURE_TARGET_DAYS
+
+
+def report(sketches, by, target, exact=None, weeks=None):
+    """Print median / p90 per cell of `by` against the target.
+
+    exact is an optional (keys, cell, values) triple over the same cells as
+    sketches; when given, exact quantiles and the sketch error are shown.
+    """
+    keep = None
+    if weeks and "week_start" in sketches.dims and sketches.keys:
+        position = sketches.dims.index("week_start")
+        latest = max(day_number(key[position]) for key in sketches.keys)
+        keep = [day_number(key[position]) > latest - weeks * 7 for key in sketches.keys]
+    rolled = sketches.regroup(by, keep)
+    estimates = rolled.quantiles()
+    counts = rolled.counts()
+
+    exact_by_key = {}
+    if exact is not None:
+        keys, cell, values = exact
+        positions = [sketches.dims.index(d) for d in by]
+        allowed = np.ones(len(keys), dtype=bool) if keep is None else np.asarray(keep)
+        coarse = {}
+        for i, key in enumerate(keys):
+            if allowed[i]:
+                coarse.setdefault(tuple(key[p] for p in positions), []).append(i)
+        order = np.argsort(cell, kind="stable")
+        bounds = np.searchsorted(cell[order], np.arange(len(keys) + 1))
+        for key, cells in coarse.items():
+            chunk = np.concatenate([values[order[bounds[c]:bounds[c + 1]]] for c in cells])
+            exact_by_key[key] = np.quantile(chunk, QUANTILES)
+
+    label = " x ".join(by) or "all"
+    header = f"{label:<32}{'gaps':>10}{'median':>8}{'p90':>8}"
+    if exact is not None:
+        header += f"{'exact med':>11}{'exact p90':>11}{'max err':>9}"
+    print(header + f"  vs ≤{target:g}d")
+    if not rolled.keys:
+        print("  (no gap events)")
+    for i in sorted(range(len(rolled.keys)), key=lambda i: rolled.keys[i]):
+        median, p90 = estimates[i]
+        name = " / ".join(str(v) for v in rolled.keys[i]) or "all"
+        line = f"{name:<32}{counts[i]:>10,}{median:>8.1f}{p90:>8.1f}"
+        if exact is not None:
+            exact_median, exact_p90 = exact_by_key[rolled.keys[i]]
+            error = max(abs(median - exact_median), abs(p90 - exact_p90))
+            line += f"{exact_median:>11.1f}{exact_p90:>11.1f}{error:>9.2f}"
+        print(line + ("  ✓" if median <= target else "  ✗ above target"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gap Closure Cycle Time quantile sketches")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="Detect gap events and build per-cell sketches")
+    build_parser.add_argument("--claims", required=True, help="fact_claims CSV file or part directory")
+    build_parser.add_argument("--drugs", required=True, help="dim_drug CSV file")
+    build_parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+    build_parser.add_argument("--as-of", help="Calculation date (YYYY-MM-DD); defaults to latest claim date")
+    build_parser.add_argument("--out", required=True, help="Sketch file (.npz)")
+    build_parser.add_argument("--compression", type=int, default=DEFAULT_COMPRESSION, help="t-digest compression")
+    build_parser.add_argument("--by", help=f"Also report, grouped by comma-separated {DIMENSIONS}")
+    build_parser.add_argument("--exact", action="store_true", help="Report exact quantiles and sketch error")
+
+    report_parser = sub.add_parser("report", help="Merge sketch files and report median / p90")
+    report_parser.add_argument("--sketches", nargs="+", required=True, help="Sketch files to merge")
+    report_parser.add_argument("--by", default="", help=f"Comma-separated group-by from {DIMENSIONS}")
+    report_parser.add_argument("--weeks", type=int, help="Only the latest N weeks")
+
+    for p in (build_parser, report_parser):
+        p.add_argument("--catalog", default=DEFAULT_CATALOG, help="metrics_catalog.md (for the target)")
+    args = parser.parse_args()
+
+    target = catalog_target(args.catalog)
+    started = time.perf_counter()
+    if args.command == "build":
+        claims = load_claims(args.claims, args.drugs)
+        members = load_members(args.members)
+        loaded = time.perf_counter()
+        as_of_day = day_number(args.as_of) if args.as_of else int(claims.claim_day.max())
+        events = gap_events(claims, as_of_day)
+        keys, cell = event_cells(events, claims, members)
+        sketches = Sketches.from_values(DIMENSIONS, keys, cell, events.cycle_days, args.compression)
+        sketches.save(args.out)
+        built = time.perf_counter()
+        print(f"✓ Loaded {len(claims):,} paid claims in {loaded - started:.1f}s")
+        print(f"✓ {len(events):,} closed gaps ({events.open_gaps:,} open) in {len(sketches.keys):,} cells, "
+              f"{len(sketches.mean):,} centroids in {built - loaded:.1f}s → {args.out}")
+        if args.by is not None:
+            exact = (keys, cell, events.cycle_days.astype(np.float64)) if args.exact else None
+            report(sketches, [d for d in args.by.split(",") if d], target, exact)
+    else:
+        sketches = Sketches.merge([Sketches.load(path) for path in args.sketches])
+        report(sketches, [d for d in args.by.split(",") if d], target, weeks=args.weeks)
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
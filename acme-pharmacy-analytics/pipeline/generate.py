@@ -0,0 +1,293 @@
+"""
+Synthetic data generator for the contract tables.
+
+Generates dim_client, dim_drug, dim_member, fact_claims and fact_telemetry
+following data_contracts/schemas.md. All data is synthetic (see
+security_privacy.md); no real PHI/PII is ever produced.
+
+Members are generated in fixed-size chunks. Each chunk draws from its own
+random stream, derived from the seed and the chunk index, and writes its own
+part file, so:
+
+- output is byte-identical for a given seed regardless of --workers
+- each worker holds one chunk in memory, whatever the total size
+- chunks run on a process pool and scale to 5M members / 100M claims
+
+Usage:
+    python -m pipeline.generate --members 100000 --out data --seed 42
+    python -m pipeline.generate --members 5000000 --workers 16 --gzip --out data
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.tables import COLUMNS, day_number, day_string, open_text
+
+# Members per chunk (and per part file)
+CHUNK_MEMBERS = 50_000
+
+# Random stream ids, so tables never share a stream for the same chunk
+MEMBER_STREAM = 1
+TELEMETRY_STREAM = 2
+
+CLIENTS = [
+    ("ACME", "ACME Pharmacy", "Mid-Market", "Northeast"),
+    ("NWH", "Northwind Health", "Enterprise", "Midwest"),
+    ("SUMRX", "Summit Rx", "Mid-Market", "West"),
+    ("BAYRX", "Bayview Pharmacy", "Small Business", "West"),
+    ("LKCARE", "Lakeside Care", "Enterprise", "Southeast"),
+    ("PINE", "Pinecrest Pharmacy", "Small Business", "Northeast"),
+    ("HRTLD", "Heartland Health Plans", "Enterprise", "Midwest"),
+    ("COAST", "Coastal Rx Partners", "Mid-Market", "Southwest"),
+]
+
+# (drug_id, name, class, brand_generic_flag)
+DRUGS = [
+    ("D001", "Metformin", "Diabetes", "Generic"),
+    ("D002", "Glipizide", "Diabetes", "Generic"),
+    ("D003", "Januvia", "Diabetes", "Brand"),
+    ("D004", "Jardiance", "Diabetes", "Brand"),
+    ("D005", "Lisinopril", "Hypertension", "Generic"),
+    ("D006", "Amlodipine", "Hypertension", "Generic"),
+    ("D007", "Losartan", "Hypertension", "Generic"),
+    ("D008", "Hydrochlorothiazide", "Hypertension", "Generic"),
+    ("D009", "Atorvastatin", "Statins", "Generic"),
+    ("D010", "Rosuvastatin", "Statins", "Generic"),
+    ("D011", "Simvastatin", "Statins", "Generic"),
+    ("D012", "Crestor", "Statins", "Brand"),
+]
+
+DRUG_CLASSES = ["Diabetes", "Hypertension", "Statins"]
+
+# Share of members on each drug class
+CLASS_PREVALENCE = [0.35, 0.55, 0.50]
+
+RISK_BANDS = ["Low", "Medium", "High"]
+RISK_WEIGHTS = [0.50, 0.35, 0.15]
+# Mean adherence propensity by risk band (Beta distribution parameters)
+RISK_ADHERENCE = [(9.0, 1.5), (7.0, 1.8), (5.0, 2.0)]
+
+GENDERS = ["M", "F", "Other"]
+GENDER_WEIGHTS = [0.48, 0.50, 0.02]
+
+PLANS_PER_CLIENT = 3
+
+SUPPLY_DAYS = [30, 60, 90]
+SUPPLY_WEIGHTS = [0.70, 0.05, 0.25]
+
+STATUSES = ["paid", "denied", "pending"]
+STATUS_WEIGHTS = [0.93, 0.04, 0.03]
+
+# Median cost of a 30-day supply
+GENERIC_COST = 12.0
+BRAND_COST = 380.0
+
+TELEMETRY_USERS_PER_CLIENT = 40
+TELEMETRY_DAYS = 90
+EVENT_TYPES = ["login", "dashboard_view", "drill_down", "export_csv", "ai_query", "alert_triage"]
+EVENT_WEIGHTS = [0.15, 0.45, 0.15, 0.05, 0.12, 0.08]
+FEATURES = ["client_analytics", "exec_overview", "internal_ops", "product_metrics",
+            "insights_alerts", "admin_governance", "ai_chat"]
+
+
+def chunk_rng(seed, stream, index):
+    """Independent random generator for one chunk of one stream."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream, index)))
+
+
+def part_name(index, gzip_output):
+    return f"part-{index:05d}.csv" + (".gz" if gzip_output else "")
+
+
+def write_lines(path, header, lines):
+    """Write a header and pre-formatted CSV lines."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open_text(path, "w") as f:
+        f.write(",".join(header) + "\n")
+        f.writelines(lines)
+
+
+def write_dimensions(out_dir, clients):
+    """Write dim_client and dim_drug, which are small and not chunked."""
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    for table, rows in (("dim_client", CLIENTS[:clients]), ("dim_drug", DRUGS)):
+        with open_text(Path(out_dir) / f"{table}.csv", "w") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(COLUMNS[table])
+            writer.writerows(rows)
+
+
+def generate_member_chunk(task):
+    """Generate dim_member and fact_claims part files for one member chunk.
+
+    Returns (chunk index, members written, claims written).
+    """
+    index, members, out_dir, seed, clients, end_day, history_days, gzip_output = task
+    rng = chunk_rng(seed, MEMBER_STREAM, index)
+    first = index * CHUNK_MEMBERS
+    n = min(CHUNK_MEMBERS, members - first)
+    member_no = np.arange(first, first + n)
+
+    client = rng.integers(0, clients, n)
+    plan = rng.integers(1, PLANS_PER_CLIENT + 1, n)
+    risk = rng.choice(3, n, p=RISK_WEIGHTS)
+    gender = rng.choice(3, n, p=GENDER_WEIGHTS)
+    dob = end_day - rng.integers(45 * 365, 90 * 365, n)
+
+    member_lines = [
+        f"M{m:08d},{CLIENTS[c][0]},{day_string(d)},{GENDERS[g]},{RISK_BANDS[r]},plan-{p}\n"
+        for m, c, d, g, r, p in zip(
+            member_no.tolist(), client.tolist(), dob.tolist(),
+            gender.tolist(), risk.tolist(), plan.tolist(),
+        )
+    ]
+    write_lines(Path(out_dir) / "dim_member" / part_name(index, gzip_output), COLUMNS["dim_member"], member_lines)
+
+    # Fill histories per member and drug class, as a (members, max fills)
+    # grid; early refills can come at about half the supply interval.
+    max_fills = 2 * history_days // min(SUPPLY_DAYS) + 2
+    drug_ids = np.array([d[0] for d in DRUGS])
+    brand = np.array([d[3] == "Brand" for d in DRUGS])
+    claim_parts = []
+    for class_index, drug_class in enumerate(DRUG_CLASSES):
+        on_drug = np.flatnonzero(rng.random(n) < CLASS_PREVALENCE[class_index])
+        k = len(on_drug)
+        alpha = np.array([a for a, _ in RISK_ADHERENCE])[risk[on_drug]]
+        beta = np.array([b for _, b in RISK_ADHERENCE])[risk[on_drug]]
+        propensity = rng.beta(alpha, beta)
+        supply = np.array(SUPPLY_DAYS)[rng.choice(len(SUPPLY_DAYS), k, p=SUPPLY_WEIGHTS)]
+        class_drugs = np.flatnonzero(np.array([d[2] for d in DRUGS]) == drug_class)
+        drug = class_drugs[rng.integers(0, len(class_drugs), k)]
+
+        # Refill interval stretches the supply by the member's propensity
+        gaps = supply[:, None] / propensity[:, None] * rng.lognormal(0.0, 0.15, (k, max_fills))
+        offsets = rng.integers(0, supply)[:, None] + np.concatenate(
+            [np.zeros((k, 1)), np.cumsum(gaps[:, :-1], axis=1)], axis=1
+        ).astype(np.int64)
+        valid = offsets < history_days
+        row, col = np.nonzero(valid)
+        claim_parts.append((
+            on_drug[row],
+            end_day - history_days + 1 + offsets[row, col],
+            drug[row],
+            supply[row],
+        ))
+
+    member_index = np.concatenate([p[0] for p in claim_parts])
+    claim_day = np.concatenate([p[1] for p in claim_parts])
+    drug = np.concatenate([p[2] for p in claim_parts])
+    supply = np.concatenate([p[3] for p in claim_parts])
+    order = np.lexsort((drug, claim_day, member_index))
+    member_index, claim_day, drug, supply = member_index[order], claim_day[order], drug[order], supply[order]
+
+    status = rng.choice(len(STATUSES), len(order), p=STATUS_WEIGHTS)
+    cost = np.where(brand[drug], BRAND_COST, GENERIC_COST) * supply / 30.0
+    paid = np.where(status == 0, cost * rng.lognormal(0.0, 0.25, len(order)), 0.0)
+
+    # Claim ids number each member's claims in date order
+    starts = np.flatnonzero(np.r_[True, member_index[1:] != member_index[:-1]])
+    sequence = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+
+    day_strings = {}
+    claim_lines = []
+    for m, s, d, g, sup, amt, st in zip(
+        (member_no[member_index]).tolist(), sequence.tolist(), claim_day.tolist(),
+        drug_ids[drug].tolist(), supply.tolist(), paid.tolist(), status.tolist(),
+    ):
+        date = day_strings.get(d)
+        if date is None:
+            date = day_strings[d] = day_string(d)
+        claim_lines.append(f"C{m:08d}-{s:03d},M{m:08d},{g},{date},{sup},{amt:.2f},{STATUSES[st]}\n")
+    write_lines(Path(out_dir) / "fact_claims" / part_name(index, gzip_output), COLUMNS["fact_claims"], claim_lines)
+
+    return index, n, len(claim_lines)
+
+
+def generate_telemetry_chunk(task):
+    """Generate product telemetry events for one client's users."""
+    client_index, out_dir, seed, end_day, gzip_output = task
+    rng = chunk_rng(seed, TELEMETRY_STREAM, client_index)
+    client_id = CLIENTS[client_index][0]
+    users = TELEMETRY_USERS_PER_CLIENT
+
+    # Each user has a daily activity rate; active days log a few events
+    activity = rng.beta(2.0, 3.0, users)
+    active = rng.random((TELEMETRY_DAYS, users)) < activity
+    day, user = np.nonzero(active)
+    events = rng.poisson(3.0, len(day)) + 1
+    day = np.repeat(day, events)
+    user = np.repeat(user, events)
+    event_type = rng.choice(len(EVENT_TYPES), len(day), p=EVENT_WEIGHTS)
+    feature = rng.integers(0, len(FEATURES), len(day))
+
+    lines = [
+        f"E{client_id}-{i:07d},U{client_id}-{u:03d},{client_id},"
+        f"{day_string(end_day - TELEMETRY_DAYS + 1 + d)},{EVENT_TYPES[t]},{FEATURES[f]}\n"
+        for i, (d, u, t, f) in enumerate(zip(day.tolist(), user.tolist(), event_type.tolist(), feature.tolist()))
+    ]
+    write_lines(Path(out_dir) / "fact_telemetry" / part_name(client_index, gzip_output),
+                COLUMNS["fact_telemetry"], lines)
+    return client_index, len(lines)
+
+
+def generate(out_dir, members, seed=42, clients=5, end_date="2025-10-19",
+             history_days=730, workers=None, gzip_output=False):
+    """Generate all tables under out_dir; return row counts per table."""
+    if not 1 <= clients <= len(CLIENTS):
+        raise ValueError(f"clients must be between 1 and {len(CLIENTS)}")
+    end_day = day_number(end_date)
+    for table in ("dim_member", "fact_claims", "fact_telemetry"):
+        # Stale parts from a larger earlier run would otherwise be read back
+        for stale in (Path(out_dir) / table).glob("part-*"):
+            stale.unlink()
+    write_dimensions(out_dir, clients)
+
+    chunks = (members + CHUNK_MEMBERS - 1) // CHUNK_MEMBERS
+    member_tasks = [
+        (i, members, str(out_dir), seed, clients, end_day, history_days, gzip_output)
+        for i in range(chunks)
+    ]
+    telemetry_tasks = [(c, str(out_dir), seed, end_day, gzip_output) for c in range(clients)]
+
+    counts = {"dim_client": clients, "dim_drug": len(DRUGS), "dim_member": 0, "fact_claims": 0, "fact_telemetry": 0}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for index, n_members, n_claims in pool.map(generate_member_chunk, member_tasks):
+            counts["dim_member"] += n_members
+            counts["fact_claims"] += n_claims
+            print(f"  chunk {index + 1}/{chunks}: {n_members:,} members, {n_claims:,} claims")
+        for _, n_events in pool.map(generate_telemetry_chunk, telemetry_tasks):
+            counts["fact_telemetry"] += n_events
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic ACME Pharmacy data")
+    parser.add_argument("--members", type=int, default=100_000, help="Number of members")
+    parser.add_argument("--clients", type=int, default=5, help=f"Number of clients (max {len(CLIENTS)})")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--end-date", default="2025-10-19", help="Last claim date (YYYY-MM-DD)")
+    parser.add_argument("--history-days", type=int, default=730, help="Days of claim history")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--gzip", action="store_true", help="Write gzip-compressed part files")
+    parser.add_argument("--out", default="data", help="Output directory")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(
+        args.out, args.members, seed=args.seed, clients=args.clients, end_date=args.end_date,
+        history_days=args.history_days, workers=args.workers, gzip_output=args.gzip,
+    )
+    print()
+    for table, count in counts.items():
+        print(f"✓ {table}: {count:,} rows")
+    print(f"✓ Generated in {time.perf_counter() - started:.1f}s → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Incremental daily adherence refresh.
+
+Keeps per member/drug class coverage state in a SQLite file keyed by the last
+as_of_date. Each nightly run reads only the claims received since the last
+run, loads state for the member/drug class groups those claims touch, recomputes
+their windows with the adherence engine and writes delta rows for
+fact_adherence. Work is proportional to the day's claims: state rows are
+fetched and replaced by primary key, never scanned.
+
+State per group is the fills whose shifted coverage still reaches into the
+lookback horizon, plus carry_end: where coverage from older, pruned fills
+ran out. Replaying carry_end as a synthetic fill that ends there, dated
+ahead of the kept fills, reproduces the forward shift exactly. Groups with
+no coverage left in the horizon are dropped from state.
+
+Late-arriving claims dated on or before the stored as_of_date are folded in
+the same way: state keeps every fill that can still shift a claim dated
+inside the horizon. A claim dated before the horizon could move coverage the
+state no longer holds, so the run fails and asks for --init.
+
+Members without new claims keep their previous fact_adherence row; run
+pipeline.adherence for a full recompute (e.g. at month end).
+
+Usage:
+    # Bootstrap state from full history
+    python -m pipeline.incremental --init --state data/adherence_state.db \\
+        --claims data/fact_claims --drugs data/dim_drug.csv --as-of 2025-10-19
+
+    # Nightly delta
+    python -m pipeline.incremental --state data/adherence_state.db \\
+        --claims data/claims_2025-10-20.csv --drugs data/dim_drug.csv \\
+        --as-of 2025-10-20 --out data/fact_adherence_delta.csv
+"""
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from pipeline.adherence import (
+    LOOKBACK_DAYS, adherence_rows, compute_adherence, group_starts, shift_fills, sort_claims,
+)
+from pipeline.metrics import stage
+from pipeline.tables import COLUMNS, ClaimArrays, day_number, day_string, load_claims, write_rows
+
+# Extra days of fills kept beyond the metric lookback
+STATE_GRACE_DAYS = 30
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coverage_state (
+    member_id TEXT NOT NULL,
+    drug_class TEXT NOT NULL,
+    carry_end INTEGER,
+    fills BLOB NOT NULL,
+    PRIMARY KEY (member_id, drug_class)
+) WITHOUT ROWID;
+"""
+
+
+def open_state(path):
+    """Open (and create if needed) the coverage state database."""
+    conn = sqlite3.connect(path)
+    conn.executescript(STATE_SCHEMA)
+    return conn
+
+
+def state_as_of(conn):
+    """Return the as_of day the state was last advanced to, or None."""
+    row = conn.execute("SELECT value FROM state_meta WHERE key = 'as_of_date'").fetchone()
+    return day_number(row[0]) if row else None
+
+
+def fetch_state(conn, keys):
+    """Load stored state for (member_id, drug_class) keys by primary key."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS affected (member_id TEXT, drug_class TEXT)")
+    conn.execute("DELETE FROM affected")
+    conn.executemany("INSERT INTO affected VALUES (?, ?)", keys)
+    rows = conn.execute(
+        "SELECT s.member_id, s.drug_class, s.carry_end, s.fills "
+        "FROM affected a JOIN coverage_state s "
+        "ON s.member_id = a.member_id AND s.drug_class = a.drug_class"
+    )
+    return {
+        (member_id, drug_class): (carry_end, np.frombuffer(fills, dtype=np.int32).reshape(-1, 2))
+        for member_id, drug_class, carry_end, fills in rows
+    }
+
+
+def merge_state(claims, state):
+    """Prepend stored fills (and carry) to new claims for the same groups."""
+    member_code = {member_id: i for i, member_id in enumerate(claims.member_ids)}
+    class_code = {drug_class: i for i, drug_class in enumerate(claims.drug_classes)}
+    member, drug_class, day, supply = [], [], [], []
+    for (member_id, class_name), (carry_end, fills) in state.items():
+        m = member_code[member_id]
+        c = class_code[class_name]
+        if carry_end is not None:
+            # Coverage from pruned fills ends at carry_end. A synthetic fill
+            # dated before the first kept fill and ending there reproduces
+            # the forward shift; its days all fall before the horizon.
+            first_day = min(carry_end, int(fills[0, 0])) - 1
+            fills = np.vstack([[first_day, carry_end - first_day], fills])
+        member.append(np.full(len(fills), m))
+        drug_class.append(np.full(len(fills), c))
+        day.append(fills[:, 0])
+        supply.append(fills[:, 1])
+    if not member:
+        return claims
+    return ClaimArrays(
+        member=np.concatenate([claims.member, *member]),
+        drug_class=np.concatenate([claims.drug_class, *drug_class]),
+        claim_day=np.concatenate([claims.claim_day, *day]),
+        days_supply=np.concatenate([claims.days_supply, *supply]),
+        member_ids=claims.member_ids,
+        drug_classes=claims.drug_classes,
+    )
+
+
+def state_rows(claims, as_of_day):
+    """Build coverage_state rows for every group in claims.
+
+    Returns (rows to upsert, keys to delete).
+    """
+    member, drug_class, day, supply = sort_claims(claims, as_of_day)
+    if len(member) == 0:
+        return [], []
+    group_start = group_starts(member, drug_class)
+    first = np.flatnonzero(group_start)
+    _, end = shift_fills(group_start, day, supply)
+
+    # Shifted ends rise within a group, so pruned fills form a prefix
+    horizon = as_of_day + 1 - LOOKBACK_DAYS - STATE_GRACE_DAYS
+    kept = end > horizon
+    carry = np.maximum.reduceat(np.where(kept, np.iinfo(np.int64).min, end), first)
+    kept_count = np.add.reduceat(kept.astype(np.int64), first)
+    offsets = np.concatenate([[0], np.cumsum(kept_count)]) * 8
+    packed = np.column_stack([day[kept], supply[kept]]).astype(np.int32).tobytes()
+
+    upserts, deletes = [], []
+    for g, i in enumerate(first.tolist()):
+        key = (claims.member_ids[member[i]], claims.drug_classes[drug_class[i]])
+        if kept_count[g] == 0:
+            deletes.append(key)
+            continue
+        carry_end = int(carry[g]) if carry[g] != np.iinfo(np.int64).min else None
+        upserts.append((*key, carry_end, packed[offsets[g]:offsets[g + 1]]))
+    return upserts, deletes
+
+
+def save_state(conn, upserts, deletes, as_of_day):
+    """Write group state and advance as_of_date in one transaction."""
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO coverage_state VALUES (?, ?, ?, ?)", upserts)
+        conn.executemany("DELETE FROM coverage_state WHERE member_id = ? AND drug_class = ?", deletes)
+        conn.execute(
+            "INSERT OR REPLACE INTO state_meta VALUES ('as_of_date', ?)", (day_string(as_of_day),)
+        )
+
+
+def initialize(conn, claims, as_of_day):
+    """Rebuild state from full claim history and return full adherence."""
+    with conn:
+        conn.execute("DELETE FROM coverage_state")
+    upserts, deletes = state_rows(claims, as_of_day)
+    save_state(conn, upserts, deletes, as_of_day)
+    return compute_adherence(claims, as_of_day)
+
+
+def state_horizon(last):
+    """Earliest claim day the state saved at as_of day last can still take."""
+    return last + 1 - LOOKBACK_DAYS - STATE_GRACE_DAYS
+
+
+@stage("incremental")
+def refresh(conn, claims, as_of_day):
+    """Apply claims received since the last run; return delta adherence.
+
+    claims must not repeat claims already applied: each is added to its
+    group's coverage, including back-dated claims on or before the stored
+    as_of_date. Claims dated after as_of_day are ignored.
+    """
+    last = state_as_of(conn)
+    if last is None:
+        raise ValueError("state is empty; run with --init first")
+    if as_of_day <= last:
+        raise ValueError(f"as_of {day_string(as_of_day)} is not after state as_of {day_string(last)}")
+    horizon = state_horizon(last)
+    too_old = int(np.count_nonzero(claims.claim_day < horizon))
+    if too_old:
+        raise ValueError(f"{too_old:,} claims are dated before the state horizon {day_string(horizon)}; "
+                         "rebuild state with --init")
+
+    new = claims.claim_day <= as_of_day
+    claims = ClaimArrays(
+        member=claims.member[new],
+        drug_class=claims.drug_class[new],
+        claim_day=claims.claim_day[new],
+        days_supply=claims.days_supply[new],
+        member_ids=claims.member_ids,
+        drug_classes=claims.drug_classes,
+    )
+    pairs = np.unique(np.column_stack([claims.member, claims.drug_class]), axis=0)
+    keys = [(claims.member_ids[m], claims.drug_classes[c]) for m, c in pairs.tolist()]
+
+    merged = merge_state(claims, fetch_state(conn, keys))
+    upserts, deletes = state_rows(merged, as_of_day)
+    save_state(conn, upserts, deletes, as_of_day)
+    return compute_adherence(merged, as_of_day)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental fact_adherence refresh")
+    parser.add_argument("--state", required=True, help="Coverage state SQLite file")
+    parser.add_argument("--claims", required=True, help="New fact_claims (or full history with --init)")
+    parser.add_argument("--drugs", required=True, help="dim_drug CSV file")
+    parser.add_argument("--as-of", required=True, help="Calculation date (YYYY-MM-DD)")
+    parser.add_argument("--out", default="data/fact_adherence_delta.csv", help="Output CSV path")
+    parser.add_argument("--init", action="store_true", help="Rebuild state from full claim history")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = open_state(args.state)
+    claims = load_claims(args.claims, args.drugs)
+    as_of_day = day_number(args.as_of)
+    last = state_as_of(conn)
+    backdated = 0 if args.init or last is None else int(np.count_nonzero(claims.claim_day <= last))
+    result = initialize(conn, claims, as_of_day) if args.init else refresh(conn, claims, as_of_day)
+    count = write_rows(
+        args.out, COLUMNS["fact_adherence"], adherence_rows(result, claims.member_ids, claims.drug_classes)
+    )
+    conn.close()
+
+    print(f"✓ Read {len(claims):,} paid claims")
+    if backdated:
+        print(f"· Folded in {backdated:,} back-dated claims (on or before {day_string(last)})")
+    print(f"✓ Wrote {count:,} {'full' if args.init else 'delta'} rows to {args.out}")
+    print(f"✓ State advanced to {args.as_of} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Bulk loader into the web app's Prisma SQLite database.
+
+Writes dim_client, dim_member, fact_adherence and fact_notification CSVs
+straight into DimClient, DimMember, FactAdherence and FactNotification.
+Tables must already exist (`npm run db:push` in apps/web).
+
+For speed the load:
+- relaxes journal and sync pragmas for the duration of the load, then
+  restores them
+- drops the secondary indexes (@@index([clientId]), @@index([asOfDate]), ...)
+  on the target tables and rebuilds them once at the end
+- inserts with batched executemany, one transaction per table; with
+  --replace the table is cleared in that same transaction, so a failed
+  load leaves the previous rows in place
+- checks each table's row count against the rows read from the source
+  before committing, and rolls back on a mismatch
+
+Prisma stores SQLite DateTime values as epoch milliseconds; ids are derived
+from the contract keys so reloading the same data is idempotent with
+--replace.
+
+Usage:
+    python -m pipeline.load --db apps/web/prisma/dev.db --data data \\
+        --adherence data/fact_adherence.csv --notifications data/fact_notification.csv --replace
+"""
+
+import argparse
+import datetime
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from pipeline.metrics import stage
+from pipeline.tables import day_number, read_columns, read_rows
+
+DEFAULT_DB = "apps/web/prisma/dev.db"
+
+# Rows per executemany call
+BATCH_ROWS = 50_000
+
+MS_PER_DAY = 86_400_000
+
+# Display names and zip codes for synthetic members, as in prisma/seed.ts
+FIRST_NAMES = ["John", "Jane", "Michael", "Sarah", "Robert", "Mary", "William", "Patricia",
+               "James", "Jennifer", "David", "Linda", "Richard", "Barbara", "Joseph", "Elizabeth"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+              "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas"]
+
+INSERT_SQL = {
+    "DimClient": 'INSERT INTO "DimClient" (id, name, segment, region, createdAt) VALUES (?, ?, ?, ?, ?)',
+    "DimMember": (
+        'INSERT INTO "DimMember" (id, clientId, name, age, dob, gender, zipCode, riskBand, planId, createdAt) '
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    # clientId comes from DimMember by primary key, so no member map is held in Python
+    "FactAdherence": (
+        'INSERT INTO "FactAdherence" (id, clientId, memberId, drugClass, pdc90, pdc180, mpr90, asOfDate, createdAt) '
+        'VALUES (?, COALESCE((SELECT clientId FROM "DimMember" WHERE id = ?), \'\'), ?, ?, ?, ?, ?, ?, ?)'
+    ),
+    "FactNotification": (
+        'INSERT INTO "FactNotification" (id, clientId, ruleKey, entityRef, message, recommendedAction, '
+        "severity, owner, slaHours, status, createdAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+}
+
+# Load order: members before adherence, whose clientId is looked up from DimMember
+LOAD_ORDER = ["DimClient", "DimMember", "FactAdherence", "FactNotification"]
+
+
+def timestamp_ms(value):
+    """Convert an ISO date or datetime string to epoch milliseconds (UTC)."""
+    if len(value) <= 10:
+        return day_number(value) * MS_PER_DAY
+    parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def client_rows(path, created_ms):
+    for row in read_rows(path):
+        yield row["client_id"], row["name"], row["segment"], row["region"], created_ms
+
+
+def member_rows(path, created_ms, today):
+    columns = ["member_id", "client_id", "dob", "gender", "risk_band", "plan_id"]
+    for member_id, client_id, dob, gender, risk_band, plan_id in read_columns(path, columns):
+        h = zlib.crc32(member_id.encode())
+        born = datetime.date.fromisoformat(dob)
+        age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+        yield (
+            member_id, client_id,
+            f"{FIRST_NAMES[h % len(FIRST_NAMES)]} {LAST_NAMES[(h >> 8) % len(LAST_NAMES)]}",
+            age, timestamp_ms(dob), gender, f"{10000 + (h >> 16) % 90000}",
+            risk_band, plan_id, created_ms,
+        )
+
+
+def adherence_rows(path, created_ms):
+    as_of_cache = {}
+    columns = ["member_id", "drug_class", "pdc_90", "pdc_180", "mpr_90", "as_of_date"]
+    for member_id, drug_class, pdc_90, pdc_180, mpr_90, as_of in read_columns(path, columns):
+        as_of_ms = as_of_cache.get(as_of)
+        if as_of_ms is None:
+            as_of_ms = as_of_cache[as_of] = timestamp_ms(as_of)
+        yield (
+            f"{member_id}:{drug_class}:{as_of}", member_id, member_id, drug_class,
+            float(pdc_90), float(pdc_180), float(mpr_90), as_of_ms, created_ms,
+        )
+
+
+def notification_rows(path):
+    for row in read_rows(path):
+        yield (
+            row["notification_id"], row["client_id"] or None, row["rule_key"], row["entity_ref"],
+            row["message"], row["recommended_action"], row["severity"], row["owner"],
+            int(row["sla_hours"]), row["status"], timestamp_ms(row["created_at"]),
+        )
+
+
+@contextmanager
+def bulk_pragmas(conn):
+    """Relax durability for the load and restore the previous settings after."""
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    # MEMORY keeps rollback working for a failed batch; only an OS crash
+    # mid-load can leave the file inconsistent, and a reload fixes that.
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+    try:
+        yield
+    finally:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+
+
+@contextmanager
+def deferred_indexes(conn, tables):
+    """Drop secondary (non-unique) indexes on tables; rebuild them on exit."""
+    placeholders = ", ".join("?" for _ in tables)
+    indexes = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND sql NOT LIKE 'CREATE UNIQUE%' AND tbl_name IN ({placeholders})",
+        tables,
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    try:
+        yield [name for name, _ in indexes]
+    finally:
+        for _, sql in indexes:
+            conn.execute(sql)
+
+
+def insert_batches(conn, sql, rows, batch_rows=BATCH_ROWS):
+    """executemany rows in fixed-size batches; return how many rows the source yielded.
+
+    Runs inside the caller's transaction.
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_rows:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def load_table(conn, table, rows, replace=False):
+    """Replace or append a table's rows in one transaction; return rows inserted.
+
+    The row count is checked against the rows read from the source before
+    COMMIT; on a mismatch or any error the transaction is rolled back, so
+    --replace never leaves the table empty.
+    """
+    conn.execute("BEGIN")
+    try:
+        if replace:
+            conn.execute(f'DELETE FROM "{table}"')
+        before = table_count(conn, table)
+        read = insert_batches(conn, INSERT_SQL[table], rows)
+        after = table_count(conn, table)
+        if after != before + read:
+            raise RuntimeError(f"{table}: read {read:,} source rows but the table grew by {after - before:,}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return read
+
+
+def table_count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+
+@stage("load")
+def bulk_load(db_path, sources, replace=False):
+    """Load row sources into tables; return {table: rows inserted}.
+
+    sources maps a table name to an iterable of parameter tuples for
+    INSERT_SQL[table]. Each table loads in its own transaction: if a row
+    fails, or the table's count does not match the rows read from its
+    source, that table is rolled back (RuntimeError or the sqlite3 error).
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        existing = {
+            name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+        missing = [table for table in sources if table not in existing]
+        if missing:
+            raise RuntimeError(f"{db_path} has no table(s) {', '.join(missing)}; run `npm run db:push` first")
+
+        tables = [table for table in LOAD_ORDER if table in sources]
+        inserted = {}
+        with bulk_pragmas(conn), deferred_indexes(conn, tables) as dropped:
+            if dropped:
+                print(f"  deferred indexes: {', '.join(dropped)}")
+            for table in tables:
+                started = time.perf_counter()
+                inserted[table] = load_table(conn, table, sources[table], replace)
+                print(f"  {table}: {inserted[table]:,} rows in {time.perf_counter() - started:.1f}s")
+        conn.execute("ANALYZE")
+
+        if "FactAdherence" in inserted:
+            orphans = conn.execute("SELECT COUNT(*) FROM \"FactAdherence\" WHERE clientId = ''").fetchone()[0]
+            if orphans:
+                print(f"  ⚠ {orphans:,} FactAdherence rows reference members not in DimMember")
+        return inserted
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load pipeline output into the web app SQLite database")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database path")
+    parser.add_argument("--data", help="Generator output directory (dim_client.csv, dim_member/)")
+    parser.add_argument("--adherence", help="fact_adherence CSV file or part directory")
+    parser.add_argument("--notifications", help="fact_notification CSV file or part directory")
+    parser.add_argument("--replace", action="store_true", help="Clear target tables before loading")
+    args = parser.parse_args()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    created_ms = int(now.timestamp() * 1000)
+    sources = {}
+    if args.data:
+        sources["DimClient"] = client_rows(Path(args.data) / "dim_client.csv", created_ms)
+        sources["DimMember"] = member_rows(Path(args.data) / "dim_member", created_ms, now.date())
+    if args.adherence:
+        sources["FactAdherence"] = adherence_rows(args.adherence, created_ms)
+    if args.notifications:
+        sources["FactNotification"] = notification_rows(args.notifications)
+    if not sources:
+        parser.error("nothing to load: pass --data, --adherence and/or --notifications")
+
+    started = time.perf_counter()
+    inserted = bulk_load(args.db, sources, replace=args.replace)
+    print(f"✓ Loaded {sum(inserted.values()):,} rows into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+Latency histograms and stage timers with Prometheus text export.
+
+requirements/observability.md asks for dashboard query latency (p50, p95,
+p99) and data pipeline execution time. Durations are recorded in integer
+nanoseconds into fixed-bucket, HDR-style log-linear histograms: values below
+SUB_BUCKETS are exact, and above that each power of two is split into
+SUB_BUCKETS / 2 linear buckets, so any recorded value is reported within
+1 / SUB_BUCKETS (0.4%) of its true value, at any sample count, in a fixed
+~5K-bucket array. Recording is a bucket-index computation and an increment;
+histograms merge by adding counts.
+
+    @stage("adherence")                 # pipeline stage: duration + failures
+    def compute_adherence(...): ...
+
+    with timed("acme_dashboard_query_seconds", query="cube"):
+        ...
+
+    histogram("acme_batch_seconds").record_array(batch_ns)   # hot loops
+
+Snapshots are Prometheus text exposition format. A CLI run writes one on
+exit when ACME_METRICS_DIR is set (<dir>/<job>.prom, for the node_exporter
+textfile collector) and/or pushes it to ACME_METRICS_PUSHGATEWAY. The job
+is named after the pipeline module, so each nightly stage keeps its own
+file.
+
+Usage:
+    ACME_METRICS_DIR=/var/lib/node_exporter/textfile python -m pipeline.adherence ...
+    python -m pipeline.metrics overhead [--samples 5000000]
+"""
+
+import argparse
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+METRICS_DIR_ENV = "ACME_METRICS_DIR"
+PUSHGATEWAY_ENV = "ACME_METRICS_PUSHGATEWAY"
+
+SUB_BITS = 8
+SUB_BUCKETS = 1 << SUB_BITS
+HALF_BUCKETS = SUB_BUCKETS // 2
+# Up to 2^45 ns (~9.8 hours); longer values land in the last bucket
+MAX_EXPONENT = 45 - SUB_BITS + 1
+BUCKETS = SUB_BUCKETS + MAX_EXPONENT * HALF_BUCKETS
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+STAGE_SECONDS = "acme_pipeline_stage_seconds"
+STAGE_FAILURES = "acme_pipeline_stage_failures_total"
+QUERY_SECONDS = "acme_dashboard_query_seconds"
+
+
+def bucket_index(value):
+    """Bucket of a non-negative integer value."""
+    if value < SUB_BUCKETS:
+        return value if value > 0 else 0
+    shift = value.bit_length() - SUB_BITS
+    return min(SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (value >> shift) - HALF_BUCKETS, BUCKETS - 1)
+
+
+def bucket_indexes(values):
+    """bucket_index over an integer array."""
+    values = np.maximum(np.asarray(values, dtype=np.int64), 0)
+    # frexp's exponent is the bit length for integers below 2^53
+    shift = np.maximum(np.frexp(values.astype(np.float64))[1] - SUB_BITS, 0)
+    index = np.where(
+        shift > 0,
+        SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (values >> shift) - HALF_BUCKETS,
+        values,
+    )
+    return np.minimum(index, BUCKETS - 1)
+
+
+def bucket_values():
+    """Representative (midpoint) value of every bucket."""
+    index = np.arange(BUCKETS, dtype=np.int64)
+    log = np.maximum(index - SUB_BUCKETS, 0)
+    shift = np.where(index >= SUB_BUCKETS, log // HALF_BUCKETS + 1, 0)
+    low = np.where(index >= SUB_BUCKETS, (log % HALF_BUCKETS + HALF_BUCKETS) << shift, index)
+    return low + ((1 << shift) - 1) / 2
+
+
+_BUCKET_VALUES = bucket_values()
+
+
+class Histogram:
+    """Log-linear histogram of integer nanosecond durations.
+
+    record() only appends to a pending list (list.append is atomic, so no
+    lock on the hot path); every FLUSH_RECORDS values, and before any read,
+    the pending values are bucketed together with record_array().
+    """
+
+    FLUSH_RECORDS = 4096
+
+    def __init__(self):
+        self.counts = np.zeros(BUCKETS, dtype=np.int64)
+        self._recorded = 0
+        self.total = 0
+        self._min = None
+        self._max = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def record(self, value_ns):
+        pending = self._pending
+        pending.append(value_ns)
+        if len(pending) >= self.FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self, wait=False):
+        """Bucket pending records; unless wait, a no-op while another thread is flushing."""
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            # Values appended during the fold land after n and are kept
+            n = len(self._pending)
+            values = self._pending[:n]
+            del self._pending[:n]
+            self._add_array(np.array(values, dtype=np.int64))
+        finally:
+            self._lock.release()
+
+    def record_array(self, values_ns):
+        """Record many durations at once (one bincount, no Python loop)."""
+        with self._lock:
+            self._add_array(np.asarray(values_ns, dtype=np.int64))
+
+    def _add_array(self, values_ns):
+        if not len(values_ns):
+            return
+        self.counts += np.bincount(bucket_indexes(values_ns), minlength=BUCKETS)
+        self._add(len(values_ns), int(values_ns.sum()), int(values_ns.min()), int(values_ns.max()))
+
+    def _add(self, count, total, low, high):
+        self._min = low if self._min is None else min(self._min, low)
+        self._max = high if self._max is None else max(self._max, high)
+        self._recorded += count
+        self.total += total
+
+    @property
+    def count(self):
+        return self._recorded + len(self._pending)
+
+    def merge(self, other):
+        other.flush(wait=True)
+        with self._lock:
+            if other._recorded:
+                self.counts += other.counts
+                self._add(other._recorded, other.total, other._min, other._max)
+
+    def quantiles(self, qs=QUANTILES):
+        """Values (ns) at the given quantiles, clamped to the observed range."""
+        self.flush(wait=True)
+        if not self._recorded:
+            return [float("nan")] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(np.asarray(qs) * self._recorded), 1)
+        values = _BUCKET_VALUES[np.searchsorted(cumulative, ranks)]
+        return np.clip(values, self._min, self._max).tolist()
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+
+class Counter:
+    """Monotonic counter; value stays None (not exported) until first inc()."""
+
+    def __init__(self):
+        self.value = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value = (self.value or 0) + amount
+
+
+class Registry:
+    """Named metric families, each a set of series keyed by label values."""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _series(self, kind, factory, name, help_text, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, {"kind": kind, "help": help_text, "series": {}})
+            if family["kind"] != kind:
+                raise ValueError(f"metric {name} is a {family['kind']}, not a {kind}")
+            family["help"] = family["help"] or help_text
+            series = family["series"].get(key)
+            if series is None:
+                series = family["series"][key] = factory()
+            return series
+
+    def histogram(self, name, help_text="", **labels):
+        return self._series("summary", Histogram, name, help_text, labels)
+
+    def counter(self, name, help_text="", **labels):
+        return self._series("counter", Counter, name, help_text, labels)
+
+    def clear(self):
+        with self._lock:
+            self._families.clear()
+
+    def prometheus_text(self):
+        """Snapshot in Prometheus text exposition format (histograms as summaries, in seconds)."""
+        lines = []
+        with self._lock:
+            families = {name: dict(family, series=dict(family["series"])) for name, family in self._families.items()}
+        # Series registered (e.g. by a decorator at import) but never used are skipped
+        for name, family in sorted(families.items()):
+            samples = []
+            for key, series in sorted(family["series"].items()):
+                if family["kind"] == "counter":
+                    if series.value is not None:
+                        samples.append(f"{name}{format_labels(key)} {series.value}")
+                    continue
+                quantiles = series.quantiles()
+                if not series._recorded:
+                    continue
+                for q, value in zip(QUANTILES, quantiles):
+                    samples.append(f"{name}{format_labels(key + (('quantile', str(q)),))} {value / 1e9:.9g}")
+                samples.append(f"{name}_sum{format_labels(key)} {series.total / 1e9:.9g}")
+                samples.append(f"{name}_count{format_labels(key)} {series._recorded}")
+            if not samples:
+                continue
+            if family["help"]:
+                lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(samples)
+        lines.append(f"acme_metrics_snapshot_timestamp_seconds {time.time():.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name, help_text="", **labels):
+    return REGISTRY.histogram(name, help_text, **labels)
+
+
+def counter(name, help_text="", **labels):
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+class timed:
+    """Time a block (with timed(...)) or every call of a function (@timed(...)).
+
+    failures, if given, is a Counter incremented when the block raises (and
+    touched with 0 otherwise, so it is exported); the duration is recorded
+    either way.
+    """
+
+    __slots__ = ("histogram", "failures", "_started")
+
+    def __init__(self, name, help_text="", failures=None, **labels):
+        self.histogram = histogram(name, help_text, **labels)
+        self.failures = failures
+
+    def __enter__(self):
+        self._started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter_ns() - self._started)
+        if self.failures is not None:
+            self.failures.inc(1 if exc_type is not None else 0)
+        return False
+
+    def __call__(self, fn):
+        record, failures = self.histogram.record, self.failures
+        clock = time.perf_counter_ns
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = clock()
+            failed = 1
+            try:
+                result = fn(*args, **kwargs)
+                failed = 0
+                return result
+            finally:
+                record(clock() - started)
+                if failures is not None:
+                    failures.inc(failed)
+
+        return wrapper
+
+
+def stage(name):
+    """Timer for a pipeline stage: duration histogram plus failure counter."""
+    failures = counter(STAGE_FAILURES, "Pipeline stage runs that raised", stage=name)
+    return timed(STAGE_SECONDS, "Pipeline stage duration", failures=failures, stage=name)
+
+
+def query_timer(query):
+    return timed(QUERY_SECONDS, "Dashboard query latency", query=query)
+
+
+def write_textfile(path, registry=REGISTRY):
+    """Atomically write a snapshot (the textfile collector must never see a partial file)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(registry.prometheus_text(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def push(url, job, registry=REGISTRY, timeout=5):
+    """PUT a snapshot to a Prometheus Pushgateway under the job name."""
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/metrics/job/{job}", data=registry.prometheus_text().encode("utf-8"),
+        method="PUT", headers={"Content-Type": "text/plain; version=0.0.4"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout):
+        pass
+
+
+def job_name():
+    """pipeline_<module> for `python -m pipeline.<module>` runs."""
+    return f"pipeline_{Path(sys.argv[0]).stem or 'python'}"
+
+
+def export_snapshot():
+    """Write/push a snapshot to the configured destinations; never raises."""
+    if not REGISTRY._families:
+        return
+    job = job_name()
+    try:
+        if os.environ.get(METRICS_DIR_ENV):
+            write_textfile(Path(os.environ[METRICS_DIR_ENV]) / f"{job}.prom")
+        if os.environ.get(PUSHGATEWAY_ENV):
+            push(os.environ[PUSHGATEWAY_ENV], job)
+    except OSError as e:
+        print(f"⚠ metrics export failed: {e}", file=sys.stderr)
+
+
+if os.environ.get(METRICS_DIR_ENV) or os.environ.get(PUSHGATEWAY_ENV):
+    atexit.register(export_snapshot)
+
+
+def overhead(samples):
+    """Measure recording cost and quantile accuracy on a lognormal sample."""
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(mean=np.log(2e6), sigma=1.5, size=samples).astype(np.int64)
+
+    registry = Registry()
+    scalar = registry.histogram("scalar")
+    subset = values[:min(samples, 1_000_000)].tolist()
+    started = time.perf_counter_ns()
+    for value in subset:
+        scalar.record(value)
+    per_record = (time.perf_counter_ns() - started) / len(subset)
+
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(len(subset)):
+        pass
+    loop = (clock() - started) / len(subset)
+
+    def noop():
+        pass
+
+    wrapped = timed("decorated")(noop)
+    started = clock()
+    for _ in range(len(subset)):
+        wrapped()
+    per_call = (clock() - started) / len(subset)
+
+    batch = registry.histogram("batch")
+    started = clock()
+    batch.record_array(values)
+    per_array_value = (clock() - started) / samples
+
+    exact = np.quantile(values, QUANTILES, method="inverted_cdf")
+    approx = batch.quantiles()
+    print(f"✓ record(): {per_record - loop:.0f} ns, @timed call: {per_call - loop:.0f} ns, "
+          f"record_array(): {per_array_value:.1f} ns/value")
+    for q, e, a in zip(QUANTILES, exact, approx):
+        print(f"  p{q * 100:g}: exact {e / 1e6:.3f} ms, histogram {a / 1e6:.3f} ms ({(a - e) / e * 100:+.2f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instrumentation histograms and Prometheus export")
+    sub = parser.add_subparsers(dest="command", required=True)
+    overhead_parser = sub.add_parser("overhead", help="Measure recording overhead and quantile accuracy")
+    overhead_parser.add_argument("--samples", type=int, default=5_000_000, help="Samples for the accuracy check")
+    args = parser.parse_args()
+
+    if args.command == "overhead":
+        overhead(args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Weekly "What changed" digest (Story 2.2): top-K movers across the cohort
+lattice.
+
+A mover is a cohort - any combination of drug class x plan x region x risk
+band, including the client overall - whose adherent rate (members with
+PDC_90 >= 80%) moved significantly week over week. Inputs are the current
+and prior weeks of the AggAdherenceWeekly cube (a few hundred cells per
+client whatever the member count), with region joined from DimClient.
+Cube cells hold one row per member x drug class, so cohorts not split by
+drug class take their member count from AggMemberWeekly; the adherent rate
+is over member x drug class rows either way.
+
+The lattice is walked coarse to fine, BUC style: a cuboid is aggregated only
+from the base cells whose projection onto its parent cuboid (one dimension
+fewer) survived minimum-support pruning, since a cohort can never have more
+members than its parent. Each cuboid is one packed-key np.unique plus a few
+bincounts. Candidates must pass a two-proportion z-test and a minimum delta,
+and a bounded heap per scope keeps the top K by impact (members whose
+adherence status moved).
+
+Results are written to AggWeeklyMover with narrative text, replacing the
+week, so the executive dashboard reads them directly. Scope "ALL" holds the
+org-wide digest for EXEC users.
+
+Usage:
+    python -m pipeline.movers --db apps/web/prisma/dev.db [--week 2025-10-13] [--top 3] [--json data/movers.json]
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import sqlite3
+import time
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from pipeline.load import MS_PER_DAY
+from pipeline.rollup import latest_week, week_start
+from pipeline.tables import day_number, day_string
+
+LATTICE_DIMENSIONS = ["drugClass", "planId", "region", "riskBand"]
+
+ORG_SCOPE = "ALL"
+
+TOP_K = 3
+
+# Cohorts with fewer members in both weeks are never reported (or refined)
+MIN_SUPPORT = 50
+
+# A mover must be significant and big enough to matter
+MIN_Z = 1.96
+MIN_DELTA_PP = 2.0
+
+INSERT_SQL = (
+    'INSERT INTO "AggWeeklyMover" (weekStart, clientId, rank, metric, segment, priorValue, '
+    "currentValue, delta, members, zScore, narrative) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+METRIC_LABELS = {"adherent_rate": "adherence"}
+
+
+@dataclass
+class Mover:
+    scope: str
+    segment: dict
+    metric: str
+    prior: float
+    current: float
+    delta: float
+    members: int
+    z: float
+    impact: float
+
+    @property
+    def narrative(self):
+        parts = []
+        for name in LATTICE_DIMENSIONS:
+            value = self.segment.get(name)
+            if value is None:
+                continue
+            if name == "region":
+                value = f"{value} region"
+            elif name == "riskBand":
+                value = f"{value} risk"
+            parts.append(value)
+        cohort = " · ".join(parts) or ("Overall" if self.scope != ORG_SCOPE else "Org-wide")
+        direction = "up" if self.delta > 0 else "down"
+        text = (f"{cohort} {METRIC_LABELS[self.metric]} {direction} {abs(self.delta):.1f}pp "
+                f"({self.prior:.1f}% → {self.current:.1f}%, {self.members:,} members)")
+        return text[0].upper() + text[1:]
+
+
+def load_cells(conn, week_ms):
+    """Base cells of the current and prior week; return (codes, values, measures).
+
+    codes is {dimension: int array}, values is {dimension: list of labels},
+    and measures is a (cells, 2 weeks, 3) array of member x drug class rows,
+    adherentCount and distinct members. The distinct count of a client x
+    region x plan x risk band group is held by one of its cells, so it sums
+    correctly over any cohort that does not split drug classes.
+    """
+    rows = conn.execute(
+        'SELECT a.weekStart, a.clientId, COALESCE(c.region, \'Unknown\'), a.drugClass, a.planId, a.riskBand, '
+        'a.members, a.adherentCount FROM "AggAdherenceWeekly" a '
+        'LEFT JOIN "DimClient" c ON c.id = a.clientId WHERE a.weekStart IN (?, ?)',
+        (week_ms, week_ms - 7 * MS_PER_DAY),
+    ).fetchall()
+
+    names = ["clientId", "region", "drugClass", "planId", "riskBand"]
+    lookup = {name: {} for name in names}
+    cells = {}
+    groups = {}
+    for week, *key, members, adherent in rows:
+        coded = tuple(lookup[name].setdefault(value, len(lookup[name])) for name, value in zip(names, key))
+        cell = cells.setdefault(coded, np.zeros((2, 3)))
+        cell[0 if week == week_ms else 1, :2] += (members, adherent)
+        groups.setdefault(coded[:2] + coded[3:], cell)
+
+    distinct = conn.execute(
+        'SELECT m.weekStart, m.clientId, COALESCE(c.region, \'Unknown\'), m.planId, m.riskBand, m.members '
+        'FROM "AggMemberWeekly" m LEFT JOIN "DimClient" c ON c.id = m.clientId WHERE m.weekStart IN (?, ?)',
+        (week_ms, week_ms - 7 * MS_PER_DAY),
+    )
+    group_names = ["clientId", "region", "planId", "riskBand"]
+    for week, *key, members in distinct:
+        coded = tuple(lookup[name].get(value) for name, value in zip(group_names, key))
+        if coded in groups:
+            groups[coded][0 if week == week_ms else 1, 2] += members
+
+    keys = np.array(list(cells), dtype=np.int64).reshape(len(cells), len(names))
+    codes = {name: keys[:, i] for i, name in enumerate(names)}
+    values = {name: list(lookup[name]) for name in names}
+    measures = np.array(list(cells.values())).reshape(len(cells), 2, 3)
+    return codes, values, measures
+
+
+def cohort_candidates(scope, dims, codes, values, measures, rows):
+    """Aggregate one cuboid over rows; return (movers, keep).
+
+    keep marks the rows in cells with enough support; only those are
+    refined by the cuboid's children.
+    """
+    key = np.zeros(rows.sum(), dtype=np.int64)
+    for name in dims:
+        key = key * len(values[name]) + codes[name][rows]
+    cells, inverse = np.unique(key, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = np.stack([
+        np.bincount(inverse, measures[rows, week, m], minlength=len(cells))
+        for week in range(2) for m in range(3)
+    ], axis=1).reshape(len(cells), 2, 3)
+
+    members = sums[:, :, 0 if "drugClass" in dims else 2]
+    supported = members.max(axis=1) >= MIN_SUPPORT
+    keep = np.zeros(len(rows), dtype=bool)
+    keep[np.flatnonzero(rows)] = supported[inverse]
+
+    movers = []
+    comparable = (members >= MIN_SUPPORT).all(axis=1)
+    if not comparable.any():
+        return movers, keep
+    n1, n0 = sums[:, 0, 0], sums[:, 1, 0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate1, rate0 = sums[:, 0, 1] / n1, sums[:, 1, 1] / n0
+        pooled = (sums[:, 0, 1] + sums[:, 1, 1]) / (n1 + n0)
+        z_rate = (rate1 - rate0) / np.sqrt(pooled * (1 - pooled) * (1 / n1 + 1 / n0))
+    metrics = {"adherent_rate": (rate0 * 100, rate1 * 100, z_rate)}
+    for metric, (prior, current, z) in metrics.items():
+        delta = current - prior
+        hits = comparable & (np.abs(delta) >= MIN_DELTA_PP) & (np.abs(np.nan_to_num(z)) >= MIN_Z)
+        for i in np.flatnonzero(hits).tolist():
+            segment = {}
+            rest = int(cells[i])
+            for name in reversed(dims):
+                rest, code = divmod(rest, len(values[name]))
+                segment[name] = values[name][code]
+            movers.append(Mover(
+                scope=scope, segment={d: segment[d] for d in dims}, metric=metric,
+                prior=float(prior[i]), current=float(current[i]), delta=float(delta[i]),
+                members=int(members[i, 0]), z=float(z[i]), impact=abs(float(delta[i])) * float(members[i, 0]) / 100,
+            ))
+    return movers, keep
+
+
+def scope_movers(scope, codes, values, measures, rows, top):
+    """Top movers of one scope across its whole lattice."""
+    # Dimensions constant within the scope (region for one client) add only
+    # duplicate cohorts
+    dims = [name for name in LATTICE_DIMENSIONS if len(np.unique(codes[name][rows])) > 1]
+    heap = []
+    counter = itertools.count()
+    surviving = {(): rows}
+    for size in range(len(dims) + 1):
+        for cuboid in itertools.combinations(dims, size):
+            parent_rows = surviving.get(cuboid[:-1], rows)
+            if not parent_rows.any():
+                surviving[cuboid] = parent_rows
+                continue
+            movers, keep = cohort_candidates(scope, cuboid, codes, values, measures, parent_rows)
+            surviving[cuboid] = keep
+            for mover in movers:
+                entry = (mover.impact, next(counter), mover)
+                if len(heap) < top:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heappushpop(heap, entry)
+    return [mover for _, _, mover in sorted(heap, key=lambda e: (-e[0], e[1]))]
+
+
+def digest(conn, week_ms, top=TOP_K):
+    """{scope: [Mover]} for every client plus the org-wide scope."""
+    codes, values, measures = load_cells(conn, week_ms)
+    result = {}
+    if not len(measures):
+        return result
+    everything = np.ones(len(measures), dtype=bool)
+    result[ORG_SCOPE] = scope_movers(ORG_SCOPE, codes, values, measures, everything, top)
+    for code, client_id in enumerate(values["clientId"]):
+        result[client_id] = scope_movers(client_id, codes, values, measures, codes["clientId"] == code, top)
+    return result
+
+
+def segment_label(segment):
+    return ";".join(f"{name}={value}" for name, value in segment.items()) or "overall"
+
+
+def save(conn, week_ms, movers):
+    """Replace the week's movers in AggWeeklyMover; return rows written."""
+    rows = [
+        (week_ms, scope, rank, m.metric, segment_label(m.segment), m.prior, m.current, m.delta,
+         m.members, m.z, m.narrative)
+        for scope, scope_list in movers.items()
+        for rank, m in enumerate(scope_list, start=1)
+    ]
+    with conn:
+        conn.execute('DELETE FROM "AggWeeklyMover" WHERE weekStart = ?', (week_ms,))
+        conn.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weekly top-K movers digest over the rollup cube")
+    parser.add_argument("--db", required=True, help="Web app SQLite database")
+    parser.add_argument("--week", help="Any date in the week (YYYY-MM-DD); default: latest cube week")
+    parser.add_argument("--top", type=int, default=TOP_K, help="Movers per scope")
+    parser.add_argument("--json", help="Also write the digest as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Print only; do not write AggWeeklyMover")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    week_ms = week_start(day_number(args.week)) * MS_PER_DAY if args.week else latest_week(conn)
+    if week_ms is None:
+        raise SystemExit("AggAdherenceWeekly is empty; run pipeline.rollup refresh first")
+    movers = digest(conn, week_ms, args.top)
+    computed = time.perf_counter()
+
+    week = day_string(week_ms // MS_PER_DAY)
+    for scope, scope_list in movers.items():
+        print(f"{scope} — week of {week}")
+        for rank, mover in enumerate(scope_list, start=1):
+            print(f"  {rank}. {mover.narrative}")
+        if not scope_list:
+            print("  (no significant movers)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "week_start": week,
+                "movers": {
+                    scope: [{**asdict(m), "narrative": m.narrative} for m in scope_list]
+                    for scope, scope_list in movers.items()
+                },
+            }, f, indent=2)
+    if not args.dry_run:
+        written = save(conn, week_ms, movers)
+        print(f"✓ Wrote {written} movers to AggWeeklyMover")
+    print(f"({(computed - started) * 1000:.1f} ms)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
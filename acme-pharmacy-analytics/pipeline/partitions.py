@@ -0,0 +1,538 @@
+"""
+Hive-style partitioned storage for fact_claims and fact_adherence.
+
+Layout:
+
+    lake/
+      _manifest.json                           partitions, part files and their stats
+      fact_claims/
+        client_id=ACME/month=2025-08/part-00000.csv
+        client_id=ACME/month=2025-09/part-00000.csv
+        client_id=ACME/month=2025-09/part-00001.csv     appended by a later write
+        client_id=__HIVE_DEFAULT_PARTITION__/...        members missing from dim_member
+      fact_adherence/
+        client_id=ACME/month=2025-10/part-00000.csv
+
+Every RLS-scoped query filters on client_id (security_privacy.md), and most
+adherence work reads a 90- or 180-day window, so rows are partitioned by
+client (joined from dim_member, since the fact tables carry only member_id)
+and by month of the table's date column. Part files are plain CSV with a
+header, readable by everything in pipeline.tables.
+
+The manifest records rows, bytes and per-column min/max (dates and numeric
+columns) for each part file. plan() prunes from the RLS scope and a date
+range using the manifest alone: other clients' partitions, months outside the
+range, then part files whose min/max dates miss it. No data is read until the
+surviving files are scanned, and a scan applies the exact date predicate to
+the rows of boundary months.
+
+Writes are appends: each write adds one part number to every partition it
+touches. Parts are written under temporary names, renamed, and only then
+published in the manifest (replaced atomically), so readers never see a
+partial write.
+
+Usage:
+    python -m pipeline.partitions write --store data/lake --table fact_claims \\
+        --source data/fact_claims --members data/dim_member
+    python -m pipeline.partitions plan --store data/lake --table fact_claims \\
+        --role CLIENT_VIEWER --client ACME --days 90
+    python -m pipeline.partitions scan --store data/lake --table fact_claims \\
+        --role CLIENT_VIEWER --client ACME --days 90 --out data/acme_claims_90d.csv
+    python -m pipeline.partitions info --store data/lake
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from pipeline.contracts import file_chunks, key_hashes
+from pipeline.rls import scope_for, scoped_filters
+from pipeline.tables import COLUMNS, day_number, day_string, table_files
+
+MANIFEST = "_manifest.json"
+MANIFEST_VERSION = 1
+
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Partitioned tables and the date column that picks the month
+DATE_COLUMNS = {"fact_claims": "claim_date", "fact_adherence": "as_of_date"}
+
+# Columns with min/max stats in the manifest, and how they are parsed
+STAT_COLUMNS = {
+    "fact_claims": {"claim_date": "DATE", "days_supply": "INTEGER", "paid_amount": "DECIMAL"},
+    "fact_adherence": {"as_of_date": "DATE", "pdc_90": "DECIMAL", "pdc_180": "DECIMAL", "mpr_90": "DECIMAL"},
+}
+STAT_SCALE = 4
+
+# Buffered output across all partitions before it is appended to the part files
+BUFFER_BYTES = 64 * 1024 * 1024
+
+# Partition keys pack (client code + 1) above (months since 1970 + 1); 0 is the default partition
+_MONTH_BITS = 20
+
+
+def partition_name(client_id, month):
+    return f"client_id={quote(client_id, safe='')}/month={month}"
+
+
+def month_string(months):
+    """'YYYY-MM' for months since 1970-01."""
+    return str(np.datetime64(int(months), "M"))
+
+
+def month_days(month):
+    """First and last day number of a 'YYYY-MM' month."""
+    first = np.datetime64(month, "M")
+    return int(first.astype("datetime64[D]").astype(np.int64)), \
+        int((first + 1).astype("datetime64[D]").astype(np.int64)) - 1
+
+
+class MemberClients:
+    """member_id -> client_id lookup from dim_member, on hashes of the raw bytes."""
+
+    def __init__(self, members_path):
+        member_hashes, client_codes, self.clients = [], [], []
+        codes = {}
+        for file in table_files(members_path):
+            for chunk in file_chunks(file):
+                client_mat, client_widths = chunk.matrix("client_id")
+                hashes = key_hashes(client_mat, client_widths)
+                unique, first = np.unique(hashes, return_index=True)
+                for h, row in zip(unique.tolist(), first.tolist()):
+                    if h not in codes:
+                        codes[h] = len(self.clients)
+                        self.clients.append(chunk.values("client_id", [row])[0])
+                lookup = np.array([codes[h] for h in unique.tolist()], dtype=np.int32)
+                client_codes.append(lookup[np.searchsorted(unique, hashes)])
+                member_hashes.append(key_hashes(*chunk.matrix("member_id")))
+        hashes = np.concatenate(member_hashes) if member_hashes else np.empty(0, dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.codes = np.concatenate(client_codes)[order] if client_codes else np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup(self, chunk):
+        """Client code of each row's member_id; -1 for members not in dim_member."""
+        hashes = key_hashes(*chunk.matrix("member_id"))
+        at = np.minimum(np.searchsorted(self.hashes, hashes), max(len(self.hashes) - 1, 0))
+        found = self.hashes[at] == hashes if len(self.hashes) else np.zeros(len(hashes), dtype=bool)
+        return np.where(found, self.codes[at] if len(self.codes) else -1, -1)
+
+
+def verbatim(chunk):
+    """Whether the chunk's fields are still laid out as the original CSV lines.
+
+    Blocks with quoted fields are re-packed by split_block without
+    separators, so their lines have to be re-encoded.
+    """
+    if len(chunk.header) == 1 or not len(chunk):
+        return True
+    return bool((chunk.starts[:, 1] == chunk.ends[:, 0] + 1).all())
+
+
+def line_bytes(chunk, rows):
+    """The CSV lines of some rows of a chunk, newline terminated, and each line's end offset."""
+    if not verbatim(chunk):
+        out = io.StringIO(newline="")
+        writer = csv.writer(out, lineterminator="\n")
+        lines = []
+        for row in zip(*[chunk.values(name, rows) for name in chunk.header]):
+            out.seek(0)
+            out.truncate()
+            writer.writerow(row)
+            lines.append(out.getvalue().encode("utf-8"))
+        return b"".join(lines), np.cumsum([len(line) for line in lines], dtype=np.int64)
+    starts = chunk.starts[rows, 0]
+    lengths = chunk.ends[rows, -1] - starts + 1
+    ends = np.cumsum(lengths)
+    index = np.arange(int(ends[-1]) if len(ends) else 0, dtype=np.int64) + np.repeat(starts - (ends - lengths), lengths)
+    data = chunk.buf[np.minimum(index, len(chunk.buf) - 1)]
+    data[ends - 1] = 10  # the byte after the last field is \n or a stripped \r
+    return data.tobytes(), ends
+
+
+def chunk_stats(chunk, table):
+    """(valid, value) per stat column; values are days for dates, scaled integers otherwise."""
+    stats = {}
+    for name, kind in STAT_COLUMNS[table].items():
+        if name in chunk.header:
+            stats[name] = chunk.parsed(name, kind, 0 if kind == "INTEGER" else STAT_SCALE)[:2]
+    return stats
+
+
+def stat_value(kind, value):
+    if kind == "DATE":
+        return day_string(value)
+    return int(value) if kind == "INTEGER" else round(value / 10**STAT_SCALE, STAT_SCALE)
+
+
+@dataclass
+class PartFile:
+    path: Path
+    rows: int = 0
+    bytes: int = 0
+    min: dict = field(default_factory=dict)
+    max: dict = field(default_factory=dict)
+
+
+class PartitionWriter:
+    """Append rows to one new part file per partition, buffering across partitions."""
+
+    def __init__(self, table_dir, header, part, kinds):
+        self.table_dir = Path(table_dir)
+        self.header = (",".join(header) + "\n").encode("utf-8")
+        self.part = part
+        self.kinds = kinds
+        self.files = {}
+        self._buffers = {}
+        self._buffered = 0
+
+    def add(self, name, data, rows, low, high):
+        """Queue data (whole lines) for the partition; low/high are its stat minima/maxima."""
+        part = self.files.get(name)
+        if part is None:
+            part = self.files[name] = PartFile(self.table_dir / name / f"part-{self.part:05d}.csv")
+            # A crashed write leaves its tmp file behind under the same part
+            # number; flush() appends, so start from an empty file
+            part.path.with_suffix(".csv.tmp").unlink(missing_ok=True)
+            self._buffers[name] = [self.header]
+            self._buffered += len(self.header)
+            part.bytes = len(self.header)
+        part.rows += rows
+        part.bytes += len(data)
+        for column, value in low.items():
+            part.min[column] = min(part.min.get(column, value), value)
+        for column, value in high.items():
+            part.max[column] = max(part.max.get(column, value), value)
+        self._buffers[name].append(data)
+        self._buffered += len(data)
+        if self._buffered >= BUFFER_BYTES:
+            self.flush()
+
+    def flush(self):
+        for name, pending in self._buffers.items():
+            if not pending:
+                continue
+            tmp = self.files[name].path.with_suffix(".csv.tmp")
+            tmp.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "ab") as f:
+                f.writelines(pending)
+            pending.clear()
+        self._buffered = 0
+
+    def commit(self):
+        """Rename the finished part files into place; return their manifest entries."""
+        self.flush()
+        entries = {}
+        for name, part in self.files.items():
+            os.replace(part.path.with_suffix(".csv.tmp"), part.path)
+            entries[name] = {
+                "path": part.path.relative_to(self.table_dir.parent).as_posix(),
+                "rows": part.rows,
+                "bytes": part.bytes,
+                "min": {column: stat_value(self.kinds[column], value) for column, value in part.min.items()},
+                "max": {column: stat_value(self.kinds[column], value) for column, value in part.max.items()},
+            }
+        return entries
+
+
+def load_manifest(store):
+    path = Path(store) / MANIFEST
+    if not path.exists():
+        return {"version": MANIFEST_VERSION, "tables": {}}
+    manifest = json.loads(path.read_text())
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{path}: manifest version {manifest.get('version')}, expected {MANIFEST_VERSION}")
+    return manifest
+
+
+def save_manifest(store, manifest):
+    path = Path(store) / MANIFEST
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+    os.replace(tmp, path)
+
+
+def write_partitioned(store, table, source, members):
+    """Partition a table (file or part directory) into the store as one new part number.
+
+    members is a MemberClients lookup. Returns (rows, partitions written).
+    """
+    if table not in DATE_COLUMNS:
+        raise ValueError(f"{table} is not partitioned; expected one of {sorted(DATE_COLUMNS)}")
+    date_column = DATE_COLUMNS[table]
+    kinds = STAT_COLUMNS[table]
+    manifest = load_manifest(store)
+    entry = manifest["tables"].setdefault(table, {
+        "date_column": date_column, "columns": COLUMNS[table], "next_part": 0, "partitions": {},
+    })
+    writer = PartitionWriter(Path(store) / table, entry["columns"], entry["next_part"], kinds)
+    names = {}
+    rows = 0
+    for file in table_files(source):
+        for chunk in file_chunks(file):
+            if not len(chunk):
+                continue
+            if chunk.header != entry["columns"]:
+                raise ValueError(f"{file}: columns {chunk.header} do not match {table} {entry['columns']}")
+            client = members.lookup(chunk)
+            valid_day, day = chunk.parsed(date_column, "DATE")
+            month = day.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            keys = ((client.astype(np.int64) + 1) << _MONTH_BITS) | np.where(valid_day, month + 1, 0)
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            unique, group_starts = np.unique(sorted_keys, return_index=True)
+            data, line_ends = line_bytes(chunk, order)
+            group_ends = np.append(group_starts[1:], len(order))
+            byte_starts = np.concatenate([[0], line_ends])[group_starts]
+            byte_ends = line_ends[group_ends - 1]
+            lows, highs = group_stats(chunk_stats(chunk, table), order, group_starts)
+            for g, key in enumerate(unique.tolist()):
+                name = names.get(key)
+                if name is None:
+                    code, months = (key >> _MONTH_BITS) - 1, (key & ((1 << _MONTH_BITS) - 1)) - 1
+                    name = names[key] = partition_name(
+                        members.clients[code] if code >= 0 else DEFAULT_PARTITION,
+                        month_string(months) if months >= 0 else DEFAULT_PARTITION)
+                low = {column: values[g] for column, values in lows.items() if values[g] is not None}
+                high = {column: values[g] for column, values in highs.items() if values[g] is not None}
+                writer.add(name, data[byte_starts[g]:byte_ends[g]], int(group_ends[g] - group_starts[g]), low, high)
+            rows += len(chunk)
+    written = writer.commit()
+    for name, part in written.items():
+        client_part, month_part = name.split("/")
+        partition = entry["partitions"].setdefault(name, {
+            "client_id": client_part.partition("=")[2], "month": month_part.partition("=")[2], "files": [],
+        })
+        partition["files"].append(part)
+    entry["next_part"] += 1
+    save_manifest(store, manifest)
+    return rows, len(written)
+
+
+def group_stats(stats, order, group_starts):
+    """Per-group min and max of each stat column (None where a group has no valid value)."""
+    lows, highs = {}, {}
+    for name, (valid, value) in stats.items():
+        valid, value = valid[order], value[order]
+        counts = np.add.reduceat(valid.astype(np.int64), group_starts)
+        big = np.iinfo(np.int64).max
+        low = np.minimum.reduceat(np.where(valid, value, big), group_starts)
+        high = np.maximum.reduceat(np.where(valid, value, -big), group_starts)
+        lows[name] = [int(v) if c else None for v, c in zip(low.tolist(), counts.tolist())]
+        highs[name] = [int(v) if c else None for v, c in zip(high.tolist(), counts.tolist())]
+    return lows, highs
+
+
+@dataclass
+class Plan:
+    """Part files a query must read, and what the manifest let it skip."""
+
+    table: str
+    date_column: str
+    start_day: int = None
+    end_day: int = None
+    files: list = field(default_factory=list)
+    rows: int = 0
+    bytes: int = 0
+    partitions: int = 0
+    total_partitions: int = 0
+    total_files: int = 0
+    total_bytes: int = 0
+    pruned: dict = field(default_factory=lambda: {"scope": 0, "month": 0, "stats": 0})
+
+    @property
+    def byte_share(self):
+        return self.bytes / self.total_bytes if self.total_bytes else 0.0
+
+
+def plan(store, table, scope, start=None, end=None, client_id=None):
+    """Select the part files a scoped query over [start, end] must read.
+
+    start/end are ISO dates (inclusive, either may be None). client_id narrows
+    an unrestricted scope; a client outside a client scope raises AccessDenied.
+    """
+    manifest = load_manifest(store)
+    if table not in manifest["tables"]:
+        raise ValueError(f"{store} has no partitioned {table}")
+    entry = manifest["tables"][table]
+    filters = scoped_filters(scope, {"client_id": client_id} if client_id else {}, client_key="client_id")
+    client = filters.get("client_id")
+    date_column = entry["date_column"]
+    result = Plan(table, date_column, day_number(start) if start else None, day_number(end) if end else None)
+    low = result.start_day if start else -np.inf
+    high = result.end_day if end else np.inf
+    for name, partition in sorted(entry["partitions"].items()):
+        files = partition["files"]
+        size = sum(part["bytes"] for part in files)
+        result.total_partitions += 1
+        result.total_files += len(files)
+        result.total_bytes += size
+        if client is not None and partition["client_id"] != quote(client, safe=""):
+            result.pruned["scope"] += len(files)
+            continue
+        if partition["month"] == DEFAULT_PARTITION:
+            # Rows without a valid date can never match a date range
+            if start or end:
+                result.pruned["month"] += len(files)
+                continue
+        else:
+            first, last = month_days(partition["month"])
+            if last < low or first > high:
+                result.pruned["month"] += len(files)
+                continue
+        selected = False
+        for part in files:
+            lo, hi = part["min"].get(date_column), part["max"].get(date_column)
+            if lo is not None and (day_number(hi) < low or day_number(lo) > high):
+                result.pruned["stats"] += 1
+                continue
+            selected = True
+            result.files.append(Path(store) / part["path"])
+            result.rows += part["rows"]
+            result.bytes += part["bytes"]
+        result.partitions += selected
+    return result
+
+
+def scan(plan_, out=None):
+    """Read the planned files, keeping rows inside the date range exactly.
+
+    Writes the rows to out (a binary file) if given; returns (rows, bytes read).
+    """
+    rows = 0
+    read = 0
+    header_written = False
+    for file in plan_.files:
+        read += file.stat().st_size
+        for chunk in file_chunks(file):
+            if out is not None and not header_written:
+                out.write((",".join(chunk.header) + "\n").encode("utf-8"))
+                header_written = True
+            if not len(chunk):
+                continue
+            keep = np.ones(len(chunk), dtype=bool)
+            if plan_.start_day is not None or plan_.end_day is not None:
+                valid, day = chunk.parsed(plan_.date_column, "DATE")
+                keep &= valid
+                if plan_.start_day is not None:
+                    keep &= day >= plan_.start_day
+                if plan_.end_day is not None:
+                    keep &= day <= plan_.end_day
+            selected = np.flatnonzero(keep)
+            rows += len(selected)
+            if out is not None and len(selected):
+                out.write(line_bytes(chunk, selected)[0])
+    return rows, read
+
+
+def latest_day(store, table):
+    """Last date in a partitioned table, from the manifest stats."""
+    entry = load_manifest(store)["tables"].get(table)
+    if entry is None:
+        return None
+    column = entry["date_column"]
+    days = [day_number(part["max"][column]) for partition in entry["partitions"].values()
+            for part in partition["files"] if column in part["max"]]
+    return max(days) if days else None
+
+
+def print_plan(result):
+    kept = len(result.files)
+    print(f"✓ {result.table}: {kept:,} of {result.total_files:,} part files in "
+          f"{result.partitions:,} of {result.total_partitions:,} partitions")
+    pruned = result.pruned
+    print(f"  pruned {pruned['scope']:,} by RLS scope, {pruned['month']:,} by month, "
+          f"{pruned['stats']:,} by min/max {result.date_column}")
+    window = " .. ".join(day_string(d) if d is not None else "*" for d in (result.start_day, result.end_day))
+    print(f"  {result.date_column} {window}: at most {result.rows:,} rows, "
+          f"{result.bytes / 1e6:,.1f} of {result.total_bytes / 1e6:,.1f} MB ({result.byte_share:.2%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hive-style client/month partitioned storage")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    write_parser = sub.add_parser("write", help="Partition a table into the store (appends a part)")
+    write_parser.add_argument("--store", required=True, help="Partitioned store directory")
+    write_parser.add_argument("--table", required=True, choices=sorted(DATE_COLUMNS))
+    write_parser.add_argument("--source", required=True, help="Table CSV file or part directory")
+    write_parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+
+    for name, help_text in (("plan", "Show which partitions a scoped query reads"),
+                            ("scan", "Read a scoped date range through the planner")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--store", required=True, help="Partitioned store directory")
+        p.add_argument("--table", required=True, choices=sorted(DATE_COLUMNS))
+        p.add_argument("--role", required=True, help="Requesting role, e.g. CLIENT_VIEWER")
+        p.add_argument("--client", help="Client id (required for client roles; a filter otherwise)")
+        p.add_argument("--org", help="Org id for org-scoped roles")
+        p.add_argument("--start", help="First date (YYYY-MM-DD)")
+        p.add_argument("--end", help="Last date (YYYY-MM-DD); defaults to the latest date with --days")
+        p.add_argument("--days", type=int, help="Window length ending at --end, e.g. 90")
+    sub.choices["scan"].add_argument("--out", help="Write matching rows to this CSV")
+
+    info_parser = sub.add_parser("info", help="Summarize the store's partitions")
+    info_parser.add_argument("--store", required=True, help="Partitioned store directory")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "write":
+        members = MemberClients(args.members)
+        loaded = time.perf_counter()
+        rows, partitions = write_partitioned(args.store, args.table, args.source, members)
+        elapsed = time.perf_counter() - loaded
+        print(f"✓ Loaded {len(members):,} members in {loaded - started:.1f}s")
+        print(f"✓ Wrote {rows:,} {args.table} rows into {partitions:,} partitions in {elapsed:.1f}s "
+              f"({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+        return
+
+    if args.command == "info":
+        for table, entry in sorted(load_manifest(args.store)["tables"].items()):
+            partitions = entry["partitions"].values()
+            clients = {p["client_id"] for p in partitions}
+            months = sorted(p["month"] for p in partitions if p["month"] != DEFAULT_PARTITION)
+            files = [part for p in partitions for part in p["files"]]
+            print(f"{table}: {len(files):,} part files in {len(partitions):,} partitions, "
+                  f"{len(clients):,} clients, months {months[0] if months else '-'} .. {months[-1] if months else '-'}, "
+                  f"{sum(f['rows'] for f in files):,} rows, {sum(f['bytes'] for f in files) / 1e6:,.1f} MB")
+        return
+
+    scope = scope_for(args.role, client_id=args.client, org_id=args.org)
+    end, start = args.end, args.start
+    if args.days:
+        if start:
+            parser.error("--days and --start are exclusive")
+        end_day = day_number(end) if end else latest_day(args.store, args.table)
+        if end_day is None:
+            parser.error(f"{args.store} has no dated {args.table} rows")
+        end, start = day_string(end_day), day_string(end_day - args.days + 1)
+    client = args.client if scope.kind != "client" else None
+    result = plan(args.store, args.table, scope, start, end, client)
+    print_plan(result)
+    if args.command == "scan":
+        out = open(args.out + ".tmp", "wb") if args.out else None
+        try:
+            rows, read = scan(result, out)
+        finally:
+            if out is not None:
+                out.close()
+        if args.out:
+            os.replace(args.out + ".tmp", args.out)
+        print(f"✓ Scanned {read / 1e6:,.1f} MB, {rows:,} rows in range, "
+              f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
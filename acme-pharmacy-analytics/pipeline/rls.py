@@ -0,0 +1,70 @@
+"""
+Row-level security scopes (security_privacy.md, requirements/rbac.md).
+
+A Scope is the effective data boundary of a request: derived from the role,
+never from the individual user, so two analysts at the same client share a
+scope and nothing wider. Anything keyed or filtered per request (caches,
+partition pruning, exports) takes a Scope rather than a user.
+"""
+
+from dataclasses import dataclass
+
+# Role -> scope kind, per the RLS table in requirements/rbac.md
+ROLE_SCOPES = {
+    "CLIENT_VIEWER": "client",     # WHERE client_id = [their_client]
+    "CLIENT_ADMIN": "client",      # WHERE client_id = [their_client]
+    "INTERNAL_OPS": "all",         # all clients
+    "PRODUCT": "aggregate",        # aggregated only, no member-level rows
+    "COMPLIANCE": "all",           # all data, read-only
+    "EXEC": "org",                 # WHERE org_id = 'Outcomes'
+}
+
+
+class AccessDenied(PermissionError):
+    """Raised when a request reaches outside its RLS scope (Test 1.3)."""
+
+
+@dataclass(frozen=True)
+class Scope:
+    kind: str
+    value: str = None
+
+    @property
+    def key(self):
+        """Hashable identity used in cache keys and audit records."""
+        return f"{self.kind}:{self.value}" if self.value else self.kind
+
+    @property
+    def member_level(self):
+        """Whether member-level rows may be returned."""
+        return self.kind != "aggregate"
+
+
+def scope_for(role, client_id=None, org_id=None):
+    """Resolve a role (and its attributes) to the effective Scope."""
+    kind = ROLE_SCOPES.get(role)
+    if kind is None:
+        raise AccessDenied(f"Access Denied: unknown role {role!r}")
+    if kind == "client":
+        if not client_id:
+            # Never fall back to a wider scope for a client role
+            raise AccessDenied(f"Access Denied: {role} requires a client_id")
+        return Scope("client", client_id)
+    if kind == "org":
+        return Scope("org", org_id or "Outcomes")
+    return Scope(kind)
+
+
+def scoped_filters(scope, filters=None, client_key="clientId"):
+    """Apply a scope to query filters; reject filters outside the scope.
+
+    A client-scoped request asking for another client's data raises
+    AccessDenied rather than silently returning its own client's rows.
+    """
+    filters = dict(filters or {})
+    if scope.kind == "client":
+        requested = filters.get(client_key)
+        if requested is not None and requested != scope.value:
+            raise AccessDenied(f"Access Denied: scope {scope.key} cannot read {client_key}={requested}")
+        filters[client_key] = scope.value
+    return filters
@@ -0,0 +1,254 @@
+"""
+Pre-aggregated KPI rollup cube (NFR-1).
+
+Materializes fact_adherence into AggAdherenceWeekly cells of
+client x drug class x plan x risk band x week holding member counts, PDC/MPR
+sums and the count of members with PDC_90 >= 80%. A member with several drug
+classes has a row in each of their class cells, so AggMemberWeekly keeps the
+distinct member count per client x plan x risk band x week; queries not split
+by drug class take members from it. KPI ribbons, 12-week trends
+and cohort drill-downs are answered from the cube (a few hundred rows per
+client) instead of aggregating raw FactAdherence on every request. Only
+member-level drill-downs read FactAdherence.
+
+Refresh is incremental: each nightly run rebuilds the cells of the snapshot's
+week with one vectorized pass and replaces just that week; earlier weeks are
+never touched. Feed it the full nightly snapshot (pipeline.adherence output),
+since a week's cells cover every member.
+
+Usage:
+    python -m pipeline.rollup refresh --db apps/web/prisma/dev.db \\
+        --members data/dim_member --snapshot data/fact_adherence.csv
+    python -m pipeline.rollup query --db apps/web/prisma/dev.db --client ACME --by drugClass
+    python -m pipeline.rollup query --db apps/web/prisma/dev.db --client ACME --by weekStart --weeks 12
+"""
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from pipeline.adherence import ADHERENT_PDC, load_adherence
+from pipeline.load import MS_PER_DAY
+from pipeline.metrics import query_timer, stage
+from pipeline.tables import day_string, load_members
+
+# Cube dimensions, in cell-id order, and the filters/group-bys queries accept
+DIMENSIONS = ["clientId", "drugClass", "planId", "riskBand", "weekStart"]
+
+INSERT_SQL = (
+    'INSERT INTO "AggAdherenceWeekly" (weekStart, clientId, drugClass, planId, riskBand, '
+    "members, pdc90Sum, pdc180Sum, mpr90Sum, adherentCount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+MEMBER_INSERT_SQL = (
+    'INSERT INTO "AggMemberWeekly" (weekStart, clientId, planId, riskBand, members) VALUES (?, ?, ?, ?, ?)'
+)
+
+# Measures derived from the additive cube columns
+MEASURES = (
+    "SUM(members) AS members, "
+    "SUM(pdc90Sum) / SUM(members) AS pdc90, "
+    "SUM(pdc180Sum) / SUM(members) AS pdc180, "
+    "SUM(mpr90Sum) / SUM(members) AS mpr90, "
+    "SUM(adherentCount) * 100.0 / SUM(members) AS adherentRate"
+)
+
+
+def week_start(day):
+    """Monday of the week containing day (days since 1970-01-01, a Thursday)."""
+    return day - (day + 3) % 7
+
+
+def build_cells(snapshot, members, drug_classes):
+    """Aggregate a snapshot into cube cells; return DB parameter rows.
+
+    Cells are keyed by a dense id over client x class x plan x risk band so
+    every measure is a single bincount.
+    """
+    sizes = [len(members.clients), len(drug_classes), len(members.plans), len(members.risk_bands)]
+    m = snapshot.member
+    cell = members.client[m].astype(np.int64)
+    for codes, size in ((snapshot.drug_class, sizes[1]), (members.plan[m], sizes[2]), (members.risk_band[m], sizes[3])):
+        cell = cell * size + codes
+    n_cells = int(np.prod(sizes)) if len(m) else 0
+
+    count = np.bincount(cell, minlength=n_cells)
+    sums = {
+        "pdc_90": np.bincount(cell, snapshot.pdc_90, minlength=n_cells),
+        "pdc_180": np.bincount(cell, snapshot.pdc_180, minlength=n_cells),
+        "mpr_90": np.bincount(cell, snapshot.mpr_90, minlength=n_cells),
+    }
+    adherent = np.bincount(cell, snapshot.pdc_90 >= ADHERENT_PDC, minlength=n_cells)
+
+    week_ms = week_start(snapshot.as_of_day) * MS_PER_DAY
+    rows = []
+    for i in np.flatnonzero(count).tolist():
+        rest, risk = divmod(i, sizes[3])
+        rest, plan = divmod(rest, sizes[2])
+        client, drug_class = divmod(rest, sizes[1])
+        rows.append((
+            week_ms, members.clients[client], drug_classes[drug_class], members.plans[plan],
+            members.risk_bands[risk], int(count[i]), float(sums["pdc_90"][i]),
+            float(sums["pdc_180"][i]), float(sums["mpr_90"][i]), int(adherent[i]),
+        ))
+    return rows
+
+
+def build_member_cells(snapshot, members):
+    """Distinct members per client x plan x risk band; return DB parameter rows."""
+    sizes = [len(members.clients), len(members.plans), len(members.risk_bands)]
+    m = np.unique(snapshot.member)
+    cell = (members.client[m].astype(np.int64) * sizes[1] + members.plan[m]) * sizes[2] + members.risk_band[m]
+    count = np.bincount(cell, minlength=int(np.prod(sizes)) if len(m) else 0)
+
+    week_ms = week_start(snapshot.as_of_day) * MS_PER_DAY
+    rows = []
+    for i in np.flatnonzero(count).tolist():
+        rest, risk = divmod(i, sizes[2])
+        client, plan = divmod(rest, sizes[1])
+        rows.append((week_ms, members.clients[client], members.plans[plan], members.risk_bands[risk], int(count[i])))
+    return rows
+
+
+@stage("rollup")
+def refresh(conn, snapshot, members, drug_classes):
+    """Replace the snapshot's week in the cube; return cells written."""
+    rows = build_cells(snapshot, members, drug_classes)
+    week_ms = week_start(snapshot.as_of_day) * MS_PER_DAY
+    with conn:
+        conn.execute('DELETE FROM "AggAdherenceWeekly" WHERE weekStart = ?', (week_ms,))
+        conn.executemany(INSERT_SQL, rows)
+        conn.execute('DELETE FROM "AggMemberWeekly" WHERE weekStart = ?', (week_ms,))
+        conn.executemany(MEMBER_INSERT_SQL, build_member_cells(snapshot, members))
+    return len(rows)
+
+
+def latest_week(conn):
+    return conn.execute('SELECT MAX(weekStart) FROM "AggAdherenceWeekly"').fetchone()[0]
+
+
+def aggregate(conn, table, measures, group_by, where, params):
+    sql = f'SELECT {", ".join([*group_by, measures])} FROM "{table}" WHERE {" AND ".join(where)}'
+    if group_by:
+        sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+    return conn.execute(sql, params)
+
+
+@query_timer("cube")
+def query(conn, group_by=(), filters=None, weeks=1):
+    """Aggregate cube cells; return a list of dict rows.
+
+    group_by and filters use DIMENSIONS names. weeks limits the query to the
+    latest N weeks in the cube (1 = current tiles, 12 = trend chart); more
+    than one week must group by weekStart, since members do not add up
+    across weeks. members is the distinct member count: per class from the
+    cube cells, otherwise from AggMemberWeekly.
+    """
+    filters = dict(filters or {})
+    for name in [*group_by, *filters]:
+        if name not in DIMENSIONS:
+            raise ValueError(f"unknown cube dimension {name!r}; expected one of {DIMENSIONS}")
+    if weeks > 1 and "weekStart" not in group_by:
+        raise ValueError(f"weeks={weeks} needs weekStart in group_by; members would be summed across weeks")
+
+    latest = latest_week(conn)
+    if latest is None:
+        return []
+    where = ["weekStart > ?"]
+    params = [latest - weeks * 7 * MS_PER_DAY]
+    for name, value in filters.items():
+        where.append(f"{name} = ?")
+        params.append(value)
+    cursor = aggregate(conn, "AggAdherenceWeekly", MEASURES, group_by, where, params)
+    names = [d[0] for d in cursor.description]
+    rows = [dict(zip(names, row)) for row in cursor]
+    if "drugClass" not in group_by and "drugClass" not in filters:
+        # Cells hold one row per member x drug class; count each member once
+        distinct = {tuple(key): members for *key, members in aggregate(
+            conn, "AggMemberWeekly", "SUM(members)", group_by, where, params)}
+        for row in rows:
+            row["members"] = distinct.get(tuple(row[name] for name in group_by), 0)
+    for row in rows:
+        if "weekStart" in row:
+            row["weekStart"] = day_string(row["weekStart"] // MS_PER_DAY)
+    return [row for row in rows if row["members"]]
+
+
+@query_timer("member_drilldown")
+def member_rows(conn, client_id, drug_class=None, plan_id=None, limit=100):
+    """Member-level drill-down (worst PDC first) from raw FactAdherence.
+
+    The cube has no member grain, so this is the one query that reads the
+    fact table; it is bounded by clientId and the latest asOfDate.
+    """
+    sql = (
+        'SELECT a.memberId, m.planId, m.riskBand, a.drugClass, a.pdc90, a.pdc180, a.mpr90 '
+        'FROM "FactAdherence" a JOIN "DimMember" m ON m.id = a.memberId '
+        'WHERE a.clientId = ? AND a.asOfDate = (SELECT MAX(asOfDate) FROM "FactAdherence" WHERE clientId = ?)'
+    )
+    params = [client_id, client_id]
+    if drug_class:
+        sql += " AND a.drugClass = ?"
+        params.append(drug_class)
+    if plan_id:
+        sql += " AND m.planId = ?"
+        params.append(plan_id)
+    sql += " ORDER BY a.pdc90 LIMIT ?"
+    params.append(limit)
+    cursor = conn.execute(sql, params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KPI rollup cube over FactAdherence")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    refresh_parser = sub.add_parser("refresh", help="Rebuild the snapshot's week in the cube")
+    refresh_parser.add_argument("--db", required=True, help="Web app SQLite database")
+    refresh_parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+    refresh_parser.add_argument("--snapshot", required=True, help="Full fact_adherence snapshot")
+
+    query_parser = sub.add_parser("query", help="Query the cube")
+    query_parser.add_argument("--db", required=True, help="Web app SQLite database")
+    query_parser.add_argument("--client", help="clientId filter (RLS scope)")
+    query_parser.add_argument("--drug-class", help="drugClass filter")
+    query_parser.add_argument("--by", default="", help=f"Comma-separated group-by from {DIMENSIONS}")
+    query_parser.add_argument("--weeks", type=int, default=1, help="Latest N weeks (12 for trends)")
+    query_parser.add_argument("--worst", type=int, metavar="N", help="Member-level drill-down: worst N members")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    if args.command == "refresh":
+        members = load_members(args.members)
+        drug_classes = []
+        snapshot = load_adherence(args.snapshot, members.index, drug_classes)
+        loaded = time.perf_counter()
+        cells = refresh(conn, snapshot, members, drug_classes)
+        week = day_string(week_start(snapshot.as_of_day))
+        print(f"✓ Loaded {len(snapshot):,} adherence rows in {loaded - started:.1f}s")
+        print(f"✓ Wrote {cells:,} cells for week of {week} in {time.perf_counter() - loaded:.2f}s")
+    elif args.worst:
+        if not args.client:
+            parser.error("--worst drill-down requires --client")
+        for row in member_rows(conn, args.client, args.drug_class, limit=args.worst):
+            print(row)
+    else:
+        filters = {}
+        if args.client:
+            filters["clientId"] = args.client
+        if args.drug_class:
+            filters["drugClass"] = args.drug_class
+        group_by = [name for name in args.by.split(",") if name]
+        if args.weeks > 1 and "weekStart" not in group_by:
+            parser.error("--weeks above 1 needs weekStart in --by")
+        for row in query(conn, group_by, filters, weeks=args.weeks):
+            print(row)
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Notification rule engine (FR-2.1, FR-2.2, FR-2.3).
+
+Evaluates the nightly rules over the current and prior fact_adherence
+snapshots and emits FactNotification rows. Every rule condition is a
+vectorized predicate over a whole level at once: cohorts (client x drug
+class x plan) or member/drug class rows. Python only runs per alert that
+fires.
+
+Alerts for the same (ruleKey, entityRef) within DEDUP_HOURS are suppressed.
+Recent alerts are read once into an in-memory set, so each candidate is a
+single hash lookup.
+
+Usage:
+    python -m pipeline.rules --members data/dim_member \\
+        --current data/fact_adherence.csv --prior data/fact_adherence_prior.csv \\
+        --db apps/web/prisma/dev.db --out data/fact_notification.csv
+"""
+
+import argparse
+import datetime
+import hashlib
+import sqlite3
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from pipeline.adherence import ADHERENT_PDC, load_adherence
+from pipeline.load import bulk_load, notification_rows, timestamp_ms
+from pipeline.metrics import stage
+from pipeline.tables import COLUMNS, load_members, read_rows, write_rows
+
+DEDUP_HOURS = 48
+
+# Cohorts smaller than this are too noisy to alert on
+MIN_COHORT_MEMBERS = 20
+
+
+@dataclass
+class Rule:
+    key: str
+    name: str
+    level: str  # "cohort" or "member"
+    condition: object  # vectorized: dict of level arrays -> boolean mask
+    severity: str
+    owner: str
+    sla_hours: int
+    message: str  # str.format template over the entity's fields
+    recommended_action: str
+    playbook_url: str
+
+
+RULES = [
+    Rule(
+        key="adherence_risk_spike",
+        name="Adherence Risk Spike",
+        level="cohort",
+        condition=lambda c: (c["pdc_90"] < 75) & (c["pdc_90_delta"] <= -5),
+        severity="High",
+        owner="CLIENT_ADMIN",
+        sla_hours=48,
+        message="{drug_class} cohort adherence fell to {pdc_90:.1f}% ({pdc_90_delta:+.1f}pp WoW), below the 75% risk threshold",
+        recommended_action="Deploy targeted outreach: 1) Identify at-risk members 2) Schedule CMR consultations 3) Send automated refill reminders within 48 hours",
+        playbook_url="/playbooks/adherence-recovery",
+    ),
+    Rule(
+        key="cohort_below_threshold",
+        name="Cohort Below Adherence Threshold",
+        level="cohort",
+        condition=lambda c: c["pdc_90"] < ADHERENT_PDC,
+        severity="Medium",
+        owner="CLIENT_ADMIN",
+        sla_hours=72,
+        message="{drug_class} cohort PDC_90 is {pdc_90:.1f}%, below the 80% Star Ratings threshold",
+        recommended_action="Review the cohort drill-down: 1) Sort members by days since last fill 2) Enroll non-adherent members in refill reminders",
+        playbook_url="/playbooks/adherence-recovery",
+    ),
+    Rule(
+        key="cohort_pdc_drop",
+        name="Cohort PDC Week-over-Week Drop",
+        level="cohort",
+        condition=lambda c: (c["pdc_90_delta"] <= -5) & (c["pdc_90"] >= 75),
+        severity="Medium",
+        owner="CLIENT_ADMIN",
+        sla_hours=72,
+        message="{drug_class} cohort PDC_90 dropped {pdc_90_delta:+.1f}pp week over week to {pdc_90:.1f}%",
+        recommended_action="Check for supply or formulary changes affecting the cohort and review recent refill gaps",
+        playbook_url="/playbooks/adherence-recovery",
+    ),
+    Rule(
+        key="adherent_rate_drop",
+        name="Adherent Member Share Drop",
+        level="cohort",
+        condition=lambda c: c["adherent_rate_delta"] <= -5,
+        severity="Medium",
+        owner="CLIENT_ADMIN",
+        sla_hours=72,
+        message="Share of adherent {drug_class} members fell to {adherent_rate:.1f}% ({adherent_rate_delta:+.1f}pp WoW)",
+        recommended_action="Target members who crossed below 80% PDC this week with pharmacist calls",
+        playbook_url="/playbooks/adherence-recovery",
+    ),
+    Rule(
+        key="oversupply_pattern",
+        name="Early Refill / Oversupply Pattern",
+        level="cohort",
+        condition=lambda c: c["oversupply_rate"] >= 15,
+        severity="Low",
+        owner="INTERNAL_OPS",
+        sla_hours=120,
+        message="{oversupply_rate:.1f}% of {drug_class} members have MPR_90 above 120% (early refills)",
+        recommended_action="Audit refill-too-soon edits and auto-refill enrollment for the cohort",
+        playbook_url="/playbooks/oversupply-review",
+    ),
+    Rule(
+        key="member_adherence_drop",
+        name="High-Risk Member Adherence Drop",
+        level="member",
+        condition=lambda m: (m["risk_band"] == "High") & (m["pdc_90"] < ADHERENT_PDC) & (m["pdc_90_delta"] <= -20),
+        severity="High",
+        owner="CLIENT_ADMIN",
+        sla_hours=24,
+        message="High-risk member {drug_class} PDC_90 fell to {pdc_90:.1f}% ({pdc_90_delta:+.1f}pp WoW)",
+        recommended_action="Pharmacist outreach call within 24 hours; confirm refill and barriers to adherence",
+        playbook_url="/playbooks/member-outreach",
+    ),
+    Rule(
+        key="member_therapy_lapse",
+        name="Member Therapy Lapse",
+        level="member",
+        condition=lambda m: (m["pdc_90"] == 0) & (m["prior_pdc_90"] > 0),
+        severity="High",
+        owner="CLIENT_ADMIN",
+        sla_hours=24,
+        message="Member has had no {drug_class} medication on hand for 90 days (prior PDC_90 {prior_pdc_90:.1f}%)",
+        recommended_action="Confirm discontinuation with prescriber or re-engage member; close the gap in the care record",
+        playbook_url="/playbooks/member-outreach",
+    ),
+]
+
+
+def align_prior(current, prior, n_classes):
+    """Return prior PDC_90 for each current row (NaN when absent)."""
+    prior_pdc = np.full(len(current), np.nan)
+    if len(prior) == 0:
+        return prior_pdc
+    current_key = current.member * n_classes + current.drug_class
+    prior_key = prior.member * n_classes + prior.drug_class
+    order = np.argsort(prior_key)
+    sorted_key = prior_key[order]
+    pos = np.minimum(np.searchsorted(sorted_key, current_key), len(sorted_key) - 1)
+    found = sorted_key[pos] == current_key
+    prior_pdc[found] = prior.pdc_90[order][pos[found]]
+    return prior_pdc
+
+
+def cohort_stats(snapshot, members, n_classes):
+    """Per cohort (client x drug class x plan) member count, mean PDC and rates."""
+    n_plans = max(len(members.plans), 1)
+    size = max(len(members.clients), 1) * n_classes * n_plans
+    cohort = (members.client[snapshot.member] * n_classes + snapshot.drug_class) * n_plans + members.plan[snapshot.member]
+    count = np.bincount(cohort, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "members": count,
+            "pdc_90": np.bincount(cohort, snapshot.pdc_90, minlength=size) / count,
+            "adherent_rate": np.bincount(cohort, snapshot.pdc_90 >= ADHERENT_PDC, minlength=size) * 100.0 / count,
+            "oversupply_rate": np.bincount(cohort, snapshot.mpr_90 > 120, minlength=size) * 100.0 / count,
+        }
+
+
+def build_levels(current, prior, members, drug_classes):
+    """Arrays each rule level is evaluated over."""
+    n_classes = len(drug_classes)
+    n_plans = max(len(members.plans), 1)
+
+    now = cohort_stats(current, members, n_classes)
+    before = cohort_stats(prior, members, n_classes)
+    cohort_id = np.arange(len(now["members"]))
+    cohort = {
+        "members": now["members"],
+        "pdc_90": now["pdc_90"],
+        "pdc_90_delta": now["pdc_90"] - before["pdc_90"],
+        "adherent_rate": now["adherent_rate"],
+        "adherent_rate_delta": now["adherent_rate"] - before["adherent_rate"],
+        "oversupply_rate": now["oversupply_rate"],
+        "client": cohort_id // (n_classes * n_plans),
+        "drug_class": cohort_id // n_plans % n_classes,
+        "plan": cohort_id % n_plans,
+    }
+
+    prior_pdc = align_prior(current, prior, n_classes)
+    risk_names = np.array(members.risk_bands or [""])
+    member = {
+        "member": current.member,
+        "client": members.client[current.member],
+        "drug_class": current.drug_class,
+        "risk_band": risk_names[members.risk_band[current.member]],
+        "pdc_90": current.pdc_90,
+        "prior_pdc_90": prior_pdc,
+        "pdc_90_delta": current.pdc_90 - prior_pdc,
+    }
+    return {"cohort": cohort, "member": member}
+
+
+def entity_ref(level, arrays, i, members, drug_classes):
+    """Stable entity reference used for display and deduplication."""
+    drug_class = drug_classes[arrays["drug_class"][i]]
+    if level == "cohort":
+        return f"{drug_class} cohort - {members.clients[arrays['client'][i]]} - {members.plans[arrays['plan'][i]]}"
+    return f"{members.member_ids[arrays['member'][i]]} - {drug_class}"
+
+
+@stage("rules")
+def evaluate(current, prior, members, drug_classes, run_at, recent):
+    """Evaluate RULES; return (notification rows, per-rule fired/suppressed counts).
+
+    recent is the set of (rule_key, entity_ref) alerted within the dedup
+    window; it is updated in place with the new alerts.
+    """
+    levels = build_levels(current, prior, members, drug_classes)
+    created_at = run_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+    rows = []
+    stats = {}
+    for rule in RULES:
+        arrays = levels[rule.level]
+        with np.errstate(invalid="ignore"):
+            mask = rule.condition(arrays)
+        if rule.level == "cohort":
+            mask &= arrays["members"] >= MIN_COHORT_MEMBERS
+        fired = suppressed = 0
+        for i in np.flatnonzero(mask).tolist():
+            ref = entity_ref(rule.level, arrays, i, members, drug_classes)
+            if (rule.key, ref) in recent:
+                suppressed += 1
+                continue
+            recent.add((rule.key, ref))
+            fields = {name: values[i] for name, values in arrays.items()}
+            fields["drug_class"] = drug_classes[fields["drug_class"]]
+            rows.append({
+                "notification_id": hashlib.sha1(f"{rule.key}|{ref}|{created_at}".encode()).hexdigest()[:24],
+                "client_id": members.clients[arrays["client"][i]],
+                "rule_key": rule.key,
+                "entity_ref": ref,
+                "message": rule.message.format(**fields),
+                "recommended_action": rule.recommended_action,
+                "severity": rule.severity,
+                "owner": rule.owner,
+                "sla_hours": rule.sla_hours,
+                "status": "Active",
+                "created_at": created_at,
+            })
+            fired += 1
+        stats[rule.key] = (fired, suppressed)
+    return rows, stats
+
+
+def recent_alerts(run_at, db_path=None, csv_path=None):
+    """Load (ruleKey, entityRef) pairs alerted within DEDUP_HOURS of run_at."""
+    since = run_at - datetime.timedelta(hours=DEDUP_HOURS)
+    recent = set()
+    if db_path:
+        conn = sqlite3.connect(db_path)
+        try:
+            recent.update(conn.execute(
+                'SELECT ruleKey, entityRef FROM "FactNotification" WHERE createdAt >= ?',
+                (int(since.timestamp() * 1000),),
+            ))
+        finally:
+            conn.close()
+    if csv_path:
+        since_ms = int(since.timestamp() * 1000)
+        recent.update(
+            (row["rule_key"], row["entity_ref"])
+            for row in read_rows(csv_path)
+            if timestamp_ms(row["created_at"]) >= since_ms
+        )
+    return recent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate notification rules over fact_adherence snapshots")
+    parser.add_argument("--members", required=True, help="dim_member CSV file or part directory")
+    parser.add_argument("--current", required=True, help="Current fact_adherence snapshot")
+    parser.add_argument("--prior", required=True, help="Prior (previous week) fact_adherence snapshot")
+    parser.add_argument("--db", help="Web app SQLite database: dedup source and insert target")
+    parser.add_argument("--recent", help="Recent fact_notification CSV to dedup against")
+    parser.add_argument("--run-at", help="Evaluation time (ISO datetime, default now UTC)")
+    parser.add_argument("--out", default="data/fact_notification.csv", help="Output CSV path")
+    args = parser.parse_args()
+
+    run_at = (
+        datetime.datetime.fromisoformat(args.run_at.replace("Z", "+00:00"))
+        if args.run_at else datetime.datetime.now(datetime.timezone.utc)
+    )
+    if run_at.tzinfo is None:
+        run_at = run_at.replace(tzinfo=datetime.timezone.utc)
+
+    started = time.perf_counter()
+    members = load_members(args.members)
+    drug_classes = []
+    current = load_adherence(args.current, members.index, drug_classes)
+    prior = load_adherence(args.prior, members.index, drug_classes)
+    recent = recent_alerts(run_at, db_path=args.db, csv_path=args.recent)
+    loaded = time.perf_counter()
+
+    rows, stats = evaluate(current, prior, members, drug_classes, run_at, recent)
+    evaluated = time.perf_counter()
+    write_rows(args.out, COLUMNS["fact_notification"], rows)
+    if args.db and rows:
+        bulk_load(args.db, {"FactNotification": notification_rows(args.out)})
+
+    print(f"✓ Loaded {len(current):,} current / {len(prior):,} prior rows in {loaded - started:.1f}s")
+    for key, (fired, suppressed) in stats.items():
+        print(f"  {key}: {fired:,} alerts, {suppressed:,} suppressed (<{DEDUP_HOURS}h)")
+    print(f"✓ Evaluated {len(RULES)} rules in {evaluated - loaded:.2f}s → {len(rows):,} notifications in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+"""
+Nightly batch runner: the pipeline stages as a DAG on a process pool.
+
+architecture_overview.md runs the nightly chain serially: generation at
+2 AM, transforms at 3 AM, tests and metric refresh at 5 AM, notification
+rules at 6 AM. Here each stage declares the stages it needs, the files it
+reads and writes, and the shared files it must hold alone:
+
+    generate ─┬─ validate ──────────────────┐
+              └─ adherence ─┬─ rules ───────┴─ load
+                            ├─ rollup ─ digest
+                            └─ sample
+
+A stage starts as soon as its dependencies are done, in its own worker
+process (`python -m pipeline.<module>` with the stage's arguments), so
+validation runs alongside adherence, and rules alongside the rollup and
+sample.
+Stages that write the SQLite database (load, rollup, digest) hold it as a
+resource, so they never overlap. validate exits non-zero on contract
+violations, which holds back load.
+
+Each stage's cache key hashes the code of its module and of the pipeline
+modules it imports, its arguments, the content of its external inputs
+(files no stage produces), and the keys of the stages it depends on. A
+stage whose key matches its last successful run, and whose outputs are
+unchanged on disk, is skipped. Resources are shared, so they are not part
+of a stage's outputs; the runner stamps each one after every stage that
+holds it, and a resource changed outside the runner (a replaced database)
+reruns every stage that holds it. Successful stages are recorded as soon as
+they finish. Rerunning after a failure therefore resumes where the night
+stopped: a failed 5 AM step reruns without redoing 3 AM's work, and fixing
+a stage's code reruns that stage and only what depends on it.
+
+Every run writes a report under the state directory. It has each stage's
+start, duration, and queue wait (ready but waiting for a worker or the
+database). It also gives the critical path through the DAG by measured
+wait plus duration, so it accounts for worker and resource limits and tracks
+wall time, with each stage's slack. The DAG-only path, by duration alone,
+shows how long the night would take with no waits.
+
+Usage:
+    python -m pipeline.runner run --data data --db apps/web/prisma/dev.db --members 100000 --as-of 2025-10-19
+    python -m pipeline.runner run ... --force adherence     # rerun a stage and everything downstream
+    python -m pipeline.runner plan ...                      # what would run, and why
+    python -m pipeline.runner report [--state data/.runner]
+"""
+
+import argparse
+import ast
+import concurrent.futures
+import contextlib
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pipeline.contracts import DEFAULT_SCHEMAS
+from pipeline.load import DEFAULT_DB
+
+PIPELINE_DIR = Path(__file__).resolve().parent
+STATE_DIR = "data/.runner"
+WORKERS = min(4, os.cpu_count() or 1)
+LOG_TAIL_LINES = 20
+
+@dataclass
+class Stage:
+    """One node of the DAG: a pipeline module run with fixed arguments."""
+
+    name: str
+    module: str
+    argv: list
+    deps: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    # Files written by several stages (the database): held exclusively, stamped by the runner
+    resources: list = field(default_factory=list)
+
+
+def nightly_stages(data, db, members, seed, as_of, prior=None, schemas=DEFAULT_SCHEMAS, run_at=None):
+    """The nightly chain for one data directory and database."""
+    data = Path(data)
+    adherence = str(data / "fact_adherence.csv")
+    notifications = str(data / "fact_notification.csv")
+    tables = [str(data / name) for name in ("dim_client.csv", "dim_drug.csv", "dim_member", "fact_claims")]
+    # Rules compare against last week's snapshot; the first night compares
+    # the snapshot with itself, so only the threshold rules can fire
+    prior_inputs = [prior] if prior and Path(prior).exists() else []
+    prior = prior if prior_inputs else adherence
+    run_at = ["--run-at", run_at] if run_at else ["--run-at", f"{as_of}T06:00:00Z"]
+    return [
+        Stage("generate", "pipeline.generate",
+              ["--members", str(members), "--seed", str(seed), "--end-date", as_of, "--out", str(data)],
+              outputs=tables + [str(data / "fact_telemetry")]),
+        Stage("validate", "pipeline.contracts",
+              ["validate", "--schemas", schemas, "--data", str(data), "--tables", "fact_claims", "dim_member",
+               "dim_drug", "--report", str(data / "contract_report.json"),
+               "--state", str(data / "contract_state.json")],
+              deps=["generate"], inputs=[schemas], outputs=[str(data / "contract_report.json")]),
+        Stage("adherence", "pipeline.adherence",
+              ["--claims", str(data / "fact_claims"), "--drugs", str(data / "dim_drug.csv"), "--as-of", as_of,
+               "--out", adherence],
+              deps=["generate"], outputs=[adherence]),
+        Stage("sample", "pipeline.approx",
+              ["sample", "--snapshot", adherence, "--members", str(data / "dim_member"),
+               "--out", str(data / "adherence_samples.npz")],
+              deps=["adherence"], outputs=[str(data / "adherence_samples.npz")]),
+        Stage("rules", "pipeline.rules",
+              ["--members", str(data / "dim_member"), "--current", adherence, "--prior", prior,
+               "--out", notifications, *run_at],
+              deps=["adherence"], inputs=prior_inputs, outputs=[notifications]),
+        Stage("rollup", "pipeline.rollup",
+              ["refresh", "--db", db, "--members", str(data / "dim_member"), "--snapshot", adherence],
+              deps=["adherence"], resources=[db]),
+        Stage("digest", "pipeline.movers", ["--db", db, "--json", str(data / "movers.json")],
+              deps=["rollup"], outputs=[str(data / "movers.json")], resources=[db]),
+        Stage("load", "pipeline.load",
+              ["--db", db, "--data", str(data), "--adherence", adherence, "--notifications", notifications,
+               "--replace"],
+              deps=["validate", "adherence", "rules"], resources=[db]),
+    ]
+
+
+def check_dag(stages):
+    """Raise ValueError on unknown dependencies or cycles; return stages in topological order."""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        unknown = [dep for dep in stage.deps if dep not in by_name]
+        if unknown:
+            raise ValueError(f"stage {stage.name} depends on unknown stage(s) {', '.join(unknown)}")
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"dependency cycle: {' → '.join(path + [name])}")
+        state[name] = "visiting"
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        state[name] = "done"
+        order.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name, [])
+    return order
+
+
+def downstream(stages, names):
+    """The named stages plus everything that depends on them."""
+    out = set(names)
+    for stage in check_dag(stages):
+        if out & set(stage.deps):
+            out.add(stage.name)
+    return out
+
+
+def pipeline_imports(source):
+    """Names of the pipeline modules a module's source imports, in any import form."""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[1] for alias in node.names if alias.name.startswith("pipeline."))
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if node.level == 0 and module.startswith("pipeline."):
+                names.add(module.split(".")[1])
+            elif node.level == 1 and module:
+                names.add(module.split(".")[0])
+            elif (node.level == 0 and module == "pipeline") or (node.level == 1 and not module):
+                # from pipeline import rollup: the names may be modules
+                names.update(alias.name for alias in node.names)
+    return names
+
+
+def module_code_hash(module, cache=None):
+    """Hash of a pipeline module's source and of every pipeline module it imports, transitively."""
+    cache = {} if cache is None else cache
+    seen, todo, digest = set(), [module.rsplit(".", 1)[-1]], hashlib.sha256()
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name not in cache:
+            path = PIPELINE_DIR / f"{name}.py"
+            cache[name] = path.read_bytes() if path.exists() else b""
+        source = cache[name]
+        todo.extend(pipeline_imports(source))
+    for name in sorted(seen):
+        digest.update(name.encode() + b"\0" + hashlib.sha256(cache[name]).digest())
+    return digest.hexdigest()
+
+
+class FileHashes:
+    """Content hashes of input files, memoized by (size, mtime) across runs."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.known = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def file(self, path):
+        stat = path.stat()
+        entry = self.known.get(str(path))
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.known[str(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def __call__(self, path):
+        path = Path(path)
+        if not path.exists():
+            return "missing"
+        if path.is_file():
+            return self.file(path)
+        digest = hashlib.blake2b(digest_size=16)
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(f"{file.relative_to(path)}\0{self.file(file)}\0".encode())
+        return digest.hexdigest()
+
+    def save(self):
+        write_json(self.path, self.known)
+
+
+def output_stamp(paths):
+    """(size, mtime) of every output file: cheap evidence nothing touched them since the stage ran."""
+    stamp = {}
+    for path in map(Path, paths):
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            if file.exists():
+                stat = file.stat()
+                stamp[str(file)] = [stat.st_size, stat.st_mtime_ns]
+            else:
+                stamp[str(file)] = None
+    return stamp
+
+
+def write_json(path, value):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(value, indent=2))
+    os.replace(tmp, path)
+
+
+def execute(module, argv, log_path):
+    """Run `python -m module argv` in this (worker) process; return its exit code."""
+    from pipeline import metrics
+
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log), \
+            contextlib.redirect_stderr(log):
+        sys.argv = [module, *argv]
+        try:
+            runpy.run_module(module, run_name="__main__", alter_sys=True)
+            code = 0
+        except SystemExit as exit:
+            code = exit.code if isinstance(exit.code, int) else (0 if exit.code is None else 1)
+            if not isinstance(exit.code, int) and exit.code is not None:
+                print(exit.code)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        # Pool workers end without running atexit hooks
+        metrics.export_snapshot()
+    return code
+
+
+class Runner:
+    """Schedules a DAG of stages on a process pool with a persistent cache."""
+
+    def __init__(self, stages, state_dir=STATE_DIR, workers=WORKERS):
+        self.stages = {stage.name: stage for stage in check_dag(stages)}
+        self.state_dir = Path(state_dir)
+        self.workers = workers
+        self.cache_path = self.state_dir / "stages.json"
+        self.cache = json.loads(self.cache_path.read_text()) if self.cache_path.exists() else {}
+        self.resources = self.cache.pop("_resources", {})
+        # Resources that changed since a stage of ours last wrote them
+        self.touched = {path for path, stamp in self.resources.items() if output_stamp([path]) != stamp}
+        self.hashes = FileHashes(self.state_dir / "input_hashes.json")
+        self.code = {}
+        self.keys = {}
+        self.parts = {}
+
+    def key(self, name):
+        """Cache key of a stage; dependencies' keys must already be known."""
+        stage = self.stages[name]
+        self.parts[name] = {
+            "code": module_code_hash(stage.module, self.code),
+            "arguments": hashlib.sha256(json.dumps([stage.module, *stage.argv]).encode()).hexdigest(),
+            **{f"input {path}": self.hashes(path) for path in stage.inputs},
+            **{f"upstream {dep}": self.keys[dep] for dep in stage.deps},
+        }
+        self.keys[name] = hashlib.sha256(json.dumps(self.parts[name], sort_keys=True).encode()).hexdigest()
+        return self.keys[name]
+
+    def cached(self, name, force=()):
+        """Why a stage must run, or None if its last successful run still holds."""
+        entry = self.cache.get(name)
+        if name in force:
+            return "forced"
+        if entry is None:
+            return "never ran"
+        if entry["key"] != self.keys[name]:
+            before, now = entry.get("parts", {}), self.parts[name]
+            changed = sorted(part for part in set(before) | set(now) if before.get(part) != now.get(part))
+            return f"{', '.join(changed)} changed"
+        if output_stamp(self.stages[name].outputs) != entry["outputs"]:
+            return "outputs changed on disk"
+        changed = [path for path in self.stages[name].resources if path in self.touched or path not in self.resources]
+        if changed:
+            return f"{', '.join(changed)} changed outside the runner"
+        return None
+
+    def plan(self, force=()):
+        """[(stage, reason or None)] in topological order, assuming every stage that runs succeeds."""
+        force = downstream(list(self.stages.values()), force) if force else set()
+        out, changed = [], set()
+        for name, stage in self.stages.items():
+            self.key(name)
+            reason = self.cached(name, force)
+            if reason is None and changed & set(stage.deps):
+                reason = "upstream reran"
+            if reason:
+                changed.add(name)
+            out.append((stage, reason))
+        return out
+
+    def run(self, force=(), only=None):
+        """Run every stage that is not cached; return the run report."""
+        force = downstream(list(self.stages.values()), force) if force else set()
+        wanted = set(self.stages) if not only else self._with_upstream(only)
+        run_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        log_dir = self.state_dir / "logs" / run_id
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+        results = {}
+        pending = [name for name in self.stages if name in wanted]
+        running, held = {}, set()
+        ready_at = {}
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context, max_tasks_per_child=1) as pool:
+            while pending or running:
+                progressed = False
+                for name in list(pending):
+                    stage = self.stages[name]
+                    states = [results.get(dep, {}).get("status") for dep in stage.deps if dep in wanted]
+                    if any(s in ("failed", "blocked") for s in states):
+                        failed_dep = next(d for d in stage.deps if results.get(d, {}).get("status") in
+                                          ("failed", "blocked"))
+                        results[name] = {"status": "blocked", "reason": f"{failed_dep} did not succeed"}
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    if not all(s in ("ran", "cached") for s in states):
+                        continue
+                    now = time.perf_counter() - started
+                    ready_at.setdefault(name, now)
+                    self.key(name)
+                    reason = self.cached(name, force)
+                    if reason is None and any(results.get(d, {}).get("status") == "ran" for d in stage.deps):
+                        reason = "upstream reran"
+                    if reason is None:
+                        results[name] = {"status": "cached", "ready": now, "start": now, "seconds": 0.0,
+                                         "wait": 0.0, "reason": f"cached from {self.cache[name]['finished_at']}"}
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    if held & set(stage.resources) or len(running) >= self.workers:
+                        continue
+                    log_path = log_dir / f"{name}.log"
+                    future = pool.submit(execute, stage.module, stage.argv, str(log_path))
+                    running[future] = name
+                    held |= set(stage.resources)
+                    results[name] = {"status": "running", "ready": ready_at[name], "start": now,
+                                     "wait": now - ready_at[name], "reason": reason, "log": str(log_path)}
+                    pending.remove(name)
+                    print(f"→ {name:<10} started ({reason})")
+                    progressed = True
+                if progressed:
+                    continue
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    held -= set(stage.resources)
+                    for path in stage.resources:
+                        self.resources[path] = output_stamp([path])
+                    result = results[name]
+                    result["seconds"] = time.perf_counter() - started - result["start"]
+                    try:
+                        code = future.result()
+                    except Exception as e:  # the worker itself died
+                        code, result["error"] = 1, repr(e)
+                    result["exit_code"] = code
+                    if code == 0:
+                        result["status"] = "ran"
+                        self._record(name, result)
+                        print(f"✓ {name:<10} {result['seconds']:.1f}s")
+                    else:
+                        result["status"] = "failed"
+                        self._save()
+                        print(f"✗ {name:<10} exit {code} after {result['seconds']:.1f}s — log {result['log']}")
+                        for line in tail(result["log"]):
+                            print(f"    {line}")
+        self.hashes.save()
+
+        report = {
+            "run_id": run_id,
+            "started_at": run_id,
+            "wall_seconds": round(time.perf_counter() - started, 3),
+            "workers": self.workers,
+            "stages": {name: results.get(name, {"status": "excluded"}) for name in self.stages},
+        }
+        report.update(critical_path(self.stages, report["stages"]))
+        write_json(self.state_dir / "runs" / f"{run_id}.json", report)
+        write_json(self.state_dir / "last_run.json", report)
+        return report
+
+    def _with_upstream(self, names):
+        out, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise ValueError(f"unknown stage {name}")
+            if name not in out:
+                out.add(name)
+                todo.extend(self.stages[name].deps)
+        return out
+
+    def _record(self, name, result):
+        self.cache[name] = {
+            "key": self.keys[name],
+            "parts": self.parts[name],
+            "outputs": output_stamp(self.stages[name].outputs),
+            "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "seconds": round(result["seconds"], 3),
+        }
+        self._save()
+
+    def _save(self):
+        write_json(self.cache_path, {**self.cache, "_resources": self.resources})
+
+
+def longest_path(stages, duration):
+    """Earliest start per stage, the end of the longest chain, and that chain."""
+    earliest = {}
+    for name, stage in stages.items():
+        earliest[name] = max((earliest[dep] + duration[dep] for dep in stage.deps), default=0.0)
+    finish = {name: earliest[name] + duration[name] for name in stages}
+    end = max(finish.values(), default=0.0)
+    chain = []
+    name = max(finish, key=finish.get) if end > 0 else None
+    while name is not None:
+        chain.append(name)
+        deps = stages[name].deps
+        name = max(deps, key=lambda d: finish[d]) if deps else None
+    return earliest, end, chain[::-1]
+
+
+def critical_path(stages, results):
+    """Slack per stage and the critical chain by measured wait plus duration.
+
+    A stage's queue wait is part of its span, so the chain accounts for worker
+    and resource limits. The DAG-only length uses duration alone.
+    """
+    ran = {name: results[name].get("status") == "ran" for name in stages}
+    seconds = {name: results[name].get("seconds", 0.0) if ran[name] else 0.0 for name in stages}
+    span = {name: seconds[name] + results[name].get("wait", 0.0) if ran[name] else 0.0 for name in stages}
+    earliest, end, chain = longest_path(stages, span)
+    latest_finish = {name: end for name in stages}
+    for name in reversed(list(stages)):
+        for dep in stages[name].deps:
+            latest_finish[dep] = min(latest_finish[dep], latest_finish[name] - span[name])
+    for name in stages:
+        results[name]["slack"] = round(latest_finish[name] - span[name] - earliest[name], 3)
+    return {
+        "critical_path": chain,
+        "critical_seconds": round(end, 3),
+        "critical_wait_seconds": round(sum(span[name] - seconds[name] for name in chain), 3),
+        "dag_seconds": round(longest_path(stages, seconds)[1], 3),
+        "stage_seconds": round(sum(seconds.values()), 3),
+    }
+
+
+def tail(path, lines=LOG_TAIL_LINES):
+    try:
+        return Path(path).read_text(encoding="utf-8", errors="replace").splitlines()[-lines:]
+    except OSError:
+        return []
+
+
+def print_report(report):
+    print(f"Run {report['run_id']}: {report['wall_seconds']:.1f}s wall on {report['workers']} workers")
+    print(f"  {'stage':<10} {'status':<8} {'start':>7} {'seconds':>8} {'wait':>6} {'slack':>7}  note")
+    for name, result in report["stages"].items():
+        critical = "*" if name in report["critical_path"] and result["status"] == "ran" else " "
+        print(f"{critical} {name:<10} {result['status']:<8} {result.get('start', 0):>7.1f} "
+              f"{result.get('seconds', 0):>8.1f} {result.get('wait', 0):>6.1f} {result.get('slack', 0):>7.1f}  "
+              f"{result.get('reason', '')}")
+    wall = max(report["wall_seconds"], 1e-9)
+    if not report["critical_path"]:
+        print("Nothing ran; every stage was cached")
+        return
+    print(f"Critical path: {' → '.join(report['critical_path'])} = {report['critical_seconds']:.1f}s "
+          f"({report.get('critical_wait_seconds', 0):.1f}s queued) of {report['wall_seconds']:.1f}s wall")
+    if "dag_seconds" in report:
+        print(f"  DAG only (no worker or resource waits): {report['dag_seconds']:.1f}s")
+    print(f"  {report['stage_seconds']:.1f}s of stage time ({report['stage_seconds'] / wall:.2f}x parallelism)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, cached DAG runner for the nightly batch")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("run", "Run the nightly DAG, skipping cached stages"),
+                               ("plan", "Show which stages would run, and why")):
+        p = sub.add_parser(command, help=help_text)
+        p.add_argument("--data", default="data", help="Data directory")
+        p.add_argument("--db", default=DEFAULT_DB, help="Web app SQLite database")
+        p.add_argument("--members", type=int, default=100_000, help="Members to generate")
+        p.add_argument("--seed", type=int, default=42, help="Generator seed")
+        p.add_argument("--as-of", default="2025-10-19", help="Business date of the run (YYYY-MM-DD)")
+        p.add_argument("--prior", help="Last week's fact_adherence snapshot for the rules stage")
+        p.add_argument("--schemas", default=DEFAULT_SCHEMAS, help="data_contracts/schemas.md")
+        p.add_argument("--state", default=STATE_DIR, help="Runner cache, logs and reports")
+        p.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="Rerun these and everything after")
+        p.add_argument("--only", nargs="+", metavar="STAGE", help="Run only these (and what they need)")
+        p.add_argument("--workers", type=int, default=WORKERS, help="Worker processes")
+    report_parser = sub.add_parser("report", help="Print the last run's report")
+    report_parser.add_argument("--state", default=STATE_DIR, help="Runner cache, logs and reports")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        path = Path(args.state) / "last_run.json"
+        if not path.exists():
+            raise SystemExit(f"no runs recorded under {args.state}")
+        print_report(json.loads(path.read_text()))
+        return
+
+    stages = nightly_stages(args.data, args.db, args.members, args.seed, args.as_of, args.prior, args.schemas)
+    runner = Runner(stages, args.state, args.workers)
+    unknown = [name for name in args.force + (args.only or []) if name not in runner.stages]
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}; stages: {', '.join(runner.stages)}")
+    if args.command == "plan":
+        for stage, reason in runner.plan(args.force):
+            print(f"  {stage.name:<10} {'run: ' + reason if reason else 'cached'}")
+        return
+
+    report = runner.run(args.force, args.only)
+    print_report(report)
+    failed = [name for name, result in report["stages"].items() if result["status"] in ("failed", "blocked")]
+    if failed:
+        print(f"✗ {', '.join(failed)} did not complete; rerun the same command to resume")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Searchable metrics catalog (FR-3.2) for the AI agent and the catalog page.
+
+Indexes the spec kit markdown (data_contracts/metrics_catalog.md, glossary.md,
+requirements/..., and optionally the files generate_spec_files.py would emit)
+into a persisted inverted index:
+
+- Each heading starts a section document; title terms are boosted.
+- "**Label:** value" lines become fields, so metric sections expose their
+  definition, formula, threshold/target, source tables and owner.
+- Every markdown link between spec files is recorded in a link graph, with
+  links under "**Related:**" / "Related Documents" tagged as related.
+- Source Tables chains ("fact_claims → ... → fact_adherence") give lineage.
+
+Queries are BM25-ranked over the postings lists and return in well under a
+millisecond for a corpus this size, so retrieval never dominates the 5 s
+agent budget (Story 6.1, Test 7.1).
+
+Usage:
+    python -m pipeline.search build --spec ../acme-pharmacy-analytics-spec --index data/catalog_index.json
+    python -m pipeline.search query --index data/catalog_index.json "How is PDC_90 calculated?"
+    python -m pipeline.search lineage --index data/catalog_index.json PDC_90
+    python -m pipeline.search related --index data/catalog_index.json data_contracts/metrics_catalog.md
+"""
+
+import argparse
+import json
+import math
+import os
+import posixpath
+import re
+import runpy
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_BOOST = 3
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how",
+    "in", "is", "it", "of", "on", "or", "the", "this", "to", "what", "when", "which", "with",
+}
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FIELD = re.compile(r"^\*\*([^*]+?):\*\*\s*(.*)$")
+_LINK = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+_TOKEN = re.compile(r"[a-z0-9]+(?:_[a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercase word tokens; compound names like PDC_90 also yield their parts."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part not in STOPWORDS)
+    return tokens
+
+
+def slugify(title):
+    """GitHub-style heading anchor."""
+    slug = re.sub(r"[^\w\- ]", "", title.lower()).strip()
+    return slug.replace(" ", "-")
+
+
+def parse_markdown(path, text):
+    """Split one markdown file into section documents and outgoing links.
+
+    Returns (sections, links): sections are dicts with id, path, title,
+    fields and text; links are (source section id, target, kind) tuples with
+    targets resolved relative to the spec kit root.
+    """
+    sections = []
+    links = []
+    related = False
+
+    def start(title, anchor):
+        section = {
+            "id": f"{path}#{anchor}" if anchor else path,
+            "path": path,
+            "title": title,
+            "fields": {},
+            "text": [],
+        }
+        sections.append(section)
+        return section
+
+    current = start(path, "")
+    for line in text.splitlines():
+        heading = _HEADING.match(line)
+        if heading:
+            title = heading.group(2)
+            current = start(title, slugify(title) if len(heading.group(1)) > 1 else "")
+            related = "related" in title.lower()
+            continue
+        field = _FIELD.match(line.strip())
+        if field:
+            label = field.group(1).strip().lower()
+            current["fields"][label] = field.group(2).strip()
+            related = label == "related"
+        elif line.strip() and not line.lstrip().startswith(("-", "*")):
+            # Prose ends a **Related:** list; a Related heading spans its section
+            related = related and "related" in current["title"].lower()
+        current["text"].append(line)
+
+        for _, target in _LINK.findall(line):
+            if "://" in target or target.startswith(("mailto:", "#")):
+                continue
+            file_part, _, anchor = target.partition("#")
+            resolved = posixpath.normpath(posixpath.join(posixpath.dirname(path), file_part))
+            links.append((current["id"], f"{resolved}#{anchor}" if anchor else resolved,
+                          "related" if related else "mention"))
+
+    for section in sections:
+        section["text"] = "\n".join(section["text"]).strip()
+    # Drop the empty preamble section of files that start with a heading
+    return [s for s in sections if s["text"] or s["fields"]], links
+
+
+def spec_documents(spec_dir, generator=None):
+    """{relative path: markdown text} for the spec kit.
+
+    With generator (a generate_spec_files.py path), its spec_files are
+    included for any file not already on disk, so the index covers the full
+    kit without running the generator.
+    """
+    spec_dir = Path(spec_dir)
+    documents = {
+        path.relative_to(spec_dir).as_posix(): path.read_text(encoding="utf-8")
+        for path in sorted(spec_dir.rglob("*.md"))
+    }
+    if generator:
+        generated = runpy.run_path(str(generator), run_name="spec_generator")["spec_files"]
+        for path, content in generated.items():
+            documents.setdefault(path, content.strip() + "\n")
+    return documents
+
+
+class CatalogIndex:
+    """BM25 inverted index over spec sections plus the spec link graph."""
+
+    def __init__(self, sections, postings, lengths, links):
+        self.sections = sections
+        self.postings = postings
+        self.lengths = lengths
+        self.links = links
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+        self._by_id = {s["id"]: i for i, s in enumerate(sections)}
+
+    @classmethod
+    def build(cls, documents):
+        sections, links = [], []
+        for path, text in sorted(documents.items()):
+            file_sections, file_links = parse_markdown(path, text)
+            sections.extend(file_sections)
+            links.extend(file_links)
+
+        postings = defaultdict(list)
+        lengths = []
+        for doc, section in enumerate(sections):
+            terms = Counter(tokenize(section["text"]))
+            for term in tokenize(section["title"]):
+                terms[term] += TITLE_BOOST
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings[term].append((doc, tf))
+        return cls(sections, dict(postings), lengths, links)
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "version": INDEX_VERSION,
+            "sections": self.sections,
+            "postings": self.postings,
+            "lengths": self.lengths,
+            "links": self.links,
+        }
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+        if payload.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path}: index version {payload.get('version')}, expected {INDEX_VERSION}; rebuild it")
+        links = [tuple(link) for link in payload["links"]]
+        return cls(payload["sections"], payload["postings"], payload["lengths"], links)
+
+    def search(self, query, top=5):
+        """Top sections for a free-text query as (score, section) pairs."""
+        n = len(self.sections)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / self.avg_length)
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top]
+        return [(score, self.sections[doc]) for doc, score in ranked]
+
+    def section(self, section_id):
+        i = self._by_id.get(section_id)
+        return self.sections[i] if i is not None else None
+
+    def related(self, target, kind=None):
+        """Outgoing and incoming links of a file or section id.
+
+        A file path matches every section in it; returns
+        {"outgoing": [...], "incoming": [...]} of (section id, target, kind).
+        """
+        def matches(ref):
+            return ref == target or ref.partition("#")[0] == target
+
+        links = [link for link in self.links if kind is None or link[2] == kind]
+        return {
+            "outgoing": [link for link in links if matches(link[0])],
+            "incoming": [link for link in links if matches(link[1])],
+        }
+
+    def metrics(self):
+        """Sections that define a metric (have a definition field)."""
+        return [s for s in self.sections
+                if "business definition" in s["fields"] or "definition" in s["fields"]]
+
+    def lineage(self, name):
+        """Definition fields, source-table chain and related docs for a metric.
+
+        Returns None if no metric section title starts with name.
+        """
+        name = name.lower()
+        candidates = [s for s in self.metrics() if s["title"].lower().startswith(name)]
+        if not candidates:
+            return None
+        # Prefer the catalog entry (it carries source tables) over glossary entries
+        section = max(candidates, key=lambda s: ("source tables" in s["fields"], s["path"].startswith("data_contracts")))
+        chain = section["fields"].get("source tables", "")
+        tables = [step.split(":")[-1].strip() for step in re.split(r"→|->|,", chain) if step.strip()]
+        file_links = self.related(section["path"], kind="related")["outgoing"]
+        return {
+            "id": section["id"],
+            "title": section["title"],
+            "fields": section["fields"],
+            "tables": tables,
+            "related": sorted({target for _, target, _ in file_links}),
+            "mentioned_in": sorted({source for source, _, _ in self.related(section["id"])["incoming"]}),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index over the metrics catalog and spec kit")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="Index the spec kit")
+    build_parser.add_argument("--spec", default="../acme-pharmacy-analytics-spec", help="Spec kit directory")
+    build_parser.add_argument("--generator", help="Also index spec_files from generate_spec_files.py")
+    build_parser.add_argument("--index", required=True, help="Index JSON file")
+
+    query_parser = sub.add_parser("query", help="BM25 search")
+    query_parser.add_argument("--index", required=True, help="Index JSON file")
+    query_parser.add_argument("--top", type=int, default=5, help="Results to return")
+    query_parser.add_argument("text", help="Query text")
+
+    lineage_parser = sub.add_parser("lineage", help="Metric definition, source tables and related docs")
+    lineage_parser.add_argument("--index", required=True, help="Index JSON file")
+    lineage_parser.add_argument("metric", help="Metric name, e.g. PDC_90")
+
+    related_parser = sub.add_parser("related", help="Link graph neighbours of a file or section")
+    related_parser.add_argument("--index", required=True, help="Index JSON file")
+    related_parser.add_argument("target", help="Spec path or path#anchor")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "build":
+        index = CatalogIndex.build(spec_documents(args.spec, args.generator))
+        index.save(args.index)
+        print(f"✓ Indexed {len(index.sections):,} sections, {len(index.postings):,} terms, "
+              f"{len(index.links):,} links in {time.perf_counter() - started:.2f}s")
+        return
+
+    index = CatalogIndex.load(args.index)
+    loaded = time.perf_counter()
+    if args.command == "query":
+        for score, section in index.search(args.text, args.top):
+            print(f"{score:6.2f}  {section['id']}  {section['title']}")
+    elif args.command == "lineage":
+        result = index.lineage(args.metric)
+        if result is None:
+            raise SystemExit(f"No metric matching {args.metric!r}")
+        print(f"{result['title']}  ({result['id']})")
+        for label, value in result["fields"].items():
+            if value:
+                print(f"  {label}: {value}")
+        if result["tables"]:
+            print(f"  lineage: {' → '.join(result['tables'])}")
+        for target in result["related"]:
+            print(f"  related: {target}")
+    else:
+        graph = index.related(args.target)
+        for source, target, kind in graph["outgoing"]:
+            print(f"→ {target}  ({kind}, from {source})")
+        for source, target, kind in graph["incoming"]:
+            print(f"← {source}  ({kind}, to {target})")
+    print(f"(load {(loaded - started) * 1000:.1f} ms, query {(time.perf_counter() - loaded) * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,667 @@
+"""
+Asyncio KPI query service for the dashboards (NFR-1).
+
+The dashboard pages query SQLite through Prisma one request at a time, so at
+the 9 AM spike every user at a client fires the same KPI queries at the same
+moment. This service answers the acceptance-test queries over a local HTTP
+API instead:
+
+    GET /kpi                        KPI ribbon: overall, Diabetes, Hypertension
+                                    and Statins PDC_90 with a status color (Test 1.1)
+    GET /cohort?drug_class=Diabetes cohort drill: worst plans plus the 12-week
+                                    trend (Test 1.2)
+    GET /trend?weeks=12             week-over-week trend, optionally per drug class
+    GET /members?drug_class=...     member-level drill-down, worst PDC first (Test 1.3)
+    GET /preview?exact=1            the exec "5 numbers" from sketches and samples
+                                    (pipeline.approx) with 95% bounds; exact=1 reruns
+    GET /stats, /metrics, /healthz  pool, coalescing and cache counters; Prometheus text
+
+The caller's role comes from the X-Role header, along with X-Client-Id and
+X-Org-Id. The web app sets these from the session. The RLS scope is derived
+from the role (pipeline.rls), so a client_id query parameter outside the
+scope gets 403 "Access Denied" rather than another client's rows.
+
+A request is answered in four steps. Each later step runs only if the
+earlier one did not answer it:
+
+    cache        the RLS-scoped QueryCache (pipeline.cache), if enabled
+    singleflight an identical query already in flight is awaited, not re-run:
+                 N identical concurrent requests execute once
+    client limit at most --per-client queries of one scope execute at a time,
+                 so one client's spike cannot hold every connection
+    pool         a bounded pool of read-only SQLite connections, each query
+                 run on the pool's thread executor off the event loop
+
+/preview reads samples and sketches, not SQLite, so it skips the client
+limit and pool: previews run on their own executor, and at most
+--exact-previews slow exact reruns run at once.
+
+`loadtest` replays the 9 AM spike. Users start within --ramp seconds of
+each other, and each cycles through the dashboard mix with its own drug
+classes, plans and drill-down limits. In-process, the spike runs twice:
+as served, then with coalescing off, since coalesced requests make p95 a
+best case. The command reports latency percentiles and the coalescing ratio,
+and exits 1 if the uncoalesced p95 misses the NFR-1 target.
+
+Usage:
+    python -m pipeline.service serve --db apps/web/prisma/dev.db --port 8050
+    curl -H 'X-Role: CLIENT_VIEWER' -H 'X-Client-Id: ACME' 'localhost:8050/cohort?drug_class=Diabetes'
+    python -m pipeline.service loadtest --db apps/web/prisma/dev.db --users 60 --cache-ttl 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from pipeline.adherence import ADHERENT_PDC
+from pipeline.approx import ACTIVE_DAYS, Samples, preview
+from pipeline.bench import NFR_CONCURRENT_USERS, NFR_DASHBOARD_P95_S, percentiles
+from pipeline.cache import DEFAULT_TTL_SECONDS, GenerationFile, QueryCache
+from pipeline.metrics import REGISTRY, counter, histogram
+from pipeline.rls import AccessDenied, scope_for, scoped_filters
+from pipeline.rollup import member_rows, query
+
+DEFAULT_PORT = 8050
+DEFAULT_POOL_SIZE = 4
+DEFAULT_PER_CLIENT = 2
+DEFAULT_EXACT_PREVIEWS = 1
+
+# KPI ribbon tiles (Test 1.1) and their color bands
+KPI_DRUG_CLASSES = ("Diabetes", "Hypertension", "Statins")
+KPI_WARNING_PDC = 75.0
+KPI_WHY = ("Star Ratings count a member as adherent at PDC >= 80%; "
+           "plans below the threshold lose adherence stars")
+
+TREND_WEEKS = 12
+TOP_PLANS = 10
+MEMBER_LIMIT = 100
+MAX_MEMBER_LIMIT = 1000
+
+# loadtest: users start spread over RAMP_SECONDS; drill-down limits they pick
+RAMP_SECONDS = 2.0
+MEMBER_LIMITS = (25, 50, 100, 250)
+
+MAX_REQUEST_LINE = 8192
+MAX_HEADERS = 100
+
+REQUEST_SECONDS = "acme_service_request_seconds"
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class BadRequest(ValueError):
+    """A malformed request or parameter (400)."""
+
+
+def kpi_status(pdc):
+    """Tile color: green at/above the Star Ratings threshold, yellow within 5 points, red below."""
+    if pdc is None:
+        return None
+    if pdc >= ADHERENT_PDC:
+        return "green"
+    return "yellow" if pdc >= KPI_WARNING_PDC else "red"
+
+
+def tile(label, row):
+    pdc = round(row["pdc90"], 1) if row else None
+    return {"label": label, "pdc90": pdc, "adherentRate": round(row["adherentRate"], 1) if row else None,
+            "members": row["members"] if row else 0, "status": kpi_status(pdc), "why": KPI_WHY}
+
+
+def kpi_ribbon(conn, filters):
+    """Overall PDC_90 plus one tile per KPI drug class, from the cube."""
+    overall = query(conn, (), filters)
+    by_class = {row["drugClass"]: row for row in query(conn, ("drugClass",), filters)}
+    return {"tiles": [tile("Overall PDC_90", overall[0] if overall else None)]
+            + [tile(f"{name} PDC", by_class.get(name)) for name in KPI_DRUG_CLASSES]}
+
+
+def cohort_view(conn, filters, top):
+    """Drug-class cohort drill: the worst plans by PDC_90 and the 12-week trend."""
+    plans = sorted(query(conn, ("planId",), filters), key=lambda row: row["pdc90"])
+    return {"drugClass": filters["drugClass"], "worstPlans": plans[:top],
+            "trend": query(conn, ("weekStart",), filters, weeks=TREND_WEEKS)}
+
+
+def preview_view(samples, store, scope, client_id, drug_class, plan_id, days, exact):
+    """The exec "5 numbers" (pipeline.approx), from samples and sketches only."""
+    estimates = preview(samples, scope, store, client_id, drug_class, plan_id, days, exact)
+    return {"exact": exact,
+            "estimates": [asdict(e) | {"error": e.error, "within_bound": e.within_bound} for e in estimates]}
+
+
+class ConnectionPool:
+    """A fixed set of read-only SQLite connections lent out to executor threads.
+
+    A connection is used by one thread at a time. It returns to the pool when
+    its query finishes, even if the awaiting request was cancelled first.
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="sqlite")
+        self._connections = [sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+                             for _ in range(size)]
+        self._idle = asyncio.Queue()
+        for conn in self._connections:
+            self._idle.put_nowait(conn)
+        self.waits = 0
+
+    @property
+    def in_use(self):
+        return self.size - self._idle.qsize()
+
+    async def run(self, fn, *args):
+        """Run fn(conn, *args) on a pooled connection in the executor."""
+        if self._idle.empty():
+            self.waits += 1
+        conn = await self._idle.get()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn, conn, *args)
+        future.add_done_callback(lambda _: self._idle.put_nowait(conn))
+        return await future
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for conn in self._connections:
+            conn.close()
+
+
+class PreviewRunner:
+    """Runs /preview off the SQLite pool, on its own thread executor.
+
+    An exact rerun scans the partitioned store for seconds, so at most
+    exact_limit run at once. The executor has one more thread than that,
+    so sample estimates never queue behind exact reruns.
+    """
+
+    def __init__(self, exact_limit=DEFAULT_EXACT_PREVIEWS):
+        self.exact_limit = exact_limit
+        self.executor = ThreadPoolExecutor(max_workers=exact_limit + 1, thread_name_prefix="preview")
+        self._exact = asyncio.Semaphore(exact_limit)
+        self.exact_waits = 0
+
+    async def run(self, fn, *args, exact=False):
+        """Run fn(*args) in the executor, within the exact limit if exact."""
+        loop = asyncio.get_running_loop()
+        if not exact:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        if self._exact.locked():
+            self.exact_waits += 1
+        async with self._exact:
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls: the first caller runs, the rest await it.
+
+    The call runs as its own task, so a caller that disconnects does not
+    cancel it for the callers still waiting.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, make_call):
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executed += 1
+            task = asyncio.get_running_loop().create_task(make_call())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller went away
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class ClientLimiter:
+    """At most `limit` concurrently executing queries per RLS scope."""
+
+    def __init__(self, limit=DEFAULT_PER_CLIENT):
+        self.limit = limit
+        self._semaphores = {}
+        self.throttled = 0
+
+    def __call__(self, scope):
+        semaphore = self._semaphores.get(scope.key)
+        if semaphore is None:
+            semaphore = self._semaphores[scope.key] = asyncio.Semaphore(self.limit)
+        if semaphore.locked():
+            self.throttled += 1
+        return semaphore
+
+
+class QueryService:
+    def __init__(self, db_path, pool_size=DEFAULT_POOL_SIZE, per_client=DEFAULT_PER_CLIENT,
+                 cache=None, samples=None, store=None, exact_previews=DEFAULT_EXACT_PREVIEWS, coalesce=True):
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.coalesce = coalesce
+        self.previews = PreviewRunner(exact_previews)
+        self.samples_path = samples
+        self.store = store
+        self._samples = None
+        self.flights = SingleFlight()
+        self.limiter = ClientLimiter(per_client)
+        self.cache = cache
+        self.requests = 0
+
+    async def execute(self, name, params, scope, fn, *args):
+        """Answer a query from the cache, an identical in-flight query, or the pool."""
+        async def run():
+            async with self.limiter(scope):
+                return await self.pool.run(fn, *args)
+
+        return await self.answer(name, params, scope, run)
+
+    async def answer(self, name, params, scope, run):
+        """Answer from the cache or an identical in-flight call, else await run()."""
+        key = QueryCache.key(name, params, scope)
+        if self.cache is not None:
+            hit, value = self.cache.get(key)
+            if hit:
+                return value
+
+        async def call():
+            # Read before the query runs, so a publish meanwhile drops the result
+            generation = self.cache.generation() if self.cache is not None else None
+            value = await run()
+            if self.cache is not None:
+                self.cache.put(key, value, generation=generation)
+            return value
+
+        if not self.coalesce:
+            self.flights.executed += 1
+            return await call()
+        return await self.flights.do(key, call)
+
+    def samples(self):
+        """The adherence sample, reloaded when the nightly run replaces the file."""
+        if self.samples_path is None:
+            raise BadRequest("/preview needs the service started with --samples")
+        mtime = os.stat(self.samples_path).st_mtime_ns
+        if self._samples is None or self._samples[0] != mtime:
+            self._samples = (mtime, Samples.load(self.samples_path))
+        return self._samples[1]
+
+    async def handle(self, path, params, headers):
+        """Route a GET request; return (status, JSON-serializable body)."""
+        if path == "/healthz":
+            return 200, {"ok": True}
+        if path == "/stats":
+            return 200, self.stats()
+
+        scope = scope_for(headers.get("x-role"), client_id=headers.get("x-client-id"),
+                          org_id=headers.get("x-org-id"))
+        requested = {"clientId": params["client_id"]} if "client_id" in params else {}
+        filters = scoped_filters(scope, requested)
+        drug_class = params.get("drug_class")
+
+        if path == "/kpi":
+            return 200, await self.execute("kpi", sorted(filters.items()), scope, kpi_ribbon, filters)
+        if path == "/cohort":
+            if not drug_class:
+                raise BadRequest("/cohort requires drug_class")
+            filters["drugClass"] = drug_class
+            top = int_param(params, "top", TOP_PLANS, 1, 100)
+            return 200, await self.execute(f"cohort top={top}", sorted(filters.items()), scope,
+                                           cohort_view, filters, top)
+        if path == "/trend":
+            if drug_class:
+                filters["drugClass"] = drug_class
+            weeks = int_param(params, "weeks", TREND_WEEKS, 1, 104)
+            rows = await self.execute(f"trend weeks={weeks}", sorted(filters.items()), scope,
+                                      query, ("weekStart",), filters, weeks)
+            return 200, {"weeks": weeks, "trend": rows}
+        if path == "/members":
+            if not scope.member_level:
+                raise AccessDenied(f"Access Denied: scope {scope.key} cannot read member-level rows")
+            client_id = filters.get("clientId")
+            if not client_id:
+                raise BadRequest("/members requires client_id for this role")
+            plan_id = params.get("plan_id")
+            limit = int_param(params, "limit", MEMBER_LIMIT, 1, MAX_MEMBER_LIMIT)
+            rows = await self.execute(
+                f"members limit={limit}", (client_id, drug_class, plan_id), scope,
+                member_rows, client_id, drug_class, plan_id, limit)
+            return 200, {"clientId": client_id, "members": rows}
+        if path == "/preview":
+            plan_id = params.get("plan_id")
+            days = int_param(params, "days", ACTIVE_DAYS, 1, 3650)
+            exact = params.get("exact") in ("1", "true")
+            args = (self.samples(), self.store, scope, filters.get("clientId"), drug_class, plan_id, days, exact)
+            return 200, await self.answer(
+                f"preview days={days} exact={exact}", (*sorted(filters.items()), drug_class, plan_id), scope,
+                lambda: self.previews.run(preview_view, *args, exact=exact))
+        return 404, {"error": f"no such endpoint {path}"}
+
+    def stats(self):
+        flights = self.flights
+        executed = flights.executed
+        result = {
+            "requests": self.requests,
+            "executed": executed,
+            "coalesced": flights.coalesced,
+            "in_flight": len(flights),
+            "pool": {"size": self.pool.size, "in_use": self.pool.in_use, "waits": self.pool.waits},
+            "per_client": {"limit": self.limiter.limit, "throttled": self.limiter.throttled},
+            "preview": {"exact_limit": self.previews.exact_limit, "exact_waits": self.previews.exact_waits},
+        }
+        if self.cache is not None:
+            stats = self.cache.stats
+            result["cache"] = {"entries": len(self.cache), "hits": stats.hits, "misses": stats.misses,
+                               "hit_rate": round(stats.hit_rate, 3), "invalidations": stats.invalidations}
+        return result
+
+    async def serve_connection(self, reader, writer):
+        """HTTP/1.1 with keep-alive; GET only, JSON responses."""
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, headers = request
+                started = time.perf_counter_ns()
+                self.requests += 1
+                url = urlsplit(target)
+                try:
+                    if method != "GET":
+                        status, body = 405, {"error": f"{method} not allowed"}
+                    elif url.path == "/metrics":
+                        status, body = 200, REGISTRY.prometheus_text()
+                    else:
+                        status, body = await self.handle(url.path, dict(parse_qsl(url.query)), headers)
+                except AccessDenied as e:
+                    status, body = 403, {"error": str(e)}
+                except ValueError as e:
+                    status, body = 400, {"error": str(e)}
+                except Exception as e:
+                    print(f"⚠ {method} {target} failed: {e!r}", file=sys.stderr)
+                    status, body = 500, {"error": "internal error"}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(encode_response(status, body, keep_alive))
+                await writer.drain()
+                endpoint = url.path if status != 404 else "other"
+                histogram(REQUEST_SECONDS, "KPI service request latency", endpoint=endpoint).record(
+                    time.perf_counter_ns() - started)
+                counter("acme_service_responses_total", "KPI service responses",
+                        status=str(status)).inc()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, BadRequest):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.pool.close()
+        self.previews.close()
+
+
+def int_param(params, name, default, low, high):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+    if not low <= number <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return number
+
+
+async def read_request(reader):
+    """Read one request head; None on a cleanly closed connection."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if len(line) > MAX_REQUEST_LINE:
+        raise BadRequest("request line too long")
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise BadRequest("malformed request line") from None
+    headers = {}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length:
+        await reader.readexactly(length)
+    return method, target, headers
+
+
+def encode_response(status, body, keep_alive=True):
+    if isinstance(body, str):
+        payload, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+    else:
+        payload, content_type = json.dumps(body, separators=(",", ":")).encode("utf-8"), "application/json"
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + payload
+
+
+def build_service(args, coalesce=True):
+    cache = None
+    if args.cache_ttl > 0:
+        generation = GenerationFile(args.generation_file) if args.generation_file else (lambda: 0)
+        cache = QueryCache(ttl_seconds=args.cache_ttl, generation=generation)
+    return QueryService(args.db, args.pool_size, args.per_client, cache, args.samples, args.store,
+                        args.exact_previews, coalesce)
+
+
+async def serve(args):
+    service = build_service(args)
+    server = await asyncio.start_server(service.serve_connection, args.host, args.port)
+    print(f"✓ Serving {args.db} on http://{args.host}:{args.port} "
+          f"(pool {args.pool_size}, {args.per_client} per client, "
+          f"cache {'off' if service.cache is None else f'{args.cache_ttl:g}s'})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def dashboard_requests(rng, plans, count):
+    """One user's session: the dashboard mix from a random page, with the
+    user's own drug classes, plans and drill-down limits."""
+    first = rng.randrange(4)
+    targets = []
+    for page in range(first, first + count):
+        drug_class = rng.choice(KPI_DRUG_CLASSES)
+        if page % 4 == 0:
+            targets.append("/kpi")
+        elif page % 4 == 1:
+            targets.append(f"/cohort?drug_class={drug_class}")
+        elif page % 4 == 2:
+            targets.append("/trend?weeks=12" + (f"&drug_class={drug_class}" if rng.random() < 0.5 else ""))
+        else:
+            target = f"/members?drug_class={drug_class}&limit={rng.choice(MEMBER_LIMITS)}"
+            if plans and rng.random() < 0.5:
+                target += f"&plan_id={quote(rng.choice(plans))}"
+            targets.append(target)
+    return targets
+
+
+async def user_session(host, port, client, targets, delay, start, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    await start.wait()
+    await asyncio.sleep(delay)
+    for target in targets:
+        request = (f"GET {target} HTTP/1.1\r\nHost: {host}\r\n"
+                   f"X-Role: CLIENT_VIEWER\r\nX-Client-Id: {client}\r\n\r\n")
+        started = time.perf_counter()
+        writer.write(request.encode("latin-1"))
+        status_line = await reader.readline()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        await reader.readexactly(int(headers["content-length"]))
+        status = int(status_line.split()[1])
+        if status != 200:
+            raise RuntimeError(f"{target} as {client} returned {status}")
+        latencies.setdefault(target.split("?")[0], []).append(time.perf_counter() - started)
+    writer.close()
+
+
+async def spike(host, port, sessions, service=None):
+    """Run (client, targets, delay) sessions against a service; return the run's results."""
+    start = asyncio.Event()
+    latencies = {}
+    tasks = [asyncio.create_task(user_session(host, port, client, targets, delay, start, latencies))
+             for client, targets, delay in sessions]
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    start.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    everything = [s for values in latencies.values() for s in values]
+    return {
+        "requests_per_s": round(len(everything) / elapsed, 1) if elapsed else None,
+        "all": percentiles(everything),
+        "by_endpoint": {path: percentiles(values) for path, values in sorted(latencies.items())},
+        "service": service.stats() if service else None,
+    }
+
+
+async def loadtest(args):
+    """The 9 AM spike: users start over the ramp, each with their own mix.
+
+    Against an in-process service the same sessions run twice, as served
+    and with coalescing off.
+    """
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    clients = [client_id for (client_id,) in conn.execute('SELECT id FROM "DimClient" ORDER BY id')]
+    plans = {}
+    for client_id, plan_id in conn.execute('SELECT DISTINCT clientId, planId FROM "DimMember" ORDER BY 1, 2'):
+        plans.setdefault(client_id, []).append(plan_id)
+    conn.close()
+
+    rng = random.Random(args.seed)
+    sessions = []
+    for user in range(args.users):
+        client = clients[user % len(clients)]
+        sessions.append((client, dashboard_requests(rng, plans.get(client, []), args.per_user),
+                         rng.uniform(0, args.ramp)))
+
+    result = {"users": args.users, "clients": len(clients), "ramp_s": args.ramp, "runs": {}}
+    if args.url:
+        url = urlsplit(args.url)
+        result["runs"]["served"] = await spike(url.hostname, url.port or DEFAULT_PORT, sessions)
+        return result
+    for name, coalesce in (("served", True), ("uncoalesced", False)):
+        service = build_service(args, coalesce)
+        server = await asyncio.start_server(service.serve_connection, args.host, 0)
+        try:
+            result["runs"][name] = await spike(args.host, server.sockets[0].getsockname()[1], sessions, service)
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+    return result
+
+
+def print_loadtest(result):
+    """Print each run; return whether the worst-case p95 meets NFR-1."""
+    for name, run in result["runs"].items():
+        overall = run["all"]
+        label = "without coalescing" if name == "uncoalesced" else "as served"
+        print(f"✓ {overall['count']:,} requests from {result['users']} users across {result['clients']} clients "
+              f"over a {result['ramp_s']:g}s ramp, {label}: {run['requests_per_s']:,} req/s")
+        for path, p in run["by_endpoint"].items():
+            print(f"  {path:<10} p50 {p['p50_s'] * 1000:7.1f} ms   p95 {p['p95_s'] * 1000:7.1f} ms   "
+                  f"p99 {p['p99_s'] * 1000:7.1f} ms")
+        stats = run["service"]
+        if stats:
+            print(f"  executed {stats['executed']:,} queries for {stats['requests']:,} requests "
+                  f"({stats['coalesced']:,} coalesced, {stats['per_client']['throttled']:,} throttled per client, "
+                  f"{stats['pool']['waits']:,} pool waits)")
+            if "cache" in stats:
+                print(f"  cache hit rate {stats['cache']['hit_rate']:.1%}")
+    # Coalescing makes the served p95 a best case; judge NFR-1 without it when measured
+    name, run = next((name, result["runs"][name]) for name in ("uncoalesced", "served") if name in result["runs"])
+    p95 = run["all"]["p95_s"]
+    mark = "✓" if p95 < NFR_DASHBOARD_P95_S else "⚠"
+    print(f"{mark} p95 {p95 * 1000:.1f} ms ({name}) vs NFR-1 target {NFR_DASHBOARD_P95_S:g} s")
+    if result["users"] < NFR_CONCURRENT_USERS:
+        print(f"· {result['users']} users is below the NFR-1 load of {NFR_CONCURRENT_USERS}")
+    return p95 < NFR_DASHBOARD_P95_S
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio KPI query service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("serve", "Serve the KPI API"),
+                            ("loadtest", "Replay the 9 AM spike and check NFR-1")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--db", required=True, help="Web app SQLite database (opened read-only)")
+        p.add_argument("--host", default="127.0.0.1", help="Listen address")
+        p.add_argument("--port", type=int, default=DEFAULT_PORT, help="Listen port")
+        p.add_argument("--pool-size", type=int, default=DEFAULT_POOL_SIZE, help="Read-only connections")
+        p.add_argument("--per-client", type=int, default=DEFAULT_PER_CLIENT,
+                       help="Concurrently executing queries per RLS scope")
+        p.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_SECONDS,
+                       help="Result cache TTL in seconds (0 disables the cache)")
+        p.add_argument("--generation-file", help="Cache generation file bumped by the nightly refresh")
+        p.add_argument("--samples", help="Adherence sample file for /preview (pipeline.approx sample)")
+        p.add_argument("--store", help="Partitioned store with HLL sketches for /preview distinct counts")
+        p.add_argument("--exact-previews", type=int, default=DEFAULT_EXACT_PREVIEWS,
+                       help="Concurrently running /preview?exact=1 reruns")
+    load_parser = sub.choices["loadtest"]
+    load_parser.add_argument("--users", type=int, default=NFR_CONCURRENT_USERS, help="Concurrent users")
+    load_parser.add_argument("--per-user", type=int, default=20, help="Requests per user")
+    load_parser.add_argument("--ramp", type=float, default=RAMP_SECONDS, help="Seconds over which users start")
+    load_parser.add_argument("--seed", type=int, default=0, help="Seed for the users' request mixes")
+    load_parser.add_argument("--url", help="Load an already running service instead of an in-process one")
+    load_parser.add_argument("--out", help="Write the results JSON here")
+    args = parser.parse_args()
+
+    if args.pool_size < 1 or args.per_client < 1 or args.exact_previews < 1:
+        parser.error("--pool-size, --per-client and --exact-previews must be at least 1")
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    result = asyncio.run(loadtest(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    if not print_loadtest(result):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""
+Sharded multi-process adherence: fact_claims -> fact_adherence on a process pool.
+
+Same metrics, same output as pipeline.adherence, byte for byte, but the work
+is spread over worker processes in two phases:
+
+    parse    each claim file is cut into byte ranges on line boundaries; a
+             worker parses a range with the vectorized CSV splitter, keeps
+             paid claims with a known drug, and spills each claim to shard
+             hash(member_id) % shards, so a member's claims never straddle
+             shards
+    compute  a worker loads one shard's spills and runs compute_adherence on
+             it; the result columns come back in a shared-memory block, and
+             only its name and layout are pickled
+
+There are several times more shards than workers, and the pool's task queue
+is shared: a worker that finishes takes the next task. Large shards from a
+skewed client are submitted first, so they cannot be left for the end while
+the other workers sit idle.
+
+The merge is deterministic. Each claim carries its position in the input
+(file, range, line). A member sorts by its first claim's position, which is
+exactly the order in which load_claims assigns member codes. Drug class codes
+follow dim_drug, as in load_claims. Sorting the merged rows by (first
+position, drug class) therefore reproduces the single-process row order, and
+adherence_rows formats the values identically.
+
+The report gives each worker's tasks, claims and busy time per phase, for
+sizing hosts.
+
+Usage:
+    python -m pipeline.shards --claims data/fact_claims --drugs data/dim_drug.csv \\
+        --as-of 2025-10-19 --out data/fact_adherence.csv --workers 8 [--report data/shards.json]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.adherence import AdherenceArrays, adherence_rows, compute_adherence
+from pipeline.contracts import CHUNK_BYTES, Chunk, key_hashes, split_block
+from pipeline.metrics import stage
+from pipeline.tables import COLUMNS, ClaimArrays, day_number, load_drug_classes, table_files, write_rows
+
+# Byte range of a claim file parsed by one task
+RANGE_BYTES = 64 * 1024 * 1024
+
+SHARDS_PER_WORKER = 8
+
+# Claim order refs pack file index, range index and line within the range
+_FILE_SHIFT = 48
+_RANGE_SHIFT = 32
+
+_PAID = np.frombuffer(b"paid", dtype=np.uint8)
+
+
+def bytes_matrix(values):
+    """(rows, width) uint8 matrix and widths of byte strings, as Chunk.matrix returns."""
+    array = np.array(values, dtype="S")
+    width = max(array.dtype.itemsize, 1)
+    mat = np.frombuffer(array.tobytes(), dtype=np.uint8).reshape(len(array), width).copy()
+    return mat, np.array([len(value) for value in values], dtype=np.int64)
+
+
+def drug_lookup(drug_path):
+    """Sorted drug_id hashes, their class codes, and the class list (in load_claims order)."""
+    classes = {}
+    drug_ids, codes = [], []
+    for drug_id, drug_class in load_drug_classes(drug_path).items():
+        drug_ids.append(drug_id.encode("utf-8"))
+        codes.append(classes.setdefault(drug_class, len(classes)))
+    hashes = key_hashes(*bytes_matrix(drug_ids)) if drug_ids else np.empty(0, dtype=np.uint64)
+    order = np.argsort(hashes)
+    return hashes[order], np.array(codes, dtype=np.int16)[order], list(classes)
+
+
+def file_ranges(files, range_bytes=RANGE_BYTES):
+    """Parse tasks: (file index, range index, path, header, start, end) covering every data line.
+
+    Gzip files cannot be split and are one range each (end None).
+    """
+    tasks = []
+    for file_index, path in enumerate(files):
+        gzipped = str(path).endswith(".gz")
+        opener = gzip.open if gzipped else open
+        with opener(path, "rb") as f:
+            first = f.readline()
+        header = first.decode("utf-8-sig").strip().split(",")
+        if gzipped:
+            tasks.append((file_index, 0, str(path), header, None, None))
+            continue
+        size = os.path.getsize(path)
+        starts = list(range(len(first), size, range_bytes)) or [len(first)]
+        for range_index, start in enumerate(starts):
+            tasks.append((file_index, range_index, str(path), header, start,
+                          min(start + range_bytes, size)))
+    return tasks
+
+
+def range_blocks(path, start, end, chunk_bytes=CHUNK_BYTES):
+    """Yield blocks of whole lines whose first byte lies in [start, end).
+
+    With start None the file is a gzip file read whole after its header.
+    """
+    if start is None:
+        f = gzip.open(path, "rb")
+        f.readline()
+        remaining = None
+    else:
+        f = open(path, "rb")
+        # The line crossing start belongs to the previous range
+        f.seek(start - 1)
+        f.readline()
+        remaining = end - f.tell()
+    with f:
+        carry = b""
+        while remaining is None or remaining > 0:
+            data = f.read(chunk_bytes if remaining is None else min(chunk_bytes, remaining))
+            if remaining is not None:
+                remaining -= len(data)
+                if (remaining <= 0 or not data) and data and not data.endswith(b"\n"):
+                    data += f.readline()  # finish the last line this range owns
+            if not data:
+                break
+            block = carry + data
+            cut = block.rfind(b"\n") + 1
+            block, carry = block[:cut], block[cut:]
+            if block:
+                yield block
+        if carry:
+            yield carry + b"\n"
+
+
+def column_equals(chunk, name, value):
+    mat, widths = chunk.matrix(name)
+    if mat.shape[1] < len(value):
+        return np.zeros(len(chunk), dtype=bool)
+    return (widths == len(value)) & (mat[:, :len(value)] == value).all(axis=1)
+
+
+def parse_range(task):
+    """Parse one byte range of claims and spill it by shard; return its counters."""
+    (file_index, range_index, path, header, start, end), drugs, shards, spill_dir = task
+    started = time.perf_counter()
+    drug_hashes, drug_codes, _ = drugs
+    parts = defaultdict(list)
+    ids = defaultdict(list)
+    max_day = None
+    claims = 0
+    line = 0
+    read = 0
+    for block in range_blocks(path, start, end):
+        read += len(block)
+        buf, starts, ends, lines, bad = split_block(block, len(header))
+        if len(bad):
+            raise ValueError(f"{path}: malformed claim line in byte range {start}..{end}")
+        chunk = Chunk(header, buf, starts, ends, lines, bad)
+        line_base = line
+        line += block.count(b"\n")
+        if not len(chunk):
+            continue
+        drug = key_hashes(*chunk.matrix("drug_id"))
+        at = np.minimum(np.searchsorted(drug_hashes, drug), max(len(drug_hashes) - 1, 0))
+        known = drug_hashes[at] == drug if len(drug_hashes) else np.zeros(len(chunk), dtype=bool)
+        keep = np.flatnonzero(column_equals(chunk, "status", _PAID) & known)
+        if not len(keep):
+            continue
+        valid_day, day = chunk.parsed("claim_date", "DATE")
+        valid_supply, supply = chunk.parsed("days_supply", "INTEGER")[:2]
+        if not (valid_day[keep].all() and valid_supply[keep].all()):
+            raise ValueError(f"{path}: unparseable claim_date or days_supply in a paid claim")
+        member = key_hashes(*chunk.matrix("member_id"))[keep]
+        ref = (np.int64(file_index) << _FILE_SHIFT) | (np.int64(range_index) << _RANGE_SHIFT) \
+            | (line_base + lines[keep]).astype(np.int64)
+        day = day[keep].astype(np.int32)
+        supply = supply[keep].astype(np.int32)
+        drug_class = drug_codes[at[keep]]
+        max_day = max(max_day if max_day is not None else int(day.max()), int(day.max()))
+        claims += len(keep)
+
+        shard = ((member >> np.uint64(32)) % np.uint64(shards)).astype(np.int64)
+        order = np.argsort(shard, kind="stable")
+        bounds = np.searchsorted(shard[order], np.arange(shards + 1))
+        for s in np.flatnonzero(np.diff(bounds)).tolist():
+            rows = order[bounds[s]:bounds[s + 1]]
+            parts[s].append((member[rows], ref[rows], day[rows], supply[rows], drug_class[rows]))
+            unique, first = np.unique(member[rows], return_index=True)
+            ids[s].append((unique, chunk.values("member_id", keep[rows[first]])))
+
+    counts = {}
+    for s, pieces in parts.items():
+        member, ref, day, supply, drug_class = (np.concatenate(column) for column in zip(*pieces))
+        id_hashes = np.concatenate([h for h, _ in ids[s]])
+        id_values = np.array([v.encode("utf-8") for _, values in ids[s] for v in values], dtype="S")
+        path = spill_path(spill_dir, s, file_index, range_index)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, member=member, ref=ref, day=day,
+                 supply=supply, drug_class=drug_class, id_hashes=id_hashes, id_values=id_values)
+        counts[s] = len(member)
+    return {"pid": os.getpid(), "seconds": time.perf_counter() - started, "claims": claims, "bytes": read,
+            "max_day": max_day, "shards": counts, "task": (file_index, range_index)}
+
+
+def spill_path(spill_dir, shard, file_index, range_index):
+    return Path(spill_dir) / f"shard-{shard:05d}" / f"{file_index:05d}-{range_index:05d}.npz"
+
+
+def share(arrays):
+    """Copy named arrays into one new shared-memory block; return (name, layout)."""
+    layout, size = [], 0
+    for key, array in arrays.items():
+        size = -(-size // 8) * 8
+        layout.append((key, array.dtype.str, array.shape, size))
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for key, dtype, shape, offset in layout:
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = arrays[key]
+    name = block.name
+    block.close()
+    return name, layout
+
+
+def collect(name, layout):
+    """Copy the arrays out of a shared-memory block and free it."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return {key: np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset).copy()
+                for key, dtype, shape, offset in layout}
+    finally:
+        block.close()
+        block.unlink()
+
+
+def compute_shard(task):
+    """Run compute_adherence over one shard; return its result block and counters."""
+    shard, paths, as_of_day, drug_classes = task
+    started = time.perf_counter()
+    pieces = [np.load(path) for path in paths]  # in task order, so refs ascend
+    member_hash = np.concatenate([p["member"] for p in pieces])
+    ref = np.concatenate([p["ref"] for p in pieces])
+    # Local member codes in order of first claim, as load_claims assigns them
+    unique, first, inverse = np.unique(member_hash, return_index=True, return_inverse=True)
+    rank = np.empty(len(unique), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(unique))
+    id_hashes = np.concatenate([p["id_hashes"] for p in pieces])
+    id_values = np.concatenate([p["id_values"] for p in pieces])
+    known, known_first = np.unique(id_hashes, return_index=True)
+    member_ids = np.empty(len(unique), dtype=id_values.dtype)
+    member_ids[rank] = id_values[known_first][np.searchsorted(known, unique)]
+    claims = ClaimArrays(
+        member=rank[inverse].astype(np.int32),
+        drug_class=np.concatenate([p["drug_class"] for p in pieces]),
+        claim_day=np.concatenate([p["day"] for p in pieces]),
+        days_supply=np.concatenate([p["supply"] for p in pieces]).astype(np.int16),
+        drug_classes=drug_classes,
+    )
+    first_ref = np.empty(len(unique), dtype=np.int64)
+    first_ref[rank] = ref[first]
+    result = compute_adherence(claims, as_of_day)
+    name, layout = share({
+        "first_ref": first_ref[result.member],
+        "member_id": member_ids[result.member],
+        "drug_class": result.drug_class.astype(np.int16),
+        "pdc_90": result.pdc_90,
+        "pdc_180": result.pdc_180,
+        "mpr_90": result.mpr_90,
+    })
+    return {"pid": os.getpid(), "seconds": time.perf_counter() - started, "claims": len(claims),
+            "rows": len(result), "shard": shard, "block": name, "layout": layout}
+
+
+def merge(results, as_of_day):
+    """Concatenate shard results in the single-process row order.
+
+    Returns (AdherenceArrays, member_ids) ready for adherence_rows.
+    """
+    columns = defaultdict(list)
+    for result in results:
+        for key, values in collect(result["block"], result["layout"]).items():
+            columns[key].append(values)
+    merged = {key: np.concatenate(values) for key, values in columns.items()}
+    if not merged:
+        empty = np.empty(0)
+        return AdherenceArrays(empty.astype(np.int64), empty.astype(np.int64), empty, empty, empty, as_of_day), []
+    order = np.lexsort((merged["drug_class"], merged["first_ref"]))
+    return AdherenceArrays(
+        member=np.arange(len(order), dtype=np.int64),
+        drug_class=merged["drug_class"][order].astype(np.int64),
+        pdc_90=merged["pdc_90"][order],
+        pdc_180=merged["pdc_180"][order],
+        mpr_90=merged["mpr_90"][order],
+        as_of_day=as_of_day,
+    ), [member_id.decode("utf-8") for member_id in merged["member_id"][order].tolist()]
+
+
+def worker_report(parsed, computed):
+    """Per-worker tasks, claims and busy seconds per phase, with claims/s."""
+    workers = defaultdict(lambda: {"parse": {"tasks": 0, "claims": 0, "bytes": 0, "seconds": 0.0},
+                                   "compute": {"tasks": 0, "claims": 0, "rows": 0, "seconds": 0.0}})
+    for result in parsed:
+        phase = workers[result["pid"]]["parse"]
+        phase["tasks"] += 1
+        phase["claims"] += result["claims"]
+        phase["bytes"] += result["bytes"]
+        phase["seconds"] += result["seconds"]
+    for result in computed:
+        phase = workers[result["pid"]]["compute"]
+        phase["tasks"] += 1
+        phase["claims"] += result["claims"]
+        phase["rows"] += result["rows"]
+        phase["seconds"] += result["seconds"]
+    for phases in workers.values():
+        for phase in phases.values():
+            phase["seconds"] = round(phase["seconds"], 3)
+            phase["claims_per_s"] = round(phase["claims"] / phase["seconds"]) if phase["seconds"] else None
+    return {str(pid): phases for pid, phases in sorted(workers.items())}
+
+
+@stage("adherence_sharded")
+def compute_sharded(claims_path, drug_path, as_of=None, workers=None, shards=None, spill_dir=None,
+                    range_bytes=RANGE_BYTES):
+    """Sharded adherence over a claims table; returns (AdherenceArrays, member_ids, drug_classes, report)."""
+    workers = workers or os.cpu_count()
+    shards = shards or workers * SHARDS_PER_WORKER
+    drugs = drug_lookup(drug_path)
+    drug_classes = drugs[2]
+    tasks = file_ranges(table_files(claims_path), range_bytes)
+    spill = tempfile.mkdtemp(prefix="adherence-shards-", dir=spill_dir)
+    timings = {}
+    # Start the resource tracker before forking so the workers share it: a
+    # shared-memory block created by a worker then outlives that worker
+    # until the parent unlinks it.
+    resource_tracker.ensure_running()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            started = time.perf_counter()
+            parsed = list(pool.map(parse_range, [(task, drugs, shards, spill) for task in tasks]))
+            timings["parse_s"] = time.perf_counter() - started
+
+            days = [result["max_day"] for result in parsed if result["max_day"] is not None]
+            as_of_day = day_number(as_of) if as_of else (max(days) if days else 0)
+            sizes = defaultdict(int)
+            inputs = defaultdict(list)
+            for result in parsed:
+                for shard, count in result["shards"].items():
+                    sizes[shard] += count
+                    inputs[shard].append(spill_path(spill, shard, *result["task"]))
+            # Largest first: the queue is shared, so the small shards fill in around them
+            order = sorted(inputs, key=lambda shard: (-sizes[shard], shard))
+            started = time.perf_counter()
+            futures = [pool.submit(compute_shard, (shard, sorted(inputs[shard]), as_of_day, drug_classes))
+                       for shard in order]
+            computed = [future.result() for future in futures]
+            timings["compute_s"] = time.perf_counter() - started
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+    started = time.perf_counter()
+    result, member_ids = merge(sorted(computed, key=lambda r: r["shard"]), as_of_day)
+    timings["merge_s"] = time.perf_counter() - started
+    counts = [sizes[shard] for shard in range(shards)]
+    report = {
+        "workers": workers,
+        "shards": shards,
+        "parse_tasks": len(tasks),
+        "claims": sum(r["claims"] for r in parsed),
+        "rows": len(result),
+        "shard_claims": {"min": min(counts), "max": max(counts), "mean": round(sum(counts) / shards)},
+        **{name: round(seconds, 3) for name, seconds in timings.items()},
+        "by_worker": worker_report(parsed, computed),
+    }
+    return result, member_ids, drug_classes, report
+
+
+def print_report(report):
+    print(f"✓ Parsed {report['claims']:,} paid claims in {report['parse_tasks']:,} ranges "
+          f"in {report['parse_s']:.1f}s; computed {report['shards']:,} shards "
+          f"(min {report['shard_claims']['min']:,} / max {report['shard_claims']['max']:,} claims) "
+          f"in {report['compute_s']:.1f}s; merged in {report['merge_s']:.2f}s")
+    for pid, phases in report["by_worker"].items():
+        parse, compute = phases["parse"], phases["compute"]
+        print(f"  worker {pid:>7}  parse {parse['tasks']:>3} tasks {parse['claims']:>12,} claims "
+              f"{parse['seconds']:7.1f}s ({parse['claims_per_s'] or 0:>9,}/s)   "
+              f"compute {compute['tasks']:>3} shards {compute['claims']:>12,} claims "
+              f"{compute['seconds']:7.1f}s ({compute['claims_per_s'] or 0:>9,}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded multi-process fact_adherence computation")
+    parser.add_argument("--claims", required=True, help="fact_claims CSV file or part directory")
+    parser.add_argument("--drugs", required=True, help="dim_drug CSV file")
+    parser.add_argument("--as-of", help="Calculation date (YYYY-MM-DD); defaults to latest claim date")
+    parser.add_argument("--out", default="data/fact_adherence.csv", help="Output CSV path")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--shards", type=int,
+                        help=f"Member hash shards (default: {SHARDS_PER_WORKER} per worker)")
+    parser.add_argument("--spill-dir", help="Directory for shard spill files (default: system temp)")
+    parser.add_argument("--report", help="Write the run report (per-worker throughput) as JSON")
+    args = parser.parse_args()
+    if (args.workers is not None and args.workers < 1) or (args.shards is not None and args.shards < 1):
+        parser.error("--workers and --shards must be at least 1")
+
+    started = time.perf_counter()
+    result, member_ids, drug_classes, report = compute_sharded(
+        args.claims, args.drugs, args.as_of, args.workers, args.shards, args.spill_dir)
+    computed = time.perf_counter()
+    count = write_rows(args.out, COLUMNS["fact_adherence"], adherence_rows(result, member_ids, drug_classes))
+    report["write_s"] = round(time.perf_counter() - computed, 3)
+    report["total_s"] = round(time.perf_counter() - started, 3)
+
+    print_report(report)
+    print(f"✓ Wrote {count:,} rows to {args.out} ({report['total_s']:.1f}s total)")
+    if args.report:
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{args.report}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        os.replace(tmp, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Rolling 12-week Star Ratings proxy (metrics_catalog.md, Story 2.1).
+
+The proxy is a weighted average of component star scores:
+
+    adherence     members with PDC_90 >= 80% / members      (AggAdherenceWeekly)
+    cmr           CMRs completed / CMR-eligible members     (optional CSV feed)
+    gap_closure   gaps closed within target / gaps closed   (pipeline.gaps sketches)
+
+Each component rate is a rolling 12-week ratio of summed numerators and
+denominators, mapped to 1-5 stars by interpolating STAR_CUTPOINTS. Components
+with no denominator are left out and the remaining weights renormalized.
+
+Per client the engine keeps a ring buffer of the last 12 weekly
+numerators/denominators, the running sums, and the running sums as of each
+week. Adding a week subtracts the evicted slot and adds the new one, so an
+update, the current score, the WoW delta and the per-component contribution
+are all constant time per client. Re-pushing the latest week (a nightly
+re-run) replaces it. Weights are applied at read time, so changing them
+needs no rebuild.
+
+Usage:
+    python -m pipeline.stars update --state data/star_state.npz --db apps/web/prisma/dev.db \\
+        --gap-sketches data/gap_sketches.npz [--cmr data/cmr_weekly.csv]
+    python -m pipeline.stars show --state data/star_state.npz --client ACME \\
+        [--weights adherence=3,cmr=1,gap_closure=1]
+"""
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from pipeline.gaps import DEFAULT_CATALOG, Sketches, catalog_target
+from pipeline.load import MS_PER_DAY
+from pipeline.rollup import latest_week, week_start
+from pipeline.tables import day_number, day_string, read_rows
+
+WINDOW_WEEKS = 12
+
+COMPONENTS = ["adherence", "cmr", "gap_closure"]
+
+# Adherence is triple-weighted, as in the CMS Part D measures
+DEFAULT_WEIGHTS = {"adherence": 3.0, "cmr": 1.0, "gap_closure": 1.0}
+
+# Component rate (%) at which 1, 2, 3, 4 and 5 stars are reached; 80%
+# adherent is the 4-star line used on the executive dashboard
+STAR_CUTPOINTS = {
+    "adherence": [0, 60, 70, 80, 90],
+    "cmr": [0, 50, 65, 80, 90],
+    "gap_closure": [0, 50, 65, 75, 85],
+}
+
+STAR_TARGET = 4.0
+
+
+def parse_weights(text):
+    """"adherence=3,cmr=1" -> weights dict (unlisted components keep defaults)."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        name, _, value = item.partition("=")
+        if name not in COMPONENTS:
+            raise ValueError(f"unknown Star component {name!r}; expected one of {COMPONENTS}")
+        weights[name] = float(value)
+    return weights
+
+
+def component_scores(numerator, denominator, weights):
+    """Rates, stars and weighted contributions for (..., components) sums.
+
+    Returns (rate, stars, contribution, score); score is NaN where no
+    component has data.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = np.where(denominator > 0, numerator * 100.0 / denominator, np.nan)
+    stars = np.stack([
+        np.interp(rate[..., k], STAR_CUTPOINTS[name], [1, 2, 3, 4, 5])
+        for k, name in enumerate(COMPONENTS)
+    ], axis=-1)
+    w = np.array([weights[name] for name in COMPONENTS]) * ~np.isnan(rate)
+    total = w.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        contribution = np.where(w > 0, stars * w / total, 0.0)
+    score = np.where(total[..., 0] > 0, contribution.sum(axis=-1), np.nan)
+    return rate, stars, contribution, score
+
+
+class StarProxy:
+    """Ring buffers of weekly component sums for every client."""
+
+    def __init__(self, window=WINDOW_WEEKS):
+        self.window = window
+        self.clients = []
+        self.index = {}
+        self.head = -1  # ring slot of the latest week
+        self.weeks = np.full(window, -1, dtype=np.int64)  # week start day per slot
+        k = len(COMPONENTS)
+        self.weekly = np.zeros((0, window, k, 2))  # (client, slot, component, num/den)
+        self.running = np.zeros((0, k, 2))
+        self.rolling = np.zeros((0, window, k, 2))  # running sums as of each slot's week
+
+    @property
+    def latest_week(self):
+        return int(self.weeks[self.head]) if self.head >= 0 else None
+
+    def _rows(self, client_ids):
+        new = [c for c in dict.fromkeys(client_ids) if c not in self.index]
+        if new:
+            for client_id in new:
+                self.index[client_id] = len(self.clients)
+                self.clients.append(client_id)
+            grow = len(new)
+            self.weekly = np.concatenate([self.weekly, np.zeros((grow, *self.weekly.shape[1:]))])
+            self.running = np.concatenate([self.running, np.zeros((grow, *self.running.shape[1:]))])
+            self.rolling = np.concatenate([self.rolling, np.zeros((grow, *self.rolling.shape[1:]))])
+        return np.array([self.index[c] for c in client_ids], dtype=np.int64)
+
+    def _advance(self, week):
+        self.head = (self.head + 1) % self.window
+        self.running -= self.weekly[:, self.head]
+        self.weekly[:, self.head] = 0
+        self.weeks[self.head] = week
+        self.rolling[:, self.head] = self.running
+
+    def push(self, week, client_ids, sums):
+        """Add one week of component sums; sums is (clients, components, 2).
+
+        Clients absent from client_ids contribute nothing that week. Missing
+        weeks between the latest and week are filled with empty slots; the
+        latest week may be pushed again to replace it.
+        """
+        latest = self.latest_week
+        if latest is not None and week < latest:
+            raise ValueError(f"week {day_string(week)} is before the latest week {day_string(latest)}")
+        rows = self._rows(list(client_ids))
+        if latest is None or week > latest:
+            first = week if latest is None else latest + 7
+            for w in range(max(first, week - 7 * (self.window - 1)), week + 1, 7):
+                self._advance(w)
+        else:
+            self.running -= self.weekly[:, self.head]
+            self.weekly[:, self.head] = 0
+        self.weekly[rows, self.head] = sums
+        self.running += self.weekly[:, self.head]
+        self.rolling[:, self.head] = self.running
+
+    def current(self, client_id, weights=DEFAULT_WEIGHTS):
+        """Score, WoW delta and per-component breakdown for the latest week."""
+        row = self.index[client_id]
+        previous = (self.head - 1) % self.window
+        rate, stars, contribution, score = component_scores(
+            self.rolling[row, self.head, :, 0], self.rolling[row, self.head, :, 1], weights)
+        prior = component_scores(
+            self.rolling[row, previous, :, 0], self.rolling[row, previous, :, 1], weights)[3]
+        has_prior = self.weeks[previous] >= 0 and self.weeks[previous] < self.weeks[self.head]
+        return {
+            "client_id": client_id,
+            "week_start": day_string(self.latest_week),
+            "score": float(score),
+            "wow_delta": float(score - prior) if has_prior else None,
+            "components": {
+                name: {"rate": float(rate[k]), "stars": float(stars[k]), "contribution": float(contribution[k])}
+                for k, name in enumerate(COMPONENTS)
+            },
+        }
+
+    def trend(self, client_id, weights=DEFAULT_WEIGHTS):
+        """[(week_start, score)] for the weeks in the window, oldest first."""
+        row = self.index[client_id]
+        slots = [(self.head + 1 + i) % self.window for i in range(self.window)]
+        slots = [s for s in slots if self.weeks[s] >= 0]
+        scores = component_scores(self.rolling[row, slots, :, 0], self.rolling[row, slots, :, 1], weights)[3]
+        return [(day_string(int(self.weeks[s])), float(v)) for s, v in zip(slots, scores)]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, clients=np.array(self.clients), head=self.head, weeks=self.weeks,
+                 weekly=self.weekly, running=self.running, rolling=self.rolling)
+
+    @classmethod
+    def load(cls, path, window=WINDOW_WEEKS):
+        if not Path(path).exists():
+            return cls(window)
+        with np.load(path) as data:
+            proxy = cls(len(data["weeks"]))
+            proxy.clients = data["clients"].tolist()
+            proxy.index = {c: i for i, c in enumerate(proxy.clients)}
+            proxy.head = int(data["head"])
+            proxy.weeks = data["weeks"]
+            proxy.weekly = data["weekly"]
+            proxy.running = data["running"]
+            proxy.rolling = data["rolling"]
+        return proxy
+
+
+def week_sums(week, conn=None, gap_sketches=None, cmr_path=None, target_days=None):
+    """Collect one week's (clients, components, 2) sums from the available feeds."""
+    sums = {}
+
+    def add(client_id, component, numerator, denominator):
+        cell = sums.setdefault(client_id, np.zeros((len(COMPONENTS), 2)))
+        cell[COMPONENTS.index(component)] += (numerator, denominator)
+
+    if conn is not None:
+        rows = conn.execute(
+            'SELECT clientId, SUM(adherentCount), SUM(members) FROM "AggAdherenceWeekly" '
+            "WHERE weekStart = ? GROUP BY clientId", (week * MS_PER_DAY,))
+        for client_id, adherent, members in rows:
+            add(client_id, "adherence", adherent, members)
+
+    if gap_sketches is not None:
+        position = gap_sketches.dims.index("week_start")
+        keep = [day_number(key[position]) == week for key in gap_sketches.keys]
+        by_client = gap_sketches.regroup(["client_id"], keep)
+        # Cycle times are whole days: <= target means below target + 0.5
+        within = by_client.cdf(target_days + 0.5) * by_client.counts()
+        for (client_id,), closed, n in zip(by_client.keys, within, by_client.counts()):
+            add(client_id, "gap_closure", closed, n)
+
+    if cmr_path:
+        for row in read_rows(cmr_path):
+            if day_number(row["week_start"]) == week:
+                add(row["client_id"], "cmr", float(row["completed"]), float(row["eligible"]))
+
+    client_ids = sorted(sums)
+    return client_ids, np.array([sums[c] for c in client_ids]).reshape(len(client_ids), len(COMPONENTS), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling 12-week Star Ratings proxy")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = sub.add_parser("update", help="Push one week into the rolling window")
+    update_parser.add_argument("--state", required=True, help="Engine state file (.npz)")
+    update_parser.add_argument("--db", help="Web app SQLite database (AggAdherenceWeekly)")
+    update_parser.add_argument("--gap-sketches", help="pipeline.gaps sketch file")
+    update_parser.add_argument("--cmr", help="CSV of client_id, week_start, completed, eligible")
+    update_parser.add_argument("--week", help="Any date in the week (YYYY-MM-DD); default: latest cube week")
+    update_parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="metrics_catalog.md (gap target)")
+
+    show_parser = sub.add_parser("show", help="Current score, WoW delta, components and trend")
+    show_parser.add_argument("--state", required=True, help="Engine state file (.npz)")
+    show_parser.add_argument("--client", help="Client id (default: all clients)")
+    show_parser.add_argument("--weights", help="Component weights, e.g. adherence=3,cmr=1,gap_closure=1")
+    args = parser.parse_args()
+
+    proxy = StarProxy.load(args.state)
+    if args.command == "update":
+        conn = sqlite3.connect(args.db) if args.db else None
+        if args.week:
+            # Any date in the week selects it; ring slots step by whole weeks from Monday
+            week = week_start(day_number(args.week))
+        elif conn is not None and latest_week(conn) is not None:
+            week = latest_week(conn) // MS_PER_DAY
+        else:
+            parser.error("--week is required without a populated --db")
+        sketches = Sketches.load(args.gap_sketches) if args.gap_sketches else None
+        client_ids, sums = week_sums(week, conn, sketches, args.cmr, catalog_target(args.catalog))
+        proxy.push(week, client_ids, sums)
+        proxy.save(args.state)
+        print(f"✓ Pushed week of {day_string(week)} for {len(client_ids)} clients → {args.state}")
+        return
+
+    weights = parse_weights(args.weights)
+    for client_id in [args.client] if args.client else proxy.clients:
+        result = proxy.current(client_id, weights)
+        delta = f"{result['wow_delta']:+.2f}" if result["wow_delta"] is not None else "n/a"
+        status = "✓" if result["score"] >= STAR_TARGET else "✗ below 4.0"
+        print(f"{client_id}  week of {result['week_start']}: {result['score']:.2f}★ (WoW {delta})  {status}")
+        for name, part in result["components"].items():
+            if np.isnan(part["rate"]):
+                print(f"    {name:<12} no data")
+            else:
+                print(f"    {name:<12} {part['rate']:5.1f}%  {part['stars']:.2f}★  +{part['contribution']:.2f}")
+        print("    trend: " + "  ".join(f"{score:.2f}" for _, score in proxy.trend(client_id, weights)))
+
+
+if __name__ == "__main__":
+    main()
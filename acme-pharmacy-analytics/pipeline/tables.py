@@ -0,0 +1,246 @@
+"""
+Readers and writers for the contract tables in data_contracts/schemas.md.
+
+Tables are exchanged as CSV with a header row. A table path may be a single
+file or a directory of part files (part-00000.csv, part-00001.csv.gz, ...),
+which are read in name order.
+"""
+
+import csv
+import datetime
+import gzip
+import io
+from dataclasses import dataclass, field
+from operator import itemgetter
+from pathlib import Path
+
+import numpy as np
+
+# Column order for each contract table (data_contracts/schemas.md)
+COLUMNS = {
+    "dim_client": ["client_id", "name", "segment", "region"],
+    "dim_member": ["member_id", "client_id", "dob", "gender", "risk_band", "plan_id"],
+    "dim_drug": ["drug_id", "name", "class", "brand_generic_flag"],
+    "fact_claims": [
+        "claim_id", "member_id", "drug_id", "claim_date",
+        "days_supply", "paid_amount", "status",
+    ],
+    "fact_adherence": ["member_id", "drug_class", "pdc_90", "pdc_180", "mpr_90", "as_of_date"],
+    # Output of the notification rule engine, loaded into FactNotification
+    "fact_notification": [
+        "notification_id", "client_id", "rule_key", "entity_ref", "message",
+        "recommended_action", "severity", "owner", "sla_hours", "status", "created_at",
+    ],
+    # Product telemetry for FR-1.4 (DAU/WAU/MAU); not yet in schemas.md
+    "fact_telemetry": ["event_id", "user_id", "client_id", "event_date", "event_type", "feature"],
+    # Feed arrival manifests for FR-1.3 / Story 3.1; not yet in schemas.md
+    "feed_manifest": ["feed_id", "source", "data_date", "arrived_at", "row_count"],
+}
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def day_number(value):
+    """Convert an ISO date string (YYYY-MM-DD) to days since 1970-01-01."""
+    return (datetime.date.fromisoformat(value[:10]) - EPOCH).days
+
+
+def day_string(day):
+    """Convert days since 1970-01-01 back to an ISO date string."""
+    return (EPOCH + datetime.timedelta(days=int(day))).isoformat()
+
+
+def table_files(path):
+    """List the files that make up a table path (a file or a part directory)."""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.name.endswith((".csv", ".csv.gz")))
+    return [path]
+
+
+def open_text(path, mode="r"):
+    """Open a CSV file for text I/O, transparently handling .gz.
+
+    Gzip output is written with a zero header mtime so identical content
+    always compresses to identical bytes.
+    """
+    if str(path).endswith(".gz"):
+        return io.TextIOWrapper(gzip.GzipFile(path, mode + "b", mtime=0), encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def read_rows(path):
+    """Yield each row of a table as a dict keyed by header column."""
+    for file in table_files(path):
+        with open_text(file) as f:
+            yield from csv.DictReader(f)
+
+
+def read_columns(path, columns):
+    """Yield a tuple of the named columns from each row.
+
+    Cheaper than read_rows for large tables: no dict is built per row.
+    """
+    for file in table_files(path):
+        with open_text(file) as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            pick = itemgetter(*[header.index(column) for column in columns])
+            single = len(columns) == 1
+            for row in reader:
+                yield (pick(row),) if single else pick(row)
+
+
+def write_rows(path, columns, rows):
+    """Write dict rows to a CSV file, creating directories as needed."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open_text(path, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def load_drug_classes(path):
+    """Map drug_id -> drug class from dim_drug."""
+    return {row["drug_id"]: row["class"] for row in read_rows(path)}
+
+
+@dataclass
+class ClaimArrays:
+    """Paid claims as parallel NumPy columns with integer-coded keys.
+
+    member and drug_class index into member_ids and drug_classes, so the
+    adherence engine never touches Python strings on its hot path.
+    """
+
+    member: np.ndarray
+    drug_class: np.ndarray
+    claim_day: np.ndarray
+    days_supply: np.ndarray
+    member_ids: list = field(default_factory=list)
+    drug_classes: list = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.member)
+
+
+def load_claims(claims_path, drug_path, chunk_rows=1_000_000):
+    """Read paid fact_claims rows into ClaimArrays, joining dim_drug for class.
+
+    Rows are parsed in chunks of chunk_rows into typed buffers so memory stays
+    at a few bytes per claim rather than a Python object per field.
+    """
+    drug_class_of = load_drug_classes(drug_path)
+    class_codes = {}
+    member_codes = {}
+    drug_codes = {}
+    for drug_id, drug_class in drug_class_of.items():
+        drug_codes[drug_id] = class_codes.setdefault(drug_class, len(class_codes))
+
+    parts = {"member": [], "drug_class": [], "claim_day": [], "days_supply": []}
+    member_buf = np.empty(chunk_rows, dtype=np.int32)
+    class_buf = np.empty(chunk_rows, dtype=np.int16)
+    day_buf = np.empty(chunk_rows, dtype=np.int32)
+    supply_buf = np.empty(chunk_rows, dtype=np.int16)
+    day_cache = {}
+    n = 0
+
+    def flush():
+        parts["member"].append(member_buf[:n].copy())
+        parts["drug_class"].append(class_buf[:n].copy())
+        parts["claim_day"].append(day_buf[:n].copy())
+        parts["days_supply"].append(supply_buf[:n].copy())
+
+    for file in table_files(claims_path):
+        with open_text(file) as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            i_member = header.index("member_id")
+            i_drug = header.index("drug_id")
+            i_date = header.index("claim_date")
+            i_supply = header.index("days_supply")
+            i_status = header.index("status")
+            for row in reader:
+                if row[i_status] != "paid":
+                    continue
+                code = drug_codes.get(row[i_drug])
+                if code is None:
+                    continue
+                member_id = row[i_member]
+                member = member_codes.get(member_id)
+                if member is None:
+                    member = member_codes[member_id] = len(member_codes)
+                date = row[i_date]
+                day = day_cache.get(date)
+                if day is None:
+                    day = day_cache[date] = day_number(date)
+                member_buf[n] = member
+                class_buf[n] = code
+                day_buf[n] = day
+                supply_buf[n] = int(row[i_supply])
+                n += 1
+                if n == chunk_rows:
+                    flush()
+                    n = 0
+    flush()
+
+    return ClaimArrays(
+        member=np.concatenate(parts["member"]),
+        drug_class=np.concatenate(parts["drug_class"]),
+        claim_day=np.concatenate(parts["claim_day"]),
+        days_supply=np.concatenate(parts["days_supply"]),
+        member_ids=list(member_codes),
+        drug_classes=list(class_codes),
+    )
+
+
+@dataclass
+class MemberArrays:
+    """dim_member as integer-coded columns, indexed by position.
+
+    index maps member_id -> position; client, plan and risk_band are codes
+    into clients, plans and risk_bands.
+    """
+
+    member_ids: list
+    index: dict
+    client: np.ndarray
+    plan: np.ndarray
+    risk_band: np.ndarray
+    clients: list = field(default_factory=list)
+    plans: list = field(default_factory=list)
+    risk_bands: list = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.member_ids)
+
+
+def load_members(path):
+    """Read dim_member into MemberArrays."""
+    member_ids = []
+    codes = {"client": {}, "plan": {}, "risk_band": {}}
+    columns = {"client": [], "plan": [], "risk_band": []}
+    for member_id, client_id, plan_id, risk_band in read_columns(
+        path, ["member_id", "client_id", "plan_id", "risk_band"]
+    ):
+        member_ids.append(member_id)
+        for name, value in (("client", client_id), ("plan", plan_id), ("risk_band", risk_band)):
+            table = codes[name]
+            code = table.get(value)
+            if code is None:
+                code = table[value] = len(table)
+            columns[name].append(code)
+    return MemberArrays(
+        member_ids=member_ids,
+        index={member_id: i for i, member_id in enumerate(member_ids)},
+        client=np.array(columns["client"], dtype=np.int32),
+        plan=np.array(columns["plan"], dtype=np.int32),
+        risk_band=np.array(columns["risk_band"], dtype=np.int32),
+        clients=list(codes["client"]),
+        plans=list(codes["plan"]),
+        risk_bands=list(codes["risk_band"]),
+    )
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from pipeline.generate import generate
+from pipeline.tables import ClaimArrays
+
+END_DATE = "2025-10-19"
+
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    """A small generated data directory shared by the equivalence tests."""
+    out = tmp_path_factory.mktemp("data")
+    generate(out, 1_500, seed=7, end_date=END_DATE, history_days=400, workers=1)
+    return out
+
+
+@pytest.fixture
+def random_claims():
+    """Factory for claims with heavy overlap, same-day refills and long supplies."""
+    return make_random_claims
+
+
+def make_random_claims(seed, members=60, days=400, claims=3_000):
+    rng = np.random.default_rng(seed)
+    return ClaimArrays(
+        member=rng.integers(0, members, claims).astype(np.int32),
+        drug_class=rng.integers(0, 3, claims).astype(np.int16),
+        claim_day=rng.integers(0, days, claims).astype(np.int32),
+        days_supply=rng.choice([1, 7, 30, 90], claims).astype(np.int16),
+        member_ids=[f"M{i:04d}" for i in range(members)],
+        drug_classes=["Diabetes", "Hypertension", "Statins"],
+    )
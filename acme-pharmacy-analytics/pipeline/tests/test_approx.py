@@ -0,0 +1,82 @@
+"""Preview estimates fall within their 95% bounds of the exact numbers."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pipeline.adherence import adherence_rows, compute_adherence
+from pipeline.approx import Samples, build_samples, build_sketches, preview
+from pipeline.partitions import MemberClients, write_partitioned
+from pipeline.rls import scope_for
+from pipeline.service import PreviewRunner
+from pipeline.tables import COLUMNS, load_claims, write_rows
+
+
+@pytest.fixture(scope="module")
+def previews(dataset, tmp_path_factory):
+    """A sketched store and a small-strata sample of the dataset; return (samples, store)."""
+    tmp = tmp_path_factory.mktemp("approx")
+    claims = load_claims(dataset / "fact_claims", dataset / "dim_drug.csv")
+    snapshot = tmp / "fact_adherence.csv"
+    write_rows(snapshot, COLUMNS["fact_adherence"], adherence_rows(
+        compute_adherence(claims, int(claims.claim_day.max())), claims.member_ids, claims.drug_classes))
+    members = MemberClients(dataset / "dim_member")
+    write_partitioned(tmp / "store", "fact_claims", dataset / "fact_claims", members)
+    write_partitioned(tmp / "store", "fact_adherence", snapshot, members)
+    build_sketches(tmp / "store")
+    # Strata of a few dozen rows, so most numbers are estimated from a sample
+    rows, strata, sampled = build_samples(snapshot, dataset / "dim_member", tmp / "samples.npz", per_stratum=8)
+    assert sampled < rows / 2
+    return Samples.load(tmp / "samples.npz"), tmp / "store"
+
+
+def test_estimates_within_bound(previews):
+    samples, store = previews
+    clients = sorted({key[0] for key in samples.keys})
+    estimates = []
+    for client in clients:
+        scope = scope_for("CLIENT_VIEWER", client)
+        estimates += preview(samples, scope, store, exact=True)
+        estimates += preview(samples, scope, store, drug_class="Diabetes", exact=True)
+    estimates += preview(samples, scope_for("INTERNAL_OPS"), store, exact=True)
+
+    assert all(e.exact is not None for e in estimates)
+    sampled = [e for e in estimates if e.bound > 0 and e.method.startswith("stratified")]
+    assert len(sampled) >= 3 * len(clients)
+    # Bounds are 95% intervals: allow the odd miss, never a large one
+    assert sum(e.within_bound for e in estimates) >= 0.9 * len(estimates)
+    assert all(e.error <= 2 * e.bound + 1e-9 for e in estimates)
+    assert all(e.within_bound for e in estimates if e.name.startswith(("Active", "Members")))
+
+
+def test_exact_previews_are_capped_and_estimates_do_not_wait():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow(seconds):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(seconds)
+        with lock:
+            running[0] -= 1
+        return seconds
+
+    async def main():
+        runner = PreviewRunner(exact_limit=1)
+        try:
+            exact = [asyncio.create_task(runner.run(slow, 0.2, exact=True)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            await runner.run(slow, 0, exact=False)
+            waited = time.perf_counter() - started
+            await asyncio.gather(*exact)
+            return waited, runner.exact_waits
+        finally:
+            runner.close()
+
+    waited, exact_waits = asyncio.run(main())
+    assert peak[0] == 2  # one exact rerun plus the estimate
+    assert waited < 0.1
+    assert exact_waits == 2
@@ -0,0 +1,63 @@
+"""The RLS-scoped cache never shares a key or a hit across client scopes."""
+
+import pytest
+
+from pipeline.cache import QueryCache, cached_cube_query
+from pipeline.rls import AccessDenied, scope_for
+from pipeline.tables import load_claims
+
+from .test_rollup import build_cube
+
+
+@pytest.fixture(scope="module")
+def cube(dataset, tmp_path_factory):
+    end = int(load_claims(dataset / "fact_claims", dataset / "dim_drug.csv").claim_day.max())
+    conn, _, members, _ = build_cube(dataset, tmp_path_factory.mktemp("cache"), [end])
+    yield conn, members.clients[:2]
+    conn.close()
+
+
+def test_client_scopes_never_share_a_key():
+    acme, nwh = scope_for("CLIENT_VIEWER", "ACME"), scope_for("CLIENT_VIEWER", "NWH")
+    sql, params = "SELECT * FROM kpi WHERE week = ?", ("2025-10-13",)
+    assert QueryCache.key(sql, params, acme) != QueryCache.key(sql, params, nwh)
+    # Users sharing a scope share entries, whatever their role
+    assert QueryCache.key(sql, params, acme) == QueryCache.key(" select *  from KPI where week = ?;", params,
+                                                               scope_for("CLIENT_ADMIN", "ACME"))
+
+    cache = QueryCache()
+    cache.put(QueryCache.key(sql, params, acme), ["ACME rows"])
+    assert cache.get(QueryCache.key(sql, params, nwh)) == (False, None)
+    assert cache.get(QueryCache.key(sql, params, scope_for("INTERNAL_OPS"))) == (False, None)
+    assert cache.get(QueryCache.key(sql, params, acme)) == (True, ["ACME rows"])
+
+
+def test_cube_results_stay_within_their_scope(cube):
+    conn, (first, second) = cube
+    cache = QueryCache()
+    one, two = scope_for("CLIENT_VIEWER", first), scope_for("CLIENT_ADMIN", second)
+
+    rows_one = cached_cube_query(cache, conn, one, ("drugClass",))
+    rows_two = cached_cube_query(cache, conn, two, ("drugClass",))
+    assert (cache.stats.hits, cache.stats.misses) == (0, 2)
+    assert rows_one != rows_two
+    assert rows_two == cached_cube_query(QueryCache(), conn, two, ("drugClass",), {"clientId": second})
+
+    # The same scope hits; a request for the other client is denied before the cache
+    assert cached_cube_query(cache, conn, scope_for("CLIENT_ADMIN", first), ("drugClass",)) is rows_one
+    with pytest.raises(AccessDenied):
+        cached_cube_query(cache, conn, one, ("drugClass",), {"clientId": second})
+    assert (cache.stats.hits, cache.stats.misses, len(cache)) == (1, 2, 2)
+
+
+def test_result_computed_across_a_publish_is_dropped():
+    generation = [1]
+    cache = QueryCache(generation=lambda: generation[0])
+    scope = scope_for("CLIENT_VIEWER", "ACME")
+
+    def compute():
+        generation[0] += 1  # the nightly refresh publishes while the query runs
+        return "stale"
+
+    assert cache.get_or_compute("SELECT 1", (), scope, compute) == "stale"
+    assert len(cache) == 0
@@ -0,0 +1,84 @@
+"""The contract validator flags exactly the rows that break each rule."""
+
+import gzip
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from pipeline.contracts import load_contracts, validate
+
+SCHEMAS = Path(__file__).resolve().parents[3] / "acme-pharmacy-analytics-spec/data_contracts/schemas.md"
+
+# Rule -> (column, bad values); each value replaces the field on its own line
+CORRUPTIONS = {
+    "fact_claims.claim_id.not_null": ("claim_id", [""]),
+    "fact_claims.member_id.fk": ("member_id", ["M99999999", "X1"]),
+    "fact_claims.drug_id.fk": ("drug_id", ["D999"]),
+    "fact_claims.claim_date.type": ("claim_date", ["2025-02-30", "2025/01/01", "yesterday"]),
+    "fact_claims.days_supply.type": ("days_supply", ["abc", "3.5"]),
+    "fact_claims.days_supply.range": ("days_supply", ["0", "91", "365"]),
+    "fact_claims.paid_amount.type": ("paid_amount", ["12345678901.00", "n/a"]),
+    "fact_claims.paid_amount.range": ("paid_amount", ["-0.01"]),
+    "fact_claims.status.domain": ("status", ["void", "PAID"]),
+}
+DUPLICATE_IDS = 3
+SHORT_ROWS = 2
+
+
+@pytest.fixture(scope="module")
+def contracts():
+    return load_contracts(SCHEMAS)
+
+
+def statuses(report):
+    return {rule["rule"]: (rule["status"], rule["violations"]) for rule in report["rules"]}
+
+
+def test_generated_data_passes(dataset, contracts, tmp_path):
+    for table in ("fact_claims", "dim_member"):
+        path = next(p for p in (dataset / table, dataset / f"{table}.csv") if p.exists())
+        report = validate(contracts[table], path, dataset, contracts, spill_dir=tmp_path)
+        assert report["rows"] > 0
+        assert {status for status, _ in statuses(report).values()} <= {"pass", "skipped"}
+        assert report["drift"] == []
+
+
+def test_violations_across_chunks_and_parts(dataset, contracts, tmp_path):
+    lines = b"".join(p.read_bytes() for p in sorted((dataset / "fact_claims").iterdir())).splitlines()
+    header, rows = lines[0].decode().split(","), [line.decode().split(",") for line in lines[1:]]
+    rng = np.random.default_rng(3)
+    picks = iter(rng.choice(len(rows), 40, replace=False).tolist())
+    for column, values in CORRUPTIONS.values():
+        for value in values:
+            rows[next(picks)][header.index(column)] = value
+    for _ in range(DUPLICATE_IDS):
+        rows[next(picks)][0] = rows[next(picks)][0]
+    for _ in range(SHORT_ROWS):
+        del rows[next(picks)][-1]
+
+    # Three part files, one gzipped, read in small blocks with keys spilled to disk
+    claims = tmp_path / "data" / "fact_claims"
+    claims.mkdir(parents=True)
+    size = len(rows) // 3 + 1
+    for i in range(3):
+        data = "\n".join(",".join(row) for row in [header, *rows[i * size:(i + 1) * size]]).encode() + b"\n"
+        if i == 1:
+            (claims / f"part-{i:05d}.csv.gz").write_bytes(gzip.compress(data))
+        else:
+            (claims / f"part-{i:05d}.csv").write_bytes(data)
+    for name in ("dim_member", "dim_drug.csv"):
+        source = dataset / name
+        (shutil.copytree if source.is_dir() else shutil.copyfile)(source, tmp_path / "data" / name)
+
+    report = validate(contracts["fact_claims"], claims, tmp_path / "data", contracts,
+                      memory_mb=0, chunk_bytes=4096, spill_dir=tmp_path)
+    expected = {rule: ("fail", len(values)) for rule, (_, values) in CORRUPTIONS.items()}
+    expected["fact_claims.claim_id.unique"] = ("fail", DUPLICATE_IDS)
+    expected["fact_claims.row.shape"] = ("fail", SHORT_ROWS)
+    actual = statuses(report)
+    assert {rule: actual[rule] for rule in expected} == expected
+    assert all(actual[rule] == ("pass", 0) for rule in actual if rule not in expected)
+    assert report["rows"] == len(rows) - SHORT_ROWS
+    assert report["spilled_keys"] > 0
@@ -0,0 +1,29 @@
+"""Gap detection and reporting with no fills in range."""
+
+import numpy as np
+
+from pipeline.gaps import DIMENSIONS, Sketches, build_sketches, gap_events, report
+from pipeline.tables import load_claims, load_members
+
+
+def test_no_claims_on_or_before_as_of(dataset, capsys):
+    claims = load_claims(dataset / "fact_claims", dataset / "dim_drug.csv")
+    members = load_members(dataset / "dim_member")
+    events = gap_events(claims, int(claims.claim_day.min()) - 1)
+    assert len(events) == 0 and events.open_gaps == 0
+
+    sketches = build_sketches(events, claims, members)
+    assert sketches.keys == []
+    report(sketches, ["client_id"], 14.0, weeks=4)
+    assert "(no gap events)" in capsys.readouterr().out
+
+
+def test_empty_sketch_files_round_trip(tmp_path, random_claims, capsys):
+    claims = random_claims(1)
+    events = gap_events(claims, -1)
+    empty = Sketches.from_values(DIMENSIONS, [], np.zeros(0, dtype=np.int64), events.cycle_days)
+    empty.save(tmp_path / "empty.npz")
+    merged = Sketches.merge([Sketches.load(tmp_path / "empty.npz"), empty])
+    report(merged, [], 14.0, weeks=4)
+    assert "(no gap events)" in capsys.readouterr().out
+
@@ -0,0 +1,78 @@
+"""Incremental refreshes against a full recompute on the same day."""
+
+import numpy as np
+import pytest
+
+from pipeline.adherence import compute_adherence
+from pipeline.incremental import STATE_GRACE_DAYS, initialize, open_state, refresh, state_horizon
+from pipeline.tables import ClaimArrays, load_claims
+
+from .test_adherence import as_rows
+
+
+def subset(claims, mask):
+    return ClaimArrays(member=claims.member[mask], drug_class=claims.drug_class[mask],
+                       claim_day=claims.claim_day[mask], days_supply=claims.days_supply[mask],
+                       member_ids=claims.member_ids, drug_classes=claims.drug_classes)
+
+
+def check_refreshes(conn, claims, start, days, arrival=None):
+    """Refresh on each day with the claims that arrived since the previous run.
+
+    arrival is each claim's arrival day (default: its claim day).
+    """
+    arrival = claims.claim_day if arrival is None else arrival
+    previous = start
+    for as_of_day in days:
+        arrived = (arrival > previous) & (arrival <= as_of_day)
+        delta = as_rows(refresh(conn, subset(claims, arrived), as_of_day))
+        full = as_rows(compute_adherence(subset(claims, arrival <= as_of_day), as_of_day))
+        assert delta
+        assert delta == {key: full[key] for key in delta}
+        previous = as_of_day
+
+
+@pytest.mark.parametrize("step", [1, 7])
+def test_refresh_matches_full_recompute(tmp_path, random_claims, step):
+    claims = random_claims(4, days=500, claims=6_000)
+    conn = open_state(tmp_path / "state.db")
+    initialize(conn, claims, 200)
+    # Run past the pruning horizon, so carried coverage is replayed too
+    check_refreshes(conn, claims, 200, range(200 + step, 200 + STATE_GRACE_DAYS + 220, step))
+
+
+def test_refresh_matches_full_recompute_on_generated_claims(tmp_path, dataset):
+    claims = load_claims(dataset / "fact_claims", dataset / "dim_drug.csv")
+    end = int(claims.claim_day.max())
+    conn = open_state(tmp_path / "state.db")
+    initialize(conn, claims, end - 60)
+    check_refreshes(conn, claims, end - 60, [end - 59, end - 45, end - 44, end - 14, end])
+
+
+@pytest.mark.parametrize("seed", [6, 7])
+def test_backdated_claims_are_folded_in(tmp_path, random_claims, seed):
+    claims = random_claims(seed, days=500, claims=6_000)
+    # A third of claims arrive up to 60 days after their claim date
+    rng = np.random.default_rng(seed)
+    arrival = claims.claim_day + np.where(rng.random(len(claims.claim_day)) < 0.3,
+                                          rng.integers(1, 60, len(claims.claim_day)), 0)
+    conn = open_state(tmp_path / "state.db")
+    initialize(conn, subset(claims, arrival <= 200), 200)
+    check_refreshes(conn, claims, 200, range(207, 200 + STATE_GRACE_DAYS + 220, 7), arrival)
+
+
+def test_refresh_rejects_claims_behind_the_state_horizon(tmp_path, random_claims):
+    claims = random_claims(5)
+    conn = open_state(tmp_path / "state.db")
+    initialize(conn, claims, 300)
+    with pytest.raises(ValueError, match="--init"):
+        refresh(conn, subset(claims, claims.claim_day == state_horizon(300) - 1), 301)
+    refresh(conn, subset(claims, claims.claim_day == state_horizon(300)), 301)
+
+
+def test_refresh_rejects_stale_as_of(tmp_path, random_claims):
+    claims = random_claims(5)
+    conn = open_state(tmp_path / "state.db")
+    initialize(conn, claims, 200)
+    with pytest.raises(ValueError):
+        refresh(conn, claims, 200)
@@ -0,0 +1,43 @@
+"""A failed --replace load leaves the previous rows in place."""
+
+import sqlite3
+
+import pytest
+
+from pipeline.load import bulk_load, table_count
+
+NOTIFICATION_TABLE = """
+CREATE TABLE "FactNotification" (
+    id TEXT PRIMARY KEY, clientId TEXT, ruleKey TEXT, entityRef TEXT, message TEXT,
+    recommendedAction TEXT, severity TEXT, owner TEXT, slaHours INTEGER, status TEXT, createdAt INTEGER
+)
+"""
+
+
+def notifications(*ids):
+    return [(i, "ACME", "rule", "ref", "msg", "act", "high", "ops", 24, "open", 0) for i in ids]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "dev.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute(NOTIFICATION_TABLE)
+        conn.execute('CREATE INDEX "FactNotification_clientId_idx" ON "FactNotification"(clientId)')
+    bulk_load(path, {"FactNotification": notifications("a", "b", "c")})
+    return path
+
+
+def test_replace_loads_in_one_transaction(db):
+    assert bulk_load(db, {"FactNotification": notifications("d", "e")}, replace=True) == {"FactNotification": 2}
+    with sqlite3.connect(db) as conn:
+        assert table_count(conn, "FactNotification") == 2
+
+
+def test_failed_replace_keeps_previous_rows(db):
+    with pytest.raises(sqlite3.IntegrityError):
+        bulk_load(db, {"FactNotification": notifications("d", "e", "d")}, replace=True)
+    with sqlite3.connect(db) as conn:
+        assert [row[0] for row in conn.execute('SELECT id FROM "FactNotification" ORDER BY id')] == ["a", "b", "c"]
+        # Deferred indexes are rebuilt even when the load fails
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchone()[0] == 1
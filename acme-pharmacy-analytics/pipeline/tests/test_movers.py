@@ -0,0 +1,52 @@
+"""Mover member counts and support are distinct members of the cohort."""
+
+from collections import defaultdict
+
+import pytest
+
+from pipeline import movers
+from pipeline.load import client_rows
+from pipeline.rollup import latest_week
+from pipeline.tables import load_claims
+
+from .test_rollup import build_cube
+
+
+@pytest.fixture(scope="module")
+def digest_cube(dataset, tmp_path_factory):
+    end = int(load_claims(dataset / "fact_claims", dataset / "dim_drug.csv").claim_day.max())
+    conn, snapshots, members, drug_classes = build_cube(dataset, tmp_path_factory.mktemp("movers"), [end - 7, end])
+    conn.execute('CREATE TABLE "DimClient" (id TEXT PRIMARY KEY, name TEXT, segment TEXT, region TEXT, createdAt INTEGER)')
+    conn.executemany('INSERT INTO "DimClient" VALUES (?, ?, ?, ?, ?)', client_rows(dataset / "dim_client.csv", 0))
+    regions = {row[0]: row[3] for row in client_rows(dataset / "dim_client.csv", 0)}
+    yield conn, snapshots[-1], members, drug_classes, regions
+    conn.close()
+
+
+def test_mover_members_are_distinct(digest_cube, monkeypatch):
+    conn, snapshot, members, drug_classes, regions = digest_cube
+    # Report every cohort with support so each one's count is checked
+    monkeypatch.setattr(movers, "MIN_Z", 0)
+    monkeypatch.setattr(movers, "MIN_DELTA_PP", 0)
+    digest = movers.digest(conn, latest_week(conn), top=10_000)
+
+    cohorts = defaultdict(set)
+    for m, c in zip(snapshot.member.tolist(), snapshot.drug_class.tolist()):
+        client_id = members.clients[members.client[m]]
+        labels = {"drugClass": drug_classes[c], "planId": members.plans[members.plan[m]],
+                  "region": regions[client_id], "riskBand": members.risk_bands[members.risk_band[m]]}
+        for scope in (client_id, movers.ORG_SCOPE):
+            for dims in range(16):
+                segment = tuple((name, labels[name]) for i, name in enumerate(movers.LATTICE_DIMENSIONS) if dims >> i & 1)
+                cohorts[scope, segment].add(m)
+
+    checked = 0
+    for scope, scope_movers in digest.items():
+        for mover in scope_movers:
+            assert mover.members == len(cohorts[scope, tuple(mover.segment.items())])
+            assert mover.members >= movers.MIN_SUPPORT
+            checked += "drugClass" not in mover.segment
+    assert checked
+    overall = next(m for m in digest[movers.ORG_SCOPE] if not m.segment)
+    assert overall.members == len(set(snapshot.member.tolist())) < len(snapshot)
+    assert f"{overall.members:,} members" in overall.narrative
@@ -0,0 +1,79 @@
+"""Cube member counts are distinct members, whatever the grouping."""
+
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+from pipeline.adherence import adherence_rows, compute_adherence, load_adherence
+from pipeline.rollup import query, refresh
+from pipeline.tables import COLUMNS, load_claims, load_members, write_rows
+
+CUBE_TABLES = """
+CREATE TABLE "AggAdherenceWeekly" (
+    weekStart INTEGER, clientId TEXT, drugClass TEXT, planId TEXT, riskBand TEXT, members INTEGER,
+    pdc90Sum REAL, pdc180Sum REAL, mpr90Sum REAL, adherentCount INTEGER,
+    PRIMARY KEY (weekStart, clientId, drugClass, planId, riskBand)
+);
+CREATE TABLE "AggMemberWeekly" (
+    weekStart INTEGER, clientId TEXT, planId TEXT, riskBand TEXT, members INTEGER,
+    PRIMARY KEY (weekStart, clientId, planId, riskBand)
+);
+"""
+
+
+def build_cube(dataset, tmp, as_of_days):
+    """Refresh the dataset's snapshots on as_of_days into an empty cube; return (conn, snapshots, members, classes)."""
+    claims = load_claims(dataset / "fact_claims", dataset / "dim_drug.csv")
+    members = load_members(dataset / "dim_member")
+    drug_classes = []
+    conn = sqlite3.connect(tmp / "cube.db")
+    conn.executescript(CUBE_TABLES)
+    snapshots = []
+    for day in as_of_days:
+        path = tmp / f"fact_adherence-{day}.csv"
+        write_rows(path, COLUMNS["fact_adherence"],
+                   adherence_rows(compute_adherence(claims, day), claims.member_ids, claims.drug_classes))
+        snapshots.append(load_adherence(path, members.index, drug_classes))
+        refresh(conn, snapshots[-1], members, drug_classes)
+    return conn, snapshots, members, drug_classes
+
+
+@pytest.fixture(scope="module")
+def cube(dataset, tmp_path_factory):
+    claims = load_claims(dataset / "fact_claims", dataset / "dim_drug.csv")
+    conn, [snapshot], members, drug_classes = build_cube(
+        dataset, tmp_path_factory.mktemp("cube"), [int(claims.claim_day.max())])
+    yield conn, snapshot, members, drug_classes
+    conn.close()
+
+
+def distinct(snapshot, members, key):
+    groups = defaultdict(set)
+    for m, c in zip(snapshot.member.tolist(), snapshot.drug_class.tolist()):
+        groups[key(m, c)].add(m)
+    return {k: len(v) for k, v in groups.items()}
+
+
+def test_members_are_distinct_across_drug_classes(cube):
+    conn, snapshot, members, drug_classes = cube
+    client = lambda m, c: members.clients[members.client[m]]
+    by_client = distinct(snapshot, members, client)
+    assert {row["clientId"]: row["members"] for row in query(conn, ("clientId",))} == by_client
+    # Members with several classes are counted once, not once per class
+    assert sum(by_client.values()) < len(snapshot)
+
+    client_id = max(by_client, key=by_client.get)
+    [overall] = query(conn, (), {"clientId": client_id})
+    assert overall["members"] == by_client[client_id]
+    by_plan = distinct(snapshot, members, lambda m, c: (client(m, c), members.plans[members.plan[m]]))
+    assert {row["planId"]: row["members"] for row in query(conn, ("planId",), {"clientId": client_id})} == {
+        plan: n for (c, plan), n in by_plan.items() if c == client_id}
+
+
+def test_members_per_drug_class(cube):
+    conn, snapshot, members, drug_classes = cube
+    by_class = distinct(snapshot, members, lambda m, c: drug_classes[c])
+    assert {row["drugClass"]: row["members"] for row in query(conn, ("drugClass",))} == by_class
+    [row] = query(conn, (), {"drugClass": drug_classes[0]})
+    assert row["members"] == by_class[drug_classes[0]]
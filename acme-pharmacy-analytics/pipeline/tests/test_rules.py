@@ -0,0 +1,57 @@
+"""Each notification rule fires exactly on its documented boundary."""
+
+import numpy as np
+import pytest
+
+from pipeline.rules import RULES
+
+RULE = {rule.key: rule for rule in RULES}
+
+
+def fires(key, **fields):
+    arrays = {name: np.array(values, dtype=object if name == "risk_band" else float) for name, values in fields.items()}
+    with np.errstate(invalid="ignore"):
+        return RULE[key].condition(arrays).tolist()
+
+
+def test_every_rule_is_pinned():
+    assert set(RULE) == {"adherence_risk_spike", "cohort_below_threshold", "cohort_pdc_drop", "adherent_rate_drop",
+                         "oversupply_pattern", "member_adherence_drop", "member_therapy_lapse"}
+
+
+@pytest.mark.parametrize("pdc_90, delta, expected", [
+    (74.99, -5.0, True), (75.0, -5.0, False), (74.99, -4.99, False), (50.0, np.nan, False),
+])
+def test_adherence_risk_spike(pdc_90, delta, expected):
+    assert fires("adherence_risk_spike", pdc_90=[pdc_90], pdc_90_delta=[delta]) == [expected]
+
+
+def test_cohort_below_threshold_includes_steady_low_cohorts():
+    # FR-2.1: any cohort under 80% alerts, whatever its trend
+    assert fires("cohort_below_threshold", pdc_90=[79.99, 80.0, 74.99, 70.0, 0.0, np.nan],
+                 pdc_90_delta=[0.0, 0.0, -5.0, 0.0, np.nan, 0.0]) == [True, False, True, True, True, False]
+
+
+@pytest.mark.parametrize("pdc_90, delta, expected", [
+    (75.0, -5.0, True), (74.99, -5.0, False), (90.0, -4.99, False), (90.0, np.nan, False),
+])
+def test_cohort_pdc_drop(pdc_90, delta, expected):
+    assert fires("cohort_pdc_drop", pdc_90=[pdc_90], pdc_90_delta=[delta]) == [expected]
+
+
+def test_adherent_rate_drop():
+    assert fires("adherent_rate_drop", adherent_rate_delta=[-5.0, -4.99, np.nan]) == [True, False, False]
+
+
+def test_oversupply_pattern():
+    assert fires("oversupply_pattern", oversupply_rate=[15.0, 14.99, np.nan]) == [True, False, False]
+
+
+def test_member_adherence_drop():
+    assert fires("member_adherence_drop", risk_band=["High", "High", "High", "Medium"],
+                 pdc_90=[79.99, 80.0, 79.99, 10.0], pdc_90_delta=[-20.0, -20.0, -19.99, -50.0]) == [True, False, False, False]
+
+
+def test_member_therapy_lapse():
+    assert fires("member_therapy_lapse", pdc_90=[0.0, 0.0, 0.01, 0.0],
+                 prior_pdc_90=[0.01, 0.0, 50.0, np.nan]) == [True, False, False, False]
@@ -0,0 +1,44 @@
+"""Runner cache keys follow every import form; the critical path includes queue waits."""
+
+import pytest
+
+from pipeline.runner import Stage, critical_path, module_code_hash, pipeline_imports
+
+
+def test_imports_in_every_form():
+    source = b"""
+import os
+import pipeline.tables
+from pipeline.load import DEFAULT_DB
+from pipeline import rollup, partitions as parts
+from . import approx
+from .gaps import gap_events
+"""
+    assert pipeline_imports(source) == {"tables", "load", "rollup", "partitions", "approx", "gaps"}
+
+
+def test_hash_follows_from_pipeline_import():
+    # cache.py reaches rollup only through "from pipeline import rollup"
+    cache = {}
+    before = module_code_hash("pipeline.cache", cache)
+    assert "rollup" in cache
+    cache["rollup"] += b"\n# changed\n"
+    assert module_code_hash("pipeline.cache", cache) != before
+
+
+def ran(start, wait, seconds):
+    return {"status": "ran", "ready": start - wait, "start": start, "wait": wait, "seconds": seconds}
+
+
+def test_critical_path_includes_queue_waits():
+    # a and b are independent, but one worker runs b only after a
+    stages = {"a": Stage("a", "m", []), "b": Stage("b", "m", []), "c": Stage("c", "m", [], deps=["a", "b"])}
+    results = {"a": ran(0, 0, 5), "b": ran(5, 5, 4), "c": ran(9, 0, 1)}
+    report = critical_path(stages, results)
+    assert report["critical_path"] == ["b", "c"]
+    assert report["critical_seconds"] == pytest.approx(10)
+    assert report["critical_wait_seconds"] == pytest.approx(5)
+    assert report["dag_seconds"] == pytest.approx(6)
+    assert report["stage_seconds"] == pytest.approx(10)
+    assert results["a"]["slack"] == pytest.approx(4)
+    assert results["b"]["slack"] == results["c"]["slack"] == pytest.approx(0)
@@ -0,0 +1,57 @@
+"""Sharded adherence output is byte-identical to the single-process engine."""
+
+import gzip
+
+import pytest
+
+from pipeline.adherence import adherence_rows, compute_adherence
+from pipeline.shards import compute_sharded
+from pipeline.tables import COLUMNS, load_claims, write_rows
+
+
+def single_process(claims_path, drugs, out):
+    claims = load_claims(claims_path, drugs)
+    result = compute_adherence(claims, int(claims.claim_day.max()))
+    write_rows(out, COLUMNS["fact_adherence"], adherence_rows(result, claims.member_ids, claims.drug_classes))
+    return out.read_bytes()
+
+
+def sharded(claims_path, drugs, out, spill_dir, **options):
+    result, member_ids, drug_classes, _ = compute_sharded(claims_path, drugs, spill_dir=spill_dir, **options)
+    write_rows(out, COLUMNS["fact_adherence"], adherence_rows(result, member_ids, drug_classes))
+    return out.read_bytes()
+
+
+@pytest.fixture(scope="module")
+def mixed_claims(dataset, tmp_path_factory):
+    """The dataset's claims re-split into plain and gzip parts, so members straddle files."""
+    out = tmp_path_factory.mktemp("mixed_claims")
+    header, *lines = b"".join(p.read_bytes() for p in sorted((dataset / "fact_claims").iterdir())).splitlines(True)
+    size = len(lines) // 4 + 1
+    for i in range(4):
+        data = header + b"".join(lines[i * size:(i + 1) * size])
+        if i % 2:
+            (out / f"part-{i:05d}.csv.gz").write_bytes(gzip.compress(data))
+        else:
+            (out / f"part-{i:05d}.csv").write_bytes(data)
+    return out
+
+
+@pytest.mark.parametrize("options", [
+    {"workers": 2},
+    {"workers": 2, "shards": 3, "range_bytes": 16 * 1024},
+    {"workers": 1, "shards": 1},
+])
+def test_matches_single_process(dataset, tmp_path, options):
+    drugs = dataset / "dim_drug.csv"
+    expected = single_process(dataset / "fact_claims", drugs, tmp_path / "single.csv")
+    assert sharded(dataset / "fact_claims", drugs, tmp_path / "sharded.csv", tmp_path, **options) == expected
+
+
+def test_matches_single_process_on_mixed_gzip_parts(dataset, mixed_claims, tmp_path):
+    drugs = dataset / "dim_drug.csv"
+    expected = single_process(mixed_claims, drugs, tmp_path / "single.csv")
+    assert expected == single_process(dataset / "fact_claims", drugs, tmp_path / "original.csv")
+    actual = sharded(mixed_claims, drugs, tmp_path / "sharded.csv", tmp_path, workers=2, shards=4,
+                     range_bytes=8 * 1024)
+    assert actual == expected